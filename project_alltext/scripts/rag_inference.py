@@ -17,15 +17,15 @@ Prerequisites:
 import os
 import subprocess
 import numpy as np
-from neo4j import GraphDatabase, exceptions
+from neo4j import exceptions
 from sentence_transformers import SentenceTransformer
 
+from neo4j_connection import Neo4jConnection
+
 #############################################
 #     NEO4J CONFIG & GLOBAL SETTINGS        #
 #############################################
-NEO4J_URI  = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASS = "Neo4j420"  # your password
+# Neo4j URI/credentials/pool settings come from neo4j_connection (NEO4J_* env vars)
 TOP_K      = 5           # how many chunks to retrieve
 OLLAMA_MODEL = "deepseek-r1:14b"  # the local Ollama model name
 
@@ -72,7 +72,7 @@ def retrieve_chunks_from_neo4j():
     """
     Connects to Neo4j, retrieves all chunk nodes + embeddings, returns list of dicts.
     """
-    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
+    conn = Neo4jConnection.from_env()
     query = """
     MATCH (ch:Chunk)
     RETURN ch.chunk_id AS chunk_id,
@@ -82,16 +82,15 @@ def retrieve_chunks_from_neo4j():
     """
     chunks = []
     try:
-        with driver.session() as session:
-            results = session.run(query)
-            for record in results:
-                chunk = {
-                    "chunk_id": record["chunk_id"],
-                    "content" : record["content"],
-                    "embedding": record["embedding"],
-                    "modality": record["modality"]
-                }
-                chunks.append(chunk)
+        results = conn.run_read(query, label="rag_inference.fetch_chunks")
+        for record in results:
+            chunk = {
+                "chunk_id": record["chunk_id"],
+                "content" : record["content"],
+                "embedding": record["embedding"],
+                "modality": record["modality"]
+            }
+            chunks.append(chunk)
         print(f"[INFO] Retrieved {len(chunks)} chunks from Neo4j.")
     except exceptions.AuthError as e:
         print(f"[ERROR] Neo4j auth error: {e}")
@@ -100,7 +99,8 @@ def retrieve_chunks_from_neo4j():
     except Exception as e:
         print(f"[ERROR] Unexpected error: {e}")
     finally:
-        driver.close()
+        conn.print_stats(prefix="INFO")
+        conn.close()
     return chunks
 
 def find_top_k_chunks(query_embedding: np.ndarray, chunks: list, top_k: int = TOP_K):
@@ -25,15 +25,15 @@ Prerequisites:
 import os
 import subprocess
 import numpy as np
-from neo4j import GraphDatabase, exceptions
+from neo4j import exceptions
 from sentence_transformers import SentenceTransformer
 
+from neo4j_connection import Neo4jConnection
+
 #############################################
 #  CONFIGURATION
 #############################################
-NEO4J_URI  = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASS = "Neo4j420"
+# Neo4j URI/credentials/pool settings come from neo4j_connection (NEO4J_* env vars)
 TOP_K      = 5
 OLLAMA_MODEL = "deepseek-r1:14b"
 
@@ -124,11 +124,10 @@ Answer:
 #  NEO4J CHUNK RETRIEVAL
 #############################################
 
-def retrieve_chunks_from_neo4j(uri: str, user: str, password: str):
+def retrieve_chunks_from_neo4j(conn: Neo4jConnection):
     """
-    Connects to Neo4j and retrieves chunk nodes + embeddings. Returns a list of dicts.
+    Retrieves chunk nodes + embeddings over the shared connection. Returns a list of dicts.
     """
-    driver = GraphDatabase.driver(uri, auth=(user, password))
     query = """
     MATCH (ch:Chunk)
     RETURN ch.chunk_id AS chunk_id,
@@ -138,15 +137,14 @@ def retrieve_chunks_from_neo4j(uri: str, user: str, password: str):
     """
     chunks = []
     try:
-        with driver.session() as session:
-            results = session.run(query)
-            for record in results:
-                chunks.append({
-                    "chunk_id": record["chunk_id"],
-                    "content" : record["content"],
-                    "embedding": record["embedding"],
-                    "modality" : record["modality"]
-                })
+        results = conn.run_read(query, label="rag_inference.fetch_chunks")
+        for record in results:
+            chunks.append({
+                "chunk_id": record["chunk_id"],
+                "content" : record["content"],
+                "embedding": record["embedding"],
+                "modality" : record["modality"]
+            })
         print(f"[INFO] Retrieved {len(chunks)} chunks from Neo4j.")
     except exceptions.AuthError as e:
         print(f"[ERROR] Neo4j auth error: {e}")
@@ -154,8 +152,6 @@ def retrieve_chunks_from_neo4j(uri: str, user: str, password: str):
         print(f"[ERROR] Neo4j service unavailable: {e}")
     except Exception as e:
         print(f"[ERROR] Unexpected error: {e}")
-    finally:
-        driver.close()
     return chunks
 
 def find_top_k_chunks(query_embedding: np.ndarray, chunks: list, top_k: int = TOP_K):
@@ -183,7 +179,12 @@ def main():
     embedding_model = load_text_model("all-MiniLM-L6-v2")
 
     # 2) Retrieve chunks from Neo4j (just once)
-    chunks = retrieve_chunks_from_neo4j(NEO4J_URI, NEO4J_USER, NEO4J_PASS)
+    conn = Neo4jConnection.from_env()
+    try:
+        chunks = retrieve_chunks_from_neo4j(conn)
+    finally:
+        conn.print_stats(prefix="INFO")
+        conn.close()
     if not chunks:
         print("[ERROR] No chunks found in Neo4j. Exiting.")
         return
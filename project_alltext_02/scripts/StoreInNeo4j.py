@@ -1,9 +1,11 @@
 """
 StoreInNeo4j.py
 
-This script connects to Neo4j at a fixed URI with hard-coded user/password:
+This script connects to Neo4j through the shared neo4j_connection module. The
+defaults are still the fixed URI and user/password:
   NEO4J_USER = "neo4j"
   NEO4J_PASS = "Neo4j420"
+and can be overridden with the NEO4J_* environment variables (see neo4j_connection.py).
 
 It reads 'embedded_data.json' by default, merges Document and Chunk nodes,
 and stores chunk properties (including embeddings).
@@ -40,13 +42,9 @@ with user=neo4j, pass=Neo4j420.
 
 import os
 import json
-from neo4j import GraphDatabase, basic_auth
 import sys
 
-# Hard-coded Neo4j credentials
-NEO4J_URI = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASS = "Neo4j420"
+from neo4j_connection import Neo4jConnection
 
 # If you'd like to optionally clear old data, set CLEAR_OLD_DATA to True:
 CLEAR_OLD_DATA = False
@@ -58,11 +56,12 @@ INPUT_JSON = "embedded_data.json"
 def store_in_neo4j():
     """
     1) Reads the embedded JSON from INPUT_JSON.
-    2) Connects to Neo4j using NEO4J_URI/USER/PASS.
+    2) Connects to Neo4j using the shared Neo4jConnection (NEO4J_* env vars).
     3) Optionally clears old data if CLEAR_OLD_DATA is True.
     4) Creates constraints for doc_id and chunk_id uniqueness.
     5) Merges Document nodes & merges Chunk nodes + a relationship:
           (Document)-[:HAS_CHUNK]->(Chunk)
+       Each file is written in one managed (retried) write transaction.
     """
     if not os.path.isfile(INPUT_JSON):
         print(f"[StoreInNeo4j] Cannot find JSON file '{INPUT_JSON}'")
@@ -79,54 +78,44 @@ def store_in_neo4j():
 
     files_list = data["files"]
 
-    print(f"[StoreInNeo4j] Connecting to {NEO4J_URI} with user '{NEO4J_USER}'...")
-    driver = GraphDatabase.driver(NEO4J_URI, auth=basic_auth(NEO4J_USER, NEO4J_PASS))
+    conn = Neo4jConnection.from_env()
+    print(f"[StoreInNeo4j] Connecting to {conn.uri} with user '{conn.user}'...")
 
     # Optionally clear old data
     if CLEAR_OLD_DATA:
         print("[StoreInNeo4j] Clearing old DB data (MATCH (n) DETACH DELETE n)")
-        with driver.session() as session:
-            session.run("MATCH (n) DETACH DELETE n")
+        conn.run_write("MATCH (n) DETACH DELETE n", label="store.clear")
 
     # Create constraints if not exist
-    with driver.session() as session:
-        session.run("CREATE CONSTRAINT IF NOT EXISTS FOR (d:Document) REQUIRE d.doc_id IS UNIQUE")
-        session.run("CREATE CONSTRAINT IF NOT EXISTS FOR (c:Chunk) REQUIRE c.chunk_id IS UNIQUE")
+    conn.run_write("CREATE CONSTRAINT IF NOT EXISTS FOR (d:Document) REQUIRE d.doc_id IS UNIQUE",
+                   label="store.constraints")
+    conn.run_write("CREATE CONSTRAINT IF NOT EXISTS FOR (c:Chunk) REQUIRE c.chunk_id IS UNIQUE",
+                   label="store.constraints")
     print("[StoreInNeo4j] Ensured constraints on doc_id and chunk_id.")
 
     doc_count = 0
     chunk_count = 0
 
-    with driver.session() as session:
-        for file_info in files_list:
-            file_name = file_info.get("file_name", "")
-            if not file_name.strip():
-                continue
+    for file_info in files_list:
+        file_name = file_info.get("file_name", "")
+        if not file_name.strip():
+            continue
 
+        # Only chunks with a non-empty chunk_id are stored
+        chunks = [c for c in file_info.get("chunks", []) if c.get("chunk_id", "").strip()]
+
+        def write_file(tx):
             # Merge the Document node
             merge_doc_query = """
             MERGE (d:Document { doc_id: $doc_id })
             ON CREATE SET d.created_at = timestamp()
             """
-            session.run(merge_doc_query, {"doc_id": file_name})
-            doc_count += 1
+            tx.run(merge_doc_query, {"doc_id": file_name})
 
             # For each chunk
-            for c in file_info.get("chunks", []):
-                chunk_id = c.get("chunk_id", "")
-                if not chunk_id.strip():
-                    continue
-
-                # We'll store or update these properties
-                modality = c.get("modality", "")
-                content = c.get("content", "")
-                embedding = c.get("embedding", [])
-                textual_modality = c.get("textual_modality", "")
-
+            for c in chunks:
                 # For metadata, store as JSON string or direct map if small enough
-                import json as pyjson
-                metadata = c.get("metadata", {})
-                metadata_str = pyjson.dumps(metadata, ensure_ascii=False)
+                metadata_str = json.dumps(c.get("metadata", {}), ensure_ascii=False)
 
                 # Merge chunk
                 merge_chunk_query = """
@@ -145,12 +134,12 @@ def store_in_neo4j():
                     ch.textual_modality = $textual_modality,
                     ch.metadata = $metadata
                 """
-                session.run(merge_chunk_query, {
-                    "chunk_id": chunk_id,
-                    "modality": modality,
-                    "content": content,
-                    "embedding": embedding,
-                    "textual_modality": textual_modality,
+                tx.run(merge_chunk_query, {
+                    "chunk_id": c["chunk_id"],
+                    "modality": c.get("modality", ""),
+                    "content": c.get("content", ""),
+                    "embedding": c.get("embedding", []),
+                    "textual_modality": c.get("textual_modality", ""),
                     "metadata": metadata_str
                 })
 
@@ -160,14 +149,17 @@ def store_in_neo4j():
                       (ch:Chunk { chunk_id: $chunk_id })
                 MERGE (d)-[:HAS_CHUNK]->(ch)
                 """
-                session.run(link_query, {
+                tx.run(link_query, {
                     "doc_id": file_name,
-                    "chunk_id": chunk_id
+                    "chunk_id": c["chunk_id"]
                 })
 
-                chunk_count += 1
+        conn.write_tx(write_file, label="store.write_file")
+        doc_count += 1
+        chunk_count += len(chunks)
 
-    driver.close()
+    conn.print_stats(prefix="StoreInNeo4j")
+    conn.close()
     print(f"[StoreInNeo4j] Done. Created/updated {doc_count} Document nodes, {chunk_count} Chunk merges.")
 
 
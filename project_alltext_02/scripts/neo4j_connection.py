@@ -0,0 +1,380 @@
+"""
+neo4j_connection.py
+
+(Kept in sync with project_alltext_03/neo4j_connection.py; each project folder is
+self-contained, so the older scripts here import their own copy.)
+
+Shared Neo4j connection layer for every stage of the pipeline (store_in_neo4j.py,
+compute_relationships.py, the retrievers and rag_query.py). Previously each script
+built its own driver from hard-coded constants and opened sessions ad hoc, so we
+had no single place to tune the Bolt connection pool or to see where query time
+was going. This module wraps one neo4j.Driver and provides:
+
+- **Configurable pool**: max_connection_pool_size and connection_acquisition_timeout
+  are passed straight to the driver. Defaults can be overridden from the environment.
+- **Transient-error retry**: each unit of work runs in an explicit transaction. If
+  it fails with a transient error (deadlock, leader switch, service unavailable,
+  expired session), we sleep with exponential backoff plus jitter and try again.
+- **Managed read/write transactions**: `run_read()` / `run_write()` open a session
+  with the right access mode, run the query, drain the result into a list of dicts
+  and commit. `read_tx()` / `write_tx()` do the same for a callable that issues
+  several queries in one transaction.
+- **Per-query counters**: for each query label we count round trips, rows returned,
+  (estimated) bytes sent/received and latency. `print_stats()` prints a summary table
+  at the end of a stage, so we can see where Bolt time goes under concurrent load.
+
+Guiding Principles:
+1. **Offline & local**: Still a local Neo4j instance; nothing leaves the machine.
+2. **One driver per process**: Drivers are thread-safe and own the pool, so stages
+   share one Neo4jConnection and open short-lived sessions from it.
+3. **Backwards compatible**: The old constants (bolt://localhost:7687, neo4j/Neo4j420)
+   remain the defaults; environment variables override them without code edits.
+
+Environment variables (all optional):
+  NEO4J_URI, NEO4J_USER, NEO4J_PASS
+  NEO4J_POOL_SIZE          (default 50)
+  NEO4J_ACQUIRE_TIMEOUT    (seconds, default 60)
+  NEO4J_MAX_RETRIES        (default 3)
+  NEO4J_RETRY_BACKOFF      (seconds, base for exponential backoff, default 0.2)
+
+Byte counters:
+  The Python driver does not expose raw socket byte counts, so we estimate the
+  PackStream size of parameters (sent) and returned records (received). This is
+  accurate to within a few bytes per value and good enough to spot queries that
+  ship whole embedding columns over the wire.
+
+Usage:
+    from neo4j_connection import Neo4jConnection
+
+    conn = Neo4jConnection.from_env()
+    rows = conn.run_read(
+        "MATCH (c:Chunk) RETURN c.chunk_id AS chunk_id",
+        label="example.list_chunks"
+    )
+    conn.run_write("MERGE (d:Document {doc_id: $doc_id})", {"doc_id": "a.txt"})
+    conn.print_stats()
+    conn.close()
+"""
+
+import os
+import time
+import random
+import threading
+
+from neo4j import GraphDatabase, basic_auth, READ_ACCESS, WRITE_ACCESS
+from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
+
+
+# Defaults (same values the individual scripts used to hard-code)
+NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.environ.get("NEO4J_USER", "neo4j")
+NEO4J_PASS = os.environ.get("NEO4J_PASS", "Neo4j420")  # Replace with your actual password
+
+DEFAULT_POOL_SIZE = int(os.environ.get("NEO4J_POOL_SIZE", "50"))
+DEFAULT_ACQUIRE_TIMEOUT = float(os.environ.get("NEO4J_ACQUIRE_TIMEOUT", "60"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("NEO4J_MAX_RETRIES", "3"))
+DEFAULT_RETRY_BACKOFF = float(os.environ.get("NEO4J_RETRY_BACKOFF", "0.2"))
+
+# Errors worth retrying: the same unit of work may succeed on a fresh attempt.
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+
+def estimate_packstream_size(value) -> int:
+    """
+    Rough PackStream (Bolt wire format) size of a Python value, in bytes.
+
+    :param value: Any parameter or record value (None, bool, int, float, str,
+                  list, dict, or a driver type such as a Node).
+    :return: Estimated number of bytes on the wire.
+    """
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, int):
+        if -16 <= value < 128:
+            return 1
+        if -2**31 <= value < 2**31:
+            return 5
+        return 9
+    if isinstance(value, float):
+        return 9
+    if isinstance(value, str):
+        n = len(value.encode("utf-8"))
+        return n + (1 if n < 16 else 2 if n < 256 else 3 if n < 65536 else 5)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) + 5
+    if isinstance(value, dict):
+        return 5 + sum(estimate_packstream_size(k) + estimate_packstream_size(v)
+                       for k, v in value.items())
+    if isinstance(value, (list, tuple)) and value and isinstance(value[0], float):
+        # Fast path for embeddings: assume a homogeneous list of floats
+        return 5 + 9 * len(value)
+    if isinstance(value, (list, tuple, set)):
+        return 5 + sum(estimate_packstream_size(v) for v in value)
+    # Nodes/relationships or other driver objects: fall back to their string form
+    return len(str(value))
+
+
+class QueryStats:
+    """
+    Counters for one query label. All fields are cumulative since the connection
+    was opened (or since the last reset_stats()).
+    """
+
+    def __init__(self):
+        self.round_trips = 0
+        self.rows = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.retries = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        avg = self.total_latency / self.round_trips if self.round_trips else 0.0
+        return {
+            "round_trips": self.round_trips,
+            "rows": self.rows,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "total_latency_s": self.total_latency,
+            "avg_latency_s": avg,
+            "max_latency_s": self.max_latency,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+
+class Neo4jConnection:
+    """
+    A pooled, retrying, instrumented wrapper around one neo4j.Driver.
+
+    Instances are thread-safe: the driver handles concurrent sessions and the
+    counters are guarded by a lock.
+    """
+
+    def __init__(
+        self,
+        uri: str = NEO4J_URI,
+        user: str = NEO4J_USER,
+        password: str = NEO4J_PASS,
+        max_pool_size: int = DEFAULT_POOL_SIZE,
+        acquisition_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+        driver=None
+    ):
+        """
+        :param uri: Bolt URI, e.g. "bolt://localhost:7687"
+        :param user: Neo4j user name
+        :param password: Neo4j password
+        :param max_pool_size: Maximum number of pooled Bolt connections
+        :param acquisition_timeout: Seconds to wait for a free pooled connection
+        :param max_retries: How many times a unit of work is retried on a transient error
+        :param retry_backoff: Base delay in seconds; attempt n sleeps ~ base * 2**n
+        :param driver: Optional pre-built driver (mainly for tests / stand-in servers)
+        """
+        self.uri = uri
+        self.user = user
+        self.max_pool_size = max_pool_size
+        self.acquisition_timeout = acquisition_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        if driver is None:
+            driver = GraphDatabase.driver(
+                uri,
+                auth=basic_auth(user, password),
+                max_connection_pool_size=max_pool_size,
+                connection_acquisition_timeout=acquisition_timeout,
+            )
+        self.driver = driver
+
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """
+        Build a connection from NEO4J_* environment variables (or the defaults
+        above). Any keyword argument overrides the corresponding setting.
+        """
+        return cls(**overrides)
+
+    # ------------------------------------------------------------------
+    # Context manager / lifecycle
+    # ------------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Close the driver and its pool."""
+        self.driver.close()
+
+    def session(self, write: bool = True, **kwargs):
+        """
+        Open a raw session for callers that need full control. Queries run through
+        a raw session are not counted; prefer run_read/run_write.
+        """
+        mode = WRITE_ACCESS if write else READ_ACCESS
+        return self.driver.session(default_access_mode=mode, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Managed transactions
+    # ------------------------------------------------------------------
+    def run_read(self, query: str, params: dict = None, label: str = None) -> list:
+        """
+        Run one read query in a managed read transaction and return all rows.
+
+        :param query: Cypher text (use $parameters, not string formatting)
+        :param params: Parameter dict
+        :param label: Name under which the query is counted in stats
+        :return: list of dicts, one per record
+        """
+        return self._execute(query, params, label, write=False)
+
+    def run_write(self, query: str, params: dict = None, label: str = None) -> list:
+        """
+        Run one write query in a managed write transaction and return all rows.
+        See run_read for parameters.
+        """
+        return self._execute(query, params, label, write=True)
+
+    def read_tx(self, work, label: str = "read_tx", session=None, max_retries: int = None):
+        """
+        Run work(tx) in a read transaction with retry. `tx` is a CountingTransaction,
+        so every tx.run(...) inside `work` is counted under `label`.
+
+        :param session: Optional long-lived session (e.g. one per worker thread).
+                        If None, a short-lived session is opened per attempt.
+        :param max_retries: Override the connection's retry count for this call
+        :return: whatever `work` returns
+        """
+        return self._retry(work, label, write=False, session=session, max_retries=max_retries)
+
+    def write_tx(self, work, label: str = "write_tx", session=None, max_retries: int = None):
+        """
+        Run work(tx) in a write transaction with retry. See read_tx.
+        """
+        return self._retry(work, label, write=True, session=session, max_retries=max_retries)
+
+    def _execute(self, query, params, label, write):
+        if label is None:
+            label = " ".join(query.split())[:60]
+
+        def work(tx):
+            return tx.run(query, params or {})
+
+        return self._retry(work, label, write)
+
+    def _retry(self, work, label, write, session=None, max_retries=None):
+        if max_retries is None:
+            max_retries = self.max_retries
+        attempt = 0
+        while True:
+            try:
+                # Leaving the transaction block commits on success, rolls back on error
+                if session is not None:
+                    with session.begin_transaction() as tx:
+                        result = work(CountingTransaction(tx, self, label))
+                else:
+                    with self.session(write=write) as own_session:
+                        with own_session.begin_transaction() as tx:
+                            result = work(CountingTransaction(tx, self, label))
+                return result
+            except RETRYABLE_ERRORS as e:
+                if attempt >= max_retries:
+                    self._record_error(label)
+                    raise
+                delay = self.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+                self._record_retry(label)
+                print(f"[neo4j_connection] Transient error on '{label}' "
+                      f"(attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+            except Exception:
+                self._record_error(label)
+                raise
+
+    # ------------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------------
+    def _get(self, label) -> QueryStats:
+        st = self._stats.get(label)
+        if st is None:
+            st = self._stats[label] = QueryStats()
+        return st
+
+    def record_round_trip(self, label, rows, bytes_sent, bytes_received, latency):
+        with self._lock:
+            st = self._get(label)
+            st.round_trips += 1
+            st.rows += rows
+            st.bytes_sent += bytes_sent
+            st.bytes_received += bytes_received
+            st.total_latency += latency
+            st.max_latency = max(st.max_latency, latency)
+
+    def _record_retry(self, label):
+        with self._lock:
+            self._get(label).retries += 1
+
+    def _record_error(self, label):
+        with self._lock:
+            self._get(label).errors += 1
+
+    def stats(self) -> dict:
+        """Return {label: counters_dict} for every query label seen so far."""
+        with self._lock:
+            return {label: st.as_dict() for label, st in self._stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    def print_stats(self, prefix: str = "neo4j_connection"):
+        """
+        Print a per-label summary table: round trips, rows, KB sent/received,
+        total and average latency. Sorted by total latency, slowest first.
+        """
+        stats = self.stats()
+        if not stats:
+            print(f"[{prefix}] No Neo4j queries recorded.")
+            return
+        print(f"[{prefix}] Neo4j query stats (pool size={self.max_pool_size}):")
+        print(f"  {'label':<40} {'trips':>7} {'rows':>9} {'KB out':>9} {'KB in':>10} "
+              f"{'total s':>9} {'avg ms':>8} {'retries':>7}")
+        for label, st in sorted(stats.items(), key=lambda kv: kv[1]["total_latency_s"], reverse=True):
+            print(f"  {label[:40]:<40} {st['round_trips']:>7} {st['rows']:>9} "
+                  f"{st['bytes_sent'] / 1024:>9.1f} {st['bytes_received'] / 1024:>10.1f} "
+                  f"{st['total_latency_s']:>9.3f} {st['avg_latency_s'] * 1000:>8.2f} {st['retries']:>7}")
+
+
+class CountingTransaction:
+    """
+    Thin proxy around a neo4j Transaction. Each run() is one round trip: we drain
+    the result into a list of dicts and record rows, estimated bytes and latency.
+    """
+
+    def __init__(self, tx, conn: Neo4jConnection, label: str):
+        self._tx = tx
+        self._conn = conn
+        self._label = label
+
+    def run(self, query: str, params: dict = None, **kwargs) -> list:
+        params = dict(params or {}, **kwargs)
+        start = time.perf_counter()
+        result = self._tx.run(query, params)
+        rows = [record.data() for record in result]
+        latency = time.perf_counter() - start
+        self._conn.record_round_trip(
+            self._label,
+            rows=len(rows),
+            bytes_sent=estimate_packstream_size(query) + estimate_packstream_size(params),
+            bytes_received=estimate_packstream_size(rows),
+            latency=latency,
+        )
+        return rows
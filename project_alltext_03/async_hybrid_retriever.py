@@ -0,0 +1,178 @@
+"""
+async_hybrid_retriever.py
+
+An **asyncio** variant of `hybrid_retriever.hybrid_retrieve` that overlaps the
+independent retrieval phases, honours a per-request deadline and reports a
+per-phase latency breakdown with the results.
+
+Why:
+----
+`hybrid_retrieve` runs three blocking steps back to back:
+    embedding retrieval (full scan incl. content) -> topic discovery -> topic expansion
+so a request's latency is the sum of all of them, and one slow query stalls the caller.
+
+Phases in this variant:
+-----------------------
+  1) "score": score the query against the caller's resident VectorIndex (ids,
+     embeddings and topic ids only; required, since loading the whole corpus per
+     request would dwarf every other phase). The topic ids of the top_n_topic winners tell us which topics are relevant, so topic
+     discovery no longer needs the chunks' content.
+  2) "fetch" and "expand" run **concurrently**:
+       - fetch: content for the top_k ids (vector_index.fetch_chunk_contents)
+       - expand: all relevant topics in one round trip
+         (topic_retriever.retrieve_by_topic_batched)
+  3) "fuse": score expansions and merge (hybrid_retriever.fuse_results).
+
+Concurrency model:
+------------------
+Our Neo4j access goes through the shared, synchronous `Neo4jConnection` (pool,
+retries, per-query stats). Rather than maintaining a second, async driver, the
+blocking calls run on a thread pool via `loop.run_in_executor`; the driver's
+connection pool serves the concurrent sessions. The event loop is free while the
+queries are in flight, so many requests can be in progress at once.
+
+Deadline:
+---------
+`deadline_s` is a per-request budget in seconds. If the score/fetch phases miss
+it, asyncio.TimeoutError is raised. If only the topic expansion misses it, we
+return the embedding-only results and set "degraded": True, so the caller still
+gets an answer on time.
+
+Cancelling the awaiting task cannot stop an executor thread that is blocked in a
+Neo4j query, so the budget left when each query starts is also passed down as
+its transaction timeout: the server aborts a query that would outlive the
+deadline, which frees its thread and pooled session instead of piling them up.
+
+Usage:
+------
+    import asyncio
+    from async_hybrid_retriever import hybrid_retrieve_async
+    from vector_index import VectorIndex
+
+    index = VectorIndex.from_neo4j(conn)      # once, reused across requests
+    result = asyncio.run(hybrid_retrieve_async(conn, query_vec, top_k=5, index=index,
+                                               deadline_s=0.5))
+    result["results"]   # same chunk dicts as hybrid_retrieve
+    result["timings"]   # {"score_ms":..., "fetch_ms":..., "expand_ms":..., "fuse_ms":..., "total_ms":...}
+"""
+
+import time
+import asyncio
+from typing import Dict
+
+import numpy as np
+
+from vector_index import VectorIndex, fetch_chunk_contents
+from topic_retriever import retrieve_by_topic_batched
+from hybrid_retriever import score_expansions, fuse_results
+
+
+async def _timed(loop, executor, timings: Dict, phase: str, func, *args):
+    """Run func(*args) on the executor and record its wall time as timings[phase_ms]."""
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    finally:
+        timings[f"{phase}_ms"] = (time.perf_counter() - start) * 1000.0
+
+
+async def hybrid_retrieve_async(
+    conn,
+    query_embedding: np.ndarray,
+    top_k: int = 5,
+    top_n_topic: int = 3,
+    topic_weight: float = 0.3,
+    max_per_topic: int = 5,
+    index: VectorIndex = None,
+    deadline_s: float = None,
+    executor=None
+) -> Dict:
+    """
+    Asynchronous hybrid retrieval with overlapped phases and a deadline.
+
+    :param conn: The shared neo4j_connection.Neo4jConnection
+    :param query_embedding: The user query as a numpy vector
+    :param top_k: How many chunks to return
+    :param top_n_topic: Inspect the top 'top_n_topic' embedding results to guess topics
+    :param topic_weight: fraction for the 'topic' portion of the final score
+    :param max_per_topic: expansion chunks per relevant topic
+    :param index: resident VectorIndex (required; build it once with
+                  VectorIndex.from_neo4j and reuse it across requests)
+    :param deadline_s: per-request budget in seconds (None = no deadline)
+    :param executor: optional concurrent.futures executor for the blocking calls
+                     (defaults to the event loop's default thread pool)
+    :return: {
+               "results": [chunk dicts as returned by hybrid_retrieve],
+               "timings": {"score_ms", "fetch_ms", "expand_ms", "fuse_ms", "total_ms"},
+               "degraded": True if topic expansion was dropped to meet the deadline
+             }
+    :raises asyncio.TimeoutError: if the embedding results cannot be produced in time
+    :raises ValueError: if no index is passed
+    """
+    if index is None:
+        raise ValueError("[async_hybrid_retriever] A resident VectorIndex is required; "
+                         "load it once with VectorIndex.from_neo4j(conn) and pass index=")
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    deadline = start + deadline_s if deadline_s is not None else None
+    timings = {}
+
+    def remaining():
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.perf_counter())
+
+    def tx_timeout():
+        # Evaluated when the query starts on its thread; at least 1 ms, as a
+        # timeout of 0 means "no timeout" to Neo4j
+        if deadline is None:
+            return None
+        return max(0.001, deadline - time.perf_counter())
+
+    # 1) score: ids + embeddings only
+    def score():
+        ids, sims = index.search(query_embedding, k=top_k)
+        topics = [index.topic_of(cid) for cid in ids]
+        return ids, sims, topics
+
+    def fetch():
+        return fetch_chunk_contents(conn, top_ids, timeout=tx_timeout())
+
+    def expand():
+        return retrieve_by_topic_batched(conn, relevant_topic_ids, max_per_topic, timeout=tx_timeout())
+
+    top_ids, top_sims, top_topics = await asyncio.wait_for(
+        _timed(loop, executor, timings, "score", score), timeout=remaining())
+
+    relevant_topic_ids = {t for t in top_topics[:top_n_topic] if t is not None}
+
+    # 2) fetch content and expand topics concurrently
+    fetch_task = asyncio.ensure_future(_timed(loop, executor, timings, "fetch", fetch))
+    expand_task = asyncio.ensure_future(_timed(loop, executor, timings, "expand", expand))
+
+    try:
+        contents = await asyncio.wait_for(fetch_task, timeout=remaining())
+    except asyncio.TimeoutError:
+        expand_task.cancel()
+        raise
+
+    degraded = False
+    try:
+        expansions = await asyncio.wait_for(expand_task, timeout=remaining())
+    except asyncio.TimeoutError:
+        # Answer on time without the topic signal
+        expansions = []
+        degraded = True
+
+    # 3) fuse
+    fuse_start = time.perf_counter()
+    embed_results = [
+        {"chunk_id": cid, "content": contents.get(cid, ""), "topic_id": tid, "sim": sim}
+        for cid, sim, tid in zip(top_ids, top_sims, top_topics)
+    ]
+    expansion_sims = score_expansions(expansions, query_embedding)
+    results = fuse_results(embed_results, expansions, expansion_sims, topic_weight, top_k)
+    timings["fuse_ms"] = (time.perf_counter() - fuse_start) * 1000.0
+    timings["total_ms"] = (time.perf_counter() - start) * 1000.0
+
+    return {"results": results, "timings": timings, "degraded": degraded}
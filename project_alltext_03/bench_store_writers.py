@@ -0,0 +1,181 @@
+"""
+bench_store_writers.py
+
+Benchmarks `store_in_neo4j --writers N` against a local **stand-in server**, so we
+can see how ingest throughput scales with the number of writer threads without
+needing a real Neo4j instance (or disturbing the one holding our data).
+
+The stand-in server is an in-process fake driver that models the costs that
+matter for batched ingestion:
+  - a fixed network round-trip time per query (rtt_ms),
+  - server CPU work proportional to the rows in each UNWIND batch (row_cost_ms),
+    limited to `cores` concurrent queries (a semaphore stands in for the server's
+    worker threads),
+  - occasional deadlocks on the shared Document uniqueness index
+    (deadlock_rate), raised as neo4j.exceptions.TransientError so the real
+    retry path in neo4j_connection.py is exercised.
+
+If writers scale properly, throughput should grow roughly linearly until
+`writers` reaches `cores`, then flatten.
+
+Usage:
+    python bench_store_writers.py [--docs 200] [--chunks-per-doc 50] [--cores 4]
+                                  [--writers 1,2,4,8] [--batch-size 500]
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+from neo4j.exceptions import TransientError
+
+from neo4j_connection import Neo4jConnection
+from store_in_neo4j import write_batches, write_parallel
+
+
+class _StandInRecord:
+    def __init__(self, values: dict):
+        self._values = values
+
+    def data(self) -> dict:
+        return dict(self._values)
+
+
+class _StandInTransaction:
+    def __init__(self, server):
+        self._server = server
+
+    def run(self, query: str, params: dict = None):
+        return self._server.execute(query, params or {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _StandInSession:
+    def __init__(self, server):
+        self._server = server
+
+    def begin_transaction(self):
+        return _StandInTransaction(self._server)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class StandInDriver:
+    """
+    Minimal driver-compatible object simulating a Neo4j server with `cores`
+    worker threads. Only the parts of the driver API used by Neo4jConnection
+    (session/begin_transaction/run/close) are implemented.
+    """
+
+    def __init__(self, cores: int = 4, rtt_ms: float = 0.5, row_cost_ms: float = 0.05,
+                 deadlock_rate: float = 0.01, seed: int = 0):
+        self.cores = threading.Semaphore(cores)
+        self.rtt = rtt_ms / 1000.0
+        self.row_cost = row_cost_ms / 1000.0
+        self.deadlock_rate = deadlock_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.deadlocks = 0
+
+    def session(self, **kwargs):
+        return _StandInSession(self)
+
+    def close(self):
+        pass
+
+    def execute(self, query: str, params: dict) -> list:
+        time.sleep(self.rtt)
+        rows = len(params.get("rows") or params.get("doc_ids") or [None])
+        with self.cores:
+            if "Document" in query and "UNWIND" in query:
+                with self.rng_lock:
+                    deadlock = self.rng.random() < self.deadlock_rate
+                if deadlock:
+                    self.deadlocks += 1
+                    raise TransientError("Neo.TransientError.Transaction.DeadlockDetected (stand-in)")
+            time.sleep(rows * self.row_cost)
+        return [_StandInRecord({})]
+
+
+def make_corpus(path: str, docs: int, chunks_per_doc: int, dim: int = 384, seed: int = 0):
+    """Write a synthetic embedded_data.json with docs x chunks_per_doc chunks."""
+    rng = random.Random(seed)
+    files = []
+    for d in range(docs):
+        name = f"doc_{d}.txt"
+        files.append({
+            "file_name": name,
+            "chunks": [{
+                "chunk_id": f"{name}_par_{c}",
+                "modality": "text",
+                "content": f"synthetic chunk {c} of {name}",
+                "embedding": [rng.random() for _ in range(dim)],
+                "metadata": {"file_name": name, "paragraph_index": c},
+                "textual_modality": "wrapped_paragraph"
+            } for c in range(chunks_per_doc)]
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"files": files}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel Neo4j ingestion against a stand-in server.")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--chunks-per-doc", type=int, default=50)
+    parser.add_argument("--cores", type=int, default=4, help="Simulated server cores.")
+    parser.add_argument("--writers", type=str, default="1,2,4,8", help="Comma-separated writer counts.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=0.5)
+    parser.add_argument("--row-cost-ms", type=float, default=0.05)
+    parser.add_argument("--deadlock-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    writer_counts = [int(w) for w in args.writers.split(",") if w.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "embedded_data.json")
+        make_corpus(corpus, args.docs, args.chunks_per_doc)
+        with open(corpus, "r", encoding="utf-8") as f:
+            files_list = json.load(f)["files"]
+        total_chunks = args.docs * args.chunks_per_doc
+        print(f"[bench_store_writers] {args.docs} docs, {total_chunks} chunks, "
+              f"{args.cores} simulated cores, batch size {args.batch_size}")
+
+        results = []
+        for writers in writer_counts:
+            driver = StandInDriver(cores=args.cores, rtt_ms=args.rtt_ms, row_cost_ms=args.row_cost_ms,
+                                   deadlock_rate=args.deadlock_rate)
+            conn = Neo4jConnection(driver=driver, max_pool_size=max(writers, 1), retry_backoff=0.01)
+            # Time only the write phase (the JSON is loaded once, outside the loop)
+            start = time.perf_counter()
+            if writers > 1:
+                write_parallel(conn, files_list, writers, args.batch_size)
+            else:
+                write_batches(conn, files_list, args.batch_size)
+            elapsed = time.perf_counter() - start
+            retries = sum(st["retries"] for st in conn.stats().values())
+            results.append((writers, elapsed, retries))
+
+    base = results[0][1] if results else 0.0
+    print("\n[bench_store_writers] Results:")
+    print(f"  {'writers':>7} {'seconds':>9} {'docs/s':>9} {'chunks/s':>10} {'speedup':>8} {'retries':>8}")
+    for writers, elapsed, retries in results:
+        print(f"  {writers:>7} {elapsed:>9.2f} {args.docs / elapsed:>9.1f} {total_chunks / elapsed:>10.1f} "
+              f"{base / elapsed:>8.2f} {retries:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,15 @@ This script is the **main orchestrator** for creating similarity relationships
 between chunk nodes in Neo4j. It leverages two separate modules for clarity:
 
   1) `embedding_relationships.py`: 
-      - compute_embedding_similarity_topk(driver, k=5)
-      - compute_embedding_similarity_threshold(driver, threshold=0.75)
+      - compute_embedding_similarity_topk(conn, k=5)
+      - compute_embedding_similarity_threshold(conn, threshold=0.75)
 
      These functions create :EMBEDDING_SIM edges among chunks, based on stored
      embeddings. For each chunk, you can connect to top-K nearest neighbors or
      connect all pairs above a chosen similarity threshold.
 
   2) `topic_relationships.py`:
-      - compute_topic_similarity(driver, full_clique=True, top_k=5)
+      - compute_topic_similarity(conn, full_clique=True, top_k=5)
 
      This function creates :TOPIC_SIM edges among chunks that share the same
      topic_id (usually assigned by a topic model like BERTopic). You can create a
@@ -50,11 +50,15 @@ Examples:
 You can combine them, for instance:
   python compute_relationships.py --embedding threshold=0.75 --topic topK=3
 
+The same work is available as a function, compute_relationships(conn, ...), which
+run_pipeline.py's in-process mode calls with its shared connection.
+
 This script then:
-  1) Connects to Neo4j.
+  1) Connects to Neo4j through the shared neo4j_connection.Neo4jConnection.
   2) If --embedding is set, calls either compute_embedding_similarity_topk(...) or compute_embedding_similarity_threshold(...).
   3) If --topic is set, calls compute_topic_similarity(...).
-  4) Closes the driver.
+  4) Bumps the store version (store_version.py) so query caches are invalidated.
+  5) Prints per-query Bolt stats and closes the connection.
 
 **Performance notes**: For large numbers of chunks, consider approximate indexing
 (e.g., FAISS) for embeddings, and partial approach for topics to avoid big cliques.
@@ -63,47 +67,22 @@ This script then:
 
 import argparse
 import sys
-from neo4j import GraphDatabase, basic_auth
 
 # Local modules:
+from neo4j_connection import Neo4jConnection
 from embedding_relationships import (
     compute_embedding_similarity_topk,
     compute_embedding_similarity_threshold
 )
 from topic_relationships import compute_topic_similarity
+from store_version import bump_store_version
+from profiling import profile_stage
 
-# Hard-coded or external config for Neo4j:
-NEO4J_URI = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASS = "Neo4j420"  # <--- Replace with your actual password or load from environment
-
-
-def main():
-    """
-    The main entry point. Parses command-line arguments to determine:
-      - whether to compute embedding-based relationships
-      - whether to compute topic-based relationships
-      - the parameters (topK, threshold, fullClique, etc.)
-
-    Then connects to Neo4j, calls the relevant functions, and exits.
-    """
-
-    parser = argparse.ArgumentParser(
-        description="Compute chunk-chunk similarity relationships in Neo4j (embedding & topic)."
-    )
-    parser.add_argument("--embedding", action="store_true",
-                        help="Compute EMBEDDING_SIM edges among chunks using stored embeddings.")
-    parser.add_argument("--topic", action="store_true",
-                        help="Compute TOPIC_SIM edges among chunks sharing the same topic_id.")
-
-    # Additional parameters come as free-form tokens like "threshold=0.75", "topK=5", "fullClique"
-    parser.add_argument("params", nargs="*", default=[],
-                        help="Parameters: threshold=0.75, topK=5, fullClique, etc. See docs.")
-    args = parser.parse_args()
 
-    # Parse param tokens into a dict
+def parse_params(tokens: list) -> dict:
+    """Free-form tokens ("threshold=0.8", "topK=5", "fullClique") -> dict."""
     params_dict = {}
-    for token in args.params:
+    for token in tokens:
         if "=" in token:
             # e.g. "threshold=0.8"
             key, val = token.split("=", 1)
@@ -113,39 +92,95 @@ def main():
         else:
             # e.g. "fullClique"
             params_dict[token.strip()] = True
+    return params_dict
 
-    # Connect to Neo4j
-    print(f"[compute_relationships] Connecting to Neo4j: {NEO4J_URI} with user '{NEO4J_USER}'")
-    driver = GraphDatabase.driver(NEO4J_URI, auth=basic_auth(NEO4J_USER, NEO4J_PASS))
+
+def compute_relationships(conn: Neo4jConnection, embedding: bool = False, topic: bool = False,
+                          params: dict = None):
+    """
+    Create the requested relationship types and bump the store version if anything changed.
+
+    :param conn: shared Neo4jConnection (left open)
+    :param embedding: compute EMBEDDING_SIM edges
+    :param topic: compute TOPIC_SIM edges
+    :param params: parsed parameters (see parse_params), e.g. {"topK": "5"}
+    """
+    params_dict = params or {}
 
     # EMBEDDING_SIM
-    if args.embedding:
+    if embedding:
         # Check if we have topK or threshold in params
         if "topK" in params_dict:
             k_val = int(params_dict["topK"])
-            compute_embedding_similarity_topk(driver, k=k_val)
+            compute_embedding_similarity_topk(conn, k=k_val)
         elif "threshold" in params_dict:
             thr_val = float(params_dict["threshold"])
-            compute_embedding_similarity_threshold(driver, threshold=thr_val)
+            compute_embedding_similarity_threshold(conn, threshold=thr_val)
         else:
             # Default approach: threshold=0.75
-            compute_embedding_similarity_threshold(driver, threshold=0.75)
+            compute_embedding_similarity_threshold(conn, threshold=0.75)
 
     # TOPIC_SIM
-    if args.topic:
+    if topic:
         # Check if fullClique or partial approach
         if "fullClique" in params_dict or "fullclique" in params_dict:
-            compute_topic_similarity(driver, full_clique=True)
+            compute_topic_similarity(conn, full_clique=True)
         elif "topK" in params_dict:
             tk = int(params_dict["topK"])
-            compute_topic_similarity(driver, full_clique=False, top_k=tk)
+            compute_topic_similarity(conn, full_clique=False, top_k=tk)
         else:
             # default is full clique
-            compute_topic_similarity(driver, full_clique=True)
+            compute_topic_similarity(conn, full_clique=True)
+
+    # New edges change retrieval results: invalidate query-time caches
+    if embedding or topic:
+        version = bump_store_version(conn, "compute_relationships")
+        print(f"[compute_relationships] Store version is now {version}.")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """CLI flags; run_pipeline.py also parses --relationship-args with this."""
+    parser = argparse.ArgumentParser(
+        description="Compute chunk-chunk similarity relationships in Neo4j (embedding & topic)."
+    )
+    parser.add_argument("--embedding", action="store_true",
+                        help="Compute EMBEDDING_SIM edges among chunks using stored embeddings.")
+    parser.add_argument("--topic", action="store_true",
+                        help="Compute TOPIC_SIM edges among chunks sharing the same topic_id.")
+
+    # Additional parameters come as free-form tokens like "threshold=0.75", "topK=5", "fullClique"
+    parser.add_argument("params", nargs="*", default=[],
+                        help="Parameters: threshold=0.75, topK=5, fullClique, etc. See docs.")
+    return parser
+
+
+def main():
+    """
+    The main entry point. Parses command-line arguments to determine:
+      - whether to compute embedding-based relationships
+      - whether to compute topic-based relationships
+      - the parameters (topK, threshold, fullClique, etc.)
+
+    Then connects to Neo4j, calls the relevant functions, and exits.
+    """
+
+    args = build_parser().parse_args()
+
+    # Parse param tokens into a dict
+    params_dict = parse_params(args.params)
+
+    # Connect to Neo4j (URI/credentials/pool settings come from NEO4J_* env vars)
+    conn = Neo4jConnection.from_env()
+    print(f"[compute_relationships] Connecting to Neo4j: {conn.uri} with user '{conn.user}'")
+
+    compute_relationships(conn, embedding=args.embedding, topic=args.topic, params=params_dict)
 
-    driver.close()
+    conn.print_stats(prefix="compute_relationships")
+    conn.close()
     print("[compute_relationships] Done.")
 
 
 if __name__ == "__main__":
-    main()
+    # Profiled if PIPELINE_PROFILE selects this stage (see profiling.py)
+    with profile_stage("compute_relationships"):
+        main()
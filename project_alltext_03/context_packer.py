@@ -0,0 +1,230 @@
+"""
+context_packer.py
+
+Packs retrieved chunks into a **token budget** for the LLM prompt. The old
+`build_prompt` concatenated whole chunks with no length control: a few large table
+or PDF chunks could produce a prompt of many thousands of tokens (slow prefill),
+while short chunks left most of the context window unused.
+
+How packing works:
+------------------
+1) Chunks are taken in descending score order (highest similarity first).
+2) Each chunk is split into sentences (also at line breaks, so table rows count as
+   sentences). Sentences already packed from an earlier chunk are dropped, which
+   removes duplicate text across overlapping chunks (boilerplate headers, repeated
+   paragraphs, etc.).
+3) If what is left of the chunk fits into the remaining budget it is packed whole;
+   otherwise it is truncated at the last sentence boundary that still fits. Chunks
+   that cannot contribute a single sentence are skipped, so a smaller, lower-ranked
+   chunk may still fit after a large one.
+4) Packing stops once the budget is used up. The result reports the token count
+   and which chunks were truncated, deduplicated or dropped.
+
+Tokenizers are pluggable (see get_tokenizer):
+  - "approx"              : regex word/punctuation count, no dependencies (default)
+  - "hf:<model name>"     : a Hugging Face tokenizer (needs `transformers`)
+  - "tiktoken:<encoding>" : a tiktoken encoding (needs `tiktoken`)
+  - or any object with a `count(text) -> int` method.
+
+Guiding Principles:
+1. **Predictable prefill**: Prompt size is bounded by the budget, not by chunk sizes.
+2. **Best evidence first**: Budget goes to the highest-scoring chunks.
+3. **Local only**: The default tokenizer needs nothing; HF tokenizers are loaded
+   from the local cache.
+
+Usage:
+    from context_packer import pack_context, get_tokenizer
+
+    packed = pack_context(top_chunks, budget_tokens=2048, tokenizer=get_tokenizer("approx"))
+    packed["chunks"]   # [(chunk_id, packed_text, sim), ...]
+    packed["tokens"]   # tokens used by chunk text
+"""
+
+import os
+import re
+
+
+DEFAULT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "approx")
+DEFAULT_PROMPT_TOKENS = int(os.getenv("PROMPT_TOKEN_BUDGET", "3072"))
+
+# Sentences shorter than this (normalised) are never deduplicated: short strings such
+# as "Total" or "N/A" legitimately repeat across table chunks.
+MIN_DEDUP_CHARS = 20
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\s*\n+\s*")
+_APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class ApproxTokenizer:
+    """Counts words and punctuation marks; close to BPE counts for English prose."""
+
+    name = "approx"
+
+    def count(self, text: str) -> int:
+        return len(_APPROX_TOKEN_RE.findall(text or ""))
+
+
+class HFTokenizer:
+    """Exact token counts from a Hugging Face tokenizer (local cache only)."""
+
+    def __init__(self, model_name: str):
+        from transformers import AutoTokenizer
+        self.name = f"hf:{model_name}"
+        self._tok = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+
+    def count(self, text: str) -> int:
+        return len(self._tok.encode(text or "", add_special_tokens=False))
+
+
+class TiktokenTokenizer:
+    """Exact token counts from a tiktoken encoding."""
+
+    def __init__(self, encoding: str):
+        import tiktoken
+        self.name = f"tiktoken:{encoding}"
+        self._enc = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self._enc.encode(text or "", disallowed_special=()))
+
+
+_TOKENIZERS = {}
+
+
+def get_tokenizer(spec=None):
+    """
+    Resolve a tokenizer spec ("approx", "hf:<model>", "tiktoken:<encoding>") or pass
+    through a tokenizer object (anything with count()). Instances are cached per spec.
+    """
+    if spec is None:
+        spec = DEFAULT_TOKENIZER
+    if not isinstance(spec, str):
+        return spec
+    if spec not in _TOKENIZERS:
+        if spec == "approx":
+            _TOKENIZERS[spec] = ApproxTokenizer()
+        elif spec.startswith("hf:"):
+            _TOKENIZERS[spec] = HFTokenizer(spec[3:])
+        elif spec.startswith("tiktoken:"):
+            _TOKENIZERS[spec] = TiktokenTokenizer(spec[len("tiktoken:"):])
+        else:
+            raise ValueError(f"[context_packer] Unknown tokenizer spec: {spec}")
+    return _TOKENIZERS[spec]
+
+
+def split_sentences(text: str) -> list:
+    """
+    Split at sentence ends and line breaks; empty pieces are dropped.
+
+    :return: [(sentence, joiner), ...] where joiner is "\n" if the sentence started
+             on a new line in the original text (table rows, list items) else " "
+    """
+    pieces, start, joiner = [], 0, " "
+    text = text or ""
+    for match in _SENTENCE_SPLIT_RE.finditer(text):
+        if text[start:match.start()].strip():
+            pieces.append((text[start:match.start()].strip(), joiner))
+        joiner = "\n" if "\n" in match.group(0) else " "
+        start = match.end()
+    if text[start:].strip():
+        pieces.append((text[start:].strip(), joiner))
+    return pieces
+
+
+def _dedup_key(sentence: str) -> str:
+    return _WHITESPACE_RE.sub(" ", sentence).strip().lower()
+
+
+def _truncate_words(text: str, budget: int, tokenizer) -> str:
+    """Longest word-boundary prefix of text within budget (binary search)."""
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if tokenizer.count(" ".join(words[:mid])) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo])
+
+
+def pack_context(top_chunks: list, budget_tokens: int = DEFAULT_PROMPT_TOKENS, tokenizer=None,
+                 chunk_overhead_tokens: int = 0) -> dict:
+    """
+    Pack chunks into at most budget_tokens tokens of chunk text.
+
+    :param top_chunks: [(chunk_id, content, sim), ...] (any order; sorted by sim here)
+    :param budget_tokens: token budget for the chunk text
+    :param tokenizer: tokenizer object or spec (see get_tokenizer)
+    :param chunk_overhead_tokens: tokens charged per packed chunk for the caller's
+                                  per-chunk header (e.g. "CHUNK #1 (id=..., sim=...):")
+    :return: {
+               "chunks": [(chunk_id, packed_text, sim), ...] in packing order,
+               "tokens": tokens used by the packed text (incl. per-chunk overhead),
+               "budget": budget_tokens,
+               "truncated": [chunk_id, ...]  cut at a sentence boundary,
+               "deduplicated": [chunk_id, ...]  had sentences removed as duplicates,
+               "dropped": [chunk_id, ...]  nothing packed
+             }
+    """
+    tokenizer = get_tokenizer(tokenizer)
+    ordered = sorted(top_chunks, key=lambda c: c[2], reverse=True)
+    seen = set()
+    packed, truncated, deduplicated, dropped = [], [], [], []
+    used = 0
+
+    for cid, content, sim in ordered:
+        remaining = budget_tokens - used - chunk_overhead_tokens
+        if remaining <= 0:
+            dropped.append(cid)
+            continue
+
+        sentences = []
+        had_duplicates = False
+        for sentence, joiner in split_sentences(content):
+            key = _dedup_key(sentence)
+            if len(key) >= MIN_DEDUP_CHARS and key in seen:
+                had_duplicates = True
+                continue
+            sentences.append((sentence, key, joiner))
+        if had_duplicates:
+            deduplicated.append(cid)
+
+        # Greedily keep whole sentences while they fit
+        kept, tokens, hard_cut = [], 0, False
+        for sentence, key, joiner in sentences:
+            # +1 for the separator that joins it to the previous sentence
+            cost = tokenizer.count(sentence) + (1 if kept else 0)
+            if tokens + cost > remaining:
+                break
+            kept.append((sentence, key, joiner))
+            tokens += cost
+
+        if not kept and sentences and not packed:
+            # The best chunk starts with a sentence larger than the whole budget
+            # (e.g. a long table row): cut it at a word boundary rather than send nothing
+            text = _truncate_words(sentences[0][0], remaining, tokenizer)
+            if text:
+                kept, tokens = [(text, sentences[0][1], "")], tokenizer.count(text)
+                hard_cut = True
+
+        if not kept:
+            dropped.append(cid)
+            continue
+        if hard_cut or len(kept) < len(sentences):
+            truncated.append(cid)
+        for _, key, _ in kept:
+            seen.add(key)
+        text = kept[0][0] + "".join(joiner + sentence for sentence, _, joiner in kept[1:])
+        packed.append((cid, text, sim))
+        used += tokens + chunk_overhead_tokens
+
+    return {
+        "chunks": packed,
+        "tokens": used,
+        "budget": budget_tokens,
+        "truncated": truncated,
+        "deduplicated": deduplicated,
+        "dropped": dropped,
+    }
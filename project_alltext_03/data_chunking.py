@@ -50,11 +50,12 @@ Desired Output Structure:
 }
 
 Usage:
-    python data_chunking.py <input_json> [output_json]
+    python data_chunking.py <input_json> [output_json] [wrap_width]
 
 Where:
 - <input_json> is a JSON file containing the list of parse results from data_extraction.
 - [output_json] is an optional path to save the chunked result.
+- [wrap_width] is the text wrap width passed to chunk_text (default WRAP_WIDTH).
 """
 
 import os
@@ -64,9 +65,70 @@ import json
 from chunk_text import chunk_text
 from chunk_table import chunk_table_rows
 from chunk_image import chunk_image_text
+from telemetry import get_telemetry
+from profiling import profile_stage
 
+# Text chunk wrap width (part of the stage fingerprint in run_pipeline.py)
+WRAP_WIDTH = 80
 
-def chunk_data(parse_results: list, output_json: str = None) -> dict:
+
+def chunk_file(file_item: dict, wrap_width: int = WRAP_WIDTH) -> dict:
+    """
+    Chunk one parse result (one element of data_extraction's list) into
+    {"file_name": <str>, "chunks": [ list of chunk dicts ]}. See chunk_data.
+
+    Used per file by chunk_data and by the streaming pipeline (streaming_pipeline.py).
+    """
+    file_name = file_item.get("file_name", "unknown_file")
+    parse_data = file_item.get("parse_data", {})
+    text_content = parse_data.get("text", "")
+    table_list = parse_data.get("tables", [])
+    images_data = parse_data.get("images", [])  # If used
+    metadata = parse_data.get("metadata", {})
+
+    # We'll gather chunk dicts here
+    chunk_list = []
+
+    # 1) Chunk the text content
+    if text_content.strip():
+        # For simplicity, we'll treat it as normal text chunking
+        # (If you specifically need chunk_image_text for OCR text, do a check or a pipeline flag)
+        text_chunks = chunk_text(
+            text_content=text_content,
+            file_name=file_name,
+            wrap_width=wrap_width
+        )
+        chunk_list.extend(text_chunks)
+
+    # 2) Chunk each table row
+    for t_idx, table_data in enumerate(table_list):
+        # We'll create row-based chunks for each table
+        # We'll pass a custom file_name that indicates table index
+        # so chunk_id doesn't overlap if there are multiple tables
+        table_name = f"{file_name}_table_{t_idx}"
+        table_chunks = chunk_table_rows(
+            table_data=table_data,
+            file_name=table_name,  # This ensures chunk_id references the correct table
+            start_index=0
+        )
+        chunk_list.extend(table_chunks)
+
+    # 3) If we have images with separate textual data, we might chunk them here
+    #    Typically, parse_image.py puts recognized text in parse_data["text"], so
+    #    images[] might not have direct text. But if it does:
+    # for img_idx, img_content in enumerate(images_data):
+    #     # if 'text' in img_content, we can chunk_image_text
+    #     # or do other chunk logic as needed.
+    #     pass
+
+    # Return the aggregated chunks
+    return {
+        "file_name": file_name,
+        "chunks": chunk_list
+    }
+
+
+def chunk_data(parse_results: list, output_json: str = None, wrap_width: int = WRAP_WIDTH) -> dict:
     """
     Given a list of parse results (each representing a file's extracted data),
     produce a chunked data structure that is easy to embed and store.
@@ -86,6 +148,9 @@ def chunk_data(parse_results: list, output_json: str = None) -> dict:
     :param output_json: If provided, the resulting chunk structure is saved to this file.
     :type output_json: str or None
 
+    :param wrap_width: Wrap width for text chunks (see chunk_text).
+    :type wrap_width: int
+
     :return: A dict with a "files" key, whose value is a list. Each element of that list
              is { "file_name": <str>, "chunks": [ list of chunk dicts ] }.
     :rtype: dict
@@ -115,53 +180,8 @@ def chunk_data(parse_results: list, output_json: str = None) -> dict:
     final_result = {"files": []}
 
     for file_item in parse_results:
-        file_name = file_item.get("file_name", "unknown_file")
-        parse_data = file_item.get("parse_data", {})
-        text_content = parse_data.get("text", "")
-        table_list = parse_data.get("tables", [])
-        images_data = parse_data.get("images", [])  # If used
-        metadata = parse_data.get("metadata", {})
-
-        # We'll gather chunk dicts here
-        chunk_list = []
-
-        # 1) Chunk the text content
-        if text_content.strip():
-            # For simplicity, we'll treat it as normal text chunking
-            # (If you specifically need chunk_image_text for OCR text, do a check or a pipeline flag)
-            text_chunks = chunk_text(
-                text_content=text_content,
-                file_name=file_name,
-                wrap_width=80
-            )
-            chunk_list.extend(text_chunks)
-
-        # 2) Chunk each table row
-        for t_idx, table_data in enumerate(table_list):
-            # We'll create row-based chunks for each table
-            # We'll pass a custom file_name that indicates table index
-            # so chunk_id doesn't overlap if there are multiple tables
-            table_name = f"{file_name}_table_{t_idx}"
-            table_chunks = chunk_table_rows(
-                table_data=table_data,
-                file_name=table_name,  # This ensures chunk_id references the correct table
-                start_index=0
-            )
-            chunk_list.extend(table_chunks)
-
-        # 3) If we have images with separate textual data, we might chunk them here
-        #    Typically, parse_image.py puts recognized text in parse_data["text"], so
-        #    images[] might not have direct text. But if it does:
-        # for img_idx, img_content in enumerate(images_data):
-        #     # if 'text' in img_content, we can chunk_image_text
-        #     # or do other chunk logic as needed.
-        #     pass
-
-        # Append the aggregated chunks
-        final_result["files"].append({
-            "file_name": file_name,
-            "chunks": chunk_list
-        })
+        final_result["files"].append(chunk_file(file_item, wrap_width=wrap_width))
+    get_telemetry().add_items("data_chunking", sum(len(f["chunks"]) for f in final_result["files"]))
 
     # If output_json is provided, save to disk
     if output_json:
@@ -175,7 +195,7 @@ def chunk_data(parse_results: list, output_json: str = None) -> dict:
 if __name__ == "__main__":
     """
     If called as a script:
-      python data_chunking.py <input_json> [output_json]
+      python data_chunking.py <input_json> [output_json] [wrap_width]
 
     <input_json> is expected to contain the parse_results from data_extraction,
     something like:
@@ -199,11 +219,12 @@ if __name__ == "__main__":
     import sys
 
     if len(sys.argv) < 2:
-        print("Usage: python data_chunking.py <input_json> [output_json]")
+        print("Usage: python data_chunking.py <input_json> [output_json] [wrap_width]")
         sys.exit(1)
 
     input_json_path = sys.argv[1]
     output_json_path = sys.argv[2] if len(sys.argv) > 2 else None
+    wrap_width_arg = int(sys.argv[3]) if len(sys.argv) > 3 else WRAP_WIDTH
 
     # Load parse results from the specified JSON file
     try:
@@ -213,8 +234,9 @@ if __name__ == "__main__":
         print(f"[data_chunking] Error loading '{input_json_path}': {e}")
         sys.exit(1)
 
-    # Chunk the data
-    chunked_result = chunk_data(parse_results_data, output_json=output_json_path)
+    # Chunk the data (profiled if PIPELINE_PROFILE selects this stage, see profiling.py)
+    with profile_stage("data_chunking"):
+        chunked_result = chunk_data(parse_results_data, output_json=output_json_path, wrap_width=wrap_width_arg)
 
     # If no output JSON given, print a summary to stdout
     if not output_json_path:
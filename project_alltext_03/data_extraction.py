@@ -32,6 +32,14 @@ Usage:
   python data_extraction.py
   # By default, it reads from the "data/" folder, calls parse_* scripts,
   # and writes "parse_results.json"
+  python data_extraction.py --resume
+  # continue an interrupted run from its last checkpoint
+  python data_extraction.py --heavy-workers 2 --heavy-memory-mb 3000 --light-workers 8
+  # resource classes: 2 concurrent OCR jobs within ~3 GB, 8 light parsers alongside
+  python data_extraction.py --queue work_queue.db --local-workers 4
+  # queue the files in shards, let 4 local worker processes (plus any started with
+  # `python data_extraction.py --queue work_queue.db --worker` on other hosts that
+  # share this directory) parse them, then merge into parse_results.json
 
 Implementation Steps:
 ---------------------
@@ -41,30 +49,189 @@ Implementation Steps:
 4) After processing all files, dump that list to parse_results.json.
 5) If run as a script, do the same. 
    So "run_script(data_extraction_py)" in run_pipeline will produce parse_results.json.
+6) The list is also returned, so run_pipeline.py's in-process mode can hand it to
+   chunking directly (output_json=None skips the file, or names a checkpoint).
+7) While writing to output_json, progress is checkpointed periodically (parse results
+   so far + number of files done, see stage_checkpoint.py); --resume continues from
+   there and produces the same parse_results.json as an uninterrupted run.
+8) With --queue, the files are split into shards on a shared work queue (work_queue.py)
+   that any number of worker processes claim under heartbeated leases. The shard
+   outputs are merged in file order, so parse_results.json is the same as from a
+   single-process run.
+9) Files are parsed concurrently in per-resource-class pools (resource_pools.py):
+   "heavy" (OCR on images, Camelot table detection on PDFs, anything over 20 MB) and
+   "light" (everything else), each with its own workers and memory budget. The
+   class and memory cost of a file are estimated from its type and size
+   (estimate_resources), so a folder of scans no longer holds up the small text
+   files behind it. Results are still collected in folder order.
 """
 
 import os
+import sys
 import json
+import time
+import argparse
 
 # your parse_* imports
-from parse_pdf import parse_pdf
+from parse_pdf import parse_pdf, HAS_CAMELOT
 from parse_docx import parse_docx
 from parse_spreadsheet import parse_spreadsheet
 from parse_text import parse_text_file
 from parse_image import parse_image
+from stage_checkpoint import StageCheckpoint, file_identity, CHECKPOINT_INTERVAL_S
+from resource_pools import ResourceScheduler, DEFAULT_RESOURCE_CLASSES
+from telemetry import get_telemetry
+from profiling import profile_stage
 
+# Resource classes: images go through docTR OCR (and PDFs through Camelot table
+# detection when it is installed); anything above LIGHT_MAX_BYTES is heavy too
+IMAGE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".gif", ".tiff"]
+LIGHT_MAX_BYTES = 20 * 1024 * 1024
+# Rough memory estimates: a fixed overhead plus a multiple of the file size
+OCR_BASE_MB = 512          # docTR detection + recognition activations
+PARSE_BASE_MB = 16
+EXPANSION = {".png": 10, ".jpg": 10, ".jpeg": 10, ".gif": 10, ".tiff": 4,   # decoded pixels
+             ".pdf": 4, ".docx": 8, ".xlsx": 20, ".xls": 20}                # parsed objects
 
-def data_extraction(data_folder="data", output_json="parse_results.json"):
+# Work-queue mode (work_queue.py): job name and files per shard
+QUEUE_JOB = "data_extraction"
+DEFAULT_SHARD_SIZE = 4
+
+
+def list_data_files(data_folder="data"):
+    """File names directly inside data_folder (subfolders are skipped)."""
+    return [name for name in os.listdir(data_folder)
+            if os.path.isfile(os.path.join(data_folder, name))]
+
+
+def extract_file(data_folder, file_name, registry=None):
+    """
+    Parse one file from data_folder into a parse result entry
+    {"file_name": ..., "parse_data": {...}}, or None if it is unsupported or fails.
+
+    Used per file by data_extraction and by the streaming pipeline (streaming_pipeline.py).
+    Each call is recorded in telemetry.py (parser, size, wall and CPU time, status).
+    """
+    full_path = os.path.join(data_folder, file_name)
+
+    print(f"[data_extraction] Processing: {file_name}")
+    # figure out extension
+    ext = os.path.splitext(file_name)[1].lower()
+
+    telemetry = get_telemetry()
+    size_bytes = os.path.getsize(full_path) if os.path.isfile(full_path) else None
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+
+    def record(parser, status):
+        telemetry.record_file("data_extraction", file_name, parser, size_bytes,
+                              time.perf_counter() - wall_start, time.thread_time() - cpu_start, status)
+
+    parser = None
+    try:
+        if ext == ".pdf":
+            parser = "parse_pdf"
+            parse_result = parse_pdf(full_path)
+        elif ext == ".docx":
+            parser = "parse_docx"
+            parse_result = parse_docx(full_path)
+        elif ext in [".xlsx", ".xls", ".csv"]:
+            parser = "parse_spreadsheet"
+            parse_result = parse_spreadsheet(full_path)
+        elif ext == ".txt":
+            parser = "parse_text"
+            parse_result = parse_text_file(full_path)
+        elif ext in IMAGE_EXTENSIONS:
+            parser = "parse_image"
+            parse_result = parse_image(full_path, registry=registry)
+        else:
+            # skip unsupported
+            print(f"[data_extraction] Skipping unsupported file type: {file_name}")
+            record("unsupported", "skipped")
+            return None
+
+        # parse_result is something like:
+        # {
+        #   "text":   <str>,
+        #   "tables": [list of tables],
+        #   "images": [],
+        #   "metadata": {...}
+        # }
+
+    except Exception as e:
+        print(f"[data_extraction] Error parsing {file_name}: {e}")
+        record(parser, "error")
+        return None
+
+    record(parser, "ok")
+    telemetry.add_items("data_extraction")
+
+    # build the entry
+    return {
+        "file_name": file_name,
+        "parse_data": parse_result
+    }
+
+
+def estimate_resources(data_folder, file_name):
+    """
+    Guess a file's resource class and peak memory from its type and size.
+
+    :return: ("heavy" | "light", estimated MB)
+    """
+    ext = os.path.splitext(file_name)[1].lower()
+    try:
+        size_mb = os.path.getsize(os.path.join(data_folder, file_name)) / (1024 * 1024)
+    except OSError:
+        # Removed or renamed since it was listed: extract_file reports and skips it
+        size_mb = 0.0
+    if ext in IMAGE_EXTENSIONS:
+        return "heavy", OCR_BASE_MB + size_mb * EXPANSION[ext]
+    cost_mb = PARSE_BASE_MB + size_mb * EXPANSION.get(ext, 2)
+    if (ext == ".pdf" and HAS_CAMELOT) or size_mb * 1024 * 1024 > LIGHT_MAX_BYTES:
+        return "heavy", cost_mb
+    return "light", cost_mb
+
+
+def extract_files(data_folder, file_names, registry=None, resource_classes=None):
+    """
+    Parse file_names concurrently, each in the pool of its resource class (see
+    resource_pools.py), and yield their entries (None for skipped files) in
+    file_names order.
+    """
+    with ResourceScheduler(resource_classes or DEFAULT_RESOURCE_CLASSES) as scheduler:
+        futures = []
+        for file_name in file_names:
+            resource_class, cost_mb = estimate_resources(data_folder, file_name)
+            futures.append(scheduler.submit(resource_class, cost_mb, extract_file,
+                                            data_folder, file_name, registry=registry))
+        for future in futures:
+            yield future.result()
+        if futures:
+            scheduler.print_stats(prefix="data_extraction")
+
+
+def data_extraction(data_folder="data", output_json="parse_results.json", registry=None,
+                    resume=False, checkpoint_interval_s=CHECKPOINT_INTERVAL_S, resource_classes=None):
     """
     Orchestrates the extraction of data from various files in 'data_folder' 
     and writes them out to 'output_json'.
 
     :param data_folder: The folder containing input files to parse.
     :type data_folder: str
-    :param output_json: The JSON file where parse results will be written.
-    :type output_json: str
+    :param output_json: The JSON file where parse results will be written (None: don't write).
+    :type output_json: str or None
+    :param registry: ModelRegistry for the OCR model; the process-wide one if None.
+    :type registry: model_registry.ModelRegistry or None
+    :param resume: continue from the checkpoint of an interrupted run (see stage_checkpoint.py).
+    :type resume: bool
+    :param checkpoint_interval_s: seconds between checkpoints (only when output_json is set).
+    :type checkpoint_interval_s: float
+    :param resource_classes: workers and memory budget per resource class
+                             (default resource_pools.DEFAULT_RESOURCE_CLASSES).
+    :type resource_classes: dict or None
 
-    :return: None, but writes parse results to output_json
+    :return: the parse results list (also written to output_json if given)
     """
 
     # We expect a structure like:
@@ -85,77 +252,146 @@ def data_extraction(data_folder="data", output_json="parse_results.json"):
 
     if not os.path.isdir(data_folder):
         print(f"[data_extraction] '{data_folder}' does not exist or is not a directory.")
-        return
+        return parse_results
 
     # scan the folder
-    for file_name in os.listdir(data_folder):
-        full_path = os.path.join(data_folder, file_name)
-        if not os.path.isfile(full_path):
-            # skip subfolders
-            continue
+    file_names = list_data_files(data_folder)
 
-        print(f"[data_extraction] Processing: {file_name}")
-        # figure out extension
-        ext = os.path.splitext(file_name)[1].lower()
+    # Checkpoints: parse results so far + how many files are done. They belong to
+    # this exact list of files (names, order, sizes, mtimes).
+    checkpoint = None
+    start = 0
+    if output_json:
+        identity = {"data_folder": data_folder,
+                    "files": [[name] + file_identity(os.path.join(data_folder, name)) for name in file_names]}
+        checkpoint = StageCheckpoint(output_json, "data_extraction", identity, checkpoint_interval_s)
+        if resume and checkpoint.resume():
+            parse_results = checkpoint.partial_records()
+            start = checkpoint.state["watermark"]
+        checkpoint.open_partial(resume=checkpoint.state is not None)
 
-        parse_result_entry = None
+    # Files are parsed concurrently (OCR apart from light parsing) but collected in
+    # folder order, so the output and the checkpoint watermark stay sequential
+    entries = extract_files(data_folder, file_names[start:], registry=registry,
+                            resource_classes=resource_classes)
+    for position, parse_result_entry in enumerate(entries, start):
+        if parse_result_entry:
+            parse_results.append(parse_result_entry)
+            if checkpoint:
+                checkpoint.append(parse_result_entry)
+        if checkpoint:
+            checkpoint.maybe_save(position + 1)
 
+    # Now we write parse_results to output_json
+    if output_json:
         try:
-            if ext == ".pdf":
-                parse_result = parse_pdf(full_path)
-            elif ext == ".docx":
-                parse_result = parse_docx(full_path)
-            elif ext in [".xlsx", ".xls", ".csv"]:
-                parse_result = parse_spreadsheet(full_path)
-            elif ext == ".txt":
-                parse_result = parse_text_file(full_path)
-            elif ext in [".png", ".jpg", ".jpeg", ".gif", ".tiff"]:
-                parse_result = parse_image(full_path)
-            else:
-                # skip unsupported
-                print(f"[data_extraction] Skipping unsupported file type: {file_name}")
-                continue
-
-            # parse_result is something like:
-            # {
-            #   "text":   <str>,
-            #   "tables": [list of tables],
-            #   "images": [],
-            #   "metadata": {...}
-            # }
-
-            # build the entry
-            parse_result_entry = {
-                "file_name": file_name,
-                "parse_data": parse_result
-            }
-
+            with open(output_json, "w", encoding="utf-8") as f:
+                json.dump(parse_results, f, indent=2)
+            print(f"[data_extraction] Wrote parse results to '{output_json}' with {len(parse_results)} file entries.")
+            checkpoint.finish()
         except Exception as e:
-            print(f"[data_extraction] Error parsing {file_name}: {e}")
-            continue
+            print(f"[data_extraction] Could not write to '{output_json}': {e}")
 
-        if parse_result_entry:
-            parse_results.append(parse_result_entry)
+    return parse_results
 
-    # Now we write parse_results to output_json
-    try:
-        with open(output_json, "w", encoding="utf-8") as f:
-            json.dump(parse_results, f, indent=2)
-        print(f"[data_extraction] Wrote parse results to '{output_json}' with {len(parse_results)} file entries.")
-    except Exception as e:
-        print(f"[data_extraction] Could not write to '{output_json}': {e}")
+
+def enqueue_extraction(queue, data_folder="data", shard_size=DEFAULT_SHARD_SIZE, job=QUEUE_JOB):
+    """
+    Coordinator: queue the files of data_folder in shards of shard_size files.
+    The job belongs to this exact list of files (names, order, sizes, mtimes).
+
+    :param queue: work_queue.WorkQueue
+    :return: number of shards still to do
+    """
+    file_names = list_data_files(data_folder)
+    params = {"data_folder": data_folder,
+              "files": [[name] + file_identity(os.path.join(data_folder, name)) for name in file_names]}
+    shards = [{"files": file_names[i:i + shard_size]} for i in range(0, len(file_names), shard_size)]
+    return queue.create_job(job, params, shards)
+
+
+def extract_shard(params, payload, registry=None):
+    """Worker: parse the files of one shard; returns their parse result entries."""
+    return [entry for entry in extract_files(params["data_folder"], payload["files"], registry=registry)
+            if entry]
+
+
+def merge_extraction(queue, output_json="parse_results.json", job=QUEUE_JOB):
+    """
+    Coordinator: concatenate the shard outputs in shard (= file) order and write
+    output_json, exactly as data_extraction() would.
+
+    :return: the parse results list
+    """
+    parse_results = [entry for shard in queue.shard_outputs(job) for entry in shard]
+    with open(output_json, "w", encoding="utf-8") as f:
+        json.dump(parse_results, f, indent=2)
+    print(f"[data_extraction] Merged {len(parse_results)} file entries into '{output_json}'.")
+    return parse_results
 
 
 def main():
     """
-    If run directly: python data_extraction.py
+    If run directly: python data_extraction.py [--resume] [--heavy-workers N] [--light-workers N]
+                                               [--heavy-memory-mb MB] [--light-memory-mb MB]
     We'll parse from 'data/' folder and write parse_results.json
+
+    Work-queue mode (several processes or hosts sharing the working directory):
+      python data_extraction.py --queue work_queue.db [--shard-size N] [--local-workers N]
+      python data_extraction.py --queue work_queue.db --worker     # on each worker host
     """
+    parser = argparse.ArgumentParser(description="Parse every file in data/ into parse_results.json.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the checkpoint of an interrupted run.")
+    parser.add_argument("--heavy-workers", type=int, default=DEFAULT_RESOURCE_CLASSES["heavy"]["workers"],
+                        help="Concurrent OCR / table-detection / very large files.")
+    parser.add_argument("--heavy-memory-mb", type=float, default=DEFAULT_RESOURCE_CLASSES["heavy"]["memory_mb"],
+                        help="Memory budget (estimated MB) of the heavy class.")
+    parser.add_argument("--light-workers", type=int, default=DEFAULT_RESOURCE_CLASSES["light"]["workers"],
+                        help="Concurrent light parses (text, CSV, DOCX, small PDFs and spreadsheets).")
+    parser.add_argument("--light-memory-mb", type=float, default=DEFAULT_RESOURCE_CLASSES["light"]["memory_mb"],
+                        help="Memory budget (estimated MB) of the light class.")
+    parser.add_argument("--queue", default=None,
+                        help="Shared work queue (SQLite file): coordinate workers instead of parsing here.")
+    parser.add_argument("--worker", action="store_true",
+                        help="With --queue: claim and parse shards until none are left.")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help="With --queue: files per shard.")
+    parser.add_argument("--local-workers", type=int, default=0,
+                        help="With --queue: also start this many worker processes on this host.")
+    args = parser.parse_args()
+
     data_folder = "data"
     output_json = "parse_results.json"
+    resource_classes = {
+        "heavy": {"workers": args.heavy_workers, "memory_mb": args.heavy_memory_mb},
+        "light": {"workers": args.light_workers, "memory_mb": args.light_memory_mb},
+    }
 
-    data_extraction(data_folder=data_folder, output_json=output_json)
+    if not args.queue:
+        data_extraction(data_folder=data_folder, output_json=output_json, resume=args.resume,
+                        resource_classes=resource_classes)
+        return
+
+    # Imported here: only the work-queue mode needs it
+    from work_queue import WorkQueue, run_worker, coordinate
+
+    queue = WorkQueue(args.queue)
+    if args.worker:
+        run_worker(queue, QUEUE_JOB, extract_shard)
+        return
+    if not os.path.isdir(data_folder):
+        print(f"[data_extraction] '{data_folder}' does not exist or is not a directory.")
+        return
+    enqueue_extraction(queue, data_folder, shard_size=max(1, args.shard_size))
+    if not coordinate(queue, QUEUE_JOB, os.path.abspath(__file__), ["--queue", args.queue, "--worker"],
+                      local_workers=args.local_workers):
+        print("[data_extraction] Work queue job did not finish; parse_results.json not written.")
+        sys.exit(1)
+    merge_extraction(queue, output_json)
 
 
 if __name__ == "__main__":
-    main()
+    # Profiled if PIPELINE_PROFILE selects this stage (see profiling.py)
+    with profile_stage("data_extraction"):
+        main()
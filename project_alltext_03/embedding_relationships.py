@@ -5,12 +5,12 @@ This module handles creation of "EMBEDDING_SIM" relationships among chunk nodes
 based on their vector embeddings. The embeddings themselves are stored in Neo4j under
 each Chunk node as a property `embedding: [ float, ... ]`. We provide two main functions:
 
-1) compute_embedding_similarity_topk(driver, k=5)
+1) compute_embedding_similarity_topk(conn, k=5)
    - For each chunk, find the top-K nearest neighbors by cosine similarity 
      (naive O(N^2) approach). Create EMBEDDING_SIM edges with an 'embedding_similarity'
      property reflecting their similarity score.
 
-2) compute_embedding_similarity_threshold(driver, threshold=0.75)
+2) compute_embedding_similarity_threshold(conn, threshold=0.75)
    - For each pair of chunks (again O(N^2)), if their similarity >= threshold, 
      create an EMBEDDING_SIM edge.
 
@@ -22,16 +22,16 @@ Guiding Principles (as per discussion):
 - **No duplication**: We'll do c1->c2 only, i<j or top-K from c1, so we don't create duplicates.
 
 Typical usage within a bigger pipeline:
-    from neo4j import GraphDatabase, basic_auth
+    from neo4j_connection import Neo4jConnection
     from embedding_relationships import (
         compute_embedding_similarity_topk,
         compute_embedding_similarity_threshold
     )
 
-    driver = GraphDatabase.driver(...)
-    compute_embedding_similarity_topk(driver, k=5)
+    conn = Neo4jConnection.from_env()
+    compute_embedding_similarity_topk(conn, k=5)
     # or
-    compute_embedding_similarity_threshold(driver, threshold=0.8)
+    compute_embedding_similarity_threshold(conn, threshold=0.8)
 
 Implementation Steps:
 - Each function fetches chunk_id + embedding from Neo4j
@@ -43,6 +43,19 @@ Implementation Steps:
 import numpy as np
 
 
+FETCH_EMBEDDINGS_QUERY = """
+MATCH (c:Chunk)
+WHERE c.embedding IS NOT NULL AND size(c.embedding) > 0
+RETURN c.chunk_id AS chunk_id, c.embedding AS embedding
+"""
+
+MERGE_EMBEDDING_SIM_QUERY = """
+MATCH (c1:Chunk { chunk_id: $c1_id }),
+      (c2:Chunk { chunk_id: $c2_id })
+MERGE (c1)-[:EMBEDDING_SIM { embedding_similarity: $sim }]->(c2)
+"""
+
+
 def cosine_similarity(vec1, vec2):
     """
     Basic cosine similarity for 1D float arrays, returning a float in [-1,1].
@@ -58,7 +71,31 @@ def cosine_similarity(vec1, vec2):
     return dot / (norm1 * norm2)
 
 
-def compute_embedding_similarity_topk(driver, k=5):
+def merge_embedding_edges(conn, edges) -> int:
+    """
+    MERGE a list of (c1_id, c2_id, sim) EMBEDDING_SIM edges in a single managed
+    write transaction (retried as a unit on transient errors).
+
+    :param conn: The shared Neo4j connection
+    :param edges: list of (c1_id, c2_id, similarity) tuples
+    :return: number of edges merged
+    """
+    if not edges:
+        return 0
+
+    def work(tx):
+        for c1_id, c2_id, sim_val in edges:
+            tx.run(MERGE_EMBEDDING_SIM_QUERY, {
+                "c1_id": c1_id,
+                "c2_id": c2_id,
+                "sim": float(sim_val)
+            })
+
+    conn.write_tx(work, label="relationships.merge_embedding_sim")
+    return len(edges)
+
+
+def compute_embedding_similarity_topk(conn, k=5):
     """
     Connect each Chunk node to its top-K nearest neighbors in embedding space.
     This is an O(N^2) naive approach, suitable for moderate numbers of chunks.
@@ -72,25 +109,19 @@ def compute_embedding_similarity_topk(driver, k=5):
       5) Repeat for each chunk. 
          This means c2->c1 edges are only created if c2 is also in c1's top-K from its perspective.
 
-    :param driver: A neo4j GraphDatabase driver
-    :type driver: neo4j.Driver
+    :param conn: The shared Neo4j connection
+    :type conn: neo4j_connection.Neo4jConnection
     :param k: Number of nearest neighbors to link for each chunk
     :type k: int
 
     Usage Example:
-        compute_embedding_similarity_topk(driver, k=5)
+        compute_embedding_similarity_topk(conn, k=5)
     """
     print(f"[embedding_relationships] EMBEDDING_SIM with top-K = {k}")
 
     # 1) Fetch chunk_id + embedding
-    with driver.session() as session:
-        query = """
-        MATCH (c:Chunk)
-        WHERE c.embedding IS NOT NULL AND size(c.embedding) > 0
-        RETURN c.chunk_id AS chunk_id, c.embedding AS embedding
-        """
-        result = session.run(query)
-        chunk_data = [(r["chunk_id"], r["embedding"]) for r in result]
+    rows = conn.run_read(FETCH_EMBEDDINGS_QUERY, label="relationships.fetch_embeddings")
+    chunk_data = [(r["chunk_id"], r["embedding"]) for r in rows]
 
     print(f"[topK] Retrieved {len(chunk_data)} chunks with embeddings.")
 
@@ -103,40 +134,27 @@ def compute_embedding_similarity_topk(driver, k=5):
 
     relationship_count = 0
 
-    with driver.session() as session:
-        # 2) For each chunk, compute similarity to all others
-        for i, emb_i in enumerate(embeddings):
-            sims = []
-            for j, emb_j in enumerate(embeddings):
-                if i == j:
-                    continue
-                sim_val = cosine_similarity(emb_i, emb_j)
-                sims.append((sim_val, j))
-
-            # 3) Sort by descending similarity, pick top-K
-            sims.sort(key=lambda x: x[0], reverse=True)
-            top_k = sims[:k]
-
-            # 4) For each neighbor, MERGE an EMBEDDING_SIM edge
-            for (sim_val, j_idx) in top_k:
-                c1_id = chunk_ids[i]
-                c2_id = chunk_ids[j_idx]
-                merge_query = """
-                MATCH (c1:Chunk { chunk_id: $c1_id }),
-                      (c2:Chunk { chunk_id: $c2_id })
-                MERGE (c1)-[:EMBEDDING_SIM { embedding_similarity: $sim }]->(c2)
-                """
-                session.run(merge_query, {
-                    "c1_id": c1_id,
-                    "c2_id": c2_id,
-                    "sim": float(sim_val)
-                })
-                relationship_count += 1
+    # 2) For each chunk, compute similarity to all others
+    for i, emb_i in enumerate(embeddings):
+        sims = []
+        for j, emb_j in enumerate(embeddings):
+            if i == j:
+                continue
+            sim_val = cosine_similarity(emb_i, emb_j)
+            sims.append((sim_val, j))
+
+        # 3) Sort by descending similarity, pick top-K
+        sims.sort(key=lambda x: x[0], reverse=True)
+        top_k = sims[:k]
+
+        # 4) MERGE an EMBEDDING_SIM edge for each neighbor (one transaction per chunk)
+        edges = [(chunk_ids[i], chunk_ids[j_idx], sim_val) for (sim_val, j_idx) in top_k]
+        relationship_count += merge_embedding_edges(conn, edges)
 
     print(f"[topK] Created {relationship_count} EMBEDDING_SIM edges using top-K = {k}.")
 
 
-def compute_embedding_similarity_threshold(driver, threshold=0.75):
+def compute_embedding_similarity_threshold(conn, threshold=0.75):
     """
     Connect chunk pairs with similarity >= threshold. This is O(N^2) and 
     can create many edges if threshold is too low or chunk set is large.
@@ -146,24 +164,18 @@ def compute_embedding_similarity_threshold(driver, threshold=0.75):
       2) For each pair (c1,c2), compute similarity
       3) If >= threshold, MERGE (c1)-[:EMBEDDING_SIM { embedding_similarity: <float> }]->(c2)
 
-    :param driver: neo4j GraphDatabase driver
-    :type driver: neo4j.Driver
+    :param conn: The shared Neo4j connection
+    :type conn: neo4j_connection.Neo4jConnection
     :param threshold: Minimum cosine similarity to link (e.g., 0.75)
     :type threshold: float
 
     Usage Example:
-        compute_embedding_similarity_threshold(driver, threshold=0.8)
+        compute_embedding_similarity_threshold(conn, threshold=0.8)
     """
     print(f"[embedding_relationships] EMBEDDING_SIM with threshold >= {threshold}")
 
-    with driver.session() as session:
-        query = """
-        MATCH (c:Chunk)
-        WHERE c.embedding IS NOT NULL AND size(c.embedding) > 0
-        RETURN c.chunk_id AS chunk_id, c.embedding AS embedding
-        """
-        result = session.run(query)
-        chunk_data = [(r["chunk_id"], r["embedding"]) for r in result]
+    rows = conn.run_read(FETCH_EMBEDDINGS_QUERY, label="relationships.fetch_embeddings")
+    chunk_data = [(r["chunk_id"], r["embedding"]) for r in rows]
 
     print(f"[threshold] Retrieved {len(chunk_data)} chunks with embeddings.")
 
@@ -177,24 +189,13 @@ def compute_embedding_similarity_threshold(driver, threshold=0.75):
     n = len(chunk_data)
     relationship_count = 0
 
-    with driver.session() as session:
-        # Compare all pairs
-        for i in range(n):
-            for j in range(i+1, n):
-                sim_val = cosine_similarity(embeddings[i], embeddings[j])
-                if sim_val >= threshold:
-                    c1_id = chunk_ids[i]
-                    c2_id = chunk_ids[j]
-                    merge_query = """
-                    MATCH (c1:Chunk { chunk_id: $c1_id }),
-                          (c2:Chunk { chunk_id: $c2_id })
-                    MERGE (c1)-[:EMBEDDING_SIM { embedding_similarity: $sim }]->(c2)
-                    """
-                    session.run(merge_query, {
-                        "c1_id": c1_id,
-                        "c2_id": c2_id,
-                        "sim": float(sim_val)
-                    })
-                    relationship_count += 1
+    # Compare all pairs, writing the edges of each row i in one transaction
+    for i in range(n):
+        edges = []
+        for j in range(i+1, n):
+            sim_val = cosine_similarity(embeddings[i], embeddings[j])
+            if sim_val >= threshold:
+                edges.append((chunk_ids[i], chunk_ids[j], sim_val))
+        relationship_count += merge_embedding_edges(conn, edges)
 
     print(f"[threshold] Created {relationship_count} EMBEDDING_SIM edges where sim >= {threshold}.")
@@ -16,27 +16,28 @@ Guiding Principles (from prior discussion):
    expansions if needed, but that logic is handled in a separate module (e.g., `hybrid_retriever.py`).
 
 Example Usage:
-    from neo4j import GraphDatabase, basic_auth
+    from neo4j_connection import Neo4jConnection
     from embedding_retriever import retrieve_by_embedding
 
-    driver = GraphDatabase.driver("bolt://localhost:7687", auth=basic_auth("neo4j", "password"))
+    conn = Neo4jConnection.from_env()
     user_query_emb = <some numpy array of the user query>
-    top_chunks = retrieve_by_embedding(driver, user_query_emb, top_k=10)
+    top_chunks = retrieve_by_embedding(conn, user_query_emb, top_k=10)
     # 'top_chunks' is a list of dictionaries, each chunk containing:
     #   { 'chunk_id': str, 'content': str, 'embedding': [...], 'topic_id': ???, 'sim': float }
 """
 
 import numpy as np
-from neo4j import Driver
 
+from neo4j_connection import Neo4jConnection
 
-def retrieve_by_embedding(driver: Driver, query_embedding: np.ndarray, top_k: int = 5) -> list:
+
+def retrieve_by_embedding(conn: Neo4jConnection, query_embedding: np.ndarray, top_k: int = 5) -> list:
     """
     Fetch chunk embeddings from Neo4j, compute cosine similarity to 'query_embedding',
     and return the top-K chunks with highest similarity. Each returned item includes
     a "sim" field indicating the computed similarity.
 
-    :param driver: neo4j.Driver object for connecting to Neo4j
+    :param conn: The shared Neo4jConnection
     :param query_embedding: a 1D numpy array or list representing the user query's embedding
     :param top_k: how many top results to return
     :return: list of dictionaries, each with keys:
@@ -50,7 +51,7 @@ def retrieve_by_embedding(driver: Driver, query_embedding: np.ndarray, top_k: in
       The list is sorted by descending sim, up to 'top_k'.
 
     Steps:
-      1) In a Neo4j session, MATCH all :Chunk nodes that have a non-empty 'embedding'.
+      1) In a managed read transaction, MATCH all :Chunk nodes that have a non-empty 'embedding'.
          Return chunk_id, content, embedding, and optionally topic_id if it exists.
       2) In Python, compute local cosine similarity between the chunk embedding
          and the provided 'query_embedding'.
@@ -65,7 +66,7 @@ def retrieve_by_embedding(driver: Driver, query_embedding: np.ndarray, top_k: in
         KNN search in Cypher. This example demonstrates a simpler approach.
 
     Example:
-       top_results = retrieve_by_embedding(driver, query_embedding, top_k=10)
+       top_results = retrieve_by_embedding(conn, query_embedding, top_k=10)
        for r in top_results:
            print(r["chunk_id"], r["sim"], r["content"][:80])
 
@@ -86,17 +87,16 @@ def retrieve_by_embedding(driver: Driver, query_embedding: np.ndarray, top_k: in
         return dot / (norm1 * norm2)
 
     # Step 1) Query Neo4j for chunk data
-    with driver.session() as session:
-        cypher = """
-        MATCH (c:Chunk)
-        WHERE c.embedding IS NOT NULL AND size(c.embedding) > 0
-        RETURN c.chunk_id AS chunk_id,
-               c.content AS content,
-               c.embedding AS embedding,
-               c.topic_id AS topic_id
-        """
-        result = session.run(cypher)
-        chunk_data = [dict(record) for record in result]  # each record -> { 'chunk_id':..., etc. }
+    cypher = """
+    MATCH (c:Chunk)
+    WHERE c.embedding IS NOT NULL AND size(c.embedding) > 0
+    RETURN c.chunk_id AS chunk_id,
+           c.content AS content,
+           c.embedding AS embedding,
+           c.topic_id AS topic_id
+    """
+    # each row -> { 'chunk_id':..., etc. }
+    chunk_data = conn.run_read(cypher, label="retrieve.embedding_scan")
 
     # Step 2) For each chunk, compute local cos sim
     for c in chunk_data:
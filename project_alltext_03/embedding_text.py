@@ -15,12 +15,28 @@ Example:
   python embedding_text.py --input chunked_data.json --output embedded_data.json
   # uses default 'all-MiniLM-L6-v2' model
 
+  python embedding_text.py --input chunked_data.json --output embedded_data.jsonl
+  # line-delimited output: one chunk record (with "file_name") per line
+
+  python embedding_text.py --input chunked_data.json --output embedded_data.json --resume
+  # continue an interrupted run from its last checkpoint (embedded_data.json.ckpt.json)
+
+  python embedding_text.py --input chunked_data.json --output embedded_data.json \
+      --queue work_queue.db --local-workers 4
+  # split the chunks into shards on a shared work queue (work_queue.py), embed them
+  # with 4 local worker processes plus any started elsewhere with
+  # `python embedding_text.py --queue work_queue.db --worker`, then merge
+
 Implementation Steps:
 ---------------------
 1) Parse command-line arguments (args.input, args.output, args.model).
 2) Load chunked_data from 'args.input'.
 3) For each chunk with non-empty 'content', embed it with SentenceTransformer.
 4) Save updated data to 'args.output'.
+
+In-process use (run_pipeline.py --mode inprocess): embed_chunked_data() embeds a
+chunked-data dict in memory, with the model taken from model_registry.py, and
+write_embedded_data() is only called when a checkpoint file is wanted.
 """
 
 import os
@@ -29,22 +45,151 @@ import json
 import argparse
 
 try:
-    from sentence_transformers import SentenceTransformer
+    import sentence_transformers  # the model itself is loaded through model_registry
 except ImportError:
     raise ImportError(
         "embedding_text.py requires sentence-transformers.\n"
         "Install via: pip install sentence-transformers"
     )
 
+from model_registry import get_registry
+from telemetry import get_telemetry
+from profiling import profile_stage
+from stage_checkpoint import StageCheckpoint, file_identity, CHECKPOINT_INTERVAL_S
+
+# Work-queue mode (work_queue.py): job name and chunks per shard
+QUEUE_JOB = "embed_chunks"
+DEFAULT_SHARD_SIZE = 256
+
+
+def embed_file(fobj: dict, model) -> tuple:
+    """
+    Embeds one file's chunks in place ({"file_name", "chunks": [...]}).
+    Used per file by embed_chunked_data and by the streaming pipeline.
+
+    :return: (embedded, skipped) chunk counts
+    """
+    count_embedded = 0
+    count_skipped = 0
+    if "chunks" not in fobj or not isinstance(fobj["chunks"], list):
+        return count_embedded, count_skipped
+    # For each chunk
+    for chunk in fobj["chunks"]:
+        if embed_chunk(chunk, model):
+            count_embedded += 1
+        else:
+            # skip empty content
+            count_skipped += 1
+    return count_embedded, count_skipped
 
-def embed_all_chunks(input_json: str, output_json: str, model_name: str = "all-MiniLM-L6-v2") -> None:
+
+def embed_chunk(chunk: dict, model) -> bool:
+    """Set chunk["embedding"] from its content; False if the content is empty."""
+    content = chunk.get("content", "")
+    if not content.strip():
+        return False
+    # embed
+    embedding = model.encode(content).tolist()  # list of floats
+    chunk["embedding"] = embedding
+    return True
+
+
+def iter_chunk_positions(data: dict):
+    """(position, chunk) for every chunk, in file order: the checkpoint watermark's unit."""
+    position = 0
+    for fobj in data["files"]:
+        if "chunks" not in fobj or not isinstance(fobj["chunks"], list):
+            continue
+        for chunk in fobj["chunks"]:
+            yield position, chunk
+            position += 1
+
+
+def embed_chunked_data(data: dict, model_name: str = "all-MiniLM-L6-v2", registry=None,
+                       start: int = 0, checkpoint: StageCheckpoint = None) -> dict:
+    """
+    Embeds each chunk's 'content' in place (chunk["embedding"] = list of floats).
+
+    :param data: chunked data {"files": [{"file_name", "chunks": [...]}, ...]}
+    :param model_name: HF SentenceTransformer model name
+    :param registry: ModelRegistry to take the model from; the process-wide one if None
+    :param start: chunk position to start at (chunks before it were restored from a checkpoint)
+    :param checkpoint: if given, each embedding is appended to it and it is saved periodically
+    :return: data (same object, now with embeddings)
+    """
+    # We expect data to be { "files": [...] }
+    if not isinstance(data, dict) or "files" not in data:
+        raise ValueError("[embed_chunks] JSON must have { 'files': [ ... ] } at top level.")
+
+    files_list = data["files"]
+
+    # Get the embedding model (loaded once per process)
+    print(f"[embed_chunks] Using model: {model_name}")
+    model = (registry or get_registry()).sentence_transformer(model_name)
+
+    count_embedded = 0
+    count_skipped = 0
+
+    if checkpoint is None and start == 0:
+        # Iterate over each file
+        for fobj in files_list:
+            embedded, skipped = embed_file(fobj, model)
+            count_embedded += embedded
+            count_skipped += skipped
+    else:
+        # Chunk by chunk, so the watermark can advance inside large files
+        for position, chunk in iter_chunk_positions(data):
+            if position < start:
+                continue
+            if embed_chunk(chunk, model):
+                count_embedded += 1
+                if checkpoint is not None:
+                    checkpoint.append({"i": position, "embedding": chunk["embedding"]})
+            else:
+                count_skipped += 1
+            if checkpoint is not None:
+                checkpoint.maybe_save(position + 1)
+
+    print(f"[embed_chunks] Embedded {count_embedded} chunks, skipped {count_skipped} (empty content).")
+    get_telemetry().add_items("embedding_text", count_embedded)
+    return data
+
+
+def write_embedded_data(data: dict, output_json: str) -> None:
+    """
+    Writes embedded data to output_json (.json: the whole structure; .jsonl: one
+    chunk record per line).
+    """
+    files_list = data["files"]
+    # Write output. A .jsonl output gets one chunk record per line (with its
+    # file_name), which store_in_neo4j.py can stream without loading it whole.
+    with open(output_json, "w", encoding="utf-8") as out_f:
+        if output_json.endswith(".jsonl"):
+            for fobj in files_list:
+                for chunk in fobj.get("chunks", []):
+                    record = dict(chunk, file_name=fobj.get("file_name"))
+                    out_f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            json.dump(data, out_f, indent=2)
+    print(f"[embed_chunks] Wrote embedded data to '{output_json}'.")
+
+
+def embed_all_chunks(input_json: str, output_json: str, model_name: str = "all-MiniLM-L6-v2",
+                     resume: bool = False, checkpoint_interval_s: float = CHECKPOINT_INTERVAL_S) -> None:
     """
     Reads the chunked_data JSON from input_json, embeds each chunk's 'content',
     writes updated data with chunk["embedding"] to output_json.
 
+    Progress is checkpointed every checkpoint_interval_s (embeddings so far + chunk
+    watermark, see stage_checkpoint.py). With resume=True the embeddings saved by an
+    interrupted run are restored and embedding continues after the watermark; the
+    output is identical to an uninterrupted run.
+
     :param input_json: Path to chunked_data JSON
     :param output_json: Path to write embedded_data JSON
     :param model_name: HF SentenceTransformer model name
+    :param resume: continue from the last checkpoint
+    :param checkpoint_interval_s: seconds between checkpoints
     """
     # Check if input exists
     if not os.path.isfile(input_json):
@@ -54,42 +199,113 @@ def embed_all_chunks(input_json: str, output_json: str, model_name: str = "all-M
     with open(input_json, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    # We expect data to be { "files": [...] }
+    if isinstance(data, dict) and "files" in data:
+        print(f"[embed_chunks] Found {len(data['files'])} file entries in {input_json}.")
+
+    embed_and_write(data, input_json, output_json, model_name, resume=resume,
+                    checkpoint_interval_s=checkpoint_interval_s)
+
+
+def embed_and_write(data: dict, input_json: str, output_json: str, model_name: str = "all-MiniLM-L6-v2",
+                    registry=None, resume: bool = False,
+                    checkpoint_interval_s: float = CHECKPOINT_INTERVAL_S) -> dict:
+    """
+    Embed already-loaded chunked data (read from input_json) with checkpoints, and
+    write it to output_json. Shared by embed_all_chunks and run_pipeline.py's
+    in-process mode.
+
+    :return: data (same object, now with embeddings)
+    """
+    checkpoint = StageCheckpoint(output_json, "embed_chunks",
+                                 identity={"input": file_identity(input_json), "model": model_name},
+                                 interval_s=checkpoint_interval_s)
+    start = 0
+    if resume and checkpoint.resume():
+        start = checkpoint.state["watermark"]
+        restored = {record["i"]: record["embedding"] for record in checkpoint.partial_records()}
+        for position, chunk in iter_chunk_positions(data):
+            if position in restored:
+                chunk["embedding"] = restored[position]
+        print(f"[embed_chunks] Restored {len(restored)} embeddings; continuing at chunk {start}.")
+    checkpoint.open_partial(resume=checkpoint.state is not None)
+
+    embed_chunked_data(data, model_name, registry=registry, start=start, checkpoint=checkpoint)
+    write_embedded_data(data, output_json)
+    checkpoint.finish()
+    return data
+
+
+def load_chunked_data(input_json: str) -> dict:
+    """Read chunked_data JSON, checking for the { "files": [...] } shape."""
+    if not os.path.isfile(input_json):
+        raise FileNotFoundError(f"[embed_chunks] input file not found: {input_json}")
+    with open(input_json, "r", encoding="utf-8") as f:
+        data = json.load(f)
     if not isinstance(data, dict) or "files" not in data:
         raise ValueError("[embed_chunks] JSON must have { 'files': [ ... ] } at top level.")
+    return data
 
-    files_list = data["files"]
-    print(f"[embed_chunks] Found {len(files_list)} file entries in {input_json}.")
 
-    # Load the embedding model
-    print(f"[embed_chunks] Loading model: {model_name}")
-    model = SentenceTransformer(model_name)
+def enqueue_embedding(queue, input_json: str, model_name: str = "all-MiniLM-L6-v2",
+                      shard_size: int = DEFAULT_SHARD_SIZE, job: str = QUEUE_JOB) -> int:
+    """
+    Coordinator: queue the chunks of input_json as ranges of shard_size chunk positions.
 
-    count_embedded = 0
-    count_skipped = 0
+    :param queue: work_queue.WorkQueue
+    :return: number of shards still to do
+    """
+    data = load_chunked_data(input_json)
+    total = sum(1 for _ in iter_chunk_positions(data))
+    params = {"input": input_json, "input_identity": file_identity(input_json), "model": model_name}
+    shards = [{"start": start, "end": min(start + shard_size, total)}
+              for start in range(0, total, shard_size)]
+    return queue.create_job(job, params, shards)
 
-    # Iterate over each file
-    for fobj in files_list:
-        if "chunks" not in fobj or not isinstance(fobj["chunks"], list):
-            continue
-        # For each chunk
-        for chunk in fobj["chunks"]:
-            content = chunk.get("content", "")
-            if content.strip():
-                # embed
-                embedding = model.encode(content).tolist()  # list of floats
-                chunk["embedding"] = embedding
-                count_embedded += 1
-            else:
-                # skip empty content
-                count_skipped += 1
 
-    print(f"[embed_chunks] Embedded {count_embedded} chunks, skipped {count_skipped} (empty content).")
+# Worker-side cache: the chunked data is read once per process, not once per shard
+_loaded_input = {}
 
-    # Write output
-    with open(output_json, "w", encoding="utf-8") as out_f:
-        json.dump(data, out_f, indent=2)
-    print(f"[embed_chunks] Wrote embedded data to '{output_json}'.")
+
+def embed_shard(params: dict, payload: dict) -> list:
+    """
+    Worker: embed chunk positions [start, end) of the job's input.
+
+    :return: one embedding (or None for empty content) per position
+    """
+    key = (params["input"], tuple(params["input_identity"]))
+    if key not in _loaded_input:
+        if file_identity(params["input"]) != params["input_identity"]:
+            raise ValueError(f"[embed_chunks] {params['input']} changed since the job was queued.")
+        _loaded_input.clear()
+        _loaded_input[key] = load_chunked_data(params["input"])
+    data = _loaded_input[key]
+
+    model = get_registry().sentence_transformer(params["model"])
+    embeddings = []
+    for position, chunk in iter_chunk_positions(data):
+        if position >= payload["end"]:
+            break
+        if position >= payload["start"]:
+            embeddings.append(chunk["embedding"] if embed_chunk(chunk, model) else None)
+    return embeddings
+
+
+def merge_embedding(queue, output_json: str, job: str = QUEUE_JOB) -> dict:
+    """
+    Coordinator: put the shard embeddings back on the job's chunks (by position)
+    and write output_json, exactly as embed_all_chunks() would.
+
+    :return: the embedded data
+    """
+    params = queue.job_params(job)
+    data = load_chunked_data(params["input"])
+    embeddings = [embedding for shard in queue.shard_outputs(job) for embedding in shard]
+    for position, chunk in iter_chunk_positions(data):
+        if embeddings[position] is not None:
+            chunk["embedding"] = embeddings[position]
+    print(f"[embed_chunks] Merged {sum(e is not None for e in embeddings)} embeddings from the work queue.")
+    write_embedded_data(data, output_json)
+    return data
 
 
 def main():
@@ -98,6 +314,8 @@ def main():
       --input <input_json>
       --output <output_json>
       [--model <model_name>]
+      [--resume]
+      [--queue <work_queue.db> [--worker] [--shard-size N] [--local-workers N]]
     If any are missing, we show an error or use defaults.
     """
     parser = argparse.ArgumentParser(description="Embed chunk content from an input JSON, write to output JSON.")
@@ -107,11 +325,40 @@ def main():
                         help="Output JSON to write the updated data.")
     parser.add_argument("--model", type=str, default="all-MiniLM-L6-v2",
                         help="SentenceTransformer model name.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the checkpoint of an interrupted run.")
+    parser.add_argument("--queue", default=None,
+                        help="Shared work queue (SQLite file): coordinate workers instead of embedding here.")
+    parser.add_argument("--worker", action="store_true",
+                        help="With --queue: claim and embed shards until none are left.")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help="With --queue: chunks per shard.")
+    parser.add_argument("--local-workers", type=int, default=0,
+                        help="With --queue: also start this many worker processes on this host.")
     args = parser.parse_args()
 
-    # Call the function
-    embed_all_chunks(args.input, args.output, args.model)
+    if not args.queue:
+        # Call the function
+        embed_all_chunks(args.input, args.output, args.model, resume=args.resume)
+        return
+
+    # Imported here: only the work-queue mode needs it
+    from work_queue import WorkQueue, run_worker, coordinate
+
+    queue = WorkQueue(args.queue)
+    if args.worker:
+        # Input and model come from the job, as queued by the coordinator
+        run_worker(queue, QUEUE_JOB, embed_shard)
+        return
+    enqueue_embedding(queue, args.input, args.model, shard_size=max(1, args.shard_size))
+    if not coordinate(queue, QUEUE_JOB, os.path.abspath(__file__), ["--queue", args.queue, "--worker"],
+                      local_workers=args.local_workers):
+        print(f"[embed_chunks] Work queue job did not finish; {args.output} not written.")
+        sys.exit(1)
+    merge_embedding(queue, args.output)
 
 
 if __name__ == "__main__":
-    main()
+    # Profiled if PIPELINE_PROFILE selects this stage (see profiling.py)
+    with profile_stage("embedding_text"):
+        main()
@@ -17,27 +17,37 @@ Guiding Principles (from discussion):
    - Phase A: We do an embedding-based retrieval (using `embedding_retriever.retrieve_by_embedding`)
      to get top-K chunks for the user query.
    - Phase B: We look at the topics in the top few chunks from Phase A to guess which topics 
-     are relevant. Then we retrieve additional chunks from those topics 
-     (using `topic_retriever.retrieve_by_topic`).
+     are relevant. Then we retrieve additional chunks from those topics in a single
+     round trip (using `topic_retriever.retrieve_by_topic_batched`).
 3. **Scoring**: We unify the embedding-based chunks and the topic-based expansions 
    into one set. Each chunk is assigned:
-      - `sim` = embedding similarity if it came from embedding retrieval (or 0.0 if only from topic)
+      - `sim` = embedding similarity to the query. Expansion chunks come back with
+        their embeddings, so they get a real similarity too (0.0 only if a chunk
+        has no embedding).
       - `topic_rel` = 1 if it was found in the topic expansions or if it already had a relevant topic
 4. **Weighted final score**: We compute 
       final_score = (1 - topic_weight)*sim + topic_weight*topic_rel
    and sort descending. Return the top-K final results.
 5. **Extensibility**: You could incorporate additional signals (like lexical or metadata).
    This module is a reference implementation for combining two signals: embedding & topic.
+6. **Lexical fusion (optional)**: Given the raw query text and a `lexical_index.LexicalIndex`
+   (BM25 over chunk content, built at ingest), the dense/topic ranking is fused with the
+   BM25 ranking, either by reciprocal-rank fusion (fusion="rrf", default) or by a weighted
+   sum with max-normalised BM25 scores (fusion="weighted"). This is what finds exact team
+   names, dates and figures that embeddings blur.
+7. **Async variant**: `async_hybrid_retriever.hybrid_retrieve_async` runs the content
+   fetch and the topic expansion concurrently, enforces a per-request deadline and
+   reports per-phase timings; it reuses score_expansions and fuse_results from here.
 
 Usage Example:
 --------------
     from hybrid_retriever import hybrid_retrieve
     import numpy as np
 
-    # Suppose 'driver' is a neo4j.Driver
+    # Suppose 'conn' is a neo4j_connection.Neo4jConnection
     # Suppose 'query_vec' is a numpy array for the user query embedding
     final_chunks = hybrid_retrieve(
-        driver, 
+        conn, 
         query_embedding=query_vec,
         top_k=5, 
         top_n_topic=3, 
@@ -45,19 +55,27 @@ Usage Example:
     )
     # 'final_chunks' is a list of chunk dicts, sorted by 'final_score'.
 
+    # With lexical fusion:
+    from lexical_index import LexicalIndex
+    lex = LexicalIndex.load("lexical_index.npz")
+    final_chunks = hybrid_retrieve(conn, query_vec, query_text="Daily Revenue by Team",
+                                   lexical_index=lex, fusion="rrf")
+
 Implementation Steps:
 ---------------------
 1) Retrieve top_k by embedding (embedding_retriever).
 2) Inspect top_n_topic from that set to determine relevant topic_ids 
    (topic_retriever.get_topic_ids_from_chunks).
-3) Retrieve expansions from those topics (topic_retriever.retrieve_by_topic).
+3) Retrieve expansions from those topics (topic_retriever.retrieve_by_topic_batched),
+   deduplicated and with embeddings, and score them against the query.
 4) Combine them into a dictionary keyed by chunk_id:
-     - if chunk is from embedding retrieval, store 'sim'
+     - every chunk has its embedding 'sim'
      - if chunk is from topic retrieval, store 'topic_rel=1'
-     - if chunk is from both, it has both 'sim>0' and 'topic_rel=1'
-     - otherwise sim=0, topic_rel=0
+     - otherwise topic_rel=0
 5) final_score = (1 - topic_weight)*sim + topic_weight*topic_rel
 6) sort descending by final_score, return the top_k.
+7) (optional) fuse that ranking with the BM25 ranking (fuse_lexical) and fetch content
+   for lexical-only winners in one round trip.
 
 Note:
 -----
@@ -74,15 +92,25 @@ import numpy as np
 
 # local modules for retrieval
 from embedding_retriever import retrieve_by_embedding
-from topic_retriever import get_topic_ids_from_chunks, retrieve_by_topic
+from topic_retriever import get_topic_ids_from_chunks, retrieve_by_topic_batched
+from vector_index import VectorIndex, fetch_chunk_contents
+
+
+# Rank offset for reciprocal-rank fusion: score = sum(1 / (RRF_K + rank))
+RRF_K = 60
 
 
 def hybrid_retrieve(
-    driver,
+    conn,
     query_embedding: np.ndarray,
     top_k: int = 5,
     top_n_topic: int = 3,
-    topic_weight: float = 0.3
+    topic_weight: float = 0.3,
+    query_text: str = None,
+    lexical_index=None,
+    fusion: str = "rrf",
+    lexical_weight: float = 0.3,
+    lexical_candidates: int = 20
 ) -> List[Dict]:
     """
     Perform a hybrid retrieval from Neo4j that merges:
@@ -91,13 +119,19 @@ def hybrid_retrieve(
     and produces a final list sorted by a weighted score:
       final_score = (1 - topic_weight) * embedding_sim + topic_weight * topic_rel
 
-    :param driver: A neo4j.Driver object
+    :param conn: The shared neo4j_connection.Neo4jConnection
     :param query_embedding: The user query as a numpy vector
     :param top_k: How many chunks to return from embedding retrieval, 
                   and also how many final results to keep
     :param top_n_topic: Inspect the top 'top_n_topic' embedding results to guess topics
     :param topic_weight: fraction for the 'topic' portion of the final score. 
                         E.g. 0.3 means 70/30 weighting of embedding vs topic.
+    :param query_text: raw query text, needed for lexical fusion
+    :param lexical_index: optional lexical_index.LexicalIndex; when given together with
+                          query_text, results are fused with BM25 (see fuse_lexical)
+    :param fusion: "rrf" (reciprocal-rank fusion) or "weighted"
+    :param lexical_weight: BM25 share of the score for fusion="weighted"
+    :param lexical_candidates: how many BM25 hits take part in the fusion
     :return: A list of chunk dictionaries, each with fields like:
                {
                   "chunk_id": ...,
@@ -111,17 +145,112 @@ def hybrid_retrieve(
              sorted descending by final_score, trimmed to top_k in the final return.
     """
     # 1) embedding retrieval
-    embed_results = retrieve_by_embedding(driver, query_embedding, top_k=top_k)
+    embed_results = retrieve_by_embedding(conn, query_embedding, top_k=top_k)
     # embed_results => [ { "chunk_id", "content", "embedding", "topic_id", "sim" }, ... ]
 
     # 2) gather topic_ids from top_n_topic of embed_results
     # If embed_results is empty, we won't find topics
     relevant_topic_ids = get_topic_ids_from_chunks(embed_results, top_n=top_n_topic)
 
-    # 3) retrieve expansions by topic
+    # 3) retrieve expansions by topic, all topics in one round trip
     # e.g. 5 expansions per topic? You can refine or param. We'll do 5 as a default
-    expansions = retrieve_by_topic(driver, relevant_topic_ids, max_per_topic=5)
+    expansions = retrieve_by_topic_batched(conn, relevant_topic_ids, max_per_topic=5)
+
+    # 4) score expansions and fuse both sets by final_score
+    expansion_sims = score_expansions(expansions, query_embedding)
+    if lexical_index is None or not query_text:
+        return fuse_results(embed_results, expansions, expansion_sims, topic_weight, top_k)
+
+    # 5) fuse the full dense/topic ranking with the BM25 ranking
+    dense = fuse_results(embed_results, expansions, expansion_sims, topic_weight,
+                         len(embed_results) + len(expansions))
+    lexical_ids, lexical_scores = lexical_index.search(query_text, k=lexical_candidates)
+    final_list = fuse_lexical(dense, list(zip(lexical_ids, lexical_scores)), fusion, lexical_weight, top_k)
+
+    # lexical-only winners have no content yet: fetch it in one round trip
+    missing = [d["chunk_id"] for d in final_list if d.get("content") is None]
+    if missing:
+        contents = fetch_chunk_contents(conn, missing)
+        for d in final_list:
+            if d.get("content") is None:
+                d["content"] = contents.get(d["chunk_id"], "")
+    return final_list
+
+
+def fuse_lexical(
+    dense_results: List[Dict],
+    lexical_hits: List[tuple],
+    fusion: str = "rrf",
+    lexical_weight: float = 0.3,
+    top_k: int = 5
+) -> List[Dict]:
+    """
+    Fuse a dense ranking (fuse_results output, sorted by final_score) with a BM25
+    ranking [(chunk_id, bm25), ...] sorted by descending score.
+
+      - "rrf":      fused = sum over both lists of 1 / (RRF_K + rank), rank from 1
+      - "weighted": fused = (1 - lexical_weight)*final_score + lexical_weight*bm25/max_bm25
+
+    Chunks found only by BM25 get sim=0.0, topic_rel=0 and content=None (the caller
+    fetches content for the winners). Each result carries 'bm25' and 'fused_score',
+    and the list is sorted by fused_score.
+    """
+    if fusion not in ("rrf", "weighted"):
+        raise ValueError(f"[hybrid_retriever] Unknown fusion method: {fusion}")
+
+    chunk_map = {}
+    for rank, data in enumerate(dense_results, start=1):
+        entry = dict(data)
+        entry["bm25"] = 0.0
+        entry["fused_score"] = 1.0 / (RRF_K + rank) if fusion == "rrf" \
+            else (1.0 - lexical_weight) * data["final_score"]
+        chunk_map[data["chunk_id"]] = entry
+
+    max_bm25 = max((score for _, score in lexical_hits), default=0.0) or 1.0
+    for rank, (cid, score) in enumerate(lexical_hits, start=1):
+        entry = chunk_map.get(cid)
+        if entry is None:
+            entry = chunk_map[cid] = {
+                "chunk_id": cid, "content": None, "topic_id": None, "sim": 0.0,
+                "topic_rel": 0, "final_score": 0.0, "bm25": 0.0, "fused_score": 0.0
+            }
+        entry["bm25"] = score
+        entry["fused_score"] += 1.0 / (RRF_K + rank) if fusion == "rrf" \
+            else lexical_weight * score / max_bm25
+
+    final_list = sorted(chunk_map.values(), key=lambda x: x["fused_score"], reverse=True)
+    return final_list[:top_k]
+
+
+def score_expansions(expansions: List[Dict], query_embedding) -> Dict:
+    """
+    Score expansion chunks against the query with their stored embeddings
+    (one GEMV over the expansion set). Chunks without an embedding are left out
+    and therefore keep sim=0.0 in fuse_results.
+
+    :return: {chunk_id: similarity}
+    """
+    scored = [e for e in expansions if e.get("embedding")]
+    if not scored:
+        return {}
+    sims = VectorIndex([e["chunk_id"] for e in scored],
+                       [e["embedding"] for e in scored]).scores(query_embedding)
+    return {e["chunk_id"]: float(sim) for e, sim in zip(scored, sims)}
+
 
+def fuse_results(
+    embed_results: List[Dict],
+    expansions: List[Dict],
+    expansion_sims: Dict,
+    topic_weight: float = 0.3,
+    top_k: int = 5
+) -> List[Dict]:
+    """
+    Merge embedding results and topic expansions into one list keyed by chunk_id,
+    compute final_score = (1 - topic_weight)*sim + topic_weight*topic_rel,
+    and return the top_k by final_score. Shared by hybrid_retrieve and the async
+    variant in async_hybrid_retriever.py.
+    """
     # We'll unify them in a chunk_map keyed by chunk_id
     chunk_map = {}
 
@@ -140,19 +269,19 @@ def hybrid_retrieve(
     for exp_item in expansions:
         cid = exp_item["chunk_id"]
         if cid not in chunk_map:
-            # chunk wasn't in embedding top_k, so sim=0
+            # chunk wasn't in embedding top_k; use its own similarity to the query
             chunk_map[cid] = {
                 "chunk_id": cid,
                 "content": exp_item["content"],
                 "topic_id": exp_item.get("topic_id"),
-                "sim": 0.0,
+                "sim": expansion_sims.get(cid, 0.0),
                 "topic_rel": 1
             }
         else:
             # chunk is in both sets, so topic_rel=1
             chunk_map[cid]["topic_rel"] = 1
 
-    # 4) compute final_score = (1 - topic_weight)*sim + topic_weight*(topic_rel)
+    # compute final_score = (1 - topic_weight)*sim + topic_weight*(topic_rel)
     final_list = []
     for cid, data in chunk_map.items():
         sim_val = data["sim"]
@@ -162,7 +291,7 @@ def hybrid_retrieve(
         data["final_score"] = final_score
         final_list.append(data)
 
-    # 5) sort by final_score desc
+    # sort by final_score desc
     final_list.sort(key=lambda x: x["final_score"], reverse=True)
 
     # return top_k from final
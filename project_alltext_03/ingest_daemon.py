@@ -0,0 +1,409 @@
+"""
+ingest_daemon.py
+
+A long-running **watch-folder daemon**: instead of re-running the whole
+run_pipeline.py whenever reports are dropped into data/, it watches the folder and
+pushes only new, changed or deleted files through
+
+    extract -> chunk -> embed -> store (-> relationship update)
+
+using the same per-file functions as the pipeline (data_extraction.extract_file,
+data_chunking.chunk_file, embedding_text.embed_file, store_in_neo4j).
+
+How it works:
+  1) Watching: inotify on Linux (through ctypes, no extra dependency), or polling the
+     folder's (size, mtime) snapshot every --poll-s seconds elsewhere (or --polling).
+  2) Debouncing: events are collected until the folder has been quiet for
+     --debounce-s seconds (copies in progress keep producing events), but never held
+     longer than --max-delay-s.
+  3) Syncing: each touched file is compared with the ingest journal. Unchanged stat ->
+     nothing to do; changed stat but same SHA-256 -> only the journal is updated;
+     new/changed content -> extract, chunk, embed, prune the chunks the new version no
+     longer has, store; gone from disk -> its Document and chunks are deleted.
+     If --relationship-args is given, compute_relationships runs after each sync that
+     changed the graph.
+  4) Journal: ingest_journal.json records, per file, the size, mtime, content hash and
+     chunk count that were ingested, plus the parameters used (wrap width, embedding
+     model). It is rewritten atomically after every sync, so after a restart the
+     daemon reconciles the folder against it and only processes what changed while it
+     was down. Changing the parameters re-ingests everything.
+
+Guiding Principles:
+1. **Only what changed**: Unchanged files are never re-parsed or re-embedded.
+2. **Crash-safe**: The journal only records a file after its data is in Neo4j; a
+   crash mid-sync means the file is simply processed again.
+3. **Local**: Models come from model_registry.py (loaded once for the daemon's
+   lifetime); one Neo4jConnection is kept open.
+
+Usage:
+    python ingest_daemon.py [--data data] [--journal ingest_journal.json]
+                            [--debounce-s 2] [--max-delay-s 30] [--polling] [--poll-s 2]
+                            [--relationship-args "--embedding threshold=0.8"]
+    python ingest_daemon.py --once     # reconcile data/ with the journal and exit
+"""
+
+import os
+import json
+import time
+import shlex
+import select
+import signal
+import struct
+import argparse
+import threading
+import ctypes
+import ctypes.util
+
+from pipeline_state import sha256_file
+from stage_checkpoint import write_json_atomic
+
+DEFAULT_JOURNAL = os.getenv("INGEST_JOURNAL", "ingest_journal.json")
+DEFAULT_DEBOUNCE_S = 2.0
+DEFAULT_MAX_DELAY_S = 30.0
+DEFAULT_POLL_S = 2.0
+# Wait before retrying a sync that failed (e.g. Neo4j unavailable)
+RETRY_S = 30.0
+
+# inotify(7) constants
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """
+    File names changed in one folder, from Linux inotify. wait() returns a set of
+    names, or None when the kernel queue overflowed (the caller should rescan).
+    """
+
+    def __init__(self, folder: str):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+
+    def wait(self, timeout: float):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback watcher: compares (size, mtime) snapshots of the folder."""
+
+    def __init__(self, folder: str, poll_s: float = DEFAULT_POLL_S):
+        self.folder = folder
+        self.poll_s = poll_s
+        self.snapshot = self._scan()
+
+    def _scan(self) -> dict:
+        snapshot = {}
+        try:
+            entries = list(os.scandir(self.folder))
+        except FileNotFoundError:
+            return snapshot
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    st = entry.stat()
+                    snapshot[entry.name] = (st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                continue
+        return snapshot
+
+    def wait(self, timeout: float):
+        time.sleep(min(timeout, self.poll_s))
+        current = self._scan()
+        changed = {name for name in set(current) | set(self.snapshot)
+                   if current.get(name) != self.snapshot.get(name)}
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(folder: str, polling: bool = False, poll_s: float = DEFAULT_POLL_S):
+    """inotify where available, else polling."""
+    if not polling:
+        try:
+            watcher = InotifyWatcher(folder)
+            print(f"[ingest_daemon] Watching '{folder}' with inotify.")
+            return watcher
+        except (OSError, AttributeError) as e:
+            print(f"[ingest_daemon] inotify unavailable ({e}); falling back to polling.")
+    print(f"[ingest_daemon] Polling '{folder}' every {poll_s:.1f}s.")
+    return PollingWatcher(folder, poll_s)
+
+
+class IngestJournal:
+    """
+    What has been ingested: {"params": {...}, "files": {name: {size, mtime_ns, sha256,
+    chunks, status, ingested_at}}}, saved atomically.
+    """
+
+    def __init__(self, path: str = DEFAULT_JOURNAL, params: dict = None):
+        self.path = path
+        self.files = {}
+        self.params = params or {}
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            self.files = saved.get("files", {})
+            if saved.get("params", {}) != self.params:
+                # Different wrap width / model: every file's chunks would differ
+                print(f"[ingest_daemon] Parameters changed since the journal was written "
+                      f"({saved.get('params')} -> {self.params}); re-ingesting all files.")
+                for entry in self.files.values():
+                    entry["sha256"] = None
+                    entry["size"] = entry["mtime_ns"] = None
+
+    def get(self, name: str):
+        return self.files.get(name)
+
+    def record(self, name: str, st, digest: str, chunks: int, status: str = "ingested"):
+        self.files[name] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": digest,
+            "chunks": chunks,
+            "status": status,
+            "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def remove(self, name: str):
+        self.files.pop(name, None)
+
+    def save(self):
+        write_json_atomic(self.path, {"params": self.params, "files": self.files}, indent=2)
+
+
+class IngestDaemon:
+    """
+    Keeps Neo4j in sync with a data folder. sync(names) processes a set of touched
+    file names; run() watches the folder and calls it after debouncing.
+    """
+
+    def __init__(self, conn, data_folder: str = "data", journal_path: str = DEFAULT_JOURNAL,
+                 wrap_width: int = None, embedding_model: str = "all-MiniLM-L6-v2",
+                 relationship_args: list = None, registry=None):
+        # Imported here: these pull in the parsers, nltk and sentence-transformers
+        from model_registry import get_registry
+        from data_chunking import WRAP_WIDTH
+
+        self.conn = conn
+        self.data_folder = data_folder
+        self.wrap_width = WRAP_WIDTH if wrap_width is None else wrap_width
+        self.embedding_model = embedding_model
+        self.relationship_args = list(relationship_args or [])
+        self.registry = registry or get_registry()
+        self.journal = IngestJournal(journal_path, params={"wrap_width": self.wrap_width,
+                                                           "embedding_model": embedding_model})
+        self.stop_event = threading.Event()
+        self.stats = {"syncs": 0, "ingested": 0, "deleted": 0, "unchanged": 0, "skipped": 0, "failed_syncs": 0}
+
+    def all_names(self) -> set:
+        """Every file on disk or in the journal (a full reconcile)."""
+        from data_extraction import list_data_files
+        on_disk = list_data_files(self.data_folder) if os.path.isdir(self.data_folder) else []
+        return set(on_disk) | set(self.journal.files)
+
+    def sync(self, names) -> dict:
+        """
+        Bring the given files up to date in Neo4j and the journal.
+
+        :return: {"ingested": [...], "deleted": [...], "unchanged": n, "skipped": [...]}
+        """
+        from data_extraction import extract_file
+        from data_chunking import chunk_file
+        from embedding_text import embed_file
+        from store_in_neo4j import store_in_neo4j, delete_documents, prune_stale_chunks
+
+        to_delete, files, ingested, skipped = [], [], [], []
+        unchanged = 0
+        for name in sorted(names):
+            path = os.path.join(self.data_folder, name)
+            entry = self.journal.get(name)
+            if not os.path.isfile(path):
+                if entry is not None and entry.get("status") == "ingested":
+                    to_delete.append(name)
+                else:
+                    self.journal.remove(name)
+                continue
+            st = os.stat(path)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                unchanged += 1
+                continue
+            digest = sha256_file(path)
+            if entry and entry["sha256"] == digest:
+                # Touched or copied over with the same content
+                self.journal.record(name, st, digest, entry.get("chunks", 0), entry.get("status", "ingested"))
+                unchanged += 1
+                continue
+
+            # New or changed content: extract -> chunk -> embed
+            parsed = extract_file(self.data_folder, name, registry=self.registry)
+            if parsed is None:
+                # Unsupported or unreadable: remember it so it is not retried until it changes
+                self.journal.record(name, st, digest, 0, status="skipped")
+                skipped.append(name)
+                if entry is not None and entry.get("status") == "ingested":
+                    to_delete.append(name)
+                continue
+            fobj = chunk_file(parsed, wrap_width=self.wrap_width)
+            embed_file(fobj, self.registry.sentence_transformer(self.embedding_model))
+            files.append(fobj)
+            ingested.append((name, st, digest, len(fobj["chunks"])))
+
+        if files:
+            prune_stale_chunks(self.conn, files)
+            store_in_neo4j(files=files, conn=self.conn)
+            for name, st, digest, chunk_count in ingested:
+                self.journal.record(name, st, digest, chunk_count)
+        if to_delete:
+            delete_documents(self.conn, to_delete)
+            for name in to_delete:
+                if name not in skipped:
+                    self.journal.remove(name)
+
+        if (files or to_delete) and self.relationship_args:
+            from compute_relationships import compute_relationships, build_parser, parse_params
+            rel_args = build_parser().parse_args(self.relationship_args)
+            compute_relationships(self.conn, embedding=rel_args.embedding, topic=rel_args.topic,
+                                  params=parse_params(rel_args.params))
+        self.journal.save()
+
+        self.stats["syncs"] += 1
+        self.stats["ingested"] += len(ingested)
+        self.stats["deleted"] += len(to_delete)
+        self.stats["unchanged"] += unchanged
+        self.stats["skipped"] += len(skipped)
+        result = {"ingested": [i[0] for i in ingested], "deleted": to_delete,
+                  "unchanged": unchanged, "skipped": skipped}
+        print(f"[ingest_daemon] Sync: {len(ingested)} ingested, {len(to_delete)} deleted, "
+              f"{len(skipped)} skipped, {unchanged} unchanged.")
+        return result
+
+    def run(self, watcher, debounce_s: float = DEFAULT_DEBOUNCE_S, max_delay_s: float = DEFAULT_MAX_DELAY_S):
+        """
+        Reconcile once, then process debounced batches of file events until stop().
+        """
+        pending = self.all_names()
+        first_event = last_event = time.monotonic() - debounce_s
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            quiet = now - last_event >= debounce_s
+            overdue = now - first_event >= max_delay_s
+            if pending and (quiet or overdue):
+                batch, pending = pending, set()
+                try:
+                    self.sync(batch)
+                except Exception as e:
+                    # Keep the batch and try again later (its files are not in the journal yet)
+                    self.stats["failed_syncs"] += 1
+                    print(f"[ingest_daemon] Sync failed ({e}); retrying in {RETRY_S:.0f}s.")
+                    pending |= batch
+                    self.stop_event.wait(RETRY_S)
+                continue
+
+            timeout = debounce_s if not pending else max(0.05, debounce_s - (now - last_event))
+            changed = watcher.wait(timeout)
+            if changed is None:
+                print("[ingest_daemon] Event queue overflowed; rescanning the folder.")
+                changed = self.all_names()
+            if changed:
+                if not pending:
+                    first_event = time.monotonic()
+                pending |= changed
+                last_event = time.monotonic()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def print_stats(self):
+        print("[ingest_daemon] " + ", ".join(f"{k}={v}" for k, v in self.stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a data folder and ingest new, changed or deleted files.")
+    parser.add_argument("--data", default="data", help="Folder to watch.")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL, help="Ingest journal (JSON).")
+    parser.add_argument("--debounce-s", type=float, default=DEFAULT_DEBOUNCE_S,
+                        help="Process events once the folder has been quiet this long.")
+    parser.add_argument("--max-delay-s", type=float, default=DEFAULT_MAX_DELAY_S,
+                        help="Never hold events longer than this.")
+    parser.add_argument("--polling", action="store_true", help="Poll instead of using inotify.")
+    parser.add_argument("--poll-s", type=float, default=DEFAULT_POLL_S, help="Polling interval.")
+    parser.add_argument("--once", action="store_true",
+                        help="Reconcile the folder with the journal once and exit.")
+    parser.add_argument("--wrap-width", type=int, default=None, help="Text chunk wrap width.")
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2", help="SentenceTransformer model.")
+    parser.add_argument("--relationship-args", default="",
+                        help='compute_relationships.py arguments run after each change, '
+                             'e.g. "--embedding threshold=0.8".')
+    args = parser.parse_args()
+
+    from neo4j_connection import Neo4jConnection
+
+    conn = Neo4jConnection.from_env()
+    print(f"[ingest_daemon] Using Neo4j at {conn.uri} with user '{conn.user}'")
+    daemon = IngestDaemon(conn, data_folder=args.data, journal_path=args.journal,
+                          wrap_width=args.wrap_width, embedding_model=args.embedding_model,
+                          relationship_args=shlex.split(args.relationship_args))
+    try:
+        if args.once:
+            daemon.sync(daemon.all_names())
+        else:
+            os.makedirs(args.data, exist_ok=True)
+            watcher = make_watcher(args.data, polling=args.polling, poll_s=args.poll_s)
+            signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+            try:
+                daemon.run(watcher, debounce_s=args.debounce_s, max_delay_s=args.max_delay_s)
+            except KeyboardInterrupt:
+                print("\n[ingest_daemon] Interrupted.")
+            finally:
+                watcher.close()
+    finally:
+        daemon.print_stats()
+        conn.print_stats(prefix="ingest_daemon")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
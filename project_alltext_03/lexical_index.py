@@ -0,0 +1,467 @@
+"""
+lexical_index.py
+
+A **lexical (keyword) index** over chunk content with BM25 scoring. It complements
+dense retrieval for queries where the exact string matters: team names, dates and
+revenue figures ("Daily Revenue by Team", "2023-07-14", "1,250.00"), which sentence
+embeddings tend to blur together.
+
+Structure:
+----------
+- Tokens: lower-cased alphanumeric words ("q3", "team4") and numbers. Thousands separators are dropped
+  ("1,250.00" -> "1250.00") and composite numbers such as dates are indexed both
+  whole and by their parts ("2023-07-14" -> "2023-07-14", "2023", "07", "14").
+- Inverted index: term -> postings list of (chunk position, term frequency), kept
+  as compact `array('I')` / `array('H')` columns (6 bytes per posting in memory).
+  Postings are sorted by chunk position because positions only ever grow.
+- On disk (`save`/`load`): one .npz file with all postings concatenated,
+  delta-encoded and variable-byte (varint) packed, so most postings take two bytes,
+  plus a small JSON header (vocabulary, chunk ids,
+  documents). Writes go to a temp file and are swapped in with os.replace.
+
+Guiding Principles:
+1. **Built at ingest**: store_in_neo4j feeds every document it writes through
+   `index_stream`, so the index is always in step with the graph.
+2. **Incremental per document**: `add_document` replaces a document's chunks
+   (old postings are tombstoned, new ones appended); `remove_document` drops one.
+   Tombstones are compacted away on `save`, so nothing is ever rebuilt from scratch.
+3. **Fast candidates**: a query only touches the postings of its own terms; scoring
+   is vectorised with numpy, so short queries take well under a millisecond.
+4. **Local files only**: No search server; the index is a single file next to the
+   pipeline's other artefacts.
+
+Usage:
+    from lexical_index import LexicalIndex
+
+    index = LexicalIndex.load_or_create("lexical_index.npz")
+    index.add_document("report.xlsx", [("report.xlsx_sheet_0", "Daily Revenue by Team ...")])
+    index.save("lexical_index.npz")
+    ids, scores = index.search("daily revenue by team", k=10)
+
+    # CLI:
+    python lexical_index.py build embedded_data.json [--index lexical_index.npz]
+    python lexical_index.py query "daily revenue by team" [--index lexical_index.npz] [--k 10]
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import argparse
+import threading
+from array import array
+
+import numpy as np
+
+from vector_index import top_k_indices
+
+
+DEFAULT_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.npz")
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+FORMAT_VERSION = 1
+
+TOKEN_RE = re.compile(r"\d+(?:[.,:/\-]\d+)+|[^\W_]+")
+_NUMBER_PART_RE = re.compile(r"\d+(?:\.\d+)?")
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3}(?:\D|$))")
+_MAX_TF = 0xFFFF
+
+
+def tokenize(text: str) -> list:
+    """
+    Split text into index terms (see module docstring). Used for both documents
+    and queries, so they always agree on normalisation.
+    """
+    if not text:
+        return []
+    terms = []
+    for match in TOKEN_RE.finditer(text.lower()):
+        token = match.group(0)
+        if token[0].isdigit():
+            token = _THOUSANDS_RE.sub("", token)
+            terms.append(token)
+            parts = _NUMBER_PART_RE.findall(token)
+            if len(parts) > 1:
+                terms.extend(parts)
+        else:
+            terms.append(token)
+    return terms
+
+
+class LexicalIndex:
+    """
+    In-memory inverted index with BM25 scoring, incremental per document and
+    persisted as a single .npz file.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.chunk_ids = []                 # position -> chunk_id
+        self._position = {}                 # chunk_id -> live position
+        self.doc_lens = array("I")          # position -> number of terms
+        self.alive = bytearray()            # position -> 1 live / 0 tombstoned
+        self.docs = {}                      # doc_id -> [positions]
+        self.postings = {}                  # term -> (array('I') positions, array('H') tfs)
+        self.total_len = 0                  # sum of live doc_lens
+        self.live_count = 0
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self.live_count
+
+    # ----------------------------------------------------------------------------------
+    # Incremental updates
+    # ----------------------------------------------------------------------------------
+    def add_document(self, doc_id: str, chunks) -> int:
+        """
+        Index (or re-index) a document. Any chunks previously indexed under doc_id
+        are tombstoned first.
+
+        :param doc_id: Document id (file_name, as in Neo4j)
+        :param chunks: iterable of (chunk_id, text)
+        :return: number of chunks indexed
+        """
+        with self._lock:
+            self.remove_document(doc_id)
+            return self.append_chunks(doc_id, chunks)
+
+    def append_chunks(self, doc_id: str, chunks) -> int:
+        """
+        Add chunks to a document without removing its existing ones (used when a
+        document arrives in several pieces, e.g. from a .jsonl stream).
+        """
+        added = 0
+        with self._lock:
+            positions = self.docs.setdefault(doc_id, [])
+            for chunk_id, text in chunks:
+                if not chunk_id:
+                    continue
+                self._tombstone(self._position.get(chunk_id))
+                terms = tokenize(text if isinstance(text, str) else "")
+                pos = len(self.chunk_ids)
+                self.chunk_ids.append(chunk_id)
+                self._position[chunk_id] = pos
+                self.doc_lens.append(len(terms))
+                self.alive.append(1)
+                positions.append(pos)
+                self.total_len += len(terms)
+                self.live_count += 1
+
+                for term, tf in _term_counts(terms).items():
+                    plist = self.postings.get(term)
+                    if plist is None:
+                        plist = self.postings[term] = (array("I"), array("H"))
+                    plist[0].append(pos)
+                    plist[1].append(min(tf, _MAX_TF))
+                added += 1
+            self.dirty = True
+        return added
+
+    def remove_document(self, doc_id: str) -> int:
+        """Tombstone every chunk of doc_id. Returns the number of chunks removed."""
+        with self._lock:
+            positions = self.docs.pop(doc_id, None)
+            if not positions:
+                return 0
+            removed = 0
+            for pos in positions:
+                if self._tombstone(pos):
+                    del self._position[self.chunk_ids[pos]]
+                    removed += 1
+            self.dirty = True
+            return removed
+
+    def _tombstone(self, pos) -> bool:
+        if pos is None or not self.alive[pos]:
+            return False
+        self.alive[pos] = 0
+        self.total_len -= self.doc_lens[pos]
+        self.live_count -= 1
+        return True
+
+    def index_stream(self, files_iter):
+        """
+        Pass-through generator: index each {"file_name", "chunks"} object as it
+        flows by and yield it unchanged. Consecutive pieces of the same document
+        are appended; a document seen again later is re-indexed from scratch.
+        """
+        current = None
+        for file_info in files_iter:
+            doc_id = file_info.get("file_name")
+            if doc_id:
+                chunks = [(ch.get("chunk_id"), ch.get("content", ""))
+                          for ch in file_info.get("chunks", [])]
+                if doc_id == current:
+                    self.append_chunks(doc_id, chunks)
+                else:
+                    self.add_document(doc_id, chunks)
+                    current = doc_id
+            yield file_info
+
+    # ----------------------------------------------------------------------------------
+    # Scoring
+    # ----------------------------------------------------------------------------------
+    def candidates(self, query: str) -> tuple:
+        """
+        BM25 scores for every live chunk containing at least one query term.
+
+        :return: (positions, scores) numpy arrays, unsorted
+        """
+        with self._lock:
+            if self.live_count == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+            # Zero-copy views; only the postings' own rows are gathered from them
+            alive = np.frombuffer(self.alive, dtype=np.uint8)
+            doc_lens = np.frombuffer(self.doc_lens, dtype=np.uint32)
+            n = self.live_count
+            avgdl = self.total_len / n if self.total_len else 1.0
+
+            all_pos, all_scores = [], []
+            for term, qtf in _term_counts(tokenize(query)).items():
+                plist = self.postings.get(term)
+                if plist is None:
+                    continue
+                pos = np.array(plist[0], dtype=np.int64)
+                tf = np.array(plist[1], dtype=np.float64)
+                live = alive[pos].astype(bool)
+                pos, tf = pos[live], tf[live]
+                df = pos.shape[0]
+                if df == 0:
+                    continue
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * doc_lens[pos] / avgdl)
+                all_pos.append(pos)
+                all_scores.append(qtf * idf * tf * (self.k1 + 1.0) / (tf + norm))
+            # Release the views while still holding the lock: a concurrent add_document
+            # cannot resize these arrays while a buffer export is alive (BufferError)
+            del alive, doc_lens
+
+        if not all_pos:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        if len(all_pos) == 1:
+            return all_pos[0], all_scores[0]
+        pos = np.concatenate(all_pos)
+        weights = np.concatenate(all_scores)
+        if pos.shape[0] * 8 > len(self.chunk_ids):
+            # Dense case (common terms): accumulate into one slot per chunk
+            summed = np.bincount(pos, weights=weights, minlength=len(self.chunk_ids))
+            hits = np.flatnonzero(summed)
+            return hits, summed[hits]
+        uniq, inverse = np.unique(pos, return_inverse=True)
+        return uniq, np.bincount(inverse, weights=weights)
+
+    def search(self, query: str, k: int = 10) -> tuple:
+        """
+        :param query: free-text query
+        :param k: number of results
+        :return: (chunk_ids, bm25_scores) sorted by descending score
+        """
+        positions, scores = self.candidates(query)
+        idx = top_k_indices(scores, k)
+        return [self.chunk_ids[positions[i]] for i in idx], [float(scores[i]) for i in idx]
+
+    # ----------------------------------------------------------------------------------
+    # Persistence
+    # ----------------------------------------------------------------------------------
+    def compact(self):
+        """Drop tombstoned chunks and renumber positions densely."""
+        with self._lock:
+            if self.live_count == len(self.chunk_ids):
+                return
+            remap = np.full(len(self.chunk_ids), -1, dtype=np.int64)
+            live_positions = [i for i, a in enumerate(self.alive) if a]
+            remap[live_positions] = np.arange(len(live_positions))
+
+            postings = {}
+            for term, (pos_arr, tf_arr) in self.postings.items():
+                pos = remap[np.array(pos_arr, dtype=np.int64)]
+                keep = pos >= 0
+                if not keep.any():
+                    continue
+                tfs = np.array(tf_arr, dtype=np.uint16)[keep]
+                postings[term] = (array("I", pos[keep].astype(np.uint32).tobytes()),
+                                  array("H", tfs.tobytes()))
+
+            self.postings = postings
+            self.chunk_ids = [self.chunk_ids[i] for i in live_positions]
+            self._position = {cid: i for i, cid in enumerate(self.chunk_ids)}
+            self.doc_lens = array("I", [self.doc_lens[i] for i in live_positions])
+            self.alive = bytearray(b"\x01" * len(live_positions))
+            self.docs = {doc_id: [int(remap[p]) for p in positions if remap[p] >= 0]
+                         for doc_id, positions in self.docs.items()}
+
+    def save(self, path: str = DEFAULT_INDEX_PATH):
+        """Compact and write the index to `path` atomically."""
+        with self._lock:
+            self.compact()
+            terms = list(self.postings.keys())
+            lengths = np.array([len(self.postings[t][0]) for t in terms], dtype=np.int64)
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+
+            positions = np.zeros(int(offsets[-1]), dtype=np.uint32)
+            tfs = np.zeros(int(offsets[-1]), dtype=np.uint16)
+            for i, term in enumerate(terms):
+                pos_arr, tf_arr = self.postings[term]
+                start, end = offsets[i], offsets[i + 1]
+                positions[start:end] = np.frombuffer(pos_arr, dtype=np.uint32)
+                tfs[start:end] = np.frombuffer(tf_arr, dtype=np.uint16)
+
+            # Delta-encode within each postings list (first entry stays absolute)
+            deltas = positions.copy()
+            if deltas.size:
+                deltas[1:] -= positions[:-1]
+                deltas[offsets[:-1][lengths > 0]] = positions[offsets[:-1][lengths > 0]]
+
+            header = {
+                "version": FORMAT_VERSION, "k1": self.k1, "b": self.b,
+                "terms": terms, "chunk_ids": self.chunk_ids,
+                "docs": {d: p for d, p in self.docs.items() if p},
+            }
+            header_bytes = np.frombuffer(json.dumps(header, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, header=header_bytes, offsets=offsets,
+                         deltas=varint_encode(deltas), tfs=varint_encode(tfs),
+                         doc_lens=np.array(self.doc_lens, dtype=np.uint32))
+            os.replace(tmp_path, path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH):
+        """Load an index written by save()."""
+        with np.load(path) as data:
+            header = json.loads(data["header"].tobytes().decode("utf-8"))
+            if header.get("version") != FORMAT_VERSION:
+                raise ValueError(f"[lexical_index] Unsupported index format in {path}: {header.get('version')}")
+            offsets = data["offsets"]
+            deltas = varint_decode(data["deltas"])
+            tfs = varint_decode(data["tfs"]).astype(np.uint16)
+            doc_lens = data["doc_lens"]
+
+        index = cls(k1=header["k1"], b=header["b"])
+        index.chunk_ids = header["chunk_ids"]
+        index._position = {cid: i for i, cid in enumerate(index.chunk_ids)}
+        index.doc_lens = array("I", doc_lens.astype(np.uint32).tobytes())
+        index.alive = bytearray(b"\x01" * len(index.chunk_ids))
+        index.docs = header["docs"]
+        index.total_len = int(doc_lens.sum())
+        index.live_count = len(index.chunk_ids)
+
+        # Undo the per-list delta encoding: a running sum, restarted at each list
+        positions = np.cumsum(deltas)
+        starts = offsets[:-1]
+        lengths = np.diff(offsets)
+        base = np.zeros(len(starts), dtype=np.int64)
+        nonzero_start = (starts > 0) & (lengths > 0)
+        base[nonzero_start] = positions[starts[nonzero_start] - 1]
+        positions = (positions - np.repeat(base, lengths)).astype(np.uint32)
+
+        for i, term in enumerate(header["terms"]):
+            start, end = offsets[i], offsets[i + 1]
+            index.postings[term] = (array("I", positions[start:end].tobytes()),
+                                    array("H", tfs[start:end].tobytes()))
+        return index
+
+    @classmethod
+    def load_or_create(cls, path: str = DEFAULT_INDEX_PATH):
+        """Load the index at path if it exists, otherwise return an empty one."""
+        if path and os.path.isfile(path):
+            return cls.load(path)
+        return cls()
+
+
+def varint_encode(values: np.ndarray) -> np.ndarray:
+    """
+    LEB128 variable-byte encoding of non-negative integers (7 bits per byte, high
+    bit set on every byte except a value's last). Small deltas and term frequencies
+    take one byte each. Vectorised: one pass per byte position (at most 5).
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if values.size == 0:
+        return np.empty(0, dtype=np.uint8)
+    nbytes = np.ones(values.shape[0], dtype=np.int64)
+    for j in range(1, 5):
+        nbytes += values >= (1 << (7 * j))
+    starts = np.cumsum(nbytes) - nbytes
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for j in range(int(nbytes.max())):
+        mask = nbytes > j
+        byte = (values[mask] >> np.uint64(7 * j)) & np.uint64(0x7F)
+        more = (nbytes[mask] > j + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + j] = (byte | more).astype(np.uint8)
+    return out
+
+
+def varint_decode(data: np.ndarray) -> np.ndarray:
+    """Inverse of varint_encode; returns an int64 array."""
+    data = np.asarray(data, dtype=np.uint8)
+    if data.size == 0:
+        return np.empty(0, dtype=np.int64)
+    last = (data & 0x80) == 0
+    value_idx = np.concatenate(([0], np.cumsum(last)[:-1]))
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    shift = 7 * (np.arange(data.shape[0]) - starts[value_idx])
+    parts = (data & 0x7F).astype(np.int64) << shift
+    return np.add.reduceat(parts, starts)
+
+
+def _term_counts(terms: list) -> dict:
+    counts = {}
+    for term in terms:
+        counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+def main():
+    """
+    CLI usage:
+      python lexical_index.py build <embedded_data.json|chunks.jsonl> [--index PATH]
+      python lexical_index.py query "<text>" [--index PATH] [--k 10]
+    """
+    parser = argparse.ArgumentParser(description="Build or query the BM25 lexical index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="(Re)index every document in an embedded data file.")
+    build.add_argument("input_json", help="Path to embedded_data.json (or a .jsonl file of chunk records)")
+    build.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Index file to update.")
+
+    query = sub.add_parser("query", help="Run a BM25 query against the index.")
+    query.add_argument("text", help="Query text")
+    query.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Index file to read.")
+    query.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        # Imported here so querying does not need the ingest module
+        from store_in_neo4j import iter_input_files
+
+        if not os.path.isfile(args.input_json):
+            print(f"[lexical_index] Cannot find input: {args.input_json}")
+            sys.exit(1)
+        index = LexicalIndex.load_or_create(args.index)
+        docs = sum(1 for _ in index.index_stream(iter_input_files(args.input_json)))
+        index.save(args.index)
+        print(f"[lexical_index] Indexed {docs} document pieces; {len(index)} chunks, "
+              f"{len(index.postings)} terms -> {args.index}")
+    else:
+        if not os.path.isfile(args.index):
+            print(f"[lexical_index] No index at {args.index}; run 'build' first.")
+            sys.exit(1)
+        index = LexicalIndex.load(args.index)
+        ids, scores = index.search(args.text, k=args.k)
+        for rank, (cid, score) in enumerate(zip(ids, scores), start=1):
+            print(f"{rank:>3}. {score:7.3f}  {cid}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+llm_scheduler.py
+
+A **generation scheduler** in front of the local LLM. Before it, every caller of
+rag_query.call_ollama talked to Ollama directly: no timeout (one hung generation froze
+the interactive session), no retry, and no limit on parallel calls (a batch run or a
+busy query_server could pile requests onto the model host).
+
+What it does:
+-------------
+  - **Concurrency limit**: at most `max_concurrent` generations run at once
+    (LLM_MAX_CONCURRENT); everything else waits in a queue. resize() changes the
+    limit at run time (rag_batch sets it from --workers).
+  - **Priority lanes**: "interactive" requests (terminal session, query_server) are
+    always started before "batch" ones (rag_batch); FIFO within a lane.
+  - **Deadlines**: each request has a deadline measured from submit(), covering queue
+    wait and generation (per-lane defaults LLM_INTERACTIVE_DEADLINE_S and
+    LLM_BATCH_DEADLINE_S). A watchdog expires queued requests that run out of time
+    and aborts running ones by cancelling their CancelToken, which shuts the socket
+    down, so even a server that never sends a byte releases the slot.
+  - **Cancellation**: GenerationRequest.cancel() (e.g. the HTTP client went away, or
+    Ctrl+C) removes a queued request or aborts a running one.
+  - **Retry**: connection errors are retried (`retries`, with backoff) while time is
+    left, but only if no token was streamed yet, so callers never see text twice.
+  - **Metrics**: per-lane queue depth (current and max), submitted / completed /
+    failed / cancelled / expired / retried counts, and wait and run time percentiles
+    over the most recent requests (metrics(), print_metrics()).
+
+Guiding Principles:
+1. **Protect the model host**: Concurrency is bounded no matter how many threads call.
+2. **Bounded latency**: Nothing waits forever; a deadline always ends a request.
+3. **Local only**: Threads and the keep-alive Ollama HTTP client (ollama_client.py);
+   mock_ollama_server.py can simulate slow and stuck generations offline.
+
+Usage:
+    from llm_scheduler import GenerationScheduler, DeadlineExceeded
+    from ollama_client import OllamaClient
+
+    scheduler = GenerationScheduler(OllamaClient().generate, max_concurrent=2)
+    request = scheduler.submit(prompt, model="deepseek-r1:32b", lane="interactive", deadline_s=60)
+    result = request.result()      # generate() dict; raises DeadlineExceeded / GenerationCancelled
+    scheduler.print_metrics()
+
+    # Try it against a fake LLM with slow and stuck generations:
+    python llm_scheduler.py --requests 40 --stuck-rate 0.1 --slow-rate 0.2 --deadline-s 5
+"""
+
+import os
+import time
+import heapq
+import argparse
+import itertools
+import threading
+from collections import deque
+
+from ollama_client import CancelToken, GenerationCancelled, CONNECTION_ERRORS
+from telemetry import percentile
+
+
+# Lanes in priority order: a queued interactive request always starts before batch work
+LANES = ("interactive", "batch")
+
+DEFAULT_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "2"))
+DEFAULT_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "1024"))
+DEFAULT_DEADLINES_S = {
+    "interactive": float(os.getenv("LLM_INTERACTIVE_DEADLINE_S", "180")),
+    "batch": float(os.getenv("LLM_BATCH_DEADLINE_S", "900")),
+}
+
+# Watchdog granularity: deadlines fire at most this late
+WATCHDOG_INTERVAL_S = 0.05
+
+# Wait/run samples kept per lane for the percentiles
+METRICS_WINDOW = 1000
+
+
+class DeadlineExceeded(GenerationCancelled):
+    """The request's deadline passed while it was queued or generating."""
+
+    def __init__(self, reason: str = "deadline"):
+        super().__init__(reason)
+
+
+class QueueFull(RuntimeError):
+    """submit() found max_queue requests already waiting."""
+
+
+class GenerationRequest:
+    """
+    Handle for one submitted generation; result() blocks until it is done.
+
+    status: "queued" -> "running" -> "done" | "failed" | "cancelled" | "expired"
+    """
+
+    def __init__(self, scheduler, prompt: str, model: str, lane: str, deadline_s: float,
+                 on_token=None, options: dict = None):
+        self._scheduler = scheduler
+        self.prompt = prompt
+        self.model = model
+        self.lane = lane
+        self.on_token = on_token
+        self.options = options
+        self.submitted_at = time.monotonic()
+        self.deadline = self.submitted_at + deadline_s
+        self.started_at = None
+        self.finished_at = None
+        self.status = "queued"
+        self.attempts = 0
+        self.tokens_streamed = 0
+        self.cancel_token = CancelToken()
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    @property
+    def wait_s(self) -> float:
+        """Time spent queued (so far, if still queued)."""
+        end = self.started_at if self.started_at is not None else (self.finished_at or time.monotonic())
+        return end - self.submitted_at
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def cancel(self, reason: str = "cancelled"):
+        """Drop the request if queued, abort it if running; no-op once finished."""
+        self._scheduler._cancel(self, reason)
+
+    def result(self, timeout: float = None) -> dict:
+        """
+        :return: the generate() result dict
+        :raises DeadlineExceeded: the deadline passed
+        :raises GenerationCancelled: cancel() was called
+        :raises TimeoutError: `timeout` passed first (the request keeps going)
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("[llm_scheduler] Request still pending")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class _LaneStats:
+    def __init__(self):
+        self.depth = 0
+        self.max_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.expired = 0
+        self.retried = 0
+        self.waits_ms = deque(maxlen=METRICS_WINDOW)
+        self.runs_ms = deque(maxlen=METRICS_WINDOW)
+
+
+class GenerationScheduler:
+    """
+    Bounded, prioritised, deadline-aware execution of LLM generations.
+    """
+
+    def __init__(self, generate_fn, max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+                 max_queue: int = DEFAULT_MAX_QUEUE, deadlines_s: dict = None,
+                 retries: int = 1, retry_backoff_s: float = 0.5):
+        """
+        :param generate_fn: callable(prompt, model=, on_token=, options=, cancel=) -> dict,
+                            e.g. OllamaClient.generate; must honour the CancelToken
+        :param max_concurrent: generations running at once
+        :param max_queue: requests allowed to wait (all lanes); submit() raises QueueFull beyond
+        :param deadlines_s: per-lane default deadlines (seconds from submit)
+        :param retries: extra attempts after a connection error (before any token streamed)
+        :param retry_backoff_s: sleep before a retry (doubled each time)
+        """
+        self.generate_fn = generate_fn
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.deadlines_s = dict(DEFAULT_DEADLINES_S, **(deadlines_s or {}))
+        self.retries = retries
+        self.retry_backoff_s = retry_backoff_s
+
+        self._cond = threading.Condition()
+        self._heap = []                 # (lane priority, seq, request)
+        self._seq = itertools.count()
+        self._running = set()
+        self._workers = []
+        self._closed = False
+        self._lanes = {lane: _LaneStats() for lane in LANES}
+
+        self._ensure_workers()
+        self._watchdog = threading.Thread(target=self._watch, name="llm_scheduler_watchdog", daemon=True)
+        self._watchdog.start()
+
+    # ----------------------------------------------------------------------------------
+    # Public API
+    # ----------------------------------------------------------------------------------
+    def submit(self, prompt: str, model: str, lane: str = "interactive", deadline_s: float = None,
+               on_token=None, options: dict = None) -> GenerationRequest:
+        """
+        Queue a generation.
+
+        :param lane: "interactive" or "batch"
+        :param deadline_s: seconds from now until the request is abandoned; the lane
+                           default if None
+        :param on_token: callback(str) for streamed text; runs on a scheduler thread
+        :raises QueueFull: if max_queue requests are already waiting
+        """
+        if lane not in self._lanes:
+            raise ValueError(f"[llm_scheduler] Unknown lane: {lane} (expected one of {LANES})")
+        if deadline_s is None:
+            deadline_s = self.deadlines_s[lane]
+        request = GenerationRequest(self, prompt, model, lane, deadline_s, on_token, options)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("[llm_scheduler] Scheduler is shut down")
+            if self.queue_depth() >= self.max_queue:
+                raise QueueFull(f"[llm_scheduler] {self.max_queue} requests already queued")
+            stats = self._lanes[lane]
+            stats.submitted += 1
+            stats.depth += 1
+            stats.max_depth = max(stats.max_depth, stats.depth)
+            heapq.heappush(self._heap, (LANES.index(lane), next(self._seq), request))
+            self._cond.notify_all()
+        return request
+
+    def generate(self, prompt: str, model: str, lane: str = "interactive", deadline_s: float = None,
+                 on_token=None, options: dict = None) -> dict:
+        """submit() and wait for the result."""
+        return self.submit(prompt, model, lane, deadline_s, on_token, options).result()
+
+    def resize(self, max_concurrent: int):
+        """Change the number of generations allowed to run at once."""
+        with self._cond:
+            self.max_concurrent = max(1, max_concurrent)
+            self._ensure_workers()
+            self._cond.notify_all()
+
+    def queue_depth(self, lane: str = None) -> int:
+        if lane is not None:
+            return self._lanes[lane].depth
+        return sum(stats.depth for stats in self._lanes.values())
+
+    def shutdown(self, cancel_running: bool = True):
+        """Cancel everything queued (and running, by default); workers exit."""
+        with self._cond:
+            self._closed = True
+            pending = [request for _, _, request in self._heap]
+            running = list(self._running)
+            self._cond.notify_all()
+        for request in pending:
+            request.cancel("scheduler shut down")
+        if cancel_running:
+            for request in running:
+                request.cancel("scheduler shut down")
+
+    def metrics(self) -> dict:
+        """Snapshot: {"running", "max_concurrent", "queued", "lanes": {lane: {...}}}"""
+        with self._cond:
+            lanes = {}
+            for lane, s in self._lanes.items():
+                waits, runs = list(s.waits_ms), list(s.runs_ms)
+                lanes[lane] = {
+                    "queued": s.depth, "max_queued": s.max_depth, "submitted": s.submitted,
+                    "completed": s.completed, "failed": s.failed, "cancelled": s.cancelled,
+                    "expired": s.expired, "retried": s.retried,
+                    "wait_p50_ms": percentile(waits, 50), "wait_p95_ms": percentile(waits, 95),
+                    "wait_max_ms": max(waits) if waits else 0.0,
+                    "run_p50_ms": percentile(runs, 50), "run_p95_ms": percentile(runs, 95),
+                }
+            return {"running": len(self._running), "max_concurrent": self.max_concurrent,
+                    "queued": self.queue_depth(), "lanes": lanes}
+
+    def print_metrics(self, prefix: str = "llm_scheduler"):
+        m = self.metrics()
+        print(f"[{prefix}] LLM scheduler: {m['running']}/{m['max_concurrent']} running, {m['queued']} queued")
+        for lane, s in m["lanes"].items():
+            if not s["submitted"]:
+                continue
+            print(f"  {lane}: {s['submitted']} submitted, {s['completed']} completed, {s['failed']} failed, "
+                  f"{s['expired']} expired, {s['cancelled']} cancelled, {s['retried']} retried; "
+                  f"wait p50 {s['wait_p50_ms']:.0f} ms / p95 {s['wait_p95_ms']:.0f} ms "
+                  f"(max queued {s['max_queued']}); run p50 {s['run_p50_ms']:.0f} ms / p95 {s['run_p95_ms']:.0f} ms")
+
+    # ----------------------------------------------------------------------------------
+    # Internals
+    # ----------------------------------------------------------------------------------
+    def _ensure_workers(self):
+        # Idle workers beyond max_concurrent simply wait; only the count of running
+        # requests is limited (see _next_request)
+        while len(self._workers) < self.max_concurrent:
+            worker = threading.Thread(target=self._work, name=f"llm_scheduler_{len(self._workers)}",
+                                      daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _finish(self, request: GenerationRequest, status: str, result: dict = None, error: Exception = None):
+        """Record the outcome once (caller holds self._cond)."""
+        if request.done():
+            return
+        request.status = status
+        request.finished_at = time.monotonic()
+        request._result = result
+        request._error = error
+        stats = self._lanes[request.lane]
+        if request.started_at is None:
+            # Never started: still counted in the queue depth
+            stats.depth -= 1
+            stats.waits_ms.append(request.wait_s * 1000.0)
+        else:
+            stats.runs_ms.append((request.finished_at - request.started_at) * 1000.0)
+        if status == "done":
+            stats.completed += 1
+        elif status == "expired":
+            stats.expired += 1
+        elif status == "cancelled":
+            stats.cancelled += 1
+        else:
+            stats.failed += 1
+        request._done.set()
+
+    def _cancel(self, request: GenerationRequest, reason: str):
+        with self._cond:
+            if request.done():
+                return
+            if request.started_at is None:
+                # Still queued: its heap entry is skipped when popped
+                self._finish(request, "cancelled", error=GenerationCancelled(reason))
+                return
+        request.cancel_token.cancel(reason)
+
+    def _next_request(self):
+        """Block until a request may start; None when shut down."""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                if self._heap and len(self._running) < self.max_concurrent:
+                    _, _, request = heapq.heappop(self._heap)
+                    if request.done():
+                        continue
+                    request.started_at = time.monotonic()
+                    request.status = "running"
+                    stats = self._lanes[request.lane]
+                    stats.depth -= 1
+                    stats.waits_ms.append(request.wait_s * 1000.0)
+                    self._running.add(request)
+                    return request
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            request = self._next_request()
+            if request is None:
+                return
+            try:
+                status, result, error = self._run(request)
+            except BaseException as e:      # never lose a worker to an unexpected error
+                status, result, error = "failed", None, e
+            with self._cond:
+                self._running.discard(request)
+                self._finish(request, status, result, error)
+                self._cond.notify_all()
+
+    def _run(self, request: GenerationRequest):
+        def on_token(piece: str):
+            request.tokens_streamed += 1
+            if request.on_token is not None:
+                request.on_token(piece)
+
+        backoff = self.retry_backoff_s
+        while True:
+            request.attempts += 1
+            try:
+                result = self.generate_fn(request.prompt, model=request.model, on_token=on_token,
+                                          options=request.options, cancel=request.cancel_token)
+                return "done", result, None
+            except GenerationCancelled as e:
+                if e.reason == "deadline":
+                    return "expired", None, DeadlineExceeded()
+                return "cancelled", None, e
+            except CONNECTION_ERRORS as e:
+                remaining = request.deadline - time.monotonic()
+                if (request.attempts > self.retries or request.tokens_streamed
+                        or request.cancel_token.cancelled or remaining <= backoff):
+                    return "failed", None, e
+                with self._cond:
+                    self._lanes[request.lane].retried += 1
+                print(f"[llm_scheduler] Generation failed ({e}); retrying in {backoff:.1f}s")
+                time.sleep(backoff)
+                backoff *= 2
+                if request.cancel_token.cancelled:
+                    return self._run_cancelled(request)
+            except Exception as e:
+                return "failed", None, e
+
+    @staticmethod
+    def _run_cancelled(request: GenerationRequest):
+        reason = request.cancel_token.reason
+        if reason == "deadline":
+            return "expired", None, DeadlineExceeded()
+        return "cancelled", None, GenerationCancelled(reason)
+
+    def _watch(self):
+        """Expire queued requests and abort running ones whose deadline has passed."""
+        while True:
+            time.sleep(WATCHDOG_INTERVAL_S)
+            now = time.monotonic()
+            with self._cond:
+                if self._closed and not self._running:
+                    return
+                expired_queued = [r for _, _, r in self._heap if not r.done() and r.deadline <= now]
+                for request in expired_queued:
+                    self._finish(request, "expired", error=DeadlineExceeded())
+                overdue = [r for r in self._running if r.deadline <= now and not r.cancel_token.cancelled]
+            for request in overdue:
+                request.cancel_token.cancel("deadline")
+
+
+def main():
+    # Imported here: only the self-test needs the mock server
+    from ollama_client import OllamaClient
+    from mock_ollama_server import start_mock_server
+
+    parser = argparse.ArgumentParser(description="Exercise the LLM scheduler against a fake LLM.")
+    parser.add_argument("--requests", type=int, default=40, help="Requests to submit (alternating lanes).")
+    parser.add_argument("--max-concurrent", type=int, default=2)
+    parser.add_argument("--deadline-s", type=float, default=5.0, help="Per-request deadline.")
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--slow-rate", type=float, default=0.2)
+    parser.add_argument("--stuck-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server, url = start_mock_server(ttft_ms=args.ttft_ms, token_ms=args.token_ms, tokens=args.tokens,
+                                    load_ms=0, slow_rate=args.slow_rate, stuck_rate=args.stuck_rate)
+    scheduler = GenerationScheduler(OllamaClient(url).generate, max_concurrent=args.max_concurrent)
+    print(f"[llm_scheduler] Fake LLM at {url}: {args.slow_rate:.0%} slow, {args.stuck_rate:.0%} stuck; "
+          f"{args.requests} requests, {args.max_concurrent} concurrent, deadline {args.deadline_s}s")
+
+    start = time.perf_counter()
+    requests = [scheduler.submit(f"question {i}", model="mock", lane=LANES[i % 2], deadline_s=args.deadline_s)
+                for i in range(args.requests)]
+    outcomes = {}
+    for request in requests:
+        try:
+            request.result()
+        except Exception:
+            # Outcome is in request.status (expired, cancelled, failed)
+            pass
+        outcomes[request.status] = outcomes.get(request.status, 0) + 1
+    wall = time.perf_counter() - start
+
+    print(f"[llm_scheduler] Finished in {wall:.2f}s: {outcomes}")
+    scheduler.print_metrics()
+    # Give the fake server a moment to notice the aborted connections
+    time.sleep(0.2)
+    state = server.state
+    print(f"[llm_scheduler] Fake LLM: {state.requests} requests, {state.slow_requests} slow, "
+          f"{state.stuck_requests} stuck, {state.abandoned} abandoned by the client, {state.active} still active")
+    scheduler.shutdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
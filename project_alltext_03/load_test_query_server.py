@@ -0,0 +1,227 @@
+"""
+load_test_query_server.py
+
+Load test for query_server.py: measures **p50 / p95 / p99 latency and QPS** of
+/query (or /retrieve) at a given client concurrency, and counts 429 rejections from
+admission control.
+
+By default it is fully **self-contained**, so it runs offline:
+  - a mock Ollama server (mock_ollama_server.py) with configurable prefill/decode time,
+  - a stand-in Neo4j driver serving a synthetic corpus (random embeddings) for the
+    two queries the server issues (index load, content fetch),
+  - a hashing embedder instead of the SentenceTransformer (deterministic, ~free),
+all in-process with a real QueryService behind a real HTTP server. Use --url to
+target an already running query_server instead.
+
+Clients are closed-loop: each of --concurrency threads sends its next request as
+soon as the previous one returns, over its own keep-alive connection.
+
+Usage:
+    python load_test_query_server.py [--concurrency 16] [--requests 500] [--endpoint query]
+                                     [--max-active 8] [--max-queue 64] [--chunks 20000]
+                                     [--llm-ttft-ms 50] [--llm-token-ms 2] [--llm-tokens 40]
+                                     [--llm-concurrency 8] [--llm-stuck-rate 0.01 --llm-deadline-s 2]
+    python load_test_query_server.py --url http://127.0.0.1:8000 --concurrency 32
+"""
+
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlparse
+
+import numpy as np
+
+from neo4j_connection import Neo4jConnection
+from mock_ollama_server import start_mock_server
+import rag_query
+from ollama_client import OllamaClient
+from query_server import QueryService, start_server
+from model_router import ModelRouter, load_policy
+from telemetry import percentile
+
+
+class _Record:
+    def __init__(self, values: dict):
+        self._values = values
+
+    def data(self) -> dict:
+        return dict(self._values)
+
+
+class SyntheticStoreDriver:
+    """
+    Driver-compatible stand-in serving a synthetic corpus: N chunks with random
+    embeddings. Answers the index load, content fetch and store version reads;
+    `rtt_ms` models the Bolt round trip.
+    """
+
+    def __init__(self, chunks: int = 20000, dim: int = 384, rtt_ms: float = 0.5, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.ids = [f"doc_{i // 50}.txt_par_{i % 50}" for i in range(chunks)]
+        self.embeddings = rng.normal(size=(chunks, dim)).astype(np.float32)
+        self.rtt = rtt_ms / 1000.0
+
+    def session(self, **kwargs):
+        return self
+
+    def begin_transaction(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def close(self):
+        pass
+
+    def run(self, query: str, params: dict = None):
+        time.sleep(self.rtt)
+        params = params or {}
+        if "StoreMeta" in query:
+            return [_Record({"version": 1})]
+        if "IN $ids" in query:
+            return [_Record({"chunk_id": cid, "content": f"Synthetic content of {cid}. Revenue was {len(cid) * 10}."})
+                    for cid in params["ids"]]
+        if "c.embedding AS embedding" in query:
+            return [_Record({"chunk_id": cid, "embedding": emb, "topic_id": None})
+                    for cid, emb in zip(self.ids, self.embeddings)]
+        return []
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedder: sum of per-token random vectors."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._cache = {}
+
+    def _token_vector(self, token: str) -> np.ndarray:
+        vec = self._cache.get(token)
+        if vec is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode("utf-8")))
+            vec = self._cache[token] = rng.normal(size=self.dim).astype(np.float32)
+        return vec
+
+    def __call__(self, texts) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.lower().split():
+                out[i] += self._token_vector(token)
+        return out
+
+
+def run_load(url: str, endpoint: str, concurrency: int, total_requests: int, seed: int = 0) -> dict:
+    """Closed-loop load: `concurrency` threads share `total_requests` requests."""
+    parsed = urlparse(url)
+    words = ["revenue", "team", "daily", "sales", "q3", "growth", "region", "forecast", "budget", "cost"]
+    counter = {"next": 0}
+    lock = threading.Lock()
+    latencies, statuses = [], {}
+
+    def client(worker_id: int):
+        rng = random.Random(seed + worker_id)
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=120)
+        while True:
+            with lock:
+                if counter["next"] >= total_requests:
+                    break
+                counter["next"] += 1
+            question = " ".join(rng.choice(words) for _ in range(6)) + "?"
+            body = json.dumps({"question": question, "k": 5})
+            start = time.perf_counter()
+            try:
+                conn.request("POST", f"/{endpoint}", body=body, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=120)
+                status = "error"
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    return {
+        "requests": total_requests, "concurrency": concurrency, "wall_s": wall,
+        "qps": statuses.get(200, 0) / wall if wall > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99), "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test query_server.py (self-contained by default).")
+    parser.add_argument("--url", help="Target a running query_server instead of starting one.")
+    parser.add_argument("--endpoint", choices=["query", "retrieve"], default="query")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--max-active", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0)
+    parser.add_argument("--chunks", type=int, default=20000, help="Synthetic corpus size.")
+    parser.add_argument("--llm-ttft-ms", type=float, default=50.0)
+    parser.add_argument("--llm-token-ms", type=float, default=2.0)
+    parser.add_argument("--llm-tokens", type=int, default=40)
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="LLM scheduler concurrency.")
+    parser.add_argument("--llm-deadline-s", type=float, default=None, help="Per-answer LLM deadline.")
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="Fraction of slow mock generations.")
+    parser.add_argument("--llm-stuck-rate", type=float, default=0.0, help="Fraction of stuck mock generations.")
+    args = parser.parse_args()
+
+    server = llm = None
+    url = args.url
+    if not url:
+        llm, llm_url = start_mock_server(ttft_ms=args.llm_ttft_ms, token_ms=args.llm_token_ms,
+                                         tokens=args.llm_tokens, load_ms=0, slow_rate=args.llm_slow_rate,
+                                         stuck_rate=args.llm_stuck_rate)
+        rag_query._ollama_client = OllamaClient(llm_url)
+        rag_query.get_llm_scheduler().resize(args.llm_concurrency)
+        conn = Neo4jConnection(driver=SyntheticStoreDriver(chunks=args.chunks))
+        # Route between two mock model names; no routing log for synthetic traffic
+        router = ModelRouter(load_policy(small_model="mock-small", large_model="mock-large"), log_path=None)
+        service = QueryService(conn, embedder=HashingEmbedder(), router=router,
+                               max_active=args.max_active, max_queue=args.max_queue,
+                               batch_size=args.batch_size, batch_wait_ms=args.batch_wait_ms,
+                               llm_deadline_s=args.llm_deadline_s)
+        server, url = start_server(service, port=0)
+        print(f"[load_test] Self-contained: query server {url}, mock LLM {llm_url}, "
+              f"{args.chunks} synthetic chunks")
+
+    result = run_load(url, args.endpoint, args.concurrency, args.requests)
+
+    print(f"\n[load_test] /{args.endpoint}: {result['requests']} requests, concurrency {result['concurrency']}")
+    print(f"  QPS {result['qps']:.1f}   p50 {result['p50_ms']:.1f} ms   p95 {result['p95_ms']:.1f} ms   "
+          f"p99 {result['p99_ms']:.1f} ms   (wall {result['wall_s']:.2f}s)")
+    print(f"  statuses: {result['statuses']}")
+    if server is not None:
+        health = service.health()
+        if health["batches"]:
+            print(f"  micro-batches: {health['batches']} (avg {health['batched_items'] / health['batches']:.1f} "
+                  f"questions/batch), rejected {health['rejected']}")
+        rag_query.get_llm_scheduler().print_metrics(prefix="load_test")
+        router.print_stats(prefix="load_test")
+        server.shutdown()
+        llm.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+mock_ollama_server.py
+
+A local **stand-in for the Ollama REST API**, so the HTTP LLM path (ollama_client.py,
+rag_query.call_ollama) can be exercised and timed offline, without a GPU or a
+downloaded model.
+
+It implements just what we use:
+  - GET  /api/tags      -> {"models": [...]}
+  - POST /api/generate  -> streamed NDJSON chunks {"response": "...", "done": false}
+                           followed by a final {"done": true, "eval_count", "eval_duration",
+                           "prompt_eval_count", "load_duration", ...}
+                           (or a single JSON object when "stream": false)
+
+The timing model is deliberately simple: `--ttft-ms` before the first token (prefill),
+then `--token-ms` per generated token (decode). The "model load" cost (`--load-ms`) is
+paid on the first request, and again whenever the previous request's keep_alive has
+expired, so the effect of keep_alive is visible. Connections are HTTP/1.1 keep-alive.
+
+Misbehaving generations, for exercising timeouts and cancellation (llm_scheduler.py):
+  - slow:  `--slow-rate` of requests (or any prompt containing "[[slow]]") run
+           `--slow-factor` times slower, prefill and decode;
+  - stuck: `--stuck-rate` of requests (or any prompt containing "[[stuck]]") never
+           produce a token; the handler holds the connection until the client gives
+           up (counted in state.abandoned) or `--stuck-s` passes.
+
+Usage:
+    python mock_ollama_server.py [--port 11435] [--ttft-ms 200] [--token-ms 20] [--tokens 50]
+    OLLAMA_HOST=http://localhost:11435 python rag_query.py
+
+    # In-process (tests/benchmarks):
+    from mock_ollama_server import start_mock_server
+    server, url = start_mock_server(ttft_ms=5, token_ms=1)
+    ...
+    server.shutdown()
+"""
+
+import re
+import json
+import time
+import random
+import select
+import socket
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+_DURATION_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*$")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0, None: 1.0}
+
+
+def client_disconnected(sock) -> bool:
+    """True if the peer closed the connection (readable with EOF); never blocks."""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+def parse_keep_alive(value) -> float:
+    """Ollama keep_alive ("30m", "10s", 300, -1) -> seconds (inf for negative)."""
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    match = _DURATION_RE.match(str(value))
+    if not match:
+        return 300.0
+    seconds = float(match.group(1)) * _UNITS[match.group(2)]
+    return float("inf") if seconds < 0 else seconds
+
+
+class MockOllamaState:
+    """Timing parameters plus which models are 'loaded' and until when."""
+
+    def __init__(self, ttft_ms: float = 200.0, token_ms: float = 20.0, tokens: int = 50,
+                 load_ms: float = 1000.0, slow_rate: float = 0.0, slow_factor: float = 10.0,
+                 stuck_rate: float = 0.0, stuck_s: float = 3600.0, seed: int = 0):
+        self.ttft = ttft_ms / 1000.0
+        self.token = token_ms / 1000.0
+        self.tokens = tokens
+        self.load = load_ms / 1000.0
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.stuck_rate = stuck_rate
+        self.stuck = stuck_s
+        self.loaded_until = {}          # model -> monotonic deadline
+        self.lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.requests = 0
+        self.loads = 0
+        self.slow_requests = 0
+        self.stuck_requests = 0
+        self.abandoned = 0              # client disconnected before the answer was complete
+        self.active = 0
+
+    def acquire_model(self, model: str, keep_alive) -> float:
+        """Return the load time to charge for this request and extend residency."""
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            cold = self.loaded_until.get(model, 0.0) < now
+            if cold:
+                self.loads += 1
+            self.loaded_until[model] = now + parse_keep_alive(keep_alive)
+        return self.load if cold else 0.0
+
+    def behaviour(self, prompt: str) -> str:
+        """'stuck', 'slow' or 'normal' for the next request (prompt markers win)."""
+        with self.lock:
+            if "[[stuck]]" in prompt or self._rng.random() < self.stuck_rate:
+                self.stuck_requests += 1
+                return "stuck"
+            if "[[slow]]" in prompt or self._rng.random() < self.slow_rate:
+                self.slow_requests += 1
+                return "slow"
+        return "normal"
+
+    def count_abandoned(self):
+        with self.lock:
+            self.abandoned += 1
+
+
+def make_handler(state: MockOllamaState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, status: int, obj: dict):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                with state.lock:
+                    models = [{"name": m} for m in state.loaded_until]
+                self._send_json(200, {"models": models})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", "0"))
+            try:
+                req = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": "invalid JSON"})
+                return
+            if self.path != "/api/generate":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            with state.lock:
+                state.active += 1
+            try:
+                self._generate(req)
+            except (BrokenPipeError, ConnectionResetError):
+                state.count_abandoned()
+                self.close_connection = True
+            finally:
+                with state.lock:
+                    state.active -= 1
+
+        def _hold_stuck(self):
+            """Produce nothing until the client disconnects or state.stuck passes."""
+            until = time.monotonic() + state.stuck
+            while time.monotonic() < until:
+                if client_disconnected(self.connection):
+                    state.count_abandoned()
+                    break
+                time.sleep(0.02)
+            self.close_connection = True
+
+        def _generate(self, req: dict):
+            model = req.get("model", "mock")
+            prompt = req.get("prompt", "")
+            n_tokens = int((req.get("options") or {}).get("num_predict") or state.tokens)
+            load_s = state.acquire_model(model, req.get("keep_alive"))
+            behaviour = state.behaviour(prompt)
+            if behaviour == "stuck":
+                self._hold_stuck()
+                return
+            factor = state.slow_factor if behaviour == "slow" else 1.0
+            ttft, token = state.ttft * factor, state.token * factor
+            start = time.perf_counter()
+            time.sleep(load_s + ttft)
+            words = [f"tok{i} " for i in range(n_tokens)]
+            final = {
+                "model": model, "done": True,
+                "prompt_eval_count": len(prompt.split()),
+                "eval_count": n_tokens,
+                "load_duration": int(load_s * 1e9),
+            }
+
+            if req.get("stream", True) is False:
+                time.sleep(token * max(n_tokens - 1, 0))
+                final["eval_duration"] = int(token * n_tokens * 1e9)
+                final["total_duration"] = int((time.perf_counter() - start) * 1e9)
+                final["response"] = "".join(words)
+                self._send_json(200, final)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            decode_start = time.perf_counter()
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(token)
+                self._write_chunk(json.dumps({"model": model, "response": word, "done": False}).encode() + b"\n")
+            final["eval_duration"] = int(max(time.perf_counter() - decode_start, 1e-9) * 1e9)
+            final["total_duration"] = int((time.perf_counter() - start) * 1e9)
+            final["response"] = ""
+            self._write_chunk(json.dumps(final).encode() + b"\n")
+            self._write_chunk(b"")
+
+    return Handler
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, **timing):
+    """
+    Start the mock server on a background thread.
+
+    :param port: 0 picks a free port
+    :param timing: MockOllamaState kwargs (ttft_ms, token_ms, tokens, load_ms,
+                   slow_rate, slow_factor, stuck_rate, stuck_s)
+    :return: (server, base_url); server.state holds counters; call server.shutdown() to stop
+    """
+    state = MockOllamaState(**timing)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama REST API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="Delay before the first token.")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="Delay per generated token.")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per answer.")
+    parser.add_argument("--load-ms", type=float, default=1000.0,
+                        help="Model load time when the model is not resident (keep_alive expired).")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests that are slow.")
+    parser.add_argument("--slow-factor", type=float, default=10.0, help="Slow requests take this many times longer.")
+    parser.add_argument("--stuck-rate", type=float, default=0.0,
+                        help="Fraction of requests that never produce a token.")
+    parser.add_argument("--stuck-s", type=float, default=3600.0,
+                        help="How long a stuck request holds its connection at most.")
+    args = parser.parse_args()
+
+    server, url = start_mock_server(args.host, args.port, ttft_ms=args.ttft_ms, token_ms=args.token_ms,
+                                    tokens=args.tokens, load_ms=args.load_ms, slow_rate=args.slow_rate,
+                                    slow_factor=args.slow_factor, stuck_rate=args.stuck_rate,
+                                    stuck_s=args.stuck_s)
+    print(f"[mock_ollama_server] Serving a mock Ollama API at {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("[mock_ollama_server] Stopped.")
+
+
+if __name__ == "__main__":
+    main()
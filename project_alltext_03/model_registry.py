@@ -0,0 +1,99 @@
+"""
+model_registry.py
+
+One place that loads the pipeline's heavy models **once per process** and hands the
+same instance to every stage that needs it:
+
+  - SentenceTransformer embedding models (embedding_text.py, rag_query.py, rag_batch.py,
+    query_server.py), keyed by model name,
+  - the docTR OCR predictor (parse_image.py), which used to be rebuilt for every image.
+
+When run_pipeline.py runs the stages in-process (--mode inprocess), extraction,
+embedding and the interactive session therefore share the loaded weights instead of
+each subprocess importing torch and loading them again. Load times are recorded so
+the pipeline can report them.
+
+Guiding Principles:
+1. **Lazy**: Nothing is imported or loaded until a stage asks for it.
+2. **Thread-safe**: Concurrent first requests for a model load it once.
+3. **Local only**: Models come from the local Hugging Face / docTR caches.
+
+Usage:
+    from model_registry import get_registry
+
+    registry = get_registry()
+    model = registry.sentence_transformer("all-MiniLM-L6-v2")
+    ocr = registry.ocr_predictor()
+    registry.print_stats()
+"""
+
+import time
+import threading
+
+
+class ModelRegistry:
+    """
+    Lazily loaded, process-wide model instances.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.load_seconds = {}
+
+    def get(self, key: str, loader):
+        """
+        Return the model stored under `key`, calling loader() the first time.
+
+        :param key: registry key, e.g. "sentence_transformer:all-MiniLM-L6-v2"
+        :param loader: zero-argument callable that loads the model
+        """
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Per-key lock: loading one model does not block lookups of another
+        with key_lock:
+            model = self._models.get(key)
+            if model is None:
+                start = time.perf_counter()
+                model = loader()
+                self.load_seconds[key] = time.perf_counter() - start
+                self._models[key] = model
+                print(f"[model_registry] Loaded {key} in {self.load_seconds[key]:.2f}s")
+        return model
+
+    def put(self, key: str, model):
+        """Register an already loaded model (or a stand-in) under `key`."""
+        self._models[key] = model
+
+    def sentence_transformer(self, model_name: str = "all-MiniLM-L6-v2"):
+        def load():
+            from sentence_transformers import SentenceTransformer
+            return SentenceTransformer(model_name)
+        return self.get(f"sentence_transformer:{model_name}", load)
+
+    def ocr_predictor(self):
+        def load():
+            from doctr.models import ocr_predictor
+            return ocr_predictor(pretrained=True)
+        return self.get("doctr:ocr_predictor", load)
+
+    def loaded(self) -> list:
+        return sorted(self._models)
+
+    def print_stats(self, prefix: str = "model_registry"):
+        total = sum(self.load_seconds.values())
+        print(f"[{prefix}] Models loaded: {len(self.load_seconds)} ({total:.2f}s total)")
+        for key, seconds in sorted(self.load_seconds.items()):
+            print(f"  {key}: {seconds:.2f}s")
+
+
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    """The process-wide registry."""
+    return _registry
@@ -0,0 +1,335 @@
+"""
+model_router.py
+
+**Latency-aware routing between a small and a large local LLM.** Every answer used
+to go to deepseek-r1:32b, so a short factual lookup ("What was Team A's revenue on
+2023-07-14?") paid the same prefill and decode cost as a question that needs
+reasoning over many chunks. The router picks the generation model per request.
+
+Policy (all thresholds configurable, see DEFAULT_POLICY):
+------------------------------------------------------------
+1) Long prompts go to the large model: more than `max_small_prompt_tokens` tokens of
+   packed context means many chunks to synthesise.
+2) Weak retrieval goes to the large model: top similarity below `min_top_sim`.
+3) Ambiguous retrieval goes to the large model: the margin between the best and the
+   second-best chunk below `min_margin` (several competing pieces of evidence).
+4) Otherwise (short prompt, one clearly winning chunk) the small model answers.
+5) A per-request **latency budget** overrides the above: if the predicted latency of
+   the chosen model exceeds the budget and the other model is faster, the faster one
+   is used ("latency_budget"; "latency_budget_unmet" if even that is predicted over).
+
+Predicted latency per model = prompt_tokens / prefill rate + expected output tokens /
+decode rate. The rates start from priors in the policy and follow the measured values
+(exponential moving average) as answers complete.
+
+Every decision and its outcome (latency, TTFT, tokens, error, budget met) is appended
+to a JSONL log (MODEL_ROUTING_LOG, default model_routing.jsonl). `report` summarises
+the log per model, per reason and per prompt-size / margin bucket, which is the data
+for tuning the thresholds; reopening a router replays the log's recent outcomes to
+warm its latency estimates.
+
+Guiding Principles:
+1. **Cheap**: Routing uses features we already have (packed prompt tokens,
+   retrieval similarities); no extra model call.
+2. **Explicit overrides**: A caller-chosen model (--model) is never re-routed.
+3. **Local only**: Both models are served by the local Ollama.
+
+Usage:
+    from model_router import ModelRouter
+
+    router = ModelRouter.open()     # LLM_SMALL_MODEL / LLM_LARGE_MODEL / MODEL_ROUTER_POLICY
+    decision = router.choose(prompt_tokens=640, sims=[0.71, 0.52, 0.50], latency_budget_ms=8000)
+    answer = call_ollama(prompt, model=decision["model"], stats=stats)
+    router.record(decision, stats)
+
+    python model_router.py route --prompt-tokens 640 --sims 0.71 0.52 --budget-ms 8000
+    python model_router.py report [--log model_routing.jsonl]
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+
+from telemetry import percentile
+
+
+DEFAULT_POLICY = {
+    "small_model": os.getenv("LLM_SMALL_MODEL", "deepseek-r1:14b"),
+    "large_model": os.getenv("LLM_LARGE_MODEL", "deepseek-r1:32b"),
+    "max_small_prompt_tokens": int(os.getenv("LLM_ROUTER_MAX_SMALL_PROMPT_TOKENS", "1200")),
+    "min_top_sim": float(os.getenv("LLM_ROUTER_MIN_TOP_SIM", "0.5")),
+    "min_margin": float(os.getenv("LLM_ROUTER_MIN_MARGIN", "0.05")),
+    # Latency priors (tokens/s) until measurements arrive, and the expected answer length
+    "prefill_tokens_per_s": {"small": 1500.0, "large": 700.0},
+    "decode_tokens_per_s": {"small": 30.0, "large": 15.0},
+    "expected_output_tokens": 300,
+}
+
+DEFAULT_LOG_PATH = os.getenv("MODEL_ROUTING_LOG", "model_routing.jsonl")
+DEFAULT_POLICY_PATH = os.getenv("MODEL_ROUTER_POLICY", "")
+
+# Weight of a new measurement in the moving averages
+EWMA_ALPHA = 0.2
+
+# Outcomes replayed from the log when a router is opened
+WARMUP_RECORDS = 500
+
+PROMPT_TOKEN_BUCKETS = (500, 1000, 2000, 4000)
+MARGIN_BUCKETS = (0.02, 0.05, 0.1, 0.2)
+
+
+def load_policy(path: str = None, **overrides) -> dict:
+    """DEFAULT_POLICY, updated from a JSON file (if given) and keyword overrides."""
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            policy.update(json.load(f))
+    policy.update({k: v for k, v in overrides.items() if v is not None})
+    return policy
+
+
+def _bucket_labels(edges) -> list:
+    """Bucket labels in ascending order: ["0-a", "a-b", ..., ">=z", "n/a"]."""
+    bounds = (0,) + tuple(edges)
+    return [f"{lo}-{hi}" for lo, hi in zip(bounds, bounds[1:])] + [f">={bounds[-1]}", "n/a"]
+
+
+def _bucket(value, edges) -> str:
+    labels = _bucket_labels(edges)
+    if value is None:
+        return labels[-1]
+    for i, edge in enumerate(edges):
+        if value < edge:
+            return labels[i]
+    return labels[-2]
+
+
+class ModelRouter:
+    """
+    Chooses small vs large model per request and learns per-model latency.
+    """
+
+    def __init__(self, policy: dict = None, log_path: str = DEFAULT_LOG_PATH):
+        """
+        :param policy: see DEFAULT_POLICY (load_policy() to merge overrides)
+        :param log_path: JSONL decision/outcome log; None disables logging
+        """
+        self.policy = policy or load_policy()
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self.prefill_tps = dict(self.policy["prefill_tokens_per_s"])
+        self.decode_tps = dict(self.policy["decode_tokens_per_s"])
+        self.output_tokens = {tier: float(self.policy["expected_output_tokens"]) for tier in ("small", "large")}
+        self.decisions = {"small": 0, "large": 0}
+
+    @classmethod
+    def open(cls, log_path: str = DEFAULT_LOG_PATH, policy_path: str = DEFAULT_POLICY_PATH, **overrides):
+        """Router with the policy file/overrides applied, warmed from the log's recent outcomes."""
+        router = cls(load_policy(policy_path, **overrides), log_path)
+        if log_path and os.path.exists(log_path):
+            for record in read_log(log_path)[-WARMUP_RECORDS:]:
+                if record.get("tier") in router.decode_tps:
+                    router._learn(record["tier"], record)
+        return router
+
+    def tier_of(self, model: str) -> str:
+        if model == self.policy["small_model"]:
+            return "small"
+        if model == self.policy["large_model"]:
+            return "large"
+        return None
+
+    def predict_ms(self, tier: str, prompt_tokens: int) -> float:
+        """Predicted wall time (prefill + decode) of one answer on `tier`."""
+        with self._lock:
+            prefill_s = prompt_tokens / max(self.prefill_tps[tier], 1e-6)
+            decode_s = self.output_tokens[tier] / max(self.decode_tps[tier], 1e-6)
+        return (prefill_s + decode_s) * 1000.0
+
+    def route(self, prompt_tokens: int, sims=None, latency_budget_ms: float = None) -> dict:
+        """
+        Pick the model for one request.
+
+        :param prompt_tokens: tokens of the packed prompt (build_prompt report)
+        :param sims: retrieval similarities of the packed chunks (any order)
+        :param latency_budget_ms: optional end-to-end generation budget
+        :return: {"model", "tier", "reason", "prompt_tokens", "top_sim", "margin",
+                  "latency_budget_ms", "predicted_ms": {"small": ms, "large": ms}}
+        """
+        p = self.policy
+        ordered = sorted((float(s) for s in (sims or [])), reverse=True)
+        top_sim = round(ordered[0], 6) if ordered else None
+        margin = round(ordered[0] - ordered[1], 6) if len(ordered) > 1 else None
+
+        if prompt_tokens > p["max_small_prompt_tokens"]:
+            tier, reason = "large", "long_prompt"
+        elif top_sim is None or top_sim < p["min_top_sim"]:
+            tier, reason = "large", "low_similarity"
+        elif margin is not None and margin < p["min_margin"]:
+            tier, reason = "large", "ambiguous_retrieval"
+        else:
+            tier, reason = "small", "confident_lookup"
+
+        predicted = {t: self.predict_ms(t, prompt_tokens) for t in ("small", "large")}
+        if latency_budget_ms is not None and predicted[tier] > latency_budget_ms:
+            other = "small" if tier == "large" else "large"
+            if predicted[other] < predicted[tier]:
+                tier = other
+                reason = "latency_budget" if predicted[other] <= latency_budget_ms else "latency_budget_unmet"
+
+        with self._lock:
+            self.decisions[tier] += 1
+        return {
+            "model": p[f"{tier}_model"], "tier": tier, "reason": reason,
+            "prompt_tokens": prompt_tokens, "top_sim": top_sim, "margin": margin,
+            "latency_budget_ms": latency_budget_ms, "predicted_ms": predicted,
+        }
+
+    def _learn(self, tier: str, outcome: dict):
+        """Fold one measured answer into the tier's moving averages."""
+        if outcome.get("error"):
+            return
+        with self._lock:
+            prompt_tokens, ttft_ms = outcome.get("prompt_tokens"), outcome.get("ttft_ms")
+            if prompt_tokens and ttft_ms:
+                rate = prompt_tokens / (ttft_ms / 1000.0)
+                self.prefill_tps[tier] += EWMA_ALPHA * (rate - self.prefill_tps[tier])
+            if outcome.get("tokens_per_s"):
+                self.decode_tps[tier] += EWMA_ALPHA * (outcome["tokens_per_s"] - self.decode_tps[tier])
+            if outcome.get("tokens"):
+                self.output_tokens[tier] += EWMA_ALPHA * (outcome["tokens"] - self.output_tokens[tier])
+
+    def record(self, decision: dict, stats: dict, latency_ms: float = None, **extra) -> dict:
+        """
+        Log a decision with its outcome and update the latency estimates.
+
+        :param decision: route() result (a fixed model may be recorded with tier None)
+        :param stats: call_ollama stats (total_s, ttft_s, tokens, tokens_per_s, error)
+        :param latency_ms: measured generation latency; stats["total_s"] if None
+        :param extra: extra fields for the log line (question id, lane, ...)
+        :return: the logged record
+        """
+        if latency_ms is None and "total_s" in stats:
+            latency_ms = stats["total_s"] * 1000.0
+        record = dict(decision, ts=time.time(), latency_ms=latency_ms,
+                      ttft_ms=stats["ttft_s"] * 1000.0 if "ttft_s" in stats else None,
+                      tokens=stats.get("tokens"), tokens_per_s=stats.get("tokens_per_s"),
+                      error=stats.get("error"), **extra)
+        budget = decision.get("latency_budget_ms")
+        record["budget_met"] = (latency_ms <= budget) if budget is not None and latency_ms is not None else None
+        if decision.get("tier") in self.decode_tps:
+            self._learn(decision["tier"], record)
+        if self.log_path:
+            line = json.dumps(record, ensure_ascii=False)
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return record
+
+    def choose(self, prompt_tokens: int, sims=None, model: str = None, latency_budget_ms: float = None) -> dict:
+        """route(), unless the caller fixed the model (then a "fixed" decision, logged the same way)."""
+        if model is None:
+            return self.route(prompt_tokens, sims, latency_budget_ms)
+        tier = self.tier_of(model)
+        return {"model": model, "tier": tier, "reason": "fixed",
+                "prompt_tokens": prompt_tokens, "top_sim": None, "margin": None,
+                "latency_budget_ms": latency_budget_ms,
+                "predicted_ms": {tier: self.predict_ms(tier, prompt_tokens)} if tier else None}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"decisions": dict(self.decisions),
+                    "prefill_tokens_per_s": dict(self.prefill_tps),
+                    "decode_tokens_per_s": dict(self.decode_tps),
+                    "expected_output_tokens": dict(self.output_tokens)}
+
+    def print_stats(self, prefix: str = "model_router"):
+        s = self.stats()
+        print(f"[{prefix}] Model routing: {s['decisions']['small']} small ({self.policy['small_model']}), "
+              f"{s['decisions']['large']} large ({self.policy['large_model']})")
+
+
+def read_log(path: str = DEFAULT_LOG_PATH) -> list:
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue        # a torn last line from a crash
+    return records
+
+
+def summarise_log(records: list) -> dict:
+    """Latency/error/budget stats grouped by model, reason, prompt-token and margin bucket."""
+    def summary(rows):
+        ok = [r for r in rows if not r.get("error") and r.get("latency_ms") is not None]
+        lat = [r["latency_ms"] for r in ok]
+        ttft = [r["ttft_ms"] for r in ok if r.get("ttft_ms") is not None]
+        budgets = [r["budget_met"] for r in rows if r.get("budget_met") is not None]
+        return {"n": len(rows), "errors": len(rows) - len(ok),
+                "latency_p50_ms": percentile(lat, 50), "latency_p95_ms": percentile(lat, 95),
+                "ttft_p50_ms": percentile(ttft, 50),
+                "budget_met_rate": sum(budgets) / len(budgets) if budgets else None}
+
+    groups = {"model": {}, "reason": {}, "prompt_tokens": {}, "margin": {}}
+    for r in records:
+        model = r.get("model")
+        groups["model"].setdefault(model, []).append(r)
+        groups["reason"].setdefault(r.get("reason"), []).append(r)
+        groups["prompt_tokens"].setdefault((_bucket(r.get("prompt_tokens"), PROMPT_TOKEN_BUCKETS), model), []).append(r)
+        groups["margin"].setdefault((_bucket(r.get("margin"), MARGIN_BUCKETS), model), []).append(r)
+    order = {"prompt_tokens": _bucket_labels(PROMPT_TOKEN_BUCKETS), "margin": _bucket_labels(MARGIN_BUCKETS)}
+
+    def sort_key(name, key):
+        if name in order:
+            return (order[name].index(key[0]), str(key[1]))
+        return (0, str(key))
+
+    return {name: {key: summary(rows) for key, rows in sorted(g.items(), key=lambda kv: sort_key(name, kv[0]))}
+            for name, g in groups.items()}
+
+
+def print_report(summary: dict):
+    for name, groups in summary.items():
+        print(f"\n[model_router] By {name}:")
+        for key, s in groups.items():
+            label = " / ".join(str(k) for k in key) if isinstance(key, tuple) else str(key)
+            budget = f", budget met {s['budget_met_rate']:.0%}" if s["budget_met_rate"] is not None else ""
+            print(f"  {label:<40} n={s['n']:<6} p50 {s['latency_p50_ms']:8.0f} ms  p95 {s['latency_p95_ms']:8.0f} ms  "
+                  f"TTFT p50 {s['ttft_p50_ms']:6.0f} ms  errors {s['errors']}{budget}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Small/large LLM routing: dry-run a decision or report on the log.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_route = sub.add_parser("route", help="Show the decision for given features.")
+    p_route.add_argument("--prompt-tokens", type=int, required=True)
+    p_route.add_argument("--sims", type=float, nargs="*", default=[], help="Retrieval similarities.")
+    p_route.add_argument("--budget-ms", type=float, default=None, help="Latency budget.")
+    p_route.add_argument("--log", default=DEFAULT_LOG_PATH, help="Log used to warm latency estimates.")
+    p_route.add_argument("--policy", default=DEFAULT_POLICY_PATH, help="Policy JSON file.")
+
+    p_report = sub.add_parser("report", help="Summarise the decision/outcome log.")
+    p_report.add_argument("--log", default=DEFAULT_LOG_PATH)
+    args = parser.parse_args()
+
+    if args.command == "route":
+        router = ModelRouter.open(log_path=args.log, policy_path=args.policy)
+        router.log_path = None
+        print(json.dumps(router.route(args.prompt_tokens, args.sims, args.budget_ms), indent=2))
+    else:
+        if not os.path.exists(args.log):
+            print(f"[model_router] No routing log at {args.log}")
+            return
+        records = read_log(args.log)
+        print(f"[model_router] {len(records)} decisions in {args.log}")
+        print_report(summarise_log(records))
+
+
+if __name__ == "__main__":
+    main()
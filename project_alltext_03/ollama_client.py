@@ -0,0 +1,290 @@
+"""
+ollama_client.py
+
+A small **HTTP client for the Ollama REST API** (POST /api/generate) that replaces
+spawning `ollama run <model>` per question.
+
+Why:
+----
+The CLI path pays for process start-up and CLI overhead on every answer, gives us
+nothing until the whole answer is done, and lets the model be unloaded between
+questions. Over HTTP we:
+  - keep one **keep-alive connection** per thread (http.client, no extra deps),
+    reconnecting transparently if the server closed an idle connection,
+  - **stream** tokens as they are generated (NDJSON lines), handing each one to a
+    callback (e.g. print to the terminal),
+  - pass **keep_alive** so the model stays resident in memory between requests,
+  - record **time-to-first-token** (TTFT) and **tokens per second** per request.
+
+Guiding Principles:
+1. **Local only**: Talks to the Ollama server on this machine (OLLAMA_HOST, default
+   http://localhost:11434). mock_ollama_server.py stands in for it offline.
+2. **Fallback**: rag_query.call_ollama falls back to the subprocess CLI path if the
+   HTTP server cannot be reached.
+3. **Thread-safe**: Connections are per thread, so a worker pool can share one client.
+4. **Cancellable**: A CancelToken passed to generate() can abort the request from
+   another thread at any point (queued in the server, prefill, or mid-stream) by
+   shutting down the socket; llm_scheduler.py uses this for deadlines.
+
+Usage:
+    from ollama_client import OllamaClient
+
+    client = OllamaClient()                       # OLLAMA_HOST / OLLAMA_KEEP_ALIVE
+    result = client.generate("Why is the sky blue?", model="deepseek-r1:32b",
+                             on_token=lambda t: print(t, end="", flush=True))
+    result["text"], result["ttft_s"], result["tokens_per_s"]
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+import http.client
+from urllib.parse import urlparse
+
+
+DEFAULT_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+DEFAULT_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+DEFAULT_TIMEOUT_S = float(os.getenv("OLLAMA_TIMEOUT", "600"))
+
+# Errors that mean "the connection is gone" (e.g. server closed an idle keep-alive socket)
+CONNECTION_ERRORS = (ConnectionError, http.client.HTTPException, OSError)
+
+
+class OllamaError(RuntimeError):
+    """The Ollama server answered with an error (non-200 or an "error" field)."""
+
+
+class GenerationCancelled(Exception):
+    """generate() was aborted through its CancelToken (deadline, client went away, ...)."""
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Aborts an in-flight generate() from another thread. While a request is running its
+    connection is attached here; cancel() shuts the socket down, which unblocks a read
+    that would otherwise wait forever on a stuck server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._conn = None
+        self.reason = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            conn = self._conn
+        sock = getattr(conn, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def check(self):
+        """Raise GenerationCancelled if cancel() was called."""
+        if self._event.is_set():
+            raise GenerationCancelled(self.reason)
+
+    def attach(self, conn):
+        with self._lock:
+            self._conn = conn
+        self.check()
+
+    def detach(self):
+        with self._lock:
+            self._conn = None
+
+
+class OllamaClient:
+    """
+    Keep-alive, streaming client for Ollama's /api/generate.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, keep_alive: str = DEFAULT_KEEP_ALIVE,
+                 timeout_s: float = DEFAULT_TIMEOUT_S):
+        """
+        :param host: base URL of the Ollama server, e.g. http://localhost:11434
+        :param keep_alive: how long the server keeps the model loaded after a request
+                           (Ollama duration string such as "30m", or -1 for forever)
+        :param timeout_s: socket timeout for connect and for each read
+        """
+        if "://" not in host:
+            host = "http://" + host
+        parsed = urlparse(host)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 11434
+        self.keep_alive = keep_alive
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+        self.connections_opened = 0
+        self._counter_lock = threading.Lock()
+
+    # ----------------------------------------------------------------------------------
+    # Connection handling
+    # ----------------------------------------------------------------------------------
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout_s)
+            conn.connect()
+            # Request headers and body go out as separate writes; without this,
+            # Nagle + delayed ACK can add ~40 ms to every request
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.conn = conn
+            with self._counter_lock:
+                self.connections_opened += 1
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def close(self):
+        """Close this thread's connection."""
+        self._reset_connection()
+
+    def _post(self, path: str, payload: dict, cancel: CancelToken = None) -> http.client.HTTPResponse:
+        """
+        POST JSON on the keep-alive connection. If the connection turns out to be
+        stale before any response arrives, reconnect and retry once (unless cancelled).
+        """
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        for attempt in range(2):
+            conn = self._connection()
+            if cancel is not None:
+                cancel.attach(conn)
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                return conn.getresponse()
+            except CONNECTION_ERRORS:
+                self._reset_connection()
+                if cancel is not None:
+                    cancel.check()
+                if attempt == 1:
+                    raise
+
+    def is_available(self) -> bool:
+        """True if the server answers GET /api/tags."""
+        try:
+            conn = self._connection()
+            conn.request("GET", "/api/tags")
+            resp = conn.getresponse()
+            resp.read()
+            return resp.status == 200
+        except CONNECTION_ERRORS:
+            self._reset_connection()
+            return False
+
+    # ----------------------------------------------------------------------------------
+    # Generation
+    # ----------------------------------------------------------------------------------
+    def generate(self, prompt: str, model: str = "deepseek-r1:32b", on_token=None,
+                 options: dict = None, stream: bool = True, cancel: CancelToken = None) -> dict:
+        """
+        Generate a completion.
+
+        :param prompt: full prompt text
+        :param model: Ollama model name
+        :param on_token: optional callback(str) invoked for each streamed piece of text
+        :param options: optional Ollama "options" (num_ctx, temperature, num_predict, ...)
+        :param stream: stream NDJSON chunks (True) or wait for one JSON reply (False)
+        :param cancel: optional CancelToken; cancelling it aborts the request
+        :return: {
+                   "text": full answer,
+                   "ttft_s": seconds until the first token arrived,
+                   "total_s": wall time of the request,
+                   "tokens": generated tokens (server's eval_count, else pieces received),
+                   "tokens_per_s": decode speed (eval_count / eval_duration if reported),
+                   "prompt_tokens": prompt_eval_count if reported,
+                   "load_s": model load time reported by the server (0 when resident)
+                 }
+        :raises OllamaError: on an HTTP error status, an "error" in the stream, or a stream
+                             that ends before its "done" message
+        :raises GenerationCancelled: if `cancel` was cancelled before the answer completed
+        """
+        payload = {"model": model, "prompt": prompt, "stream": stream, "keep_alive": self.keep_alive}
+        if options:
+            payload["options"] = options
+
+        start = time.perf_counter()
+        try:
+            resp = self._post("/api/generate", payload, cancel)
+            if resp.status != 200:
+                detail = resp.read().decode("utf-8", errors="replace")
+                raise OllamaError(f"[ollama_client] HTTP {resp.status}: {detail}")
+
+            pieces = []
+            ttft = None
+            final = {}
+            while True:
+                line = resp.readline()
+                if cancel is not None:
+                    cancel.check()
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                msg = json.loads(line)
+                if "error" in msg:
+                    raise OllamaError(f"[ollama_client] {msg['error']}")
+                piece = msg.get("response", "")
+                if piece:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    pieces.append(piece)
+                    if on_token is not None:
+                        on_token(piece)
+                if msg.get("done"):
+                    final = msg
+                    break
+            if stream and not final:
+                # EOF without a "done" message: the answer is truncated, not finished
+                raise OllamaError("[ollama_client] stream ended before done")
+            # Drain anything left so the connection can be reused
+            resp.read()
+        except (OllamaError, GenerationCancelled, json.JSONDecodeError, *CONNECTION_ERRORS):
+            self._reset_connection()
+            if cancel is not None:
+                # A shut-down socket surfaces as a connection error; report why
+                cancel.check()
+            raise
+        finally:
+            if cancel is not None:
+                cancel.detach()
+
+        total = time.perf_counter() - start
+        tokens = final.get("eval_count") or len(pieces)
+        eval_s = (final.get("eval_duration") or 0) / 1e9
+        if eval_s > 0:
+            tokens_per_s = tokens / eval_s
+        else:
+            decode_s = total - (ttft or 0.0)
+            tokens_per_s = (tokens - 1) / decode_s if tokens > 1 and decode_s > 0 else 0.0
+        return {
+            "text": "".join(pieces),
+            "ttft_s": ttft if ttft is not None else total,
+            "total_s": total,
+            "tokens": tokens,
+            "tokens_per_s": tokens_per_s,
+            "prompt_tokens": final.get("prompt_eval_count"),
+            "load_s": (final.get("load_duration") or 0) / 1e9,
+        }
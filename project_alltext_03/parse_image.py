@@ -34,6 +34,8 @@ Note:
   depending on the backend you prefer (PyTorch or TensorFlow).
 - For multi-page images (like multi-page TIFFs), docTR can read them as separate pages
   and return text for each page. We'll demonstrate how to handle that.
+- The OCR predictor is loaded once per process through model_registry.py and reused
+  for every image (loading it dominates the cost of OCR on a handful of images).
 
 Usage:
     from parse_image import parse_image
@@ -48,7 +50,6 @@ import sys
 # docTR imports
 try:
     from doctr.io import DocumentFile
-    from doctr.models import ocr_predictor
 except ImportError:
     raise ImportError(
         "docTR is not installed. Please install docTR to use parse_image.py.\n"
@@ -58,8 +59,11 @@ except ImportError:
         "  pip install 'python-doctr[tensorflow]' # for TensorFlow backend\n"
     )
 
+from model_registry import get_registry
+from telemetry import get_telemetry
 
-def parse_image(file_path: str) -> dict:
+
+def parse_image(file_path: str, registry=None) -> dict:
     """
     Reads an image file from disk and performs OCR via docTR. Returns a dictionary
     containing recognized text, empty placeholders for tables/images, and metadata.
@@ -67,6 +71,9 @@ def parse_image(file_path: str) -> dict:
     :param file_path: The path to the image file (e.g., .png, .jpg, .tiff)
     :type file_path: str
 
+    :param registry: ModelRegistry holding the OCR predictor; the process-wide one if None
+    :type registry: model_registry.ModelRegistry or None
+
     :return: Dictionary with keys:
       - "text": single string with recognized text from all pages/blocks/lines.
       - "tables": an empty list (no table extraction here).
@@ -82,8 +89,8 @@ def parse_image(file_path: str) -> dict:
       2) Use docTR's DocumentFile to open the image as a docTR 'Document' object.
          If the image is multi-page (like a multi-page TIFF), docTR will treat
          each page separately.
-      3) Load the OCR predictor model (if not already). We use pretrained=True for
-         a standard docTR text recognition model.
+      3) Get the OCR predictor model from the registry (loaded on first use). We use
+         pretrained=True for a standard docTR text recognition model.
       4) Perform OCR on the Document, resulting in a high-level structure of pages,
          blocks, lines, and words.
       5) Concatenate recognized words line by line, block by block, page by page,
@@ -108,10 +115,10 @@ def parse_image(file_path: str) -> dict:
     except Exception as e:
         raise RuntimeError(f"parse_image: Failed to read image '{file_path}': {e}")
 
-    # 3) Create an OCR predictor. pretrained=True loads a default model (for printed text).
+    # 3) Get the OCR predictor. pretrained=True loads a default model (for printed text).
     #    If you want specialized or multilingual models, docTR supports them as well.
     try:
-        ocr_model = ocr_predictor(pretrained=True)
+        ocr_model = (registry or get_registry()).ocr_predictor()
     except Exception as e:
         raise RuntimeError(
             "parse_image: Failed to load docTR OCR model. "
@@ -120,7 +127,8 @@ def parse_image(file_path: str) -> dict:
 
     # 4) Perform inference: returns a high-level result structure with pages, blocks, lines, words
     try:
-        result = ocr_model(doc)
+        with get_telemetry().timed("parse_image.ocr"):
+            result = ocr_model(doc)
     except Exception as e:
         raise RuntimeError(
             f"parse_image: docTR OCR failed on '{file_path}'. Possible model/device error: {e}"
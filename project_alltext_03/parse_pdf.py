@@ -45,6 +45,8 @@ import sys
 # PyMuPDF for text extraction and PDF metadata
 import fitz
 
+from telemetry import get_telemetry
+
 # Optional: Camelot for table extraction
 # If you want to also support Tabula, see the commented approach below
 try:
@@ -153,7 +155,8 @@ def parse_pdf(file_path: str) -> dict:
             # read_pdf returns a camelot.core.TableList
             # "pages=all" means process every page
             # If your PDF has no line-based tables, Camelot might return empty
-            tables = camelot.read_pdf(file_path, pages="all")
+            with get_telemetry().timed("parse_pdf.camelot"):
+                tables = camelot.read_pdf(file_path, pages="all")
             # Convert each Table object to a list of rows
             for t in tables:
                 df = t.df  # a pandas DataFrame
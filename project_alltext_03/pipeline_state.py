@@ -0,0 +1,190 @@
+"""
+pipeline_state.py
+
+**Stage fingerprints** for make-style incremental runs of run_pipeline.py.
+
+Each pipeline stage gets an input fingerprint: a SHA-256 over
+  - the content hashes of its input artifacts (the data/ folder, parse_results.json, ...),
+  - the source of the modules that implement it (its "code version"),
+  - its parameters (wrap_width, the embedding model, relationship thresholds, the
+    Neo4j URI, ...),
+  - the fingerprints of stages it depends on only through a side effect (the graph).
+
+After a stage succeeds, the fingerprint and the content hashes of its outputs are
+recorded in a small JSON state file. On the next run the stage is skipped when its
+fingerprint matches the record and its outputs are still on disk unchanged.
+
+Because downstream fingerprints are built from the *content* of upstream outputs,
+a stage that re-runs but produces byte-identical output does not force the stages
+after it to re-run (early cutoff, like make with content hashes instead of mtimes).
+
+Guiding Principles:
+1. **Cheap no-op runs**: File hashes are memoised by (size, mtime_ns) in the state
+   file, so re-checking an unchanged corpus costs one stat() per file.
+2. **Conservative**: A missing or changed input/output, an edited stage module or a
+   new parameter value means the stage runs. A failed stage loses its record.
+3. **Side effects are explicit**: Neo4j contents cannot be hashed from here, so graph
+   stages are chained through `after=[...]` fingerprints. Clearing the database
+   behind the pipeline's back needs --force.
+
+Usage:
+    from pipeline_state import PipelineState
+
+    state = PipelineState(".pipeline_state.json")
+    fp = state.fingerprint("data_chunking", inputs=["parse_results.json"],
+                           modules=["data_chunking", "chunk_text"], params={"wrap_width": 80})
+    if not state.is_fresh("data_chunking", fp, outputs=["chunked_data.json"]):
+        ...  # run the stage
+        state.record("data_chunking", fp, outputs=["chunked_data.json"], seconds=1.2)
+    state.save()
+"""
+
+import os
+import json
+import time
+import hashlib
+
+from stage_checkpoint import write_json_atomic
+
+DEFAULT_STATE_FILE = ".pipeline_state.json"
+
+# Read size for hashing files
+HASH_BLOCK_SIZE = 1 << 20
+
+# Directory containing the stage modules (code versions are hashed from here)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _canonical(obj) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class PipelineState:
+    """
+    Recorded stage fingerprints plus a (size, mtime_ns) -> sha256 memo of file hashes.
+    """
+
+    def __init__(self, path: str = DEFAULT_STATE_FILE):
+        self.path = path
+        self.stages = {}
+        self._file_hashes = {}
+        self._code_hashes = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                self.stages = saved.get("stages", {})
+                self._file_hashes = saved.get("file_hashes", {})
+            except (OSError, ValueError) as e:
+                # A corrupt state file only costs a full run
+                print(f"[pipeline_state] Ignoring unreadable state file '{path}': {e}")
+
+    # ---------------------------------------------------------------- hashing
+    def hash_file(self, path: str) -> str:
+        """Content hash of one file, memoised by size and mtime."""
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        memo = self._file_hashes.get(key)
+        if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns:
+            return memo[2]
+        digest = sha256_file(path)
+        self._file_hashes[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def hash_path(self, path: str):
+        """
+        Content hash of a file, or of a directory tree (relative names + file hashes).
+        None if the path does not exist.
+        """
+        if os.path.isfile(path):
+            return self.hash_file(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, path).replace(os.sep, "/")
+                digest.update(f"{rel}\0{self.hash_file(full)}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def code_version(self, modules: list) -> str:
+        """Hash of the stage's module sources (e.g. ["data_chunking", "chunk_text"])."""
+        key = tuple(modules)
+        if key not in self._code_hashes:
+            digest = hashlib.sha256()
+            for module in modules:
+                source = os.path.join(SCRIPT_DIR, f"{module}.py")
+                digest.update(f"{module}\0{self.hash_path(source)}\n".encode("utf-8"))
+            self._code_hashes[key] = digest.hexdigest()
+        return self._code_hashes[key]
+
+    # ----------------------------------------------------------- fingerprints
+    def fingerprint(self, stage: str, inputs: list = None, modules: list = None,
+                    params: dict = None, after: list = None):
+        """
+        Input fingerprint of a stage, or None if an input is missing (cannot be fresh).
+
+        :param stage: stage name
+        :param inputs: input files/directories
+        :param modules: module names implementing the stage
+        :param params: parameters that change the stage's output
+        :param after: stages whose recorded fingerprints this one depends on (side effects)
+        """
+        input_hashes = {}
+        for path in inputs or []:
+            input_hashes[path] = self.hash_path(path)
+            if input_hashes[path] is None:
+                return None
+        upstream = {}
+        for name in after or []:
+            record = self.stages.get(name)
+            upstream[name] = record["fingerprint"] if record else None
+        payload = {
+            "stage": stage,
+            "inputs": input_hashes,
+            "code": self.code_version(modules or []),
+            "params": params or {},
+            "after": upstream,
+        }
+        return hashlib.sha256(_canonical(payload).encode("utf-8")).hexdigest()
+
+    def is_fresh(self, stage: str, fingerprint: str, outputs: list = None) -> bool:
+        """True if the stage last ran with this fingerprint and its outputs are unchanged."""
+        record = self.stages.get(stage)
+        if fingerprint is None or not record or record.get("fingerprint") != fingerprint:
+            return False
+        recorded_outputs = record.get("outputs", {})
+        for path in outputs or []:
+            if path not in recorded_outputs or self.hash_path(path) != recorded_outputs[path]:
+                return False
+        return True
+
+    def record(self, stage: str, fingerprint: str, outputs: list = None, seconds: float = None):
+        """Remember a successful run (call after the outputs are written)."""
+        self.stages[stage] = {
+            "fingerprint": fingerprint,
+            "outputs": {path: self.hash_path(path) for path in outputs or []},
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seconds": seconds,
+        }
+
+    def invalidate(self, stage: str):
+        self.stages.pop(stage, None)
+
+    def save(self):
+        """Write the state file atomically."""
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        # Drop memoised hashes of files that no longer exist
+        file_hashes = {p: h for p, h in self._file_hashes.items() if os.path.exists(p)}
+        write_json_atomic(self.path, {"stages": self.stages, "file_hashes": file_hashes}, indent=2)
@@ -0,0 +1,344 @@
+"""
+profiling.py
+
+**Opt-in profiling hooks** for the pipeline stages. Finding a hot spot in chunk_text,
+parse_docx.flatten_runs or store_in_neo4j used to mean hand-editing a script to add
+cProfile; now a switch wraps a chosen stage (or every stage) and writes the reports
+into a run directory.
+
+Switches (environment variables, inherited by subprocess stages; run_pipeline.py
+sets them from --profile / --profile-mode / --profile-dir):
+  PIPELINE_PROFILE       "all" or a comma list of stages, e.g. "data_chunking,store_in_neo4j"
+  PIPELINE_PROFILE_MODE  "full" (default) or "sample"
+  PIPELINE_PROFILE_DIR   run directory (default profiles/<YYYYmmdd-HHMMSS>)
+  PIPELINE_PROFILE_HZ    sample mode: stack samples per second (default 50)
+
+Stages: data_extraction, data_chunking, embedding_text, store_in_neo4j,
+compute_relationships (and "streaming" for run_pipeline.py --mode streaming).
+
+Modes and what they write per stage into the run directory:
+- **full** (development; cProfile costs ~1.5-2x, tracemalloc more on allocation-heavy code):
+    <stage>.prof        cProfile stats, for `python -m pstats` or snakeviz. Work done in
+                        extraction pool threads and parallel Neo4j writers is profiled per
+                        job and merged in (cProfile itself only sees the calling thread).
+    <stage>.top.txt     top functions by cumulative and by own time
+    <stage>.alloc.txt   tracemalloc: peak traced memory and the top allocation sites
+                        still alive at the end of the stage (by line and by traceback)
+- **sample** (cheap enough to leave on in production):
+    <stage>.samples.txt top functions by own and cumulative share of stack samples,
+                        taken from every thread PIPELINE_PROFILE_HZ times a second
+    <stage>.folded      the same samples as folded stacks (flamegraph.pl / speedscope)
+    <stage>.alloc.txt   tracemalloc in short windows (MEM_WINDOW_S every MEM_PERIOD_S,
+                        ~5% of the time, one frame deep): top allocation sites seen in
+                        the windows
+
+Guiding Principles:
+1. **Off by default, zero cost when off**: profile_stage() returns immediately for
+   stages that are not selected.
+2. **Stdlib only**: cProfile, pstats, tracemalloc, sys._current_frames.
+3. **One run, one directory**: every stage of a pipeline run (in-process or as
+   subprocesses) writes into the same run directory.
+
+Usage:
+    from profiling import profile_stage
+
+    with profile_stage("data_chunking"):
+        chunk_data(...)
+
+    PIPELINE_PROFILE=data_chunking python data_chunking.py parse_results.json chunked_data.json
+    PIPELINE_PROFILE=all PIPELINE_PROFILE_MODE=sample python run_pipeline.py --no-query
+    python -m pstats profiles/20250101-120000/data_chunking.prof
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_ENV = "PIPELINE_PROFILE"
+PROFILE_MODE_ENV = "PIPELINE_PROFILE_MODE"
+PROFILE_DIR_ENV = "PIPELINE_PROFILE_DIR"
+PROFILE_HZ_ENV = "PIPELINE_PROFILE_HZ"
+MODES = ("full", "sample")
+
+# Lines in the text reports
+TOP_N = 30
+# Traceback depth kept by tracemalloc in full mode
+TRACEMALLOC_FRAMES = 10
+# Sample mode: stack depth kept per sample, and the tracemalloc duty cycle
+MAX_STACK_DEPTH = 64
+MEM_WINDOW_S = 1.0
+MEM_PERIOD_S = 20.0
+
+# The full-mode session of the running stage, for profile_thread()
+_active = None
+
+
+def selected(stage: str) -> bool:
+    """Is profiling switched on for this stage?"""
+    wanted = os.getenv(PROFILE_ENV, "").strip()
+    if not wanted:
+        return False
+    names = {name.strip() for name in wanted.split(",")}
+    return "all" in names or stage in names
+
+
+def configure(stages: str, mode: str = "full", directory: str = None) -> str:
+    """
+    Switch profiling on for this process and the subprocesses it starts.
+
+    :param stages: "all" or a comma list of stage names
+    :param mode: "full" or "sample"
+    :param directory: run directory (default profiles/<timestamp>)
+    :return: the run directory
+    """
+    if mode not in MODES:
+        raise ValueError(f"[profiling] Unknown mode '{mode}'; expected one of {MODES}.")
+    os.environ[PROFILE_ENV] = stages
+    os.environ[PROFILE_MODE_ENV] = mode
+    if directory:
+        os.environ[PROFILE_DIR_ENV] = directory
+    return run_directory()
+
+
+def run_directory() -> str:
+    """The run directory (created, and fixed in the environment so later stages share it)."""
+    directory = os.getenv(PROFILE_DIR_ENV)
+    if not directory:
+        directory = os.path.join("profiles", time.strftime("%Y%m%d-%H%M%S"))
+        os.environ[PROFILE_DIR_ENV] = directory
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+@contextmanager
+def profile_stage(stage: str):
+    """Profile the block as `stage` if PIPELINE_PROFILE selects it; otherwise do nothing."""
+    global _active
+    if not selected(stage):
+        yield None
+        return
+    mode = os.getenv(PROFILE_MODE_ENV, "full")
+    session = SampledProfile(stage) if mode == "sample" else FullProfile(stage)
+    print(f"[profiling] Profiling stage '{stage}' ({'sample' if mode == 'sample' else 'full'} mode).")
+    session.start()
+    if isinstance(session, FullProfile):
+        _active = session
+    try:
+        yield session
+    finally:
+        _active = None
+        session.stop()
+        paths = session.write(run_directory())
+        print(f"[profiling] {stage}: wrote {', '.join(paths)}")
+
+
+def profile_thread(fn):
+    """
+    Wrap a function that runs in a worker thread so that, during a full-mode stage,
+    it is profiled with its own cProfile.Profile and merged into the stage's .prof.
+    (Sample mode sees every thread anyway.)
+    """
+    def wrapper(*args, **kwargs):
+        session = _active
+        if session is None:
+            return fn(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ builds cProfile on sys.monitoring, which allows only one
+            # active profiler: run the job unprofiled and say so in the report
+            session.add_unprofiled_thread()
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            session.add_thread_profile(profiler)
+    return wrapper
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+def _format_alloc_stats(stats, total_label: str) -> list:
+    lines = [total_label, ""]
+    for stat in stats[:TOP_N]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {frame.filename}:{frame.lineno}")
+    return lines
+
+
+class FullProfile:
+    """cProfile + tracemalloc for one stage (deterministic, for development)."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.profiler = cProfile.Profile()
+        self.thread_profiles = []
+        self.unprofiled_threads = 0
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+        self.snapshot = None
+        self.peak_bytes = 0
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        self.peak_bytes = tracemalloc.get_traced_memory()[1]
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    def add_thread_profile(self, profiler):
+        with self._lock:
+            self.thread_profiles.append(profiler)
+
+    def add_unprofiled_thread(self):
+        with self._lock:
+            self.unprofiled_threads += 1
+
+    def write(self, directory: str) -> list:
+        prof_path = os.path.join(directory, f"{self.stage}.prof")
+        stats = pstats.Stats(self.profiler)
+        for profiler in self.thread_profiles:
+            stats.add(profiler)
+        stats.dump_stats(prof_path)
+
+        out = io.StringIO()
+        stats.stream = out
+        out.write(f"Stage {self.stage}: {len(self.thread_profiles)} worker-thread profiles merged\n")
+        if self.unprofiled_threads:
+            out.write(f"{self.unprofiled_threads} worker-thread jobs were not profiled separately "
+                      f"(another profiler was active; Python 3.12+ allows only one)\n")
+        out.write("\n")
+        out.write("=== by cumulative time ===\n")
+        stats.sort_stats("cumulative").print_stats(TOP_N)
+        out.write("=== by own time ===\n")
+        stats.sort_stats("tottime").print_stats(TOP_N)
+        top_path = os.path.join(directory, f"{self.stage}.top.txt")
+        with open(top_path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+
+        lines = _format_alloc_stats(self.snapshot.statistics("lineno"),
+                                    f"Stage {self.stage}: peak traced memory {self.peak_bytes / (1024 * 1024):.1f} MiB; "
+                                    f"top allocation sites alive at the end of the stage:")
+        lines += ["", "=== largest allocation tracebacks ==="]
+        for stat in self.snapshot.statistics("traceback")[:5]:
+            lines.append(f"\n{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+            lines.extend(f"  {line}" for line in stat.traceback.format())
+        alloc_path = os.path.join(directory, f"{self.stage}.alloc.txt")
+        with open(alloc_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return [prof_path, top_path, alloc_path]
+
+
+class SampledProfile:
+    """Statistical stack sampling + duty-cycled tracemalloc (cheap; safe in production)."""
+
+    def __init__(self, stage: str, hz: float = None):
+        self.stage = stage
+        self.interval_s = 1.0 / (hz or float(os.getenv(PROFILE_HZ_ENV, "50")))
+        self.stacks = Counter()
+        self.samples = 0
+        self.alloc_sizes = Counter()
+        self.alloc_counts = Counter()
+        self.windows = 0
+        self._stop = threading.Event()
+        self._threads = []
+        self._started = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._threads = [threading.Thread(target=self._sample_stacks, name="profile-sampler", daemon=True)]
+        # Leave an outside tracemalloc session (e.g. python -X tracemalloc) alone
+        if not tracemalloc.is_tracing():
+            self._threads.append(threading.Thread(target=self._sample_memory, name="profile-memory",
+                                                  daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self.elapsed_s = time.perf_counter() - self._started
+
+    def _sample_stacks(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def _sample_memory(self):
+        # First window right away, so short stages get one too
+        while True:
+            tracemalloc.start(1)
+            self._stop.wait(MEM_WINDOW_S)
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self.windows += 1
+            for stat in snapshot.statistics("lineno"):
+                frame = stat.traceback[0]
+                if frame.filename == tracemalloc.__file__:
+                    continue
+                key = f"{frame.filename}:{frame.lineno}"
+                self.alloc_sizes[key] += stat.size
+                self.alloc_counts[key] += stat.count
+            if self._stop.wait(MEM_PERIOD_S - MEM_WINDOW_S):
+                return
+
+    def write(self, directory: str) -> list:
+        own, cumulative = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                cumulative[label] += count
+        total = max(self.samples, 1)
+        lines = [f"Stage {self.stage}: {self.samples} stack samples over {self.elapsed_s:.1f}s "
+                 f"(every {self.interval_s * 1000:.0f} ms, all threads; idle threads included)", "",
+                 "=== by own samples ==="]
+        lines += [f"{count / total:>7.1%} {count:>8}  {label}" for label, count in own.most_common(TOP_N)]
+        lines += ["", "=== by cumulative samples ==="]
+        lines += [f"{count / total:>7.1%} {count:>8}  {label}" for label, count in cumulative.most_common(TOP_N)]
+        samples_path = os.path.join(directory, f"{self.stage}.samples.txt")
+        with open(samples_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        folded_path = os.path.join(directory, f"{self.stage}.folded")
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+        lines = [f"Stage {self.stage}: {self.windows} tracemalloc windows of {MEM_WINDOW_S:.0f}s "
+                 f"every {MEM_PERIOD_S:.0f}s; allocations made in the windows and alive at their end:", ""]
+        for key, size in self.alloc_sizes.most_common(TOP_N):
+            lines.append(f"{size / 1024:>10.1f} KiB {self.alloc_counts[key]:>8} blocks  {key}")
+        alloc_path = os.path.join(directory, f"{self.stage}.alloc.txt")
+        with open(alloc_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return [samples_path, folded_path, alloc_path]
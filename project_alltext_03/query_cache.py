@@ -0,0 +1,157 @@
+"""
+query_cache.py
+
+An in-process **retrieval-result cache** for rag_query. Dashboards and help-desk
+users ask the same questions over and over; a hit skips embedding the question and
+scanning/fetching from Neo4j entirely.
+
+Keys and values:
+----------------
+- Key: the normalised question text (NFKC, lower-cased, whitespace collapsed,
+  trailing "?!." dropped) plus the retrieval parameters (e.g. k, model name), so
+  "What was Q3 revenue?" and "what was  Q3 revenue" share an entry but a k=5 and
+  a k=10 retrieval do not.
+- Value: whatever the caller stores, typically the list of retrieved chunks.
+
+Guiding Principles:
+1. **Bounded**: LRU eviction once `max_entries` is reached, and every entry expires
+   after `ttl_s` seconds.
+2. **Never stale across writes**: Each lookup passes the current store version
+   (store_version.get_store_version). If it differs from the version the cache was
+   filled under, the whole cache is dropped; store_in_neo4j and
+   compute_relationships bump that version after every write.
+3. **Observable**: hits, misses, evictions, expirations and invalidations are
+   counted; `stats()` returns them with the hit rate.
+4. **Thread-safe**: One lock around the OrderedDict, so a server can share it.
+
+Usage:
+    from query_cache import QueryCache
+
+    cache = QueryCache(max_entries=256, ttl_s=600)
+    key = cache.make_key(question, k=5, model="all-MiniLM-L6-v2")
+    chunks = cache.get(key, version)
+    if chunks is None:
+        chunks = retrieve(...)
+        cache.put(key, chunks, version)
+    print(cache.stats())
+"""
+
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+DEFAULT_TTL_S = float(os.getenv("QUERY_CACHE_TTL", "600"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalise_query(text: str) -> str:
+    """Canonical form of a question for cache keys."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return text.rstrip("?!. ").strip()
+
+
+class QueryCache:
+    """
+    LRU + TTL cache invalidated by a store version counter.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_s: float = DEFAULT_TTL_S,
+                 clock=time.monotonic):
+        """
+        :param max_entries: LRU capacity (0 disables caching)
+        :param ttl_s: seconds an entry stays valid
+        :param clock: time source (monotonic seconds); injectable for testing
+        """
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(query_text: str, **params) -> tuple:
+        """Key = normalised query text + sorted retrieval parameters."""
+        return (normalise_query(query_text),) + tuple(sorted(params.items()))
+
+    def _check_version(self, version):
+        # Called with the lock held
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._version = version
+
+    def get(self, key: tuple, version=None):
+        """
+        :param key: from make_key
+        :param version: current store version; a change empties the cache
+        :return: the cached value, or None on a miss
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if self._clock() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value, version=None):
+        """Store value under key for the given store version (evicting LRU entries)."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (self._clock() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "version": self._version,
+            }
+
+    def print_stats(self, prefix: str = "query_cache"):
+        st = self.stats()
+        print(f"[{prefix}] Query cache: {st['hits']} hits, {st['misses']} misses "
+              f"({st['hit_rate'] * 100:.1f}% hit rate), {st['entries']} entries, "
+              f"{st['evictions']} evicted, {st['expirations']} expired, "
+              f"{st['invalidations']} invalidations")
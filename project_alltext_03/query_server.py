@@ -0,0 +1,465 @@
+"""
+query_server.py
+
+A small **HTTP query server** that keeps everything a query needs warm between
+requests, instead of paying start-up costs per CLI invocation (rag_query.py and
+rag_inference_multi.py load models and connect on every start):
+
+  - the SentenceTransformer embedding model (loaded once),
+  - the resident VectorIndex (ids + normalised embeddings; reloaded by the first
+    request that notices a store version change, see store_version.py),
+  - the Neo4j connection pool (one shared Neo4jConnection),
+  - the keep-alive Ollama HTTP client.
+
+Endpoints (JSON in, JSON out):
+  POST /retrieve  {"question": "...", "k": 5}
+        -> {"results": [{"chunk_id", "content", "sim"}, ...], "timings": {...}}
+  POST /query     {"question": "...", "k": 5, "model": "deepseek-r1:32b", "latency_budget_ms": 5000}
+        -> {"answer": "...", "model": "...", "route_reason": "...", "retrieved_ids": [...],
+            "prompt_tokens": n, "timings": {...}}
+        "model" and "latency_budget_ms" are optional: without "model" the small/large
+        model is chosen per request by model_router.py (decisions are logged).
+  GET  /health    -> {"status": "ok", "chunks": N, "store_version": v, "active": a, "queued": q,
+                      "llm": {LLM scheduler metrics: running, queued, per-lane wait percentiles, ...}}
+
+Guiding Principles:
+1. **Micro-batching**: Concurrent requests' questions are embedded together: the
+   batcher thread waits at most --batch-wait-ms after the first question for up to
+   --batch-size questions, embeds them in one forward pass and scores them with one
+   GEMM (VectorIndex.search_batch).
+2. **Admission control**: At most --max-active requests are processed at once and at
+   most --max-queue more may wait; anything beyond that is rejected immediately with
+   429 and a Retry-After header, so overload shows up as fast rejections instead of
+   unbounded latency.
+3. **Bounded generations**: LLM calls go through the scheduler's interactive lane
+   (llm_scheduler.py) with at most --llm-concurrency running; an answer that misses
+   --llm-deadline-s returns 504, and a generation whose client disconnected is
+   cancelled instead of running to completion.
+4. **Traceable**: With --trace FILE (or RAG_TRACE_FILE) each request is a trace of
+   spans (retrieve.batch_wait / .embed / .score / .fetch, build_prompt, llm.queue /
+   .prefill / .generate), see tracing.py.
+5. **Local only**: Standard library HTTP server (threaded, HTTP/1.1 keep-alive); binds
+   to 127.0.0.1 by default.
+
+Usage:
+    python query_server.py [--port 8000] [--max-active 8] [--max-queue 64]
+                           [--batch-size 32] [--batch-wait-ms 5]
+                           [--llm-concurrency 2] [--llm-deadline-s 180]
+    curl -s localhost:8000/query -d '{"question": "Daily revenue by team?"}'
+
+    # Load test against a mock LLM: python load_test_query_server.py
+"""
+
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from neo4j_connection import Neo4jConnection
+from vector_index import VectorIndex, fetch_chunk_contents
+from store_version import get_store_version
+from llm_scheduler import DEFAULT_MAX_CONCURRENT
+from model_router import ModelRouter
+from rag_query import embed_queries, build_prompt, call_ollama, get_llm_scheduler, LLM_ERROR_ANSWER
+from tracing import get_tracer, configure_tracing
+from mock_ollama_server import client_disconnected
+
+
+DEFAULT_PORT = 8000
+DEFAULT_MAX_ACTIVE = 8
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_BATCH_WAIT_MS = 5.0
+
+# How often (seconds) a request may check whether the store version changed
+INDEX_CHECK_INTERVAL = 5.0
+
+MAX_K = 50
+
+
+class QueryHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog (5) resets connections under bursty load before
+    # admission control even sees them
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class Overloaded(Exception):
+    """Raised by AdmissionControl when both the active slots and the queue are full."""
+
+
+class AdmissionControl:
+    """
+    Bounded admission: `max_active` concurrent requests, `max_queue` waiting.
+    Requests beyond that are rejected immediately (Overloaded -> HTTP 429).
+    """
+
+    def __init__(self, max_active: int = DEFAULT_MAX_ACTIVE, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self._slots = threading.Semaphore(max_active)
+        self._lock = threading.Lock()
+        self.admitted = 0       # active + waiting
+        self.active = 0
+        self.rejected = 0
+
+    def __enter__(self):
+        with self._lock:
+            if self.admitted >= self.max_active + self.max_queue:
+                self.rejected += 1
+                raise Overloaded()
+            self.admitted += 1
+        self._slots.acquire()
+        with self._lock:
+            self.active += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self._lock:
+            self.active -= 1
+            self.admitted -= 1
+        self._slots.release()
+        return False
+
+    @property
+    def queued(self) -> int:
+        return self.admitted - self.active
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads into batches and runs
+    `process(items) -> results` on one background thread.
+    """
+
+    def __init__(self, process, max_batch: int = DEFAULT_BATCH_SIZE, max_wait_ms: float = DEFAULT_BATCH_WAIT_MS):
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._run, name="micro_batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Block until the item's batch has been processed; return its result."""
+        fut = Future()
+        self._queue.put((item, fut))
+        return fut.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.process([item for item, _ in batch])
+                for (_, fut), result in zip(batch, results):
+                    fut.set_result(result)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+
+
+class QueryService:
+    """
+    The warm state behind the server: connection, index, embedder, batcher, LLM settings.
+    """
+
+    def __init__(self, conn: Neo4jConnection, embedder=None, embedding_model: str = "all-MiniLM-L6-v2",
+                 llm_model: str = None, max_active: int = DEFAULT_MAX_ACTIVE,
+                 max_queue: int = DEFAULT_MAX_QUEUE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_wait_ms: float = DEFAULT_BATCH_WAIT_MS, llm_deadline_s: float = None,
+                 router: ModelRouter = None):
+        """
+        :param embedder: callable(list of str) -> (n, dim) array; defaults to the
+                         SentenceTransformer named by embedding_model (loaded now)
+        :param llm_model: default model for /query; routed per request if None
+        :param llm_deadline_s: per-answer LLM deadline; the scheduler's interactive default if None
+        :param router: small/large model router; ModelRouter.open() if None
+        """
+        self.conn = conn
+        self.llm_model = llm_model
+        self.llm_deadline_s = llm_deadline_s
+        self.router = router if router is not None else ModelRouter.open()
+        if embedder is None:
+            embedder = lambda texts: embed_queries(texts, embedding_model, batch_size)
+        self.embedder = embedder
+        self.embedder(["warm-up"])
+
+        self._index_lock = threading.Lock()
+        self.store_version = get_store_version(conn)
+        self.index = VectorIndex.from_neo4j(conn)
+        self._last_check = time.monotonic()
+
+        self.admission = AdmissionControl(max_active, max_queue)
+        self.batcher = MicroBatcher(self._embed_and_score, batch_size, batch_wait_ms)
+
+    def maybe_refresh_index(self):
+        """Reload the index if the store version changed (checked at most every few seconds)."""
+        now = time.monotonic()
+        if now - self._last_check < INDEX_CHECK_INTERVAL or not self._index_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = now
+            version = get_store_version(self.conn)
+            if version != self.store_version:
+                index = VectorIndex.from_neo4j(self.conn)
+                self.index, self.store_version = index, version
+                print(f"[query_server] Store version {version}: reloaded {len(index)} chunk embeddings")
+        finally:
+            self._index_lock.release()
+
+    def _embed_and_score(self, items: list) -> list:
+        """Batch callback: [(question, k), ...] -> [(ids, sims, embed_s, score_s), ...]"""
+        t0 = time.perf_counter()
+        matrix = np.asarray(self.embedder([q for q, _ in items]), dtype=np.float32)
+        embed_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        hits = self.index.search_batch(matrix, k=max(k for _, k in items))
+        score_s = time.perf_counter() - t0
+        return [(ids[:k], sims[:k], embed_s, score_s) for (_, k), (ids, sims) in zip(items, hits)]
+
+    def retrieve(self, question: str, k: int = 5) -> dict:
+        tracer = get_tracer()
+        with tracer.span("retrieve", k=k) as span:
+            self.maybe_refresh_index()
+            t0 = time.perf_counter()
+            ids, sims, embed_s, score_s = self.batcher.submit((question, k))
+            batch_s = time.perf_counter() - t0
+            # The micro-batch ran on the batcher thread: record its phases after the fact
+            embed_start = t0 + max(batch_s - embed_s - score_s, 0.0)
+            tracer.record("retrieve.batch_wait", t0, embed_start)
+            tracer.record("retrieve.embed", embed_start, embed_start + embed_s)
+            tracer.record("retrieve.score", embed_start + embed_s, embed_start + embed_s + score_s,
+                          candidates=len(self.index))
+            t0 = time.perf_counter()
+            with tracer.span("retrieve.fetch", ids=len(ids)):
+                contents = fetch_chunk_contents(self.conn, ids)
+            fetch_s = time.perf_counter() - t0
+            span.set(chunks=len(ids))
+        return {
+            "results": [{"chunk_id": cid, "content": contents.get(cid, ""), "sim": sim}
+                        for cid, sim in zip(ids, sims)],
+            "timings": {"batch_wait_ms": (batch_s - embed_s - score_s) * 1000.0,
+                        "embed_ms": embed_s * 1000.0, "score_ms": score_s * 1000.0,
+                        "fetch_ms": fetch_s * 1000.0},
+        }
+
+    def query(self, question: str, k: int = 5, model: str = None, should_cancel=None,
+              latency_budget_ms: float = None) -> dict:
+        """
+        :param model: fixed model for this request; else the service default, else routed
+        :param latency_budget_ms: optional budget for the model router
+        :param should_cancel: optional callable; True once the caller no longer wants
+                              the answer (the generation is then cancelled)
+        :return: {..., "error": bool, "error_reason": "deadline" | "cancelled" | ... if any}
+        """
+        with get_tracer().span("query", question_chars=len(question), k=k) as span:
+            result = self._query(question, k, model, should_cancel, latency_budget_ms)
+            span.set(model=result["model"], route_reason=result["route_reason"],
+                     prompt_tokens=result["prompt_tokens"])
+            if result["error"]:
+                span.set_error(result.get("error_reason", "llm_error"))
+        return result
+
+    def _query(self, question: str, k: int, model: str, should_cancel, latency_budget_ms: float) -> dict:
+        retrieved = self.retrieve(question, k)
+        chunks = [(r["chunk_id"], r["content"], r["sim"]) for r in retrieved["results"]]
+        report = {}
+        prompt = build_prompt(chunks, question, report=report)
+        decision = self.router.choose(report["prompt_tokens"], [sim for _, _, sim in chunks],
+                                      model=model or self.llm_model, latency_budget_ms=latency_budget_ms)
+        stats = {}
+        t0 = time.perf_counter()
+        answer = call_ollama(prompt, model=decision["model"], stats=stats, lane="interactive",
+                             deadline_s=self.llm_deadline_s, should_cancel=should_cancel)
+        timings = dict(retrieved["timings"])
+        timings["llm_ms"] = (time.perf_counter() - t0) * 1000.0
+        self.router.record(decision, stats, latency_ms=timings["llm_ms"], lane="interactive")
+        if "ttft_s" in stats:
+            timings["ttft_ms"] = stats["ttft_s"] * 1000.0
+        if "queue_wait_s" in stats:
+            timings["llm_queue_ms"] = stats["queue_wait_s"] * 1000.0
+        result = {
+            "answer": answer,
+            "error": answer == LLM_ERROR_ANSWER,
+            "model": decision["model"],
+            "route_reason": decision["reason"],
+            "retrieved_ids": [cid for cid, _, _ in chunks],
+            "prompt_tokens": report["prompt_tokens"],
+            "timings": timings,
+        }
+        if "error" in stats:
+            result["error_reason"] = stats["error"]
+        return result
+
+    def health(self) -> dict:
+        return {"status": "ok", "chunks": len(self.index), "store_version": self.store_version,
+                "active": self.admission.active, "queued": self.admission.queued,
+                "rejected": self.admission.rejected, "batches": self.batcher.batches,
+                "batched_items": self.batcher.items, "llm": get_llm_scheduler().metrics(),
+                "routing": self.router.stats()}
+
+
+def make_handler(service: QueryService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, status: int, obj: dict, headers: dict = None):
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, service.health())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", "0"))
+                if length < 0:
+                    raise ValueError("negative Content-Length")
+            except ValueError as e:
+                # The body cannot be skipped without a valid length: answer, then close
+                self.close_connection = True
+                self._send_json(400, {"error": f"bad request: {e}"})
+                return
+            raw = self.rfile.read(length)
+            if self.path not in ("/query", "/retrieve"):
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                req = json.loads(raw or b"{}")
+                question = str(req["question"]).strip()
+                k = max(1, min(int(req.get("k", 5)), MAX_K))
+                budget = req.get("latency_budget_ms")
+                budget = float(budget) if budget is not None else None
+                if not question:
+                    raise ValueError("empty question")
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {"error": f"bad request: {e}"})
+                return
+
+            try:
+                with service.admission:
+                    if self.path == "/retrieve":
+                        result = service.retrieve(question, k)
+                    else:
+                        result = service.query(question, k, req.get("model"),
+                                               should_cancel=lambda: client_disconnected(self.connection),
+                                               latency_budget_ms=budget)
+            except Overloaded:
+                self._send_json(429, {"error": "overloaded, retry later"}, {"Retry-After": "1"})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            reason = result.get("error_reason")
+            if reason == "cancelled":
+                # Nobody is listening any more
+                self.close_connection = True
+            elif reason == "deadline":
+                self._send_json(504, result)
+            elif reason == "overloaded":
+                self._send_json(429, result, {"Retry-After": "1"})
+            else:
+                self._send_json(200, result)
+
+    return Handler
+
+
+def start_server(service: QueryService, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+    """
+    Serve on a background thread.
+
+    :return: (server, base_url); call server.shutdown() to stop
+    """
+    server = QueryHTTPServer((host, port), make_handler(service))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP query server with warm models and index.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-active", type=int, default=DEFAULT_MAX_ACTIVE,
+                        help="Requests processed concurrently.")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="Requests allowed to wait; beyond this clients get 429.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Max questions embedded per micro-batch.")
+    parser.add_argument("--batch-wait-ms", type=float, default=DEFAULT_BATCH_WAIT_MS,
+                        help="Max time the first question waits for others to join its batch.")
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--model", default=None,
+                        help="Fixed Ollama model for /query (default: route between LLM_SMALL_MODEL and LLM_LARGE_MODEL).")
+    parser.add_argument("--llm-concurrency", type=int, default=DEFAULT_MAX_CONCURRENT,
+                        help="Generations running at once on the model host.")
+    parser.add_argument("--llm-deadline-s", type=float, default=None,
+                        help="Give up on an answer after this many seconds (default LLM_INTERACTIVE_DEADLINE_S).")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="Append tracing spans to this JSONL file (default: $RAG_TRACE_FILE).")
+    parser.add_argument("--trace-otlp", metavar="URL", default=None,
+                        help="Also export spans to an OTLP/HTTP collector, e.g. http://localhost:4318/v1/traces.")
+    args = parser.parse_args()
+
+    if args.trace or args.trace_otlp:
+        configure_tracing(trace_file=args.trace, otlp_endpoint=args.trace_otlp)
+
+    conn = Neo4jConnection.from_env()
+    print(f"[query_server] Connecting to Neo4j at {conn.uri}; loading models and index...")
+    try:
+        service = QueryService(conn, embedding_model=args.embedding_model, llm_model=args.model,
+                               max_active=args.max_active, max_queue=args.max_queue,
+                               batch_size=args.batch_size, batch_wait_ms=args.batch_wait_ms,
+                               llm_deadline_s=args.llm_deadline_s)
+    except Exception as e:
+        print(f"Error in query_server: {e}")
+        conn.close()
+        sys.exit(1)
+
+    get_llm_scheduler().resize(args.llm_concurrency)
+    server, url = start_server(service, args.host, args.port)
+    print(f"[query_server] Serving {len(service.index)} chunks at {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        conn.print_stats(prefix="query_server")
+        conn.close()
+        print("[query_server] Stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+rag_batch.py
+
+**Batch question answering** for evaluations and nightly report generation. Instead of
+one `input()` question at a time (rag_query.interactive_session), thousands of
+questions are read from a JSONL file and answered with the work grouped by phase:
+
+  1) embed:    all questions embedded in batches (SentenceTransformer.encode, --embed-batch)
+  2) score:    all questions scored against the VectorIndex with one matrix-matrix
+               product per block of questions (VectorIndex.search_batch; GEMM + argpartition)
+  3) fetch:    content for the union of all retrieved ids, in a few large
+               `WHERE c.chunk_id IN $ids` round trips
+  4) prompt:   token-budgeted prompts (rag_query.build_prompt / context_packer)
+  5) generate: LLM calls through a bounded worker pool (--workers threads over the
+               keep-alive Ollama HTTP client); at most 2 x workers prompts are in flight.
+               Calls use the scheduler's "batch" lane (llm_scheduler.py), so an
+               interactive session sharing the process is served first, and each
+               call is abandoned after LLM_BATCH_DEADLINE_S (--deadline-s)
+
+Answers, retrieved ids and per-question timings are written to the output JSONL as
+each LLM call completes (so a long run can be tailed, and the order is completion
+order; use "id" to join). A throughput report is printed at the end.
+
+Unless --model fixes it, each question's model is chosen by model_router.py (small vs
+large by prompt tokens, retrieval similarity margin and the latency budget); the
+decisions and latencies are appended to the routing log.
+
+Input JSONL (one per line; "id" defaults to the line number):
+    {"id": "q1", "question": "What was Team A's revenue on 2023-07-14?"}
+    {"id": "q2", "question": "...", "latency_budget_ms": 5000}
+    "Plain strings work too"
+
+Output JSONL (one per question):
+    {"id": "q1", "question": "...", "answer": "...", "retrieved_ids": [...], "sims": [...],
+     "prompt_tokens": 812, "model": "deepseek-r1:14b", "route_reason": "confident_lookup",
+     "timings": {"embed_ms": ..., "score_ms": ..., "fetch_ms": ..., "llm_ms": ..., "ttft_ms": ...,
+                 "llm_queue_ms": ...}}
+  embed/score/fetch are the batch phase totals divided by the number of questions
+  (amortised); llm/ttft/llm_queue (time waiting for an LLM slot) are measured per
+  question. Abandoned answers carry "error": "deadline" (or "cancelled"); a question
+  whose processing raised is written as {"id", "question", "answer": null,
+  "error": "failed", "error_detail": "..."} and the batch carries on.
+  With tracing on (RAG_TRACE_FILE, tracing.py) each question is one "question" trace
+  with its build_prompt and llm.* spans.
+
+Usage:
+    python rag_batch.py questions.jsonl --output answers.jsonl [--workers 4] [--k 5]
+                        [--embed-batch 64] [--model deepseek-r1:32b] [--retrieve-only]
+                        [--latency-budget-ms 20000]
+    # or: python rag_query.py --batch questions.jsonl --output answers.jsonl
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from neo4j_connection import Neo4jConnection
+from vector_index import VectorIndex, fetch_chunk_contents
+from rag_query import embed_queries, build_prompt, call_ollama, get_llm_scheduler, LLM_ERROR_ANSWER
+from model_router import ModelRouter
+from tracing import get_tracer
+from telemetry import percentile
+
+
+# Questions scored per GEMM block: bounds the (block x N) similarity matrix in memory
+SCORE_BLOCK = 1024
+
+# Ids per content-fetch round trip
+FETCH_BLOCK = 2000
+
+
+def read_questions(path: str) -> list:
+    """Read [{"id", "question", "latency_budget_ms"}, ...] from a JSONL file (see module docstring)."""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if isinstance(obj, str):
+                obj = {"question": obj}
+            text = obj.get("question") or obj.get("query") or obj.get("text")
+            if not text:
+                print(f"[rag_batch] Skipping line {line_no}: no question")
+                continue
+            questions.append({"id": obj.get("id", line_no), "question": text,
+                              "latency_budget_ms": obj.get("latency_budget_ms")})
+    return questions
+
+
+def retrieve_batch(conn, index: VectorIndex, questions: list, k: int = 5,
+                   embedding_model: str = "all-MiniLM-L6-v2", embed_batch: int = 64,
+                   timings: dict = None) -> list:
+    """
+    Phases 1-3 for all questions at once.
+
+    :param timings: optional dict; filled with 'embed_s', 'score_s', 'fetch_s' (totals)
+    :return: list (aligned with questions) of [(chunk_id, content, sim), ...]
+    """
+    if timings is None:
+        timings = {}
+
+    t0 = time.perf_counter()
+    query_matrix = embed_queries([q["question"] for q in questions], embedding_model, embed_batch)
+    timings["embed_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    hits = []
+    for start in range(0, len(questions), SCORE_BLOCK):
+        hits.extend(index.search_batch(query_matrix[start:start + SCORE_BLOCK], k=k))
+    timings["score_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    all_ids = sorted({cid for ids, _ in hits for cid in ids})
+    contents = {}
+    for start in range(0, len(all_ids), FETCH_BLOCK):
+        contents.update(fetch_chunk_contents(conn, all_ids[start:start + FETCH_BLOCK]))
+    timings["fetch_s"] = time.perf_counter() - t0
+
+    return [[(cid, contents.get(cid, ""), sim) for cid, sim in zip(ids, sims)] for ids, sims in hits]
+
+
+def run_batch(conn, input_path: str, output_path: str, k: int = 5, workers: int = 4,
+              embedding_model: str = "all-MiniLM-L6-v2", embed_batch: int = 64,
+              llm_model: str = None, retrieve_only: bool = False,
+              index: VectorIndex = None, deadline_s: float = None, router: ModelRouter = None,
+              latency_budget_ms: float = None) -> dict:
+    """
+    Answer every question in input_path and write one JSON line per question to
+    output_path.
+
+    :param workers: max concurrent LLM calls (also the LLM scheduler's concurrency)
+    :param deadline_s: per-call LLM deadline; the scheduler's batch-lane default if None
+    :param llm_model: Ollama model for every answer; routed per question if None
+    :param router: small/large model router; ModelRouter.open() if None
+    :param latency_budget_ms: default per-answer budget for the router (a question's
+                              own "latency_budget_ms" wins)
+    :param retrieve_only: skip the LLM (retrieval evaluations)
+    :param index: VectorIndex to reuse; loaded from Neo4j if None
+    :return: the throughput report dict (also printed)
+    """
+    wall_start = time.perf_counter()
+    questions = read_questions(input_path)
+    n = len(questions)
+    print(f"[rag_batch] {n} questions from {input_path}")
+    if n == 0:
+        return {"questions": 0}
+
+    phase = {}
+    t0 = time.perf_counter()
+    if index is None:
+        index = VectorIndex.from_neo4j(conn)
+    phase["load_s"] = time.perf_counter() - t0
+    print(f"[rag_batch] Index: {len(index)} chunks ({phase['load_s']:.2f}s)")
+
+    retrieved = retrieve_batch(conn, index, questions, k, embedding_model, embed_batch, phase)
+    print(f"[rag_batch] Retrieval: embed {phase['embed_s']:.2f}s, score {phase['score_s']:.3f}s, "
+          f"fetch {phase['fetch_s']:.2f}s for {n} questions")
+    amortised = {f"{name}_ms": phase[f"{name}_s"] * 1000.0 / n for name in ("embed", "score", "fetch")}
+
+    write_lock = threading.Lock()
+    llm_latencies, ttfts, queue_waits, tokens_total, errors, expired = [], [], [], [0], [0], [0]
+    failed = [0]
+    models = {}
+    if not retrieve_only:
+        get_llm_scheduler().resize(workers)
+        if router is None:
+            router = ModelRouter.open()
+
+    def answer(i: int) -> dict:
+        q = questions[i]
+        chunks = retrieved[i]
+        report = {}
+        prompt = build_prompt(chunks, q["question"], report=report)
+        record = {
+            "id": q["id"], "question": q["question"], "answer": None,
+            "retrieved_ids": [cid for cid, _, _ in chunks],
+            "sims": [round(float(sim), 6) for _, _, sim in chunks],
+            "prompt_tokens": report["prompt_tokens"],
+            "timings": dict(amortised),
+        }
+        if not retrieve_only:
+            budget = q["latency_budget_ms"] if q["latency_budget_ms"] is not None else latency_budget_ms
+            decision = router.choose(report["prompt_tokens"], [sim for _, _, sim in chunks],
+                                     model=llm_model, latency_budget_ms=budget)
+            record["model"], record["route_reason"] = decision["model"], decision["reason"]
+            stats = {}
+            t_start = time.perf_counter()
+            record["answer"] = call_ollama(prompt, model=decision["model"], stats=stats, lane="batch",
+                                           deadline_s=deadline_s)
+            record["timings"]["llm_ms"] = (time.perf_counter() - t_start) * 1000.0
+            router.record(decision, stats, latency_ms=record["timings"]["llm_ms"], id=q["id"], lane="batch")
+            if "ttft_s" in stats:
+                record["timings"]["ttft_ms"] = stats["ttft_s"] * 1000.0
+            if "queue_wait_s" in stats:
+                record["timings"]["llm_queue_ms"] = stats["queue_wait_s"] * 1000.0
+            if "error" in stats:
+                record["error"] = stats["error"]
+            with write_lock:
+                llm_latencies.append(record["timings"]["llm_ms"])
+                if "ttft_s" in stats:
+                    ttfts.append(stats["ttft_s"] * 1000.0)
+                if "queue_wait_s" in stats:
+                    queue_waits.append(stats["queue_wait_s"] * 1000.0)
+                tokens_total[0] += stats.get("tokens", 0)
+                if record["answer"] == LLM_ERROR_ANSWER:
+                    errors[0] += 1
+                if stats.get("error") == "deadline":
+                    expired[0] += 1
+                models[decision["model"]] = models.get(decision["model"], 0) + 1
+        return record
+
+    def traced_answer(i: int) -> dict:
+        with get_tracer().span("question", id=questions[i]["id"], lane="batch") as span:
+            record = answer(i)
+            span.set(model=record.get("model"), route_reason=record.get("route_reason"),
+                     prompt_tokens=record["prompt_tokens"], chunks=len(record["retrieved_ids"]))
+            if "error" in record:
+                span.set_error(record["error"])
+        return record
+
+    t0 = time.perf_counter()
+    done = 0
+    with open(output_path, "w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="rag_batch_llm") as pool:
+        pending = {}
+        next_i = 0
+        # Keep at most 2 x workers prompts in flight so memory stays bounded
+        while next_i < n or pending:
+            while next_i < n and len(pending) < 2 * max(1, workers):
+                pending[pool.submit(traced_answer, next_i)] = next_i
+                next_i += 1
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                i = pending.pop(fut)
+                try:
+                    record = fut.result()
+                except Exception as e:
+                    # One failing question must not abort the batch (and truncate the output)
+                    q = questions[i]
+                    print(f"[rag_batch] Question {q['id']} failed: {e}")
+                    record = {"id": q["id"], "question": q["question"], "answer": None,
+                              "error": "failed", "error_detail": f"{type(e).__name__}: {e}"}
+                    failed[0] += 1
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                done += 1
+            out.flush()
+            if done % 100 == 0 or done == n:
+                print(f"[rag_batch] {done}/{n} answered")
+    phase["generate_s"] = time.perf_counter() - t0
+
+    wall = time.perf_counter() - wall_start
+    report = {
+        "questions": n,
+        "wall_s": wall,
+        "questions_per_s": n / wall if wall > 0 else 0.0,
+        "phases_s": phase,
+        "llm_p50_ms": percentile(llm_latencies, 50),
+        "llm_p95_ms": percentile(llm_latencies, 95),
+        "ttft_p50_ms": percentile(ttfts, 50),
+        "llm_queue_p50_ms": percentile(queue_waits, 50),
+        "llm_queue_p95_ms": percentile(queue_waits, 95),
+        "llm_deadline_exceeded": expired[0],
+        "generated_tokens": tokens_total[0],
+        "generated_tokens_per_s": tokens_total[0] / phase["generate_s"] if phase["generate_s"] > 0 else 0.0,
+        "llm_errors": errors[0],
+        "failed_questions": failed[0],
+        "workers": workers,
+        "models": dict(models),
+    }
+    print_report(report, output_path)
+    return report
+
+
+def print_report(report: dict, output_path: str):
+    phases = report["phases_s"]
+    print(f"\n[rag_batch] Wrote {report['questions']} answers to {output_path}")
+    print(f"[rag_batch] Throughput: {report['questions_per_s']:.2f} questions/s "
+          f"({report['questions']} in {report['wall_s']:.1f}s, {report['workers']} LLM workers)")
+    print("  " + ", ".join(f"{name[:-2]} {sec:.2f}s" for name, sec in phases.items()))
+    if report.get("failed_questions"):
+        print(f"  {report['failed_questions']} questions failed (\"error\": \"failed\" in the output)")
+    if report["llm_p50_ms"]:
+        print(f"  LLM latency p50 {report['llm_p50_ms']:.0f} ms, p95 {report['llm_p95_ms']:.0f} ms, "
+              f"TTFT p50 {report['ttft_p50_ms']:.0f} ms, {report['generated_tokens_per_s']:.1f} tok/s overall, "
+              f"{report['llm_errors']} errors")
+        print(f"  LLM queue wait p50 {report['llm_queue_p50_ms']:.0f} ms, p95 {report['llm_queue_p95_ms']:.0f} ms, "
+              f"{report['llm_deadline_exceeded']} deadlines exceeded")
+        print("  Models: " + ", ".join(f"{model} x{n}" for model, n in report["models"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions in batch.")
+    parser.add_argument("input", help="Questions JSONL")
+    parser.add_argument("--output", default="answers.jsonl", help="Answers JSONL to write.")
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per question.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent LLM calls.")
+    parser.add_argument("--embed-batch", type=int, default=64, help="Questions per embedding batch.")
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--model", default=None,
+                        help="Ollama model for every answer (default: route between LLM_SMALL_MODEL and LLM_LARGE_MODEL).")
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="Per-answer latency budget for the model router (questions may override).")
+    parser.add_argument("--retrieve-only", action="store_true", help="Skip the LLM; retrieval only.")
+    parser.add_argument("--deadline-s", type=float, default=None,
+                        help="Give up on an answer after this many seconds (default LLM_BATCH_DEADLINE_S).")
+    args = parser.parse_args()
+
+    conn = Neo4jConnection.from_env()
+    try:
+        run_batch(conn, args.input, args.output, k=args.k, workers=args.workers,
+                  embedding_model=args.embedding_model, embed_batch=args.embed_batch,
+                  llm_model=args.model, retrieve_only=args.retrieve_only, deadline_s=args.deadline_s,
+                  latency_budget_ms=args.latency_budget_ms)
+    except Exception as e:
+        print(f"Error in rag_batch: {e}")
+        sys.exit(1)
+    finally:
+        conn.print_stats(prefix="rag_batch")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
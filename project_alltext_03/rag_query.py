@@ -8,69 +8,275 @@ Provides an **interactive question-answering** (Q&A) session using:
 Key Steps:
 1) The user types a question at the prompt.
 2) We embed the question locally (or we can skip if you store query embeddings in Neo4j 5+).
-3) We do retrieval from Neo4j to get top-K chunk nodes. In a basic approach, 
-   we might just do an O(N) loop to compute similarities. 
+3) We do retrieval from Neo4j to get top-K chunk nodes, in two phases: score all
+   chunk ids against a pre-normalised embedding matrix (one GEMV + argpartition,
+   see vector_index.py), then fetch content for only the K winners. The matrix is
+   loaded once per session and reused for every question.
    If you prefer a more advanced approach (like "hybrid retrieval" with topic), 
    you can adapt that or import from a separate `hybrid_retriever.py`.
-4) Build a text prompt combining these retrieved chunks plus the user question.
-5) Call the local LLM (DeepSeek R1) using Ollama CLI. 
+   Repeated questions are answered from an LRU+TTL retrieval cache (query_cache.py)
+   keyed by the normalised question and retrieval parameters; it is dropped, and the
+   index reloaded, whenever the store version (store_version.py) changes.
+   Paraphrases of earlier questions that retrieve the same chunks reuse the earlier
+   answer from a persistent semantic answer cache (semantic_cache.py), skipping the
+   LLM call entirely.
+4) Build a text prompt combining these retrieved chunks plus the user question,
+   packed into a token budget (PROMPT_TOKEN_BUDGET, context_packer.py) so prefill
+   time stays bounded; the prompt token count is printed per question.
+5) Call the local LLM (DeepSeek R1) through the Ollama REST API over a keep-alive
+   connection, streaming the answer to the terminal as it is generated and keeping
+   the model resident (ollama_client.py). Time-to-first-token and tokens/s are
+   printed per answer. Falls back to the Ollama CLI if the API is unreachable.
+   Generations go through the LLM scheduler (llm_scheduler.py): bounded concurrency,
+   an interactive/batch priority lane, and a deadline (LLM_INTERACTIVE_DEADLINE_S), so
+   a hung model no longer freezes the session; Ctrl+C cancels the current answer.
+   Unless --model fixes it, the model is chosen per question by model_router.py:
+   short prompts with one clearly winning chunk go to the small model
+   (LLM_SMALL_MODEL), the rest to the large one (LLM_LARGE_MODEL), and
+   --latency-budget-ms can move a question to the model predicted to meet it.
+   Decisions and latencies are logged for tuning.
 6) Show the generated answer, then let the user ask another question.
 7) Repeat until "exit" or "quit" is typed.
 
+With --trace FILE (or RAG_TRACE_FILE) every question is recorded as a trace of nested
+spans (embed_query, retrieve.score, retrieve.fetch, build_prompt, llm.queue,
+llm.prefill, llm.generate, ...) with chunk/token counts and model names; see
+tracing.py. `python tracing.py FILE` prints per-span latency percentiles.
+--trace-otlp URL also sends the spans to a local OpenTelemetry collector.
+
 You'll need:
  - `neo4j` Python driver
  - `sentence_transformers` (unless skipping local query embedding)
- - `ollama` installed for running local LLM commands (or adapt to your environment).
+ - `ollama` installed and serving (OLLAMA_HOST, default http://localhost:11434);
+   mock_ollama_server.py can stand in for it offline. OLLAMA_BACKEND=cli forces the
+   subprocess path.
 
 Usage:
 ------
   python rag_query.py
   # Type queries, type "exit" or "quit" to end.
+
+  python rag_query.py --trace traces.jsonl [--trace-otlp http://localhost:4318/v1/traces]
+  python tracing.py traces.jsonl
+  # Trace every question, then summarise the span latencies
+
+  python rag_query.py --batch questions.jsonl --output answers.jsonl [--workers 4]
+  # Batch mode (see rag_batch.py)
 """
 
 import os
 import sys
+import time
+import argparse
+import threading
 import subprocess
 import numpy as np
-from neo4j import GraphDatabase, basic_auth
 
-try:
-    from sentence_transformers import SentenceTransformer
-except ImportError:
-    # If you do a direct vector index approach or skip local embedding, 
-    # you can remove or handle this gracefully.
-    pass
-
-# Hard-coded or environment-based credentials for Neo4j
-NEO4J_URI = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASS = "Neo4j420"  # Adjust to your actual password or load from env
+from neo4j_connection import Neo4jConnection
+from vector_index import VectorIndex, fetch_chunk_contents
+from query_cache import QueryCache
+from store_version import get_store_version
+from semantic_cache import SemanticAnswerCache
+from context_packer import pack_context, get_tokenizer, DEFAULT_PROMPT_TOKENS
+from ollama_client import OllamaClient, OllamaError, GenerationCancelled, CONNECTION_ERRORS
+from llm_scheduler import GenerationScheduler, DeadlineExceeded, QueueFull, DEFAULT_DEADLINES_S
+from model_router import ModelRouter
+from model_registry import get_registry
+from tracing import get_tracer, configure_tracing
+
+# Returned by call_ollama on failure (never cached)
+LLM_ERROR_ANSWER = "Error calling the local LLM. Check logs."
 
 ############################
 # LLM call (DeepSeek R1) 
 ############################
-def call_ollama(prompt: str, model="deepseek-r1:32b") -> str:
+# "http" (Ollama REST API, streaming, keep-alive) or "cli" (`ollama run` subprocess)
+LLM_BACKEND = os.getenv("OLLAMA_BACKEND", "http")
+
+_ollama_client = None
+_llm_scheduler = None
+_llm_scheduler_lock = threading.Lock()
+
+# How often call_ollama polls its should_cancel callback while waiting
+CANCEL_POLL_S = 0.2
+
+
+def get_ollama_client() -> OllamaClient:
+    """Process-wide OllamaClient (one keep-alive connection per thread)."""
+    global _ollama_client
+    if _ollama_client is None:
+        _ollama_client = OllamaClient()
+    return _ollama_client
+
+
+def get_llm_scheduler() -> GenerationScheduler:
+    """Process-wide GenerationScheduler over the Ollama HTTP client (LLM_MAX_CONCURRENT)."""
+    global _llm_scheduler
+    with _llm_scheduler_lock:
+        if _llm_scheduler is None:
+            # Resolve the client per call so a replaced _ollama_client takes effect
+            _llm_scheduler = GenerationScheduler(lambda *a, **kw: get_ollama_client().generate(*a, **kw))
+    return _llm_scheduler
+
+
+def call_ollama(prompt: str, model="deepseek-r1:32b", on_token=None, stats=None,
+                lane="interactive", deadline_s=None, should_cancel=None) -> str:
+    """
+    Calls the local LLM with the chosen model (e.g. deepseek-r1:32b).
+
+    By default this goes through the Ollama REST API (ollama_client.py): one
+    keep-alive connection, tokens streamed to `on_token` as they arrive, and the
+    model kept resident between questions via keep_alive. Requests are queued in the
+    LLM scheduler (llm_scheduler.py), which bounds concurrent generations, starts
+    interactive work before batch work and enforces the deadline. If the server
+    cannot be reached (or OLLAMA_BACKEND=cli), it falls back to the `ollama run`
+    subprocess (bounded by the same deadline); a connection lost after tokens were
+    streamed is an error instead.
+
+    Traced as an "llm" span (tracing.py) with llm.queue, llm.prefill and
+    llm.generate children built from the scheduler's and client's timings.
+
+    :param prompt: The text prompt (context + question)
+    :param model: The local model name, e.g. 'deepseek-r1:32b'
+    :param on_token: optional callback(str) for streamed text (HTTP backend only)
+    :param stats: optional dict; filled with 'backend' and, for HTTP, 'ttft_s',
+                  'total_s', 'tokens', 'tokens_per_s', 'load_s', 'queue_wait_s';
+                  'error' is "deadline", "cancelled", "overloaded" or "llm_error" when
+                  there is no answer
+    :param lane: scheduler lane, "interactive" or "batch"
+    :param deadline_s: seconds (queue wait + generation) before giving up; lane default if None
+    :param should_cancel: optional callable polled while waiting; returning True
+                          cancels the generation (e.g. the HTTP client disconnected)
+    :return: The LLM's textual answer (LLM_ERROR_ANSWER on error, deadline or cancel)
+    """
+    if stats is None:
+        stats = {}
+    tracer = get_tracer()
+    with tracer.span("llm", model=model, lane=lane) as span:
+        start = time.perf_counter()
+        answer = _call_ollama(prompt, model, on_token, stats, lane, deadline_s, should_cancel)
+        span.set(backend=stats.get("backend"), tokens=stats.get("tokens"),
+                 prompt_tokens=stats.get("prompt_tokens"), answer_chars=len(answer))
+        if "error" in stats:
+            span.set_error(stats["error"])
+        _trace_llm_phases(tracer, start, stats)
+    return answer
+
+
+def _trace_llm_phases(tracer, start: float, stats: dict):
+    """Record llm.queue / llm.prefill / llm.generate from call_ollama's stats (HTTP backend)."""
+    if "queue_wait_s" not in stats:
+        return
+    generation_start = start + stats["queue_wait_s"]
+    tracer.record("llm.queue", start, generation_start)
+    if "ttft_s" not in stats:
+        return
+    first_token = generation_start + stats["ttft_s"]
+    tracer.record("llm.prefill", generation_start, first_token,
+                  prompt_tokens=stats.get("prompt_tokens"), load_s=stats.get("load_s"))
+    tracer.record("llm.generate", first_token, generation_start + stats["total_s"],
+                  tokens=stats.get("tokens"), tokens_per_s=stats.get("tokens_per_s"))
+
+
+def _call_ollama(prompt: str, model: str, on_token, stats: dict, lane: str, deadline_s,
+                 should_cancel) -> str:
+    """call_ollama without the tracing span; stats must be a dict."""
+    deadline = None
+    if LLM_BACKEND != "cli":
+        try:
+            request = get_llm_scheduler().submit(prompt, model, lane=lane, deadline_s=deadline_s,
+                                                 on_token=on_token)
+        except QueueFull as e:
+            stats.update(backend="http", error="overloaded")
+            print(f"[call_ollama] LLM call rejected: {e}")
+            return LLM_ERROR_ANSWER
+        # The CLI fallback gets whatever is left of the request's deadline
+        deadline = request.deadline
+        try:
+            while not request.wait(CANCEL_POLL_S if should_cancel is not None else None):
+                if should_cancel():
+                    request.cancel("client went away")
+            result = request.result()
+            stats.update(result)
+            stats["backend"] = "http"
+            stats["queue_wait_s"] = request.wait_s
+            return result["text"].strip()
+        except KeyboardInterrupt:
+            # Don't leave the generation running (and holding a slot) behind us
+            request.cancel("interrupted")
+            raise
+        except DeadlineExceeded:
+            stats.update(backend="http", error="deadline", queue_wait_s=request.wait_s)
+            print(f"[call_ollama] LLM call abandoned: deadline exceeded "
+                  f"(queued {request.wait_s:.1f}s, {request.tokens_streamed} tokens streamed)")
+            return LLM_ERROR_ANSWER
+        except GenerationCancelled as e:
+            stats.update(backend="http", error="cancelled", queue_wait_s=request.wait_s)
+            print(f"[call_ollama] LLM call cancelled ({e.reason})")
+            return LLM_ERROR_ANSWER
+        except OllamaError as e:
+            stats.update(backend="http", error="llm_error")
+            print(f"[call_ollama] LLM call error: {e}")
+            return LLM_ERROR_ANSWER
+        except CONNECTION_ERRORS as e:
+            if request.tokens_streamed:
+                # Part of the answer already reached on_token: re-running it through the
+                # CLI would show the caller a second, different answer
+                stats.update(backend="http", error="llm_error", queue_wait_s=request.wait_s)
+                print(f"[call_ollama] LLM connection lost after {request.tokens_streamed} "
+                      f"tokens streamed ({e}).")
+                return LLM_ERROR_ANSWER
+            print(f"[call_ollama] Ollama HTTP API unreachable ({e}); falling back to the CLI.")
+
+    stats["backend"] = "cli"
+    if deadline is None:
+        deadline = time.monotonic() + (deadline_s if deadline_s is not None else DEFAULT_DEADLINES_S[lane])
+    try:
+        answer = call_ollama_cli(prompt, model=model, timeout_s=max(deadline - time.monotonic(), 0.0))
+    except subprocess.TimeoutExpired:
+        stats["error"] = "deadline"
+        print("[call_ollama] LLM call abandoned: deadline exceeded (CLI fallback).")
+        return LLM_ERROR_ANSWER
+    if answer == LLM_ERROR_ANSWER:
+        stats["error"] = "llm_error"
+    if on_token is not None:
+        on_token(answer)
+    return answer
+
+
+def call_ollama_cli(prompt: str, model="deepseek-r1:32b", timeout_s: float = None) -> str:
     """
     Calls the local LLM via the Ollama CLI with the chosen model 
-    (e.g. deepseek-r1:32b). Adjust if you have a different approach to 
-    calling the LLM.
+    (e.g. deepseek-r1:32b). One process per call, no streaming; used as the
+    fallback for call_ollama.
 
     :param prompt: The text prompt (context + question)
     :param model: The local model name, e.g. 'deepseek-r1:32b'
+    :param timeout_s: optional limit; the process is killed when it passes
     :return: The LLM's textual answer
+    :raises subprocess.TimeoutExpired: timeout_s passed first
     """
     cmd = ["ollama", "run", model]
     # We'll pipe the prompt into STDIN
-    result = subprocess.run(cmd, input=prompt, capture_output=True, text=True)
+    try:
+        result = subprocess.run(cmd, input=prompt, capture_output=True, text=True, timeout=timeout_s)
+    except FileNotFoundError:
+        print("[call_ollama] The 'ollama' CLI is not installed.")
+        return LLM_ERROR_ANSWER
     if result.returncode != 0:
         err_msg = f"[call_ollama] LLM call error: {result.stderr}"
         print(err_msg)
-        return "Error calling the local LLM. Check logs."
+        return LLM_ERROR_ANSWER
     return result.stdout.strip()
 
 ############################
 # Embedding query locally 
 ############################
+def get_embedding_model(model_name="all-MiniLM-L6-v2"):
+    """Load a SentenceTransformer once per process (model_registry.py) and reuse it."""
+    return get_registry().sentence_transformer(model_name)
+
+
 def embed_query(user_question, model_name="all-MiniLM-L6-v2"):
     """
     Simple function to embed the user query using a local SentenceTransformer 
@@ -80,128 +286,290 @@ def embed_query(user_question, model_name="all-MiniLM-L6-v2"):
     :param model_name: e.g. "all-MiniLM-L6-v2"
     :return: np array for the query embedding
     """
-    model = SentenceTransformer(model_name)
-    emb = model.encode([user_question])[0]  # shape (embedding_dim,)
+    with get_tracer().span("embed_query", model=model_name, question_chars=len(user_question)):
+        model = get_embedding_model(model_name)
+        emb = model.encode([user_question])[0]  # shape (embedding_dim,)
     return emb
 
+
+def embed_queries(questions, model_name="all-MiniLM-L6-v2", batch_size=64):
+    """
+    Embed many questions in batches (one forward pass per batch).
+
+    :return: np array of shape (len(questions), embedding_dim)
+    """
+    model = get_embedding_model(model_name)
+    return np.asarray(model.encode(list(questions), batch_size=batch_size))
+
 ############################
 # Retrieving chunks from Neo4j
 ############################
-def retrieve_topk_chunks(driver, query_emb, k=5):
+def retrieve_topk_chunks(conn, query_emb, k=5, index=None, timings=None):
     """
-    Example approach to fetch all chunk embeddings from Neo4j, compute local 
-    cosine similarity to the user query, and return top-K matches. 
-    For large data, consider a vector index or a separate 'hybrid' approach.
+    Two-phase top-K retrieval:
+
+      Phase 1 (scoring): score the query against a contiguous, pre-normalised
+        embedding matrix (vector_index.VectorIndex) with one GEMV, and pick the
+        top-K ids with argpartition. Only ids + embeddings are ever loaded.
+      Phase 2 (fetch): fetch `content` for just those K ids in one
+        parameterised `WHERE c.chunk_id IN $ids` query.
 
-    :param driver: The Neo4j driver
+    :param conn: The shared Neo4jConnection
     :param query_emb: np array of shape (dim,) for user question
     :param k: how many top chunks to return
+    :param index: a VectorIndex to reuse across queries. If None, one is built
+                  from Neo4j for this call (the load time is then reported too).
+    :param timings: optional dict; filled with 'load_s', 'score_s' and 'fetch_s'
+                    (also traced as retrieve.index_load / .score / .fetch spans)
     :return: a list of (chunk_id, content, sim)
     """
-    def cos_sim(a, b):
-        a = np.array(a, dtype=float)
-        b = np.array(b, dtype=float)
-        dot = np.dot(a, b)
-        norm_a = np.linalg.norm(a)
-        norm_b = np.linalg.norm(b)
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-        return dot / (norm_a * norm_b)
-
-    with driver.session() as session:
-        q = """
-        MATCH (c:Chunk)
-        WHERE c.embedding IS NOT NULL AND size(c.embedding) > 0
-        RETURN c.chunk_id AS chunk_id, c.content AS content, c.embedding AS embedding
-        """
-        result = session.run(q)
-        rows = [(r["chunk_id"], r["content"], r["embedding"]) for r in result]
-
-    chunk_sims = []
-    for cid, content, emb in rows:
-        sim_val = cos_sim(query_emb, emb)
-        chunk_sims.append((cid, content, sim_val))
-
-    # sort by descending sim, pick top-k
-    chunk_sims.sort(key=lambda x: x[2], reverse=True)
-    return chunk_sims[:k]
+    if timings is None:
+        timings = {}
+    tracer = get_tracer()
+
+    with tracer.span("retrieve", k=k) as span:
+        timings["load_s"] = 0.0
+        if index is None:
+            t0 = time.perf_counter()
+            with tracer.span("retrieve.index_load") as load_span:
+                index = VectorIndex.from_neo4j(conn)
+                load_span.set(chunks=len(index))
+            timings["load_s"] = time.perf_counter() - t0
+
+        # Phase 1: GEMV + argpartition over ids only
+        t0 = time.perf_counter()
+        with tracer.span("retrieve.score", candidates=len(index)):
+            top_ids, top_sims = index.search(query_emb, k=k)
+        timings["score_s"] = time.perf_counter() - t0
+
+        # Phase 2: content for the winners only
+        t0 = time.perf_counter()
+        with tracer.span("retrieve.fetch", ids=len(top_ids)):
+            contents = fetch_chunk_contents(conn, top_ids)
+        timings["fetch_s"] = time.perf_counter() - t0
+        span.set(chunks=len(top_ids), top_sim=float(top_sims[0]) if len(top_sims) else None)
+
+    return [(cid, contents.get(cid, ""), sim) for cid, sim in zip(top_ids, top_sims)]
 
 ############################
 # Prompt building
 ############################
-def build_prompt(top_chunks, user_question):
+def build_prompt(top_chunks, user_question, budget_tokens=None, tokenizer=None, report=None):
     """
     Combine top chunk contents plus the user question into a single text prompt 
-    for the LLM.
+    for the LLM, packed into a token budget (context_packer.py): highest-scoring
+    chunks first, truncated at sentence boundaries, duplicate sentences removed.
 
     :param top_chunks: a list of (chunk_id, content, sim)
     :param user_question: the user's query string
+    :param budget_tokens: max tokens for the whole prompt (default PROMPT_TOKEN_BUDGET)
+    :param tokenizer: tokenizer spec or object (default PROMPT_TOKENIZER, see context_packer)
+    :param report: optional dict; filled with 'prompt_tokens', 'context_tokens',
+                   'budget', 'truncated', 'deduplicated' and 'dropped'
     :return: string prompt
     """
-    context_str = ""
-    for i, (cid, content, sim_val) in enumerate(top_chunks):
-        context_str += (f"CHUNK #{i+1} (id={cid}, sim={sim_val:.3f}):\n"
-                        f"{content}\n\n")
-
-    prompt_text = (
-        "You are a helpful AI. Use ONLY the context below to answer the question.\n\n"
-        f"CONTEXT:\n{context_str}"
-        f"QUESTION: {user_question}\n\n"
-        "ANSWER:"
-    )
+    if budget_tokens is None:
+        budget_tokens = DEFAULT_PROMPT_TOKENS
+    tokenizer = get_tokenizer(tokenizer)
+
+    with get_tracer().span("build_prompt", chunks_in=len(top_chunks), budget=budget_tokens) as span:
+        header = "You are a helpful AI. Use ONLY the context below to answer the question.\n\nCONTEXT:\n"
+        footer = f"QUESTION: {user_question}\n\nANSWER:"
+        fixed_tokens = tokenizer.count(header) + tokenizer.count(footer)
+        # Charge each chunk for its "CHUNK #i (id=..., sim=...)" line (longest id as the estimate)
+        longest_id = max((str(cid) for cid, _, _ in top_chunks), key=len, default="")
+        chunk_overhead = tokenizer.count(f"CHUNK #{len(top_chunks)} (id={longest_id}, sim=0.000):") + 2
+
+        packed = pack_context(top_chunks, max(budget_tokens - fixed_tokens, 0), tokenizer,
+                              chunk_overhead_tokens=chunk_overhead)
+
+        context_str = ""
+        for i, (cid, content, sim_val) in enumerate(packed["chunks"]):
+            context_str += (f"CHUNK #{i+1} (id={cid}, sim={sim_val:.3f}):\n"
+                            f"{content}\n\n")
+
+        prompt_text = header + context_str + footer
+        span.set(chunks_packed=len(packed["chunks"]), context_tokens=packed["tokens"],
+                 truncated=len(packed["truncated"]), dropped=len(packed["dropped"]))
+        if report is not None:
+            report.update({
+                "prompt_tokens": tokenizer.count(prompt_text),
+                "context_tokens": packed["tokens"],
+                "budget": budget_tokens,
+                "truncated": packed["truncated"],
+                "deduplicated": packed["deduplicated"],
+                "dropped": packed["dropped"],
+            })
+            span.set(prompt_tokens=report["prompt_tokens"])
     return prompt_text
 
 ############################
 # Interactive loop
 ############################
-def interactive_session(driver, embedding_model="all-MiniLM-L6-v2"):
+def interactive_session(conn, embedding_model="all-MiniLM-L6-v2", cache: QueryCache = None,
+                        answer_cache: SemanticAnswerCache = None, llm_model=None,
+                        router: ModelRouter = None, latency_budget_ms=None):
     """
     Repeatedly ask the user for queries, run the pipeline for each:
-    1) embed query
-    2) retrieve top-5 chunks
+    1) embed query (skipped on a cache hit)
+    2) retrieve top-5 chunks (or take them from the cache)
     3) build prompt
-    4) call LLM
+    4) call LLM (or reuse a semantically matching cached answer)
     5) print answer
 
+    Each question is one "question" trace (tracing.py) when tracing is enabled.
     Type 'exit' or 'quit' to end.
+
+    :param cache: retrieval-result cache; a default QueryCache is created if None
+    :param answer_cache: semantic answer cache; opened from SEMANTIC_CACHE_PATH if None
+    :param llm_model: Ollama model used for answers; routed per question if None
+    :param router: small/large model router; ModelRouter.open() if None
+    :param latency_budget_ms: optional per-answer latency budget for the router
     """
+    if cache is None:
+        cache = QueryCache()
+    if answer_cache is None:
+        answer_cache = SemanticAnswerCache.open()
+    if router is None:
+        router = ModelRouter.open()
+
     print("=== Interactive RAG Q&A Session ===")
     print("(Type 'exit' or 'quit' to end)")
 
+    # Load ids + embeddings once; each question then only pays for scoring + fetch
+    t0 = time.perf_counter()
+    index_version = get_store_version(conn)
+    index = VectorIndex.from_neo4j(conn)
+    print(f"[rag_query] Loaded {len(index)} chunk embeddings in {time.perf_counter() - t0:.2f}s")
+
+    tracer = get_tracer()
     while True:
         user_q = input("\nYour question: ").strip()
         if user_q.lower() in ("exit", "quit"):
             print("[rag_query] Exiting session.")
             break
 
-        # 1) embed
-        qvec = embed_query(user_q, model_name=embedding_model)
-
-        # 2) retrieve top-5
-        top_k = retrieve_topk_chunks(driver, qvec, k=5)
-
-        # 3) build prompt
-        prompt_txt = build_prompt(top_k, user_q)
-
-        # 4) call LLM
-        llm_answer = call_ollama(prompt_txt, model="deepseek-r1:32b")
-
-        # 5) print
-        print("\n=== LLM Answer ===")
-        print(llm_answer)
-        print("===")
+        with tracer.span("question", question_chars=len(user_q), k=5) as question_span:
+            # The graph may have been re-ingested since the last question
+            version = get_store_version(conn)
+            if version != index_version:
+                t0 = time.perf_counter()
+                with tracer.span("index_reload", store_version=version) as reload_span:
+                    index = VectorIndex.from_neo4j(conn)
+                    reload_span.set(chunks=len(index))
+                index_version = version
+                print(f"[rag_query] Store version changed to {version}; reloaded {len(index)} "
+                      f"chunk embeddings in {time.perf_counter() - t0:.2f}s")
+
+            key = cache.make_key(user_q, k=5, model=embedding_model)
+            cached = cache.get(key, version)
+            if cached is not None:
+                qvec, top_k = cached
+                question_span.set(retrieval_cache="hit")
+                print("[rag_query] Retrieval: cache hit")
+            else:
+                question_span.set(retrieval_cache="miss")
+                # 1) embed
+                qvec = embed_query(user_q, model_name=embedding_model)
+
+                # 2) retrieve top-5
+                timings = {}
+                top_k = retrieve_topk_chunks(conn, qvec, k=5, index=index, timings=timings)
+                cache.put(key, (qvec, top_k), version)
+                print(f"[rag_query] Retrieval: scoring {timings['score_s'] * 1000:.2f} ms, "
+                      f"fetch {timings['fetch_s'] * 1000:.2f} ms")
+
+            # 3) build prompt within the token budget
+            prompt_report = {}
+            prompt_txt = build_prompt(top_k, user_q, report=prompt_report)
+            print(f"[rag_query] Prompt: {prompt_report['prompt_tokens']} tokens "
+                  f"(budget {prompt_report['budget']}; truncated {len(prompt_report['truncated'])}, "
+                  f"deduplicated {len(prompt_report['deduplicated'])}, dropped {len(prompt_report['dropped'])} chunks)")
+
+            # 4) pick the model, then call it, unless a paraphrase with the same evidence
+            #    was already answered
+            decision = router.choose(prompt_report["prompt_tokens"], [sim for _, _, sim in top_k],
+                                     model=llm_model, latency_budget_ms=latency_budget_ms)
+            model = decision["model"]
+            question_span.set(model=model, route_reason=decision["reason"],
+                              prompt_tokens=prompt_report["prompt_tokens"])
+            print(f"[rag_query] Model: {model} ({decision['reason']})")
+            chunk_ids = [cid for cid, _, _ in top_k]
+            with tracer.span("answer_cache.lookup") as lookup_span:
+                hit = answer_cache.lookup(qvec, chunk_ids, model=model, version=version)
+                lookup_span.set(hit=hit is not None)
+            question_span.set(answer_cache="hit" if hit is not None else "miss")
+            if hit is not None:
+                print(f"[rag_query] Answer: semantic cache hit (sim={hit['similarity']:.3f} "
+                      f"to \"{hit['question']}\")")
+                print("\n=== LLM Answer ===")
+                print(hit["answer"])
+                print("===")
+                continue
+
+            # 5) stream the answer to the terminal as it is generated
+            print("\n=== LLM Answer ===")
+            llm_stats = {}
+            try:
+                llm_answer = call_ollama(prompt_txt, model=model,
+                                         on_token=lambda t: print(t, end="", flush=True), stats=llm_stats)
+            except KeyboardInterrupt:
+                question_span.set_error("cancelled")
+                print("\n[rag_query] Answer cancelled.")
+                continue
+            print("\n===")
+            router.record(decision, llm_stats)
+            if llm_stats.get("backend") == "http" and "error" not in llm_stats:
+                print(f"[rag_query] LLM: first token {llm_stats['ttft_s'] * 1000:.0f} ms, "
+                      f"{llm_stats['tokens']} tokens at {llm_stats['tokens_per_s']:.1f} tok/s "
+                      f"(total {llm_stats['total_s']:.2f}s)")
+            if llm_answer != LLM_ERROR_ANSWER:
+                answer_cache.put(user_q, qvec, chunk_ids, llm_answer, model=model, version=version)
+
+    cache.print_stats(prefix="rag_query")
+    answer_cache.print_stats(prefix="rag_query")
+    router.print_stats(prefix="rag_query")
+    if _llm_scheduler is not None:
+        _llm_scheduler.print_metrics(prefix="rag_query")
 
 def main():
     """
-    Entry point: connect to Neo4j, start an interactive Q&A loop.
-    After user ends, close the driver.
+    Entry point: connect to Neo4j, start an interactive Q&A loop (or, with --batch,
+    answer a JSONL file of questions via rag_batch.py).
+    After user ends, print Bolt stats and close the connection.
     """
-    print(f"[rag_query] Connecting to Neo4j at {NEO4J_URI} with user '{NEO4J_USER}'")
-    driver = GraphDatabase.driver(NEO4J_URI, auth=basic_auth(NEO4J_USER, NEO4J_PASS))
-
-    interactive_session(driver, embedding_model="all-MiniLM-L6-v2")
-
-    driver.close()
+    parser = argparse.ArgumentParser(description="Interactive (or batch) RAG question answering.")
+    parser.add_argument("--batch", metavar="QUESTIONS_JSONL",
+                        help="Answer every question in this JSONL file instead of prompting.")
+    parser.add_argument("--output", default="answers.jsonl", help="Batch mode: answers JSONL to write.")
+    parser.add_argument("--workers", type=int, default=4, help="Batch mode: concurrent LLM calls.")
+    parser.add_argument("--model", default=None,
+                        help="Answer with this Ollama model (default: route between LLM_SMALL_MODEL and LLM_LARGE_MODEL).")
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="Per-answer latency budget used by the model router.")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="Append tracing spans to this JSONL file (default: $RAG_TRACE_FILE).")
+    parser.add_argument("--trace-otlp", metavar="URL", default=None,
+                        help="Also export spans to an OTLP/HTTP collector, e.g. http://localhost:4318/v1/traces.")
+    args = parser.parse_args()
+
+    if args.trace or args.trace_otlp:
+        configure_tracing(trace_file=args.trace, otlp_endpoint=args.trace_otlp)
+
+    conn = Neo4jConnection.from_env()
+    print(f"[rag_query] Connecting to Neo4j at {conn.uri} with user '{conn.user}'")
+
+    if args.batch:
+        # Imported here: rag_batch builds on this module
+        from rag_batch import run_batch
+        run_batch(conn, args.batch, args.output, workers=args.workers, llm_model=args.model,
+                  latency_budget_ms=args.latency_budget_ms)
+    else:
+        interactive_session(conn, embedding_model="all-MiniLM-L6-v2", llm_model=args.model,
+                            latency_budget_ms=args.latency_budget_ms)
+
+    conn.print_stats(prefix="rag_query")
+    conn.close()
     print("[rag_query] Done.")
 
 
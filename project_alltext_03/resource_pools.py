@@ -0,0 +1,162 @@
+"""
+resource_pools.py
+
+**Per-resource-class executors** for data_extraction.py. Before them, extraction ran
+one file at a time, so a folder of scanned images (docTR OCR, seconds and hundreds
+of MB each) held up every cheap .txt and .csv file queued behind it.
+
+Each resource class (e.g. "heavy" for OCR / table detection, "light" for plain text
+parsing) gets its own pool:
+  - **workers**: threads, i.e. how many of its jobs run at once,
+  - **memory_mb**: a memory budget. Every job is admitted with an estimated cost
+    (MB) and waits until the class has that much budget free; a job estimated
+    above the whole budget runs alone in its class.
+
+The classes share nothing, so light files stream through their own pool while the
+heavy pool works through OCR at its own pace. The caller decides each job's class
+and cost (data_extraction.estimate_resources guesses them from file type and size).
+
+Guiding Principles:
+1. **Isolation**: A slow or memory-hungry class cannot take another class's workers.
+2. **Estimates, not enforcement**: The budgets bound the sum of *estimated* costs of
+   running jobs; they keep peak memory in check without measuring it.
+3. **Observable**: Per-class jobs, busy time, longest queue wait and peak admitted
+   memory (print_stats()).
+
+Usage:
+    from resource_pools import ResourceScheduler, DEFAULT_RESOURCE_CLASSES
+
+    with ResourceScheduler(DEFAULT_RESOURCE_CLASSES) as scheduler:
+        future = scheduler.submit("heavy", 600, parse_image, "scan.png")
+        result = future.result()
+        scheduler.print_stats(prefix="data_extraction")
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import profile_thread
+
+# Workers and memory budget (MB) per class; override with EXTRACT_<CLASS>_WORKERS
+# and EXTRACT_<CLASS>_MEMORY_MB
+DEFAULT_RESOURCE_CLASSES = {
+    "heavy": {"workers": int(os.getenv("EXTRACT_HEAVY_WORKERS", "1")),
+              "memory_mb": float(os.getenv("EXTRACT_HEAVY_MEMORY_MB", "4096"))},
+    "light": {"workers": int(os.getenv("EXTRACT_LIGHT_WORKERS", "4")),
+              "memory_mb": float(os.getenv("EXTRACT_LIGHT_MEMORY_MB", "1024"))},
+}
+
+
+class MemoryBudget:
+    """Counting budget in MB: acquire() blocks until the cost fits."""
+
+    def __init__(self, limit_mb: float):
+        self.limit_mb = limit_mb
+        self.in_use = 0.0
+        self.peak = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, cost_mb: float) -> float:
+        """
+        Wait until cost_mb is free and take it. A cost above the limit is clamped
+        to the limit (the job then runs alone).
+
+        :return: the amount taken (pass it to release())
+        """
+        cost_mb = min(max(cost_mb, 0.0), self.limit_mb)
+        with self._cond:
+            while self.in_use + cost_mb > self.limit_mb:
+                self._cond.wait()
+            self.in_use += cost_mb
+            self.peak = max(self.peak, self.in_use)
+        return cost_mb
+
+    def release(self, cost_mb: float):
+        with self._cond:
+            self.in_use -= cost_mb
+            self._cond.notify_all()
+
+
+class ResourcePool:
+    """
+    One resource class: a thread pool plus a memory budget.
+
+    :param name: class name (for stats)
+    :param workers: concurrent jobs
+    :param memory_mb: budget for the estimated cost of running jobs
+    """
+
+    def __init__(self, name: str, workers: int, memory_mb: float):
+        self.name = name
+        self.workers = max(1, workers)
+        self.budget = MemoryBudget(memory_mb)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix=f"extract-{name}")
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.busy_s = 0.0
+        self.max_wait_s = 0.0
+
+    def submit(self, cost_mb: float, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs); it starts once a worker and cost_mb are free."""
+        submitted = time.perf_counter()
+
+        def run():
+            taken = self.budget.acquire(cost_mb)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.budget.release(taken)
+                with self._lock:
+                    self.jobs += 1
+                    self.busy_s += time.perf_counter() - started
+                    self.max_wait_s = max(self.max_wait_s, started - submitted)
+
+        # Profiled per job when the stage runs under full-mode profiling (profiling.py)
+        return self._executor.submit(profile_thread(run))
+
+    def shutdown(self, cancel_pending: bool = False):
+        self._executor.shutdown(wait=True, cancel_futures=cancel_pending)
+
+
+class ResourceScheduler:
+    """
+    A ResourcePool per class. A context manager: leaving the block waits for the
+    running jobs (and cancels the queued ones if the block raised).
+
+    :param classes: {class_name: {"workers": int, "memory_mb": float}}
+    """
+
+    def __init__(self, classes: dict = None):
+        classes = classes or DEFAULT_RESOURCE_CLASSES
+        self.pools = {name: ResourcePool(name, spec["workers"], spec["memory_mb"])
+                      for name, spec in classes.items()}
+
+    def submit(self, resource_class: str, cost_mb: float, fn, *args, **kwargs):
+        """Run fn in the pool of resource_class; returns a Future."""
+        if resource_class not in self.pools:
+            raise ValueError(f"[resource_pools] Unknown resource class '{resource_class}'; "
+                             f"expected one of {sorted(self.pools)}.")
+        return self.pools[resource_class].submit(cost_mb, fn, *args, **kwargs)
+
+    def shutdown(self, cancel_pending: bool = False):
+        for pool in self.pools.values():
+            pool.shutdown(cancel_pending=cancel_pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(cancel_pending=exc_type is not None)
+        return False
+
+    def print_stats(self, prefix: str = "resource_pools"):
+        print(f"[{prefix}] Resource classes:")
+        print(f"  {'class':<8} {'workers':>7} {'budget MB':>10} {'jobs':>6} {'busy s':>8} "
+              f"{'max wait s':>10} {'peak MB':>8}")
+        for pool in self.pools.values():
+            print(f"  {pool.name:<8} {pool.workers:>7} {pool.budget.limit_mb:>10.0f} {pool.jobs:>6} "
+                  f"{pool.busy_s:>8.2f} {pool.max_wait_s:>10.2f} {pool.budget.peak:>8.0f}")
@@ -29,11 +29,76 @@ Pipeline Steps:
 6) ALWAYS run rag_query.py in interactive mode (no capturing). The user can 
    type queries, type "exit"/"quit" to leave.
 
+In-process mode (--mode inprocess):
+-----------------------------------
+Every subprocess re-imports torch and loads its models from scratch, and each step
+hands its result to the next through a JSON file. With --mode inprocess the same
+steps are called as functions in this process instead:
+  - one model_registry.ModelRegistry: the docTR predictor and the SentenceTransformer
+    are loaded once and reused by extraction, embedding and the interactive session,
+  - one Neo4jConnection (one driver and Bolt pool) for storing, relationships and queries,
+  - intermediate results pass in memory; --checkpoint-dir DIR additionally writes
+    parse_results.json, chunked_data.json and embedded_data.json there.
+
+Streaming mode (--mode streaming):
+----------------------------------
+Steps 1-4 run concurrently as stages joined by bounded queues (streaming_pipeline.py):
+a file is embedded as soon as it is parsed and chunked, and stored as soon as it is
+embedded, so wall time approaches the slowest stage rather than the sum. Each stage
+has its own parallelism (--extract-workers, --chunk-workers, --embed-workers,
+--store-writers) and --queue-depth bounds the files in flight. No intermediate files
+are written, so streaming runs are not incremental.
+
+Incremental runs:
+-----------------
+Steps 1-5 are make-style rules (stage_specs): each gets a fingerprint over its input
+artifacts' content hashes, the source of its modules and its parameters (wrap width,
+embedding model, relationship arguments, Neo4j URI). A step whose fingerprint matches
+the one recorded in .pipeline_state.json (and whose outputs are unchanged on disk) is
+skipped; a step that re-runs but writes identical output does not re-trigger the
+steps after it. A no-op re-run on an unchanged corpus only stats the files.
+--force runs everything (e.g. after clearing Neo4j by hand). See pipeline_state.py.
+
+Resuming:
+---------
+Extraction, embedding and store save a checkpoint (records done + partial output)
+every CHECKPOINT_INTERVAL_S seconds (stage_checkpoint.py). After a crash, --resume
+lets them continue from their last checkpoint instead of starting over; the result
+is the same as an uninterrupted run. In-process mode resumes extraction and embedding
+when --checkpoint-dir is set (the store step there re-writes, which MERGE makes safe).
+To pick up files dropped into data/ continuously, run ingest_daemon.py instead.
+
+Each step is timed in every mode. --compare runs the pipeline once per mode (without
+the interactive session) and prints the end-to-end wall times side by side.
+
+Run report:
+-----------
+Every run ends with a telemetry report (telemetry.py), written to --report (default
+run_report.json) and summarised as a table: per step wall time, CPU time, peak RSS,
+items processed and items/s; per parser (parse_pdf, parse_image, ...) files, bytes
+and time; sub-step timers such as OCR inference and Camelot table detection; and
+the ten slowest files with the parser that handled each. Subprocess steps hand
+their numbers back through $PIPELINE_TELEMETRY_FILE. The report is written even if
+a step fails.
+
+Profiling:
+----------
+--profile STAGES (or PIPELINE_PROFILE) wraps the chosen steps, or "all", with
+cProfile + tracemalloc (--profile-mode full) or with a low-rate stack sampler and
+short tracemalloc windows (--profile-mode sample, cheap enough to leave on). Each
+step writes <step>.prof / .top.txt / .alloc.txt (full) or .samples.txt / .folded /
+.alloc.txt (sample) into one run directory (--profile-dir). See profiling.py.
+
 Usage:
 ------
-    python run_pipeline.py [--skip-relationships]
+    python run_pipeline.py [--skip-relationships] [--mode subprocess|inprocess|streaming]
+                           [--checkpoint-dir DIR] [--no-query] [--force] [--resume] [--report PATH]
+                           [--profile STAGES] [--profile-mode full|sample] [--profile-dir DIR]
+                           [--wrap-width N] [--embedding-model NAME]
+                           [--relationship-args "--embedding threshold=0.8"]
+    python run_pipeline.py --compare [--checkpoint-dir DIR]
 
-No further flags. It automatically starts the interactive Q&A once steps are done.
+By default it automatically starts the interactive Q&A once steps are done.
 
 If any step fails, we print an error and stop immediately, 
 so partial data doesn't cause confusion.
@@ -52,11 +117,27 @@ Let's begin:
 
 import sys
 import os
+import json
+import time
+import shlex
 import argparse
+import contextlib
 import subprocess
 
+from telemetry import RunReport, DEFAULT_REPORT_PATH
+from profiling import profile_stage, configure as configure_profiling, MODES as PROFILE_MODES
+
+MODES = ("subprocess", "inprocess", "streaming")
+
+# Defaults of the parameters that go into stage fingerprints
+DEFAULT_WRAP_WIDTH = 80                          # data_chunking.WRAP_WIDTH
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
-def run_script_normal(script_path, args=None) -> bool:
+# Steps that checkpoint their progress and accept --resume (stage_checkpoint.py)
+RESUMABLE_STEPS = ("data_extraction", "embedding_text", "store_in_neo4j")
+
+
+def run_script_normal(script_path, args=None, env=None) -> bool:
     """
     Runs a Python script in a 'normal' mode, capturing stdout/stderr so we can 
     display them here. If there's an error, returns False. If success, True.
@@ -65,6 +146,8 @@ def run_script_normal(script_path, args=None) -> bool:
     :type script_path: str
     :param args: CLI arguments for that script
     :type args: list
+    :param env: environment for the script (None: inherit)
+    :type env: dict or None
     """
     if args is None:
         args = []
@@ -73,7 +156,7 @@ def run_script_normal(script_path, args=None) -> bool:
     print(f"\n[run_pipeline] Running (normal): {' '.join(command)}")
 
     # capture_output=True so we see logs in this pipeline's stdout
-    result = subprocess.run(command, capture_output=True, text=True)
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
     print(result.stdout)  # print any standard output
 
     if result.returncode != 0:
@@ -111,80 +194,494 @@ def run_script_interactive(script_path, args=None) -> bool:
     return True
 
 
+@contextlib.contextmanager
+def measure(report, name: str, profile_name: str = None):
+    """
+    Telemetry (report.measure, if there is a report) and opt-in profiling
+    (profiling.py, as profile_name or name) around one in-process step. Yields the
+    stage overrides dict.
+    """
+    with profile_stage(profile_name or name):
+        if report is None:
+            yield {}
+            return
+        with report.measure(name) as stage:
+            yield stage
+
+
+def print_timings(title: str, timings: list) -> float:
+    """Print a per-step wall-time table; returns the total seconds."""
+    total = sum(seconds for _, seconds in timings)
+    print(f"\n[run_pipeline] {title}")
+    for step, seconds in timings:
+        print(f"  {step:<34} {seconds:8.2f}s")
+    print(f"  {'total':<34} {total:8.2f}s")
+    return total
+
+
+def stage_specs(folder: str = None, wrap_width: int = DEFAULT_WRAP_WIDTH,
+                embedding_model: str = DEFAULT_EMBEDDING_MODEL, relationship_args: list = None,
+                skip_relationships: bool = False, resume: bool = False) -> list:
+    """
+    Steps 1-5 as make-style rules: the script (and its CLI args) for subprocess mode,
+    plus the inputs, outputs, modules and parameters that make up each step's
+    fingerprint (see pipeline_state.py).
+
+    :param folder: where the intermediate JSON files live (None: current directory)
+    :param relationship_args: compute_relationships.py CLI tokens, e.g. ["--embedding", "threshold=0.8"]
+    :param resume: let the checkpointed steps (extraction, embedding, store) continue
+                   from an interrupted run; not part of the fingerprint, since a
+                   resumed step produces the same output
+    """
+    from neo4j_connection import NEO4J_URI
+
+    def artifact(name):
+        return os.path.join(folder, name) if folder else name
+
+    parse_results_json = artifact("parse_results.json")
+    chunked_data_json  = artifact("chunked_data.json")
+    embedded_data_json = artifact("embedded_data.json")
+    # Same default as lexical_index.DEFAULT_INDEX_PATH (not imported: it pulls in numpy)
+    lexical_index_path = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.npz")
+
+    specs = [
+        {"name": "data_extraction", "script": "data_extraction.py", "args": [],
+         "inputs": ["data"], "outputs": [parse_results_json],
+         "modules": ["data_extraction", "parse_pdf", "parse_docx", "parse_spreadsheet",
+                     "parse_text", "parse_image"],
+         "params": {}},
+        {"name": "data_chunking", "script": "data_chunking.py",
+         "args": [parse_results_json, chunked_data_json, str(wrap_width)],
+         "inputs": [parse_results_json], "outputs": [chunked_data_json],
+         "modules": ["data_chunking", "chunk_text", "chunk_table", "chunk_image"],
+         "params": {"wrap_width": wrap_width}},
+        {"name": "embedding_text", "script": "embedding_text.py",
+         "args": ["--input", chunked_data_json, "--output", embedded_data_json,
+                  "--model", embedding_model],
+         "inputs": [chunked_data_json], "outputs": [embedded_data_json],
+         "modules": ["embedding_text"],
+         "params": {"model": embedding_model}},
+        # The graph itself cannot be hashed: downstream graph steps chain on this
+        # step's fingerprint instead (after=[...])
+        {"name": "store_in_neo4j", "script": "store_in_neo4j.py", "args": [embedded_data_json],
+         "inputs": [embedded_data_json], "outputs": [lexical_index_path],
+         "modules": ["store_in_neo4j", "lexical_index", "store_version"],
+         "params": {"neo4j_uri": NEO4J_URI}},
+    ]
+    # Step 5) compute_relationships if not skipping
+    if not skip_relationships:
+        relationship_args = list(relationship_args or [])
+        specs.append(
+            {"name": "compute_relationships", "script": "compute_relationships.py",
+             "args": relationship_args, "inputs": [], "outputs": [], "after": ["store_in_neo4j"],
+             "modules": ["compute_relationships", "embedding_relationships", "topic_relationships"],
+             "params": {"args": relationship_args, "neo4j_uri": NEO4J_URI}})
+    if resume:
+        for spec in specs:
+            if spec["name"] in RESUMABLE_STEPS:
+                spec["args"] = spec["args"] + ["--resume"]
+                spec["resume"] = True
+    return specs
+
+
+def check_stage(state, spec: dict, force: bool = False):
+    """
+    Fingerprint a step against the recorded state.
+
+    :return: (fingerprint, up_to_date); (None, False) without a state
+    """
+    if state is None:
+        return None, False
+    fingerprint = state.fingerprint(spec["name"], inputs=spec["inputs"], modules=spec["modules"],
+                                    params=spec["params"], after=spec.get("after"))
+    if force or not state.is_fresh(spec["name"], fingerprint, spec["outputs"]):
+        return fingerprint, False
+    print(f"[run_pipeline] {spec['name']} is up to date (fingerprint {fingerprint[:12]}), skipping.")
+    return fingerprint, True
+
+
+def finish_stage(state, spec: dict, fingerprint: str, ok: bool, seconds: float):
+    """Record a finished step (or forget a failed one) and save the state file."""
+    if state is None:
+        return
+    if ok and fingerprint is not None:
+        state.record(spec["name"], fingerprint, outputs=spec["outputs"], seconds=seconds)
+    else:
+        state.invalidate(spec["name"])
+    state.save()
+
+
+def run_subprocess_pipeline(specs: list, run_query: bool = True, state=None, force: bool = False,
+                            report=None):
+    """
+    Steps 1-6 as separate scripts (the original mode).
+
+    :param specs: steps from stage_specs()
+    :param state: PipelineState for incremental runs (None: run every step)
+    :param force: run every step even if its fingerprint is unchanged
+    :param report: telemetry.RunReport to record each step in (each script dumps
+                   its own telemetry for it)
+    :return: list of (step, seconds), or None if a step failed
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    telemetry_file = os.path.abspath(".pipeline_telemetry.json")
+
+    timings = []
+    for spec in specs:
+        start = time.perf_counter()
+        fingerprint, up_to_date = check_stage(state, spec, force)
+        if up_to_date:
+            timings.append((f"{spec['name']} (up to date)", time.perf_counter() - start))
+            if report is not None:
+                report.add_stage(f"{spec['name']} (up to date)", time.perf_counter() - start, status="skip")
+            continue
+        env = report.child_env(telemetry_file) if report is not None else None
+        ok = run_script_normal(os.path.join(script_dir, spec["script"]), args=spec["args"], env=env)
+        seconds = time.perf_counter() - start
+        timings.append((spec["name"], seconds))
+        if report is not None:
+            report.add_subprocess_stage(spec["name"], seconds, telemetry_file, ok)
+        finish_stage(state, spec, fingerprint, ok, seconds)
+        if not ok:
+            print(f"[run_pipeline] {spec['name']} failed. Stopping.")
+            return None
+
+    print("[run_pipeline] Pipeline steps completed successfully!")
+
+    # Step 6) launch rag_query in interactive mode
+    if run_query:
+        print("[run_pipeline] Now launching rag_query.py for interactive Q&A session.\n")
+        start = time.perf_counter()
+        if not run_script_interactive(os.path.join(script_dir, "rag_query.py"), args=[]):
+            print("[run_pipeline] rag_query ended with errors.")
+        else:
+            print("[run_pipeline] rag_query ended normally.")
+        timings.append(("rag_query", time.perf_counter() - start))
+
+    return timings
+
+
+def run_in_process(specs: list, run_query: bool = True, checkpoint_dir: str = None,
+                   state=None, force: bool = False, report=None):
+    """
+    Steps 1-6 as function calls in this process, sharing one model registry and one
+    Neo4j connection; results pass in memory.
+
+    :param specs: steps from stage_specs(folder=checkpoint_dir)
+    :param run_query: finish with the interactive session
+    :param checkpoint_dir: if set, also write each intermediate result there; a step
+                           that is up to date is then skipped and its checkpoint read
+                           back only if a later step needs it
+    :param state: PipelineState for incremental runs (requires checkpoint_dir)
+    :param force: run every step even if its fingerprint is unchanged
+    :param report: telemetry.RunReport to record each step in
+    :return: list of (step, seconds), or None if a step failed
+    """
+    # Imported here so subprocess mode does not pay for torch/docTR imports
+    from model_registry import get_registry
+    from neo4j_connection import Neo4jConnection
+    from data_extraction import data_extraction
+    from data_chunking import chunk_data
+    from embedding_text import embed_chunked_data, embed_and_write
+    from store_in_neo4j import store_in_neo4j
+    from compute_relationships import compute_relationships, build_parser, parse_params
+
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        print(f"[run_pipeline] Writing checkpoints to '{checkpoint_dir}'.")
+    elif state is not None:
+        print("[run_pipeline] Incremental runs need --checkpoint-dir in-process; running every step.")
+        state = None
+
+    # The process-wide registry: rag_query's get_embedding_model() uses it too
+    registry = get_registry()
+    conn = Neo4jConnection.from_env()
+    print(f"[run_pipeline] Using Neo4j at {conn.uri} with user '{conn.user}' for every step.")
+
+    by_name = {spec["name"]: spec for spec in specs}
+    results = {}
+
+    def checkpoint(name):
+        return by_name[name]["outputs"][0] if checkpoint_dir else None
+
+    def result_of(name):
+        # Output of an earlier step: in memory, or read back from its checkpoint if it was skipped
+        if name not in results:
+            with open(checkpoint(name), "r", encoding="utf-8") as f:
+                results[name] = json.load(f)
+        return results[name]
+
+    def embed():
+        spec = by_name["embedding_text"]
+        if checkpoint_dir:
+            # Checkpointed against chunked_data.json, like the embedding_text.py script
+            return embed_and_write(result_of("data_chunking"), checkpoint("data_chunking"),
+                                   checkpoint("embedding_text"), spec["params"]["model"],
+                                   registry=registry, resume=spec.get("resume", False))
+        return embed_chunked_data(result_of("data_chunking"), spec["params"]["model"], registry=registry)
+
+    def relationships():
+        rel_args = build_parser().parse_args(by_name["compute_relationships"]["args"])
+        compute_relationships(conn, embedding=rel_args.embedding, topic=rel_args.topic,
+                              params=parse_params(rel_args.params))
+
+    steps = {
+        # Steps 1-3: extraction -> chunking -> embedding, passed in memory
+        "data_extraction": lambda: data_extraction(output_json=checkpoint("data_extraction"),
+                                                   registry=registry,
+                                                   resume=by_name["data_extraction"].get("resume", False)),
+        "data_chunking": lambda: chunk_data(result_of("data_extraction"),
+                                            output_json=checkpoint("data_chunking"),
+                                            wrap_width=by_name["data_chunking"]["params"]["wrap_width"]),
+        "embedding_text": embed,
+        # Step 4: store, on the shared connection
+        "store_in_neo4j": lambda: store_in_neo4j(files=result_of("embedding_text")["files"], conn=conn),
+        # Step 5: same relationship step the subprocess mode runs
+        "compute_relationships": relationships,
+    }
+
+    timings = []
+    for spec in specs:
+        name = spec["name"]
+        start = time.perf_counter()
+        fingerprint, up_to_date = check_stage(state, spec, force)
+        if up_to_date:
+            timings.append((f"{name} (up to date)", time.perf_counter() - start))
+            if report is not None:
+                report.add_stage(f"{name} (up to date)", time.perf_counter() - start, status="skip")
+            continue
+        print(f"\n[run_pipeline] Running (in-process): {name}")
+        try:
+            with measure(report, name):
+                results[name] = steps[name]()
+        except Exception as e:
+            finish_stage(state, spec, fingerprint, False, time.perf_counter() - start)
+            print(f"*** Error in {name}: {e}")
+            print("[run_pipeline] Stopping.")
+            conn.close()
+            return None
+        seconds = time.perf_counter() - start
+        timings.append((name, seconds))
+        finish_stage(state, spec, fingerprint, True, seconds)
+
+    print("[run_pipeline] Pipeline steps completed successfully!")
+
+    # Step 6: interactive session, reusing the loaded embedding model and connection
+    if run_query:
+        import rag_query
+        print("[run_pipeline] Now starting the interactive Q&A session.\n")
+        start = time.perf_counter()
+        rag_query.interactive_session(conn)
+        timings.append(("rag_query", time.perf_counter() - start))
+
+    registry.print_stats(prefix="run_pipeline")
+    conn.print_stats(prefix="run_pipeline")
+    conn.close()
+    return timings
+
+
+def run_streaming_pipeline(specs: list, run_query: bool = True, stream_options: dict = None,
+                           report=None):
+    """
+    Steps 1-4 as concurrent stages joined by bounded queues (streaming_pipeline.py),
+    then steps 5-6 in this process on the same connection. Nothing is fingerprinted:
+    no intermediate files are written.
+
+    :param specs: steps from stage_specs() (parameters and relationship args)
+    :param stream_options: worker counts / queue depth for run_streaming
+    :param report: telemetry.RunReport to record the steps in
+    :return: list of (step, seconds), or None if a step failed
+    """
+    from neo4j_connection import Neo4jConnection
+    from streaming_pipeline import run_streaming, print_report
+    from compute_relationships import compute_relationships, build_parser, parse_params
+
+    by_name = {spec["name"]: spec for spec in specs}
+    conn = Neo4jConnection.from_env()
+    print(f"[run_pipeline] Using Neo4j at {conn.uri} with user '{conn.user}' for every step.")
+
+    timings = []
+    start = time.perf_counter()
+    try:
+        with measure(report, "extract..store (streaming)", profile_name="streaming") as stage:
+            stream_report = run_streaming(conn, wrap_width=by_name["data_chunking"]["params"]["wrap_width"],
+                                          embedding_model=by_name["embedding_text"]["params"]["model"],
+                                          **(stream_options or {}))
+            stage["items"] = stream_report["chunks"]
+        timings.append(("extract..store (streaming)", time.perf_counter() - start))
+        print_report(stream_report)
+        if report is not None:
+            report.extra["streaming"] = stream_report
+
+        if "compute_relationships" in by_name:
+            print("\n[run_pipeline] Running (in-process): compute_relationships")
+            start = time.perf_counter()
+            rel_args = build_parser().parse_args(by_name["compute_relationships"]["args"])
+            with measure(report, "compute_relationships"):
+                compute_relationships(conn, embedding=rel_args.embedding, topic=rel_args.topic,
+                                      params=parse_params(rel_args.params))
+            timings.append(("compute_relationships", time.perf_counter() - start))
+    except Exception as e:
+        print(f"*** Error in streaming pipeline: {e}")
+        print("[run_pipeline] Stopping.")
+        conn.close()
+        return None
+
+    print("[run_pipeline] Pipeline steps completed successfully!")
+
+    if run_query:
+        import rag_query
+        print("[run_pipeline] Now starting the interactive Q&A session.\n")
+        start = time.perf_counter()
+        rag_query.interactive_session(conn)
+        timings.append(("rag_query", time.perf_counter() - start))
+
+    conn.print_stats(prefix="run_pipeline")
+    conn.close()
+    return timings
+
+
 def main():
     """
     The pipeline:
       1) data_extraction.py -> parse_results.json
-      2) data_chunking.py parse_results.json chunked_data.json
-      3) embedding_text.py --input chunked_data.json --output embedded_data.json
+      2) data_chunking.py parse_results.json chunked_data.json <wrap_width>
+      3) embedding_text.py --input chunked_data.json --output embedded_data.json --model <model>
       4) store_in_neo4j.py embedded_data.json
-      5) (optional) compute_relationships.py if not skipping
-      6) ALWAYS run rag_query.py in interactive mode.
+      5) (optional) compute_relationships.py <relationship args> if not skipping
+      6) run rag_query.py in interactive mode (unless --no-query).
+
+    Steps 1-5 are skipped when their fingerprint is unchanged (unless --force).
 
     Usage:
-      python run_pipeline.py [--skip-relationships]
+      python run_pipeline.py [--skip-relationships] [--mode subprocess|inprocess|streaming]
+                             [--checkpoint-dir DIR] [--no-query] [--compare] [--force] [--resume]
+                             [--report PATH] [--profile STAGES] [--profile-mode full|sample]
+                             [--wrap-width N] [--embedding-model NAME]
+                             [--relationship-args "--embedding threshold=0.8"]
     """
     parser = argparse.ArgumentParser(
-        description="Run entire pipeline then ALWAYS open interactive rag_query."
+        description="Run entire pipeline then open interactive rag_query."
     )
     parser.add_argument("--skip-relationships", action="store_true",
                         help="Skip compute_relationships step.")
+    parser.add_argument("--mode", choices=MODES, default="subprocess",
+                        help="Run each step as a script, call the steps in this process "
+                             "with shared models and one Neo4j connection, or stream files "
+                             "through concurrent stages.")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="In-process mode: also write intermediate JSON files to this directory "
+                             "(required for incremental in-process runs).")
+    parser.add_argument("--no-query", action="store_true",
+                        help="Stop after the pipeline steps; do not start the Q&A session.")
+    parser.add_argument("--compare", action="store_true",
+                        help="Run every mode in full (without the Q&A session) and compare wall times.")
+    parser.add_argument("--force", action="store_true",
+                        help="Run every step even if its fingerprint matches the last run.")
+    parser.add_argument("--report", default=DEFAULT_REPORT_PATH,
+                        help="Where to write the JSON run report (per-stage and per-file telemetry); "
+                             "--compare writes one per mode, e.g. run_report.inprocess.json.")
+    parser.add_argument("--profile", default=None, metavar="STAGES",
+                        help='Profile these steps ("all" or e.g. "data_chunking,store_in_neo4j"); '
+                             "see profiling.py. Same as PIPELINE_PROFILE.")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, default="full",
+                        help="full: cProfile + tracemalloc; sample: stack sampling + tracemalloc "
+                             "windows, cheap enough for production runs.")
+    parser.add_argument("--profile-dir", default=None,
+                        help="Run directory for the profiles (default profiles/<timestamp>).")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue interrupted extraction/embedding/store steps from their checkpoints.")
+    parser.add_argument("--wrap-width", type=int, default=DEFAULT_WRAP_WIDTH,
+                        help="Text chunk wrap width (data_chunking.py).")
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL,
+                        help="SentenceTransformer model for embedding_text.py.")
+    parser.add_argument("--relationship-args", default="",
+                        help='Arguments for compute_relationships.py, e.g. "--embedding threshold=0.8".')
+    streaming = parser.add_argument_group("streaming mode")
+    streaming.add_argument("--extract-workers", type=int, default=2, help="Extraction (parsing/OCR) threads.")
+    streaming.add_argument("--chunk-workers", type=int, default=1, help="Chunking threads.")
+    streaming.add_argument("--embed-workers", type=int, default=1, help="Embedding threads.")
+    streaming.add_argument("--store-writers", type=int, default=1, help="Neo4j writer threads.")
+    streaming.add_argument("--queue-depth", type=int, default=None,
+                           help="Max files waiting between two stages (default STREAM_QUEUE_DEPTH or 8).")
     args = parser.parse_args()
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Pipeline scripts
-    data_extraction_py       = os.path.join(script_dir, "data_extraction.py")
-    data_chunking_py         = os.path.join(script_dir, "data_chunking.py")
-    embedding_text_py        = os.path.join(script_dir, "embedding_text.py")
-    store_in_neo4j_py        = os.path.join(script_dir, "store_in_neo4j.py")
-    compute_relationships_py = os.path.join(script_dir, "compute_relationships.py")
-    rag_query_py             = os.path.join(script_dir, "rag_query.py")
-
-    # Filenames for each step
-    parse_results_json = "parse_results.json"
-    chunked_data_json  = "chunked_data.json"
-    embedded_data_json = "embedded_data.json"
-
-    # Step 1) data_extraction
-    if not run_script_normal(data_extraction_py):
-        print("[run_pipeline] data_extraction failed. Stopping.")
-        return
-
-    # Step 2) chunking
-    if not run_script_normal(data_chunking_py, args=[parse_results_json, chunked_data_json]):
-        print("[run_pipeline] data_chunking failed. Stopping.")
-        return
-
-    # Step 3) embedding_text
-    if not run_script_normal(embedding_text_py, args=["--input", chunked_data_json, 
-                                                      "--output", embedded_data_json]):
-        print("[run_pipeline] embedding_text failed. Stopping.")
+    # Imported here: pipeline_state is only needed once we know the mode
+    from pipeline_state import PipelineState, DEFAULT_STATE_FILE
+
+    spec_kwargs = {
+        "wrap_width": args.wrap_width,
+        "embedding_model": args.embedding_model,
+        "relationship_args": shlex.split(args.relationship_args),
+        "skip_relationships": args.skip_relationships,
+        "resume": args.resume,
+    }
+    if args.skip_relationships:
+        print("[run_pipeline] Skipping compute_relationships step as requested.")
+    if args.profile:
+        # Through the environment, so subprocess steps profile themselves too
+        profile_dir = configure_profiling(args.profile, args.profile_mode, args.profile_dir)
+        print(f"[run_pipeline] Profiling '{args.profile}' ({args.profile_mode} mode) into '{profile_dir}'.")
+
+    def subprocess_run(run_query, force, report):
+        state = PipelineState(DEFAULT_STATE_FILE)
+        return run_subprocess_pipeline(stage_specs(**spec_kwargs), run_query=run_query,
+                                       state=state, force=force, report=report)
+
+    def in_process_run(run_query, force, report):
+        folder = args.checkpoint_dir
+        state = PipelineState(os.path.join(folder, DEFAULT_STATE_FILE)) if folder else None
+        return run_in_process(stage_specs(folder=folder, **spec_kwargs), run_query=run_query,
+                              checkpoint_dir=folder, state=state, force=force, report=report)
+
+    def streaming_run(run_query, force, report):
+        stream_options = {
+            "extract_workers": args.extract_workers,
+            "chunk_workers": args.chunk_workers,
+            "embed_workers": args.embed_workers,
+            "store_writers": args.store_writers,
+        }
+        if args.queue_depth is not None:
+            stream_options["queue_depth"] = args.queue_depth
+        return run_streaming_pipeline(stage_specs(**spec_kwargs), run_query=run_query,
+                                      stream_options=stream_options, report=report)
+
+    runners = {"subprocess": subprocess_run, "inprocess": in_process_run, "streaming": streaming_run}
+
+    def run_with_report(mode, report_path, **kwargs):
+        # The report is written (and summarised) even if a step failed
+        report = RunReport(mode)
+        try:
+            return runners[mode](report=report, **kwargs)
+        finally:
+            report.print_summary(report.write(report_path))
+
+    if args.compare:
+        totals = {}
+        base, ext = os.path.splitext(args.report)
+        for mode in runners:
+            print(f"\n[run_pipeline] ===== {mode} mode =====")
+            # Full runs: skipping up-to-date steps would make the comparison meaningless
+            timings = run_with_report(mode, f"{base}.{mode}{ext}", run_query=False, force=True)
+            if timings is None:
+                print(f"[run_pipeline] {mode} mode failed; no comparison.")
+                return
+            totals[mode] = print_timings(f"{mode} mode wall time", timings)
+        print("\n[run_pipeline] End-to-end wall time:")
+        for mode, total in totals.items():
+            speedup = totals["subprocess"] / max(total, 1e-9)
+            print(f"  {mode:<12} {total:8.2f}s ({speedup:.2f}x vs subprocess)")
         return
 
-    # Step 4) store_in_neo4j
-    if not run_script_normal(store_in_neo4j_py, args=[embedded_data_json]):
-        print("[run_pipeline] store_in_neo4j failed. Stopping.")
+    timings = run_with_report(args.mode, args.report, run_query=not args.no_query, force=args.force)
+    if timings is None:
         return
 
-    # Step 5) compute_relationships if not skipping
-    if not args.skip_relationships:
-        if not run_script_normal(compute_relationships_py, args=[]):
-            print("[run_pipeline] compute_relationships failed. Stopping.")
-            return
-    else:
-        print("[run_pipeline] Skipping compute_relationships step as requested.")
-
-    print("[run_pipeline] Pipeline steps completed successfully!")
-    print("[run_pipeline] Now launching rag_query.py for interactive Q&A session.\n")
-
-    # Step 6) ALWAYS launch rag_query in interactive mode
-    if not run_script_interactive(rag_query_py, args=[]):
-        print("[run_pipeline] rag_query ended with errors.")
+    print_timings(f"{args.mode} mode wall time", timings)
+    if args.no_query:
+        print("[run_pipeline] Done. Pipeline steps complete (interactive session skipped).")
     else:
-        print("[run_pipeline] rag_query ended normally.")
-
-    print("[run_pipeline] Done. The entire pipeline (including interactive session) is complete.")
+        print("[run_pipeline] Done. The entire pipeline (including interactive session) is complete.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,302 @@
+"""
+semantic_cache.py
+
+A **semantic answer cache** for rag_query. The LLM call is by far the most expensive
+step (often tens of seconds on deepseek-r1:32b), and many questions are paraphrases
+of earlier ones ("Q3 revenue by team?" / "What was each team's revenue in Q3?").
+Exact-text caching (query_cache.py) misses those; this cache matches on meaning.
+
+Each entry stores:
+    (query embedding, retrieved chunk-id set, answer, LLM model, store version, expiry)
+
+A new question hits when ALL of these hold:
+  1) its embedding is within `threshold` cosine similarity of a cached query,
+  2) its retrieved chunk-id set is exactly the cached one (same evidence in the
+     prompt, so the cached answer is still grounded in the same context),
+  3) the LLM model and the store version (store_version.py) are the same,
+  4) the entry has not expired (per-entry TTL).
+
+Guiding Principles:
+1. **Vector index over cached queries**: Cached query embeddings live in one growable,
+   pre-normalised float32 matrix; a lookup is one GEMV + argpartition over it (the
+   same approach as vector_index.py), checking only the few nearest entries.
+2. **Persistent across sessions**: Entries are appended to a JSONL journal
+   (default semantic_cache.jsonl, or $SEMANTIC_CACHE_PATH) as they are added and
+   replayed on start-up. Expired entries are skipped on load, and the journal is
+   compacted (rewritten atomically) when most of it is dead.
+3. **Bounded**: At most `max_entries` live entries; the oldest are evicted first.
+   Every SWEEP_EVERY_PUTS puts, expired rows are dropped, the matrix is repacked
+   once most of its rows are dead, and the journal is compacted, so a long-running
+   process does not grow without limit.
+4. **Conservative**: A hit requires the same retrieved chunks; a near-duplicate
+   question that retrieves different evidence always goes to the LLM.
+
+Usage:
+    from semantic_cache import SemanticAnswerCache
+
+    cache = SemanticAnswerCache.open("semantic_cache.jsonl", threshold=0.95, ttl_s=86400,
+                                     max_entries=10000)
+    hit = cache.lookup(query_vec, chunk_ids, model="deepseek-r1:32b", version=v)
+    if hit is None:
+        answer = call_ollama(prompt)
+        cache.put(question, query_vec, chunk_ids, answer, model="deepseek-r1:32b", version=v)
+    else:
+        answer = hit["answer"]
+"""
+
+import os
+import json
+import time
+import threading
+
+import numpy as np
+
+from vector_index import top_k_indices
+
+
+DEFAULT_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.jsonl")
+DEFAULT_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+DEFAULT_TTL_S = float(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+
+# How many nearest cached queries to check per lookup (they may differ in chunk ids)
+CANDIDATES_PER_LOOKUP = 8
+
+# Rewrite the journal on open when fewer than this fraction of its lines are live
+COMPACT_LIVE_FRACTION = 0.5
+
+# Drop expired rows, repack the matrix and compact the journal every this many puts
+SWEEP_EVERY_PUTS = 256
+
+
+class SemanticAnswerCache:
+    """
+    Cosine-threshold answer cache with a vector index over cached query embeddings,
+    per-entry TTL, oldest-first eviction and an append-only JSONL journal.
+    """
+
+    def __init__(self, path: str = None, threshold: float = DEFAULT_THRESHOLD,
+                 ttl_s: float = DEFAULT_TTL_S, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 clock=time.time):
+        """
+        :param path: JSONL journal to append entries to (None = in-memory only)
+        :param threshold: minimum cosine similarity between query embeddings for a hit
+        :param ttl_s: default time-to-live for new entries, in seconds
+        :param max_entries: most live entries kept; the oldest are evicted beyond it
+        :param clock: wall-clock time source (expiry must survive restarts)
+        """
+        self.path = path
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self._clock = clock
+        self._matrix = None       # (capacity, dim) float32, first _size rows used
+        self._size = 0
+        self._entries = []        # row -> entry dict (None once expired or evicted)
+        self._live = 0
+        self._oldest = 0          # no live rows before this one
+        self._journal_lines = 0
+        self._puts_since_sweep = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # ----------------------------------------------------------------------------------
+    # Opening / persistence
+    # ----------------------------------------------------------------------------------
+    @classmethod
+    def open(cls, path: str = DEFAULT_CACHE_PATH, **kwargs):
+        """Create a cache backed by `path`, replaying any entries already journalled."""
+        cache = cls(path=path, **kwargs)
+        if path and os.path.isfile(path):
+            lines = 0
+            now = cache._clock()
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from a crash; everything before it is intact
+                        continue
+                    if entry.get("expires_at", 0) > now:
+                        cache._append(entry)
+            cache._journal_lines = lines
+            if lines and len(cache) < lines * COMPACT_LIVE_FRACTION:
+                cache.compact()
+            print(f"[semantic_cache] Loaded {len(cache)} cached answers from {path}")
+        return cache
+
+    def compact(self):
+        """Rewrite the journal with only the live entries (atomic replace)."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        if not self.path:
+            return
+        now = self._clock()
+        lines = 0
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries:
+                if entry is not None and entry["expires_at"] > now:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    lines += 1
+        os.replace(tmp_path, self.path)
+        self._journal_lines = lines
+
+    def _journal(self, entry: dict):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._journal_lines += 1
+
+    # ----------------------------------------------------------------------------------
+    # Index
+    # ----------------------------------------------------------------------------------
+    def __len__(self):
+        return self._live
+
+    def _append(self, entry: dict) -> bool:
+        """
+        Add an entry to the index, evicting the oldest one beyond max_entries.
+
+        :return: False if the entry was rejected (zero vector or a different
+                 embedding dimension than the cached entries)
+        """
+        vec = np.asarray(entry["embedding"], dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        if norm == 0.0:
+            return False
+        if self._matrix is None:
+            self._matrix = np.zeros((16, vec.shape[0]), dtype=np.float32)
+        elif vec.shape[0] != self._matrix.shape[1]:
+            # Different embedding model than the cached entries: cannot compare
+            return False
+        if self._size == self._matrix.shape[0]:
+            grown = np.zeros((self._size * 2, self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._matrix
+            self._matrix = grown
+        self._matrix[self._size] = vec / norm
+        self._entries.append(entry)
+        self._size += 1
+        self._live += 1
+        while self._live > self.max_entries:
+            # Rows are in insertion order, so the first live row is the oldest
+            while self._entries[self._oldest] is None:
+                self._oldest += 1
+            self._drop(self._oldest)
+            self.evictions += 1
+        if self._size - self._live > max(self._live, 16):
+            self._repack()
+        return True
+
+    def _drop(self, row: int):
+        """Remove a row from the index (a zero row never matches again)."""
+        self._entries[row] = None
+        self._matrix[row] = 0.0
+        self._live -= 1
+
+    def _repack(self):
+        """Move the live rows to the front of a right-sized matrix, freeing dead ones."""
+        keep = [i for i in range(self._size) if self._entries[i] is not None]
+        matrix = np.zeros((max(16, 2 * len(keep)), self._matrix.shape[1]), dtype=np.float32)
+        matrix[:len(keep)] = self._matrix[keep]
+        self._matrix = matrix
+        self._entries = [self._entries[i] for i in keep]
+        self._size = len(keep)
+        self._oldest = 0
+
+    def _sweep(self):
+        """Drop expired rows, then repack the matrix and compact the journal if mostly dead."""
+        now = self._clock()
+        for i in range(self._oldest, self._size):
+            entry = self._entries[i]
+            if entry is not None and entry["expires_at"] <= now:
+                self._drop(i)
+                self.expirations += 1
+        if self._matrix is not None and self._size - self._live > self._live:
+            self._repack()
+        if self._journal_lines and self._live < self._journal_lines * COMPACT_LIVE_FRACTION:
+            self._compact()
+
+    def lookup(self, query_embedding, chunk_ids, model: str = "", version=None):
+        """
+        :param query_embedding: embedding of the new question
+        :param chunk_ids: ids retrieved for the new question (order does not matter)
+        :param model: LLM model the answer must come from
+        :param version: current store version
+        :return: the matching entry dict (with an added "similarity"), or None
+        """
+        q = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        wanted = sorted(chunk_ids)
+        with self._lock:
+            if self._size == 0 or norm == 0.0 or q.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+            sims = self._matrix[:self._size] @ (q / norm)
+            now = self._clock()
+            for i in top_k_indices(sims, CANDIDATES_PER_LOOKUP):
+                if sims[i] < self.threshold:
+                    break
+                entry = self._entries[i]
+                if entry is None:
+                    continue
+                if entry["expires_at"] <= now:
+                    self._drop(i)
+                    self.expirations += 1
+                    continue
+                if entry["chunk_ids"] == wanted and entry["model"] == model and entry["version"] == version:
+                    self.hits += 1
+                    return dict(entry, similarity=float(sims[i]))
+            self.misses += 1
+            return None
+
+    def put(self, question: str, query_embedding, chunk_ids, answer: str,
+            model: str = "", version=None, ttl_s: float = None):
+        """
+        Cache an answer and append it to the journal. Entries the index rejects
+        (zero vector, different embedding dimension) are not journalled.
+
+        :param ttl_s: per-entry TTL override (defaults to the cache's ttl_s)
+        """
+        now = self._clock()
+        entry = {
+            "question": question,
+            "embedding": [float(x) for x in np.asarray(query_embedding).reshape(-1)],
+            "chunk_ids": sorted(chunk_ids),
+            "answer": answer,
+            "model": model,
+            "version": version,
+            "created_at": now,
+            "expires_at": now + (self.ttl_s if ttl_s is None else ttl_s),
+        }
+        with self._lock:
+            if not self._append(entry):
+                return
+            self._journal(entry)
+            self._puts_since_sweep += 1
+            if self._puts_since_sweep >= SWEEP_EVERY_PUTS:
+                self._puts_since_sweep = 0
+                self._sweep()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def print_stats(self, prefix: str = "semantic_cache"):
+        st = self.stats()
+        print(f"[{prefix}] Semantic answer cache: {st['hits']} hits, {st['misses']} misses "
+              f"({st['hit_rate'] * 100:.1f}% hit rate), {st['entries']} entries")
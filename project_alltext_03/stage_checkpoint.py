@@ -0,0 +1,175 @@
+"""
+stage_checkpoint.py
+
+**Checkpoint and resume** for the long-running ingestion stages (data_extraction.py,
+embedding_text.py, store_in_neo4j.py). Without it, a crash at record 900k of 1M means
+starting again from zero, because each stage writes its output once, at the end.
+
+A checkpoint is two files next to the stage's output:
+  - <output>.partial.jsonl: the records produced so far, appended one JSON line each
+    (parse results, chunk embeddings; empty for store_in_neo4j, whose output is Neo4j),
+  - <output>.ckpt.json: the processed-record **watermark** (how many input records
+    are done), the byte length of the partial file at that point, and the identity
+    of the inputs and parameters it belongs to.
+
+Every `interval_s` seconds the stage flushes and fsyncs the partial file, then
+replaces the checkpoint file atomically (write to a temp file, fsync, os.replace).
+With --resume the stage loads the checkpoint, truncates the partial file back to
+the recorded length (dropping records written after the last checkpoint), reads
+the records back and continues from the watermark. Because the final output is
+still assembled and written the same way, a resumed run produces output identical
+to an uninterrupted one. The checkpoint is removed once the output is written.
+
+Guiding Principles:
+1. **Atomic**: A crash at any moment leaves either the previous or the new
+   checkpoint, never a torn one; the watermark never runs ahead of the partial file.
+2. **Safe to ignore**: A checkpoint for different inputs or parameters is reported
+   and discarded; the stage starts over.
+3. **Cheap**: Checkpoints are time-based (CHECKPOINT_INTERVAL_S, default 30s), so
+   the overhead is one fsync per interval.
+
+Usage:
+    from stage_checkpoint import StageCheckpoint, file_identity
+
+    ckpt = StageCheckpoint("embedded_data.json", "embedding_text",
+                           identity={"input": file_identity("chunked_data.json"), "model": name})
+    state = ckpt.resume() if resume else None       # None: start from scratch
+    records = ckpt.partial_records() if state else []
+    ckpt.open_partial(resume=state is not None)
+    for position, record in work(start=state["watermark"] if state else 0):
+        ckpt.append(record)
+        ckpt.maybe_save(position + 1)
+    ... write the output ...
+    ckpt.finish()
+"""
+
+import os
+import json
+import time
+
+CHECKPOINT_INTERVAL_S = float(os.getenv("CHECKPOINT_INTERVAL_S", "30"))
+
+
+def file_identity(path: str) -> list:
+    """Cheap identity of an input file: [size, mtime_ns]."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def write_json_atomic(path: str, obj, indent: int = None) -> None:
+    """Write JSON to a temp file, fsync it and rename it over `path`."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class StageCheckpoint:
+    """
+    Watermark + partial output for one stage run. See the module docstring.
+
+    :param output_path: the stage's final output (checkpoint files are named after it)
+    :param stage: stage name, stored in and checked against the checkpoint
+    :param identity: JSON-able description of the inputs and parameters
+    :param interval_s: seconds between checkpoints
+    """
+
+    def __init__(self, output_path: str, stage: str, identity: dict,
+                 interval_s: float = CHECKPOINT_INTERVAL_S):
+        self.stage = stage
+        self.identity = identity
+        self.interval_s = interval_s
+        self.path = f"{output_path}.ckpt.json"
+        self.partial_path = f"{output_path}.partial.jsonl"
+        self.state = None
+        self._partial = None
+        self._last_save = time.monotonic()
+        self.saves = 0
+
+    def resume(self):
+        """
+        Load the checkpoint if it matches this run.
+
+        :return: {"watermark": int, "partial_bytes": int, ...} or None (start from scratch)
+        """
+        if not os.path.isfile(self.path):
+            print(f"[{self.stage}] No checkpoint at '{self.path}'; starting from the beginning.")
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[{self.stage}] Unreadable checkpoint '{self.path}' ({e}); starting from the beginning.")
+            return None
+        if state.get("stage") != self.stage or state.get("identity") != json.loads(json.dumps(self.identity)):
+            print(f"[{self.stage}] Checkpoint '{self.path}' belongs to other inputs or parameters; "
+                  f"starting from the beginning.")
+            return None
+        self.state = state
+        print(f"[{self.stage}] Resuming from checkpoint: {state['watermark']} records done "
+              f"(saved {state.get('saved_at')}).")
+        return state
+
+    def partial_records(self) -> list:
+        """Records saved up to the checkpoint (anything written after it is dropped)."""
+        if not self.state or not os.path.isfile(self.partial_path):
+            return []
+        limit = self.state.get("partial_bytes", 0)
+        records = []
+        with open(self.partial_path, "rb") as f:
+            data = f.read(limit)
+        for line in data.splitlines():
+            if line.strip():
+                records.append(json.loads(line))
+        return records
+
+    def open_partial(self, resume: bool = False):
+        """Open the partial file for appending (truncated to the checkpoint on resume)."""
+        if resume and self.state and os.path.isfile(self.partial_path):
+            self._partial = open(self.partial_path, "r+b")
+            self._partial.truncate(self.state.get("partial_bytes", 0))
+            self._partial.seek(0, os.SEEK_END)
+        else:
+            self._partial = open(self.partial_path, "wb")
+        self._last_save = time.monotonic()
+
+    def append(self, record):
+        self._partial.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def maybe_save(self, watermark: int, **extra) -> bool:
+        """Save a checkpoint if interval_s has passed since the last one."""
+        if time.monotonic() - self._last_save < self.interval_s:
+            return False
+        self.save(watermark, **extra)
+        return True
+
+    def save(self, watermark: int, **extra):
+        """Make the partial file durable, then record the watermark atomically."""
+        partial_bytes = 0
+        if self._partial is not None:
+            self._partial.flush()
+            os.fsync(self._partial.fileno())
+            partial_bytes = self._partial.tell()
+        state = {
+            "stage": self.stage,
+            "identity": self.identity,
+            "watermark": watermark,
+            "partial_bytes": partial_bytes,
+            "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        state.update(extra)
+        write_json_atomic(self.path, state)
+        self.state = state
+        self.saves += 1
+        self._last_save = time.monotonic()
+
+    def finish(self):
+        """The output is complete: remove the checkpoint and partial files."""
+        if self._partial is not None:
+            self._partial.close()
+            self._partial = None
+        for path in (self.path, self.partial_path):
+            if os.path.exists(path):
+                os.remove(path)
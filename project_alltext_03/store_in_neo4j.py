@@ -21,7 +21,7 @@ Guiding Principles (from our RAG discussions):
 3. **Consistent Data Model**: Each JSON file entry has "file_name" and "chunks". We
    create a Document node for the file, Chunk nodes for each chunk, and link them.
 4. **Handling duplicates**: Use MERGE in Cypher for doc_id and chunk_id to avoid duplicates.
-5. **CLI**: Typically run `python store_in_neo4j.py <embedded_data.json> [--clear]`
+5. **CLI**: Typically run `python store_in_neo4j.py <embedded_data.json> [--clear] [--writers N]`
    to optionally clear old data before ingesting new.
 
 Typical Embedded JSON (embedded_data.json):
@@ -50,26 +50,557 @@ Resulting Graph in Neo4j:
 (:Chunk {chunk_id: chunk_id, content:..., embedding:..., ...})
 (:Document)-[:HAS_CHUNK]->(:Chunk)
 
+Batching & parallel writers:
+- Chunks are written with one UNWIND statement per batch (--batch-size, default 500),
+  so a batch is a single round trip instead of three per chunk.
+- `--writers N` routes each incoming document to one of N threads (the one with
+  the least work assigned so far), through a small bounded queue per thread. Each
+  thread has its own session and batched transactions. Because all writers MERGE into the shared
+  Document/Chunk uniqueness indexes, deadlocks are possible; each batch is retried
+  with backoff (see neo4j_connection.py). bench_store_writers.py measures how
+  throughput scales with N against a local stand-in server.
+
+Streaming input:
+- The input is never loaded whole. For embedded_data.json we parse the "files"
+  array incrementally and yield one file object at a time; for line-delimited
+  input (*.jsonl, one chunk record per line, each with a "file_name") we yield
+  groups of at most --batch-size chunks. Peak memory is therefore bounded by the
+  batch size (and, for .json input, by the largest single file) rather than by
+  the corpus size.
+- Progress (documents and chunks written per second) is printed every few seconds.
+- After the writes, the store version counter (store_version.py) is bumped so
+  query-time caches know to drop what they hold.
+
+JSONL record formats accepted (one JSON object per line):
+  {"file_name": "a.txt", "chunk_id": "a.txt_par_0", "content": "...", "embedding": [...], ...}
+  {"file_name": "a.txt", "chunks": [ {...}, ... ]}     # a whole file object per line
+
+Lexical index:
+- Every document written is also fed to the BM25 lexical index (lexical_index.py),
+  updated incrementally per document and saved to --lexical-index (default
+  lexical_index.npz, or $LEXICAL_INDEX_PATH) once the writes have succeeded.
+  --clear starts a fresh index; --no-lexical-index skips it.
+
+Updates and deletions:
+- delete_documents() removes Documents with their chunks and edges, and
+  prune_stale_chunks() drops the chunks a changed document no longer has (MERGE
+  alone only adds). ingest_daemon.py uses both for changed and deleted files.
+
+Checkpoint and resume:
+- While writing from a file, the number of input objects that are completely
+  committed (a contiguous prefix, so it is correct with --writers N) is saved
+  periodically to <input>.store.ckpt.json (stage_checkpoint.py). --resume skips
+  that many objects, so an interrupted ingest continues where it stopped; the
+  skipped objects still pass through the lexical index, which therefore ends up
+  the same as after an uninterrupted run. --clear is not repeated on resume.
+
 Usage Example:
     python store_in_neo4j.py embedded_data.json
     # Optionally, pass '--clear' to remove old data: python store_in_neo4j.py embedded_data.json --clear
+    # Parallel ingest: python store_in_neo4j.py embedded_data.json --writers 4 --batch-size 1000
+    # Line-delimited chunk records: python store_in_neo4j.py embedded_data.jsonl
+    # Continue an interrupted ingest: python store_in_neo4j.py embedded_data.json --clear --resume
 """
 
 import os
+import re
 import sys
 import json
-from neo4j import GraphDatabase, basic_auth
+import time
+import queue
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from neo4j_connection import Neo4jConnection
+from store_version import bump_store_version
+from stage_checkpoint import StageCheckpoint, file_identity, CHECKPOINT_INTERVAL_S
+from telemetry import get_telemetry
+from profiling import profile_stage, profile_thread
+from lexical_index import LexicalIndex, DEFAULT_INDEX_PATH as DEFAULT_LEXICAL_INDEX_PATH
+
+
+# Batched writes: one UNWIND statement per batch instead of three round trips per chunk.
+MERGE_DOCS_QUERY = """
+UNWIND $doc_ids AS doc_id
+MERGE (d:Document { doc_id: doc_id })
+ON CREATE SET d.created_at = timestamp()
+"""
+
+MERGE_CHUNKS_QUERY = """
+UNWIND $rows AS row
+MERGE (ch:Chunk { chunk_id: row.chunk_id })
+ON CREATE SET ch.created_at = timestamp()
+SET ch.modality = row.modality,
+    ch.content = row.content,
+    ch.embedding = row.embedding,
+    ch.textual_modality = row.textual_modality,
+    ch.metadata = row.metadata
+WITH ch, row
+MATCH (d:Document { doc_id: row.doc_id })
+MERGE (d)-[:HAS_CHUNK]->(ch)
+"""
+
+# Removing documents (ingest_daemon.py): the Document, its chunks and their edges
+DELETE_DOCS_QUERY = """
+UNWIND $doc_ids AS doc_id
+MATCH (d:Document { doc_id: doc_id })
+OPTIONAL MATCH (d)-[:HAS_CHUNK]->(ch:Chunk)
+DETACH DELETE ch, d
+"""
+
+# Re-ingesting a changed document: MERGE only adds, so drop chunks it no longer has
+PRUNE_CHUNKS_QUERY = """
+UNWIND $docs AS doc
+MATCH (d:Document { doc_id: doc.doc_id })-[:HAS_CHUNK]->(ch:Chunk)
+WHERE NOT ch.chunk_id IN doc.chunk_ids
+DETACH DELETE ch
+"""
+
+# Default number of chunks per write transaction
+DEFAULT_BATCH_SIZE = 500
+
+# Concurrent writers MERGE into the same Document/Chunk uniqueness indexes, so
+# deadlocks are expected occasionally; give each batch more attempts than usual.
+WRITER_DEADLOCK_RETRIES = 8
+
+# File objects waiting per writer thread. Small, so a slow writer applies
+# back-pressure to the reader instead of letting the input pile up in memory.
+WRITER_QUEUE_DEPTH = 2
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+# How much of the input to read at a time when streaming a .json file
+READ_SIZE = 1 << 20
+
+_FILES_ARRAY_RE = re.compile(r'"files"\s*:\s*\[')
+
+
+def iter_json_files(input_json: str, read_size: int = READ_SIZE):
+    """
+    Incrementally parse {"files": [ {...}, {...}, ... ]} and yield one file
+    object at a time, without loading the whole document. Only the current file
+    object (plus at most one read buffer) is held in memory.
+
+    :param input_json: Path to embedded_data.json
+    :param read_size: Characters to read per refill
+    :return: generator of {"file_name", "chunks"} dicts
+    """
+    decoder = json.JSONDecoder()
+    with open(input_json, "r", encoding="utf-8") as f:
+        buf = ""
+        # 1) Find the opening bracket of the "files" array
+        while True:
+            m = _FILES_ARRAY_RE.search(buf)
+            if m:
+                pos = m.end()
+                break
+            more = f.read(read_size)
+            if not more:
+                raise ValueError("[store_in_neo4j] Input JSON must contain { 'files': [ ... ] }.")
+            buf += more
+
+        # 2) Decode array elements one by one
+        while True:
+            # skip separators, refilling the buffer as needed
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                more = f.read(read_size)
+                if not more:
+                    raise ValueError("[store_in_neo4j] Unterminated 'files' array in input JSON.")
+                buf, pos = more, 0
+                continue
+            if buf[pos] == "]":
+                return
+
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Element is not complete yet: read more. Reading at least as much as
+                # we already hold keeps re-parsing of very large elements linear.
+                more = f.read(max(read_size, len(buf) - pos))
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+
+            yield obj
+            pos = end
+            if pos >= read_size:
+                buf, pos = buf[pos:], 0
+
+
+def iter_jsonl_files(input_jsonl: str, group_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Read line-delimited records and yield file objects. Consecutive chunk records
+    with the same file_name are grouped, at most group_size chunks per yielded
+    object, so memory stays bounded even for a huge document. A line that
+    already holds a whole file object ({"file_name", "chunks"}) is yielded as is.
+
+    :param input_jsonl: Path to a .jsonl file
+    :param group_size: Maximum chunks per yielded file object
+    :return: generator of {"file_name", "chunks"} dicts
+    """
+    current_name, current_chunks = None, []
+    with open(input_jsonl, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"[store_in_neo4j] Bad JSON on line {line_no} of {input_jsonl}: {e}")
+
+            if "chunks" in record:
+                if current_chunks:
+                    yield {"file_name": current_name, "chunks": current_chunks}
+                    current_name, current_chunks = None, []
+                yield record
+                continue
+
+            name = record.get("file_name") or record.get("doc_id")
+            if current_chunks and (name != current_name or len(current_chunks) >= group_size):
+                yield {"file_name": current_name, "chunks": current_chunks}
+                current_chunks = []
+            current_name = name
+            current_chunks.append(record)
+
+    if current_chunks:
+        yield {"file_name": current_name, "chunks": current_chunks}
+
+
+def iter_input_files(input_path: str, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Pick the streaming reader by extension: *.jsonl / *.ndjson are line-delimited,
+    everything else is treated as the {"files": [...]} JSON produced by embedding_text.py.
+    """
+    if input_path.endswith((".jsonl", ".ndjson")):
+        return iter_jsonl_files(input_path, group_size=batch_size)
+    return iter_json_files(input_path)
+
+
+class IngestProgress:
+    """
+    Thread-safe counters for documents and chunks written, printing a progress
+    line (totals and per-second rates) at most every `interval` seconds.
+    """
 
+    def __init__(self, interval: float = PROGRESS_INTERVAL):
+        self.interval = interval
+        self.docs = 0
+        self.chunks = 0
+        self.start = time.perf_counter()
+        self._last_report = self.start
+        self._lock = threading.Lock()
+
+    def record(self, docs: int, chunks: int):
+        with self._lock:
+            self.docs += docs
+            self.chunks += chunks
+            now = time.perf_counter()
+            if now - self._last_report >= self.interval:
+                self._last_report = now
+                self._print(now)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def _print(self, now):
+        elapsed = max(now - self.start, 1e-9)
+        print(f"[store_in_neo4j] Progress: {self.docs} docs, {self.chunks} chunks in {elapsed:.1f}s "
+              f"({self.docs / elapsed:.1f} docs/s, {self.chunks / elapsed:.1f} chunks/s)")
+
+
+class WriteWatermark:
+    """
+    Input position up to which every file object has been written to Neo4j: the
+    resume point for --resume. With parallel writers objects complete out of order,
+    so only the contiguous prefix of completed objects counts.
+    """
 
-# Hard-coded or configurable
-NEO4J_URI = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASS = "Neo4j420"  # Replace with your actual password
+    def __init__(self, start: int = 0):
+        self.value = start
+        self._next = start
+        self._seq = {}
+        self._done = set()
+        self.lock = threading.Lock()
+
+    def track(self, files_iter):
+        """Pass-through generator numbering file objects in input order."""
+        for file_info in files_iter:
+            with self.lock:
+                self._seq[id(file_info)] = self._next
+                self._next += 1
+            yield file_info
+
+    def written(self, file_infos) -> int:
+        """Mark file objects as written; returns the (possibly advanced) watermark."""
+        with self.lock:
+            for file_info in file_infos:
+                seq = self._seq.pop(id(file_info), None)
+                if seq is not None:
+                    self._done.add(seq)
+            while self.value in self._done:
+                self._done.remove(self.value)
+                self.value += 1
+            return self.value
+
+
+def chunk_params(ch: dict, doc_id: str = None) -> dict:
+    """
+    Build the Cypher parameters for one chunk dict (as found in embedded_data.json).
+    Metadata is stored as a JSON string: for Neo4j < 5 nested maps are not allowed
+    as property values, so a string is the safe choice.
+
+    :param ch: chunk dict
+    :param doc_id: file_name of the owning Document (used for the HAS_CHUNK link)
+    """
+    return {
+        "doc_id": doc_id,
+        "chunk_id": ch.get("chunk_id"),
+        "modality": ch.get("modality", ""),
+        "content": ch.get("content", ""),
+        "embedding": ch.get("embedding", []),  # list of floats
+        "textual_modality": ch.get("textual_modality", ""),
+        "metadata": json.dumps(ch.get("metadata", {}), ensure_ascii=False)
+    }
+
+
+def iter_batches(files_list, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Group files into write batches of roughly batch_size chunks. A document is
+    never split across batches unless it alone exceeds batch_size, so a batch
+    holds whole documents where possible.
+
+    :param files_list: iterable of {"file_name", "chunks"} dicts (a list or a
+                       streaming reader such as iter_input_files)
+    :param batch_size: target number of chunks per batch
+    :return: generator of (doc_ids, chunk_rows) tuples
+    """
+    for doc_ids, rows, _ in _iter_batches_done(files_list, batch_size):
+        if doc_ids or rows:
+            yield doc_ids, rows
+
+
+def _iter_batches_done(files_list, batch_size: int):
+    """
+    iter_batches, plus for each batch the file objects whose last rows it carries
+    (they are fully written once the batch commits; used for resume watermarks).
+    """
+    doc_ids, rows, done = [], [], []
+    for file_info in files_list:
+        file_name = file_info.get("file_name")
+        if not file_name:
+            # skip if no file_name
+            done.append(file_info)
+            continue
+
+        # skip chunks without chunk_id
+        chunk_rows = [chunk_params(ch, file_name)
+                      for ch in file_info.get("chunks", []) if ch.get("chunk_id")]
+
+        if rows and len(rows) + len(chunk_rows) > batch_size:
+            yield doc_ids, rows, done
+            doc_ids, rows, done = [], [], []
+
+        doc_ids.append(file_name)
+        for i in range(0, len(chunk_rows), batch_size):
+            rows.extend(chunk_rows[i:i + batch_size])
+            if len(rows) >= batch_size:
+                yield doc_ids, rows, done
+                doc_ids, rows, done = [file_name], [], []
+        done.append(file_info)
+
+    if rows or doc_ids or done:
+        yield doc_ids, rows, done
+
+
+def write_batches(conn: Neo4jConnection, files_list, batch_size: int = DEFAULT_BATCH_SIZE,
+                  session=None, max_retries: int = None, progress: IngestProgress = None,
+                  on_written=None) -> tuple:
+    """
+    Write files_list to Neo4j, one managed write transaction per batch.
+
+    :param conn: The shared Neo4jConnection
+    :param files_list: iterable of {"file_name", "chunks"} dicts
+    :param batch_size: chunks per transaction
+    :param session: optional long-lived session (one per writer thread)
+    :param max_retries: retry override for transient errors (e.g. deadlocks)
+    :param progress: optional IngestProgress shared by all writers
+    :param on_written: optional callback(file_objects) after each commit, with the
+                       file objects that are now completely written
+    :return: (doc_count, chunk_count)
+    """
+    doc_count = 0
+    chunk_count = 0
+    last_doc = None
+
+    for doc_ids, rows, done in _iter_batches_done(files_list, batch_size):
+        def work(tx):
+            # Documents first, so the MATCH in MERGE_CHUNKS_QUERY finds them
+            tx.run(MERGE_DOCS_QUERY, {"doc_ids": doc_ids})
+            if rows:
+                tx.run(MERGE_CHUNKS_QUERY, {"rows": rows})
+
+        if doc_ids:
+            conn.write_tx(work, label="store.write_batch", session=session, max_retries=max_retries)
+        if on_written is not None:
+            on_written(done)
+
+        # A document split across batches (or across consecutive JSONL groups)
+        # repeats its doc_id, so only count changes of doc_id
+        new_docs = 0
+        for d in doc_ids:
+            if d != last_doc:
+                new_docs += 1
+                last_doc = d
+        doc_count += new_docs
+        chunk_count += len(rows)
+        if progress is not None:
+            progress.record(new_docs, len(rows))
+
+    return doc_count, chunk_count
+
+
+_STOP = object()
+
+
+def _put_or_fail(q: queue.Queue, item, future):
+    """
+    Put `item` on a writer's queue, blocking while it is full (back-pressure),
+    but surface the writer's exception instead of blocking forever if it died.
+    """
+    while True:
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            if future.done():
+                future.result()  # re-raises the writer's exception
+                raise RuntimeError("[store_in_neo4j] Writer thread exited early.")
+
+
+def _stop_writer(q: queue.Queue, future):
+    """
+    Hand a writer its _STOP, waiting while its queue is full. Never raises: a writer
+    that already died is skipped (its error is re-raised from future.result() once
+    every other writer has been stopped).
+    """
+    while not future.done():
+        try:
+            q.put(_STOP, timeout=0.5)
+            return
+        except queue.Full:
+            pass
+
+
+def write_parallel(conn: Neo4jConnection, files_list, writers: int,
+                   batch_size: int = DEFAULT_BATCH_SIZE, progress: IngestProgress = None,
+                   on_written=None) -> tuple:
+    """
+    Route documents across `writers` threads. Each document goes to exactly one
+    writer (the one with the fewest chunks assigned so far), so no two writers
+    MERGE the same Document or Chunk node and lock contention is limited to the
+    shared uniqueness index itself. Each thread holds its own session and writes
+    in batched transactions, retrying on deadlocks with backoff.
+
+    Works on a stream: documents are handed over through small bounded queues,
+    so the reader never runs far ahead of the writers.
+
+    :return: (doc_count, chunk_count)
+    """
+    if conn.max_pool_size < writers:
+        print(f"[store_in_neo4j] Warning: pool size {conn.max_pool_size} < writers {writers}; "
+              f"writers will wait on connection acquisition.")
+
+    queues = [queue.Queue(maxsize=WRITER_QUEUE_DEPTH) for _ in range(writers)]
+    loads = [0] * writers
+
+    def drain(q):
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+            yield item
+
+    def writer(q):
+        with conn.session(write=True) as session:
+            return write_batches(conn, drain(q), batch_size, session=session,
+                                 max_retries=WRITER_DEADLOCK_RETRIES, progress=progress,
+                                 on_written=on_written)
+
+    doc_count = 0
+    chunk_count = 0
+    with ThreadPoolExecutor(max_workers=writers, thread_name_prefix="neo4j-writer") as pool:
+        futures = [pool.submit(profile_thread(writer), q) for q in queues]
+        last_name, idx = None, 0
+        try:
+            for file_info in files_list:
+                # Consecutive pieces of the same document stay on the same writer
+                if file_info.get("file_name") != last_name:
+                    idx = loads.index(min(loads))
+                    last_name = file_info.get("file_name")
+                _put_or_fail(queues[idx], file_info, futures[idx])
+                loads[idx] += len(file_info.get("chunks", []))
+        finally:
+            # Stop every live writer before anything re-raises, or the pool would wait
+            # on writers that never get their _STOP
+            for q, fut in zip(queues, futures):
+                _stop_writer(q, fut)
+        for fut in futures:
+            docs, chunks = fut.result()
+            doc_count += docs
+            chunk_count += chunks
+    return doc_count, chunk_count
+
+
+def delete_documents(conn: Neo4jConnection, doc_ids: list,
+                     lexical_index_path: str = DEFAULT_LEXICAL_INDEX_PATH) -> None:
+    """
+    Delete Documents (with their Chunks and every relationship on them), drop them
+    from the lexical index and bump the store version.
+
+    :param doc_ids: file names
+    """
+    if not doc_ids:
+        return
+    conn.run_write(DELETE_DOCS_QUERY, {"doc_ids": list(doc_ids)}, label="store.delete_docs")
+    if lexical_index_path:
+        lexical_index = LexicalIndex.load_or_create(lexical_index_path)
+        for doc_id in doc_ids:
+            lexical_index.remove_document(doc_id)
+        lexical_index.save(lexical_index_path)
+    version = bump_store_version(conn, "store_in_neo4j.delete")
+    print(f"[store_in_neo4j] Deleted {len(doc_ids)} documents; store version is now {version}.")
+
+
+def prune_stale_chunks(conn: Neo4jConnection, files: list) -> None:
+    """
+    For documents about to be re-stored, delete the chunks (and their edges) that the
+    new version no longer contains. Chunks that are kept are updated by the MERGE.
+
+    :param files: {"file_name", "chunks"} dicts of the new versions
+    """
+    docs = [{"doc_id": f["file_name"], "chunk_ids": [ch.get("chunk_id") for ch in f.get("chunks", [])]}
+            for f in files if f.get("file_name")]
+    if docs:
+        conn.run_write(PRUNE_CHUNKS_QUERY, {"docs": docs}, label="store.prune_chunks")
 
 
 def store_in_neo4j(
-    input_json: str,
-    clear_old_data: bool = False
+    input_json: str = None,
+    clear_old_data: bool = False,
+    conn: Neo4jConnection = None,
+    writers: int = 1,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    lexical_index_path: str = DEFAULT_LEXICAL_INDEX_PATH,
+    files: list = None,
+    resume: bool = False,
+    checkpoint_interval_s: float = CHECKPOINT_INTERVAL_S
 ):
     """
     Reads the JSON file at input_json, which should have the structure:
@@ -93,145 +624,192 @@ def store_in_neo4j(
         ]
       }
     Connects to Neo4j, optionally clears old data, creates Document and Chunk nodes,
-    and merges relationships.
+    and merges relationships. Chunks are written in batches of `batch_size` per
+    managed write transaction (retried as a unit on transient errors).
 
-    :param input_json: Path to embedded_data.json
+    The input is streamed (see iter_input_files), so memory is bounded by the
+    batch size rather than by the size of input_json.
+
+    :param input_json: Path to embedded_data.json, or a .jsonl file of chunk records
     :type input_json: str
 
-    :param clear_old_data: If True, runs MATCH (n) DETACH DELETE n to clear the entire DB.
+    :param clear_old_data: If True, deletes every node (except the StoreMeta version
+                           counter, see store_version.py) to clear the DB.
     :type clear_old_data: bool
 
-    :return: None
-    """
-
-    # 1) Load the JSON
-    if not os.path.isfile(input_json):
-        raise FileNotFoundError(f"[store_in_neo4j] Cannot find JSON: {input_json}")
+    :param conn: Shared Neo4jConnection. If None, one is created from the
+                 environment and closed when we are done.
+    :type conn: Neo4jConnection or None
 
-    with open(input_json, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    :param writers: Number of parallel writer threads. 1 writes sequentially;
+                    N > 1 partitions documents across N threads, each with its
+                    own session.
+    :type writers: int
 
-    # Validate basic structure
-    if "files" not in data or not isinstance(data["files"], list):
-        raise ValueError("[store_in_neo4j] Input JSON must contain { 'files': [ ... ] }.")
+    :param batch_size: Number of chunks per write transaction.
+    :type batch_size: int
 
-    files_list = data["files"]
+    :param lexical_index_path: BM25 index file updated with every document written
+                               (see lexical_index.py). None disables it.
+    :type lexical_index_path: str or None
 
-    # 2) Connect to Neo4j
-    print(f"[store_in_neo4j] Connecting to {NEO4J_URI} with user '{NEO4J_USER}'...")
-    driver = GraphDatabase.driver(NEO4J_URI, auth=basic_auth(NEO4J_USER, NEO4J_PASS))
+    :param files: In-memory file objects ({"file_name", "chunks"} dicts, e.g. from
+                  embedding_text.embed_chunked_data), used instead of reading
+                  input_json (run_pipeline.py --mode inprocess).
+    :type files: list or None
 
-    # 3) Optionally clear old data
-    if clear_old_data:
-        with driver.session() as session:
-            print("[store_in_neo4j] Clearing all data in the database (MATCH (n) DETACH DELETE n)...")
-            session.run("MATCH (n) DETACH DELETE n")
+    :param resume: Skip the input objects an interrupted run already wrote (its
+                   checkpoint, <input_json>.store.ckpt.json, records the watermark).
+                   They still pass through the lexical index, so the index and the
+                   graph end up as after an uninterrupted run. Needs input_json. For
+                   .jsonl input the batch size must match the interrupted run's
+                   (otherwise the run starts from the beginning).
+    :type resume: bool
 
-    # 4) Create constraints for doc_id and chunk_id
-    with driver.session() as session:
-        session.run("CREATE CONSTRAINT IF NOT EXISTS FOR (d:Document) REQUIRE d.doc_id IS UNIQUE")
-        session.run("CREATE CONSTRAINT IF NOT EXISTS FOR (c:Chunk) REQUIRE c.chunk_id IS UNIQUE")
-
-    doc_count = 0
-    chunk_count = 0
-
-    # 5) Merge Document and Chunk nodes
-    with driver.session() as session:
-        for file_info in files_list:
-            file_name = file_info.get("file_name")
-            if not file_name:
-                # skip if no file_name
-                continue
-
-            doc_count += 1
-            # MERGE the Document node
-            merge_doc_query = """
-            MERGE (d:Document { doc_id: $doc_id })
-            ON CREATE SET d.created_at = timestamp()
-            """
-            session.run(merge_doc_query, {"doc_id": file_name})
-
-            chunks = file_info.get("chunks", [])
-            for ch in chunks:
-                chunk_id = ch.get("chunk_id")
-                if not chunk_id:
-                    # skip if no chunk_id
-                    continue
-
-                # Properties we store or update
-                modality = ch.get("modality", "")
-                content = ch.get("content", "")
-                embedding = ch.get("embedding", [])  # list of floats
-                textual_modality = ch.get("textual_modality", "")
-                metadata = ch.get("metadata", {})
-                # We'll store metadata as a JSON string or map. For Neo4j < 5, you might store it as string
-                # If new Neo4j versions allow maps, you can store directly. We'll do a string to be safe.
-                import json as pyjson
-                metadata_str = pyjson.dumps(metadata, ensure_ascii=False)
-
-                # Merge chunk node
-                merge_chunk_query = """
-                MERGE (ch:Chunk { chunk_id: $chunk_id })
-                ON CREATE SET 
-                    ch.created_at = timestamp(),
-                    ch.modality = $modality,
-                    ch.content = $content,
-                    ch.embedding = $embedding,
-                    ch.textual_modality = $textual_modality,
-                    ch.metadata = $metadata
-                ON MATCH SET
-                    ch.modality = $modality,
-                    ch.content = $content,
-                    ch.embedding = $embedding,
-                    ch.textual_modality = $textual_modality,
-                    ch.metadata = $metadata
-                """
-                session.run(merge_chunk_query, {
-                    "chunk_id": chunk_id,
-                    "modality": modality,
-                    "content": content,
-                    "embedding": embedding,
-                    "textual_modality": textual_modality,
-                    "metadata": metadata_str
-                })
-
-                # Link doc->chunk
-                link_doc_chunk_query = """
-                MATCH (d:Document { doc_id: $doc_id })
-                MATCH (ch:Chunk { chunk_id: $chunk_id })
-                MERGE (d)-[:HAS_CHUNK]->(ch)
-                """
-                session.run(link_doc_chunk_query, {
-                    "doc_id": file_name,
-                    "chunk_id": chunk_id
-                })
-
-                chunk_count += 1
-
-    driver.close()
-
-    print(f"[store_in_neo4j] Done. Created/updated {doc_count} Document nodes and {chunk_count} Chunk merges.")
+    :param checkpoint_interval_s: Seconds between checkpoints (input_json only).
+    :type checkpoint_interval_s: float
 
+    :return: (doc_count, chunk_count)
+    """
 
-if __name__ == "__main__":
+    # 1) Open the input as a stream of file objects (validated as it is read)
+    if files is not None:
+        files_iter = iter(files)
+    else:
+        if not input_json or not os.path.isfile(input_json):
+            raise FileNotFoundError(f"[store_in_neo4j] Cannot find JSON: {input_json}")
+        files_iter = iter_input_files(input_json, batch_size)
+        # Parse the first file object now, so a wrong file (no "files" array) or bad
+        # JSON fails before --clear deletes anything
+        first = next(files_iter, None)
+        if first is not None:
+            files_iter = itertools.chain([first], files_iter)
+
+    # Index each document lexically as it streams past on its way to the writers
+    lexical_index = None
+    if lexical_index_path:
+        lexical_index = LexicalIndex() if clear_old_data else LexicalIndex.load_or_create(lexical_index_path)
+        files_iter = lexical_index.index_stream(files_iter)
+
+    # 2) Connect to Neo4j (or reuse the caller's connection)
+    own_conn = conn is None
+    if own_conn:
+        conn = Neo4jConnection.from_env()
+    try:
+        print(f"[store_in_neo4j] Using Neo4j at {conn.uri} with user '{conn.user}'...")
+
+        # Checkpoints (file input only): how many input objects are fully written
+        checkpoint = None
+        skip = 0
+        if files is None:
+            identity = {"input": file_identity(input_json), "neo4j_uri": conn.uri, "clear": clear_old_data}
+            if input_json.endswith((".jsonl", ".ndjson")):
+                # JSONL records are grouped into file objects of up to batch_size chunks, so
+                # the watermark (counted in file objects) only means the same thing for the
+                # same batch size
+                identity["group_size"] = batch_size
+            checkpoint = StageCheckpoint(f"{input_json}.store", "store_in_neo4j",
+                                         identity=identity, interval_s=checkpoint_interval_s)
+            if resume and checkpoint.resume():
+                skip = checkpoint.state["watermark"]
+                # Already written (and indexed again above): don't write them twice
+                files_iter = itertools.islice(files_iter, skip, None)
+        watermark = WriteWatermark(start=skip)
+        files_iter = watermark.track(files_iter)
+
+        checkpoint_lock = threading.Lock()
+
+        def on_written(done):
+            watermark.written(done)
+            if checkpoint is not None:
+                with checkpoint_lock:
+                    # Read under the lock so a slower writer never saves an older value
+                    checkpoint.maybe_save(watermark.value)
+
+        # 3) Optionally clear old data (not again when resuming a run that did)
+        if clear_old_data and skip:
+            print("[store_in_neo4j] Resuming: the database was already cleared by the interrupted run.")
+        elif clear_old_data:
+            print("[store_in_neo4j] Clearing all data in the database (all nodes except StoreMeta)...")
+            # Keep the version counter so it stays monotonic across clears
+            conn.run_write("MATCH (n) WHERE NOT n:StoreMeta DETACH DELETE n", label="store.clear")
+
+        # 4) Create constraints for doc_id and chunk_id
+        conn.run_write("CREATE CONSTRAINT IF NOT EXISTS FOR (d:Document) REQUIRE d.doc_id IS UNIQUE",
+                       label="store.constraints")
+        conn.run_write("CREATE CONSTRAINT IF NOT EXISTS FOR (c:Chunk) REQUIRE c.chunk_id IS UNIQUE",
+                       label="store.constraints")
+
+        # 5) Merge Document and Chunk nodes in batches, sequentially or with N writers
+        progress = IngestProgress()
+        if writers > 1:
+            print(f"[store_in_neo4j] Writing with {writers} parallel writers, batch size {batch_size}.")
+            doc_count, chunk_count = write_parallel(conn, files_iter, writers, batch_size, progress=progress,
+                                                    on_written=on_written)
+        else:
+            doc_count, chunk_count = write_batches(conn, files_iter, batch_size, progress=progress,
+                                                   on_written=on_written)
+        elapsed = progress.elapsed()
+
+        # Tell query-time caches that the graph changed
+        version = bump_store_version(conn, "store_in_neo4j")
+        print(f"[store_in_neo4j] Store version is now {version}.")
+
+        if lexical_index is not None:
+            lexical_index.save(lexical_index_path)
+            print(f"[store_in_neo4j] Lexical index: {len(lexical_index)} chunks, "
+                  f"{len(lexical_index.postings)} terms -> {lexical_index_path}")
+        if checkpoint is not None:
+            checkpoint.finish()
+
+        conn.print_stats(prefix="store_in_neo4j")
+    finally:
+        if own_conn:
+            conn.close()
+
+    get_telemetry().add_items("store_in_neo4j", chunk_count)
+    elapsed = max(elapsed, 1e-9)
+    print(f"[store_in_neo4j] Done. Created/updated {doc_count} Document nodes and {chunk_count} Chunk merges "
+          f"in {elapsed:.2f}s ({doc_count / elapsed:.1f} docs/s, {chunk_count / elapsed:.1f} chunks/s).")
+    return doc_count, chunk_count
+
+
+def main():
     """
     CLI usage:
-      python store_in_neo4j.py <embedded_data.json> [--clear]
+      python store_in_neo4j.py <embedded_data.json> [--clear] [--writers N] [--batch-size B]
+                              [--lexical-index PATH | --no-lexical-index] [--resume]
 
     If --clear is provided, the script will delete all data from Neo4j
     before ingesting new. Use with caution.
     """
-    clear_flag = False
-    if len(sys.argv) < 2:
-        print("Usage: python store_in_neo4j.py <embedded_data.json> [--clear]")
-        sys.exit(1)
-
-    input_file = sys.argv[1]
-    if "--clear" in sys.argv:
-        clear_flag = True
+    parser = argparse.ArgumentParser(description="Store embedded chunks as Document/Chunk nodes in Neo4j.")
+    parser.add_argument("input_json", help="Path to embedded_data.json (or a .jsonl file of chunk records)")
+    parser.add_argument("--clear", action="store_true",
+                        help="Delete all existing data before ingesting (all nodes except the StoreMeta version counter).")
+    parser.add_argument("--writers", type=int, default=1,
+                        help="Number of parallel writer threads (documents are partitioned across them).")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Number of chunks per write transaction.")
+    parser.add_argument("--lexical-index", default=DEFAULT_LEXICAL_INDEX_PATH,
+                        help="BM25 lexical index file to update.")
+    parser.add_argument("--no-lexical-index", action="store_true",
+                        help="Do not update the lexical index.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its checkpoint instead of rewriting everything.")
+    args = parser.parse_args()
 
     try:
-        store_in_neo4j(input_file, clear_old_data=clear_flag)
+        store_in_neo4j(args.input_json, clear_old_data=args.clear,
+                       writers=max(1, args.writers), batch_size=max(1, args.batch_size),
+                       lexical_index_path=None if args.no_lexical_index else args.lexical_index,
+                       resume=args.resume)
     except Exception as e:
         print(f"Error in store_in_neo4j: {e}")
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Profiled if PIPELINE_PROFILE selects this stage (see profiling.py)
+    with profile_stage("store_in_neo4j"):
+        main()
@@ -0,0 +1,62 @@
+"""
+store_version.py
+
+A single **store version counter** kept in Neo4j, so anything that caches query-time
+state (retrieval results, the in-memory VectorIndex, ...) can tell cheaply whether
+the graph has changed since it was built.
+
+Model:
+    (:StoreMeta {name: "store", version: <int>, updated_at: <ms>, updated_by: <str>})
+
+Guiding Principles:
+1. **Writers bump, readers compare**: store_in_neo4j and compute_relationships call
+   `bump_store_version` after their writes; readers call `get_store_version` (one
+   tiny read) and drop cached state when the number differs from what they saw.
+2. **Monotonic**: The counter only ever increases. store_in_neo4j --clear keeps the
+   StoreMeta node, so a wiped-and-reloaded graph never reuses an old version.
+3. **Lives with the data**: Stored in the same database, so every process that sees
+   the graph sees the same version.
+
+Usage:
+    from store_version import get_store_version, bump_store_version
+
+    version = get_store_version(conn)          # 0 if nothing was ever stored
+    bump_store_version(conn, "store_in_neo4j")  # after a write
+"""
+
+from neo4j_connection import Neo4jConnection
+
+
+STORE_META_LABEL = "StoreMeta"
+
+READ_VERSION_QUERY = """
+MATCH (m:StoreMeta {name: 'store'})
+RETURN m.version AS version
+"""
+
+BUMP_VERSION_QUERY = """
+MERGE (m:StoreMeta {name: 'store'})
+SET m.version = coalesce(m.version, 0) + 1,
+    m.updated_at = timestamp(),
+    m.updated_by = $reason
+RETURN m.version AS version
+"""
+
+
+def get_store_version(conn: Neo4jConnection) -> int:
+    """Current store version (0 if the counter has never been bumped)."""
+    rows = conn.run_read(READ_VERSION_QUERY, label="store_version.read")
+    if not rows or rows[0].get("version") is None:
+        return 0
+    return int(rows[0]["version"])
+
+
+def bump_store_version(conn: Neo4jConnection, reason: str = "") -> int:
+    """
+    Increment the store version after a write.
+
+    :param reason: who bumped it (stored as updated_by, for debugging)
+    :return: the new version
+    """
+    rows = conn.run_write(BUMP_VERSION_QUERY, {"reason": reason}, label="store_version.bump")
+    return int(rows[0].get("version") or 0) if rows else 0
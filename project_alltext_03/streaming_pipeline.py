@@ -0,0 +1,330 @@
+"""
+streaming_pipeline.py
+
+Runs extraction, chunking, embedding and storage **concurrently**, as stages joined
+by bounded queues, instead of one stage at a time:
+
+    data/ file names -> [extract x N] -> q -> [chunk x N] -> q -> [embed x N] -> q -> [store writers x N]
+
+A file is embedded as soon as it has been parsed and chunked, and written to Neo4j as
+soon as it has been embedded, so the stages overlap. With enough work in flight the
+end-to-end time approaches that of the slowest stage instead of the sum of all stages.
+
+Guiding Principles:
+1. **Back-pressure**: Every queue holds at most `queue_depth` files. A fast stage
+   blocks on a full queue instead of running ahead, so memory stays flat no matter
+   how large the corpus is (at most depth + workers files per stage in flight).
+2. **Per-stage parallelism**: Each stage has its own worker count (OCR/embedding
+   release the GIL in native code; storage uses store_in_neo4j's parallel writers).
+3. **Same results**: The workers call the same per-file functions as the other modes
+   (data_extraction.extract_file, data_chunking.chunk_file, embedding_text.embed_file,
+   store_in_neo4j's batched writers). Only the scheduling differs; files may reach
+   Neo4j in a different order, which MERGE does not care about.
+4. **Fail fast**: The first exception in any stage stops every stage and is re-raised.
+   (A file that cannot be parsed is skipped, exactly as in data_extraction.py.)
+
+Each stage reports items, busy time and utilisation, so the bottleneck is visible.
+
+Usage:
+    python run_pipeline.py --mode streaming [--extract-workers 2] [--embed-workers 1] ...
+
+    python streaming_pipeline.py [--data data] [--extract-workers 2] [--chunk-workers 1]
+                                 [--embed-workers 1] [--store-writers 1] [--queue-depth 8]
+
+    from streaming_pipeline import run_streaming, print_report
+    report = run_streaming(conn, data_folder="data", extract_workers=2)
+    print_report(report)
+"""
+
+import os
+import time
+import queue
+import argparse
+import threading
+
+from profiling import profile_stage, profile_thread
+
+DEFAULT_QUEUE_DEPTH = int(os.getenv("STREAM_QUEUE_DEPTH", "8"))
+
+# How often blocked puts/gets check whether another stage failed
+POLL_S = 0.2
+
+_STOP = object()
+
+
+class PipelineAborted(RuntimeError):
+    """Raised in a stage when another stage failed."""
+
+
+class StreamStage:
+    """
+    One stage: `workers` threads that take items from `inbox`, apply `fn` and put
+    the result (unless None) on `outbox`. The stop marker is forwarded downstream
+    once the last worker of the stage has finished.
+    """
+
+    def __init__(self, name: str, fn, workers: int, inbox: queue.Queue, outbox: queue.Queue,
+                 abort: threading.Event, errors: list):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.abort = abort
+        self.errors = errors
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_s = 0.0
+        self._lock = threading.Lock()
+        self._alive = self.workers
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=profile_thread(self._work), name=f"stream-{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def join(self):
+        for t in self._threads:
+            t.join()
+
+    def _work(self):
+        try:
+            while True:
+                item = get_or_abort(self.inbox, self.abort)
+                if item is _STOP:
+                    # Let the sibling workers see it too
+                    self.inbox.put(_STOP)
+                    break
+                start = time.perf_counter()
+                result = self.fn(item)
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.items_in += 1
+                    self.busy_s += elapsed
+                    if result is not None:
+                        self.items_out += 1
+                if result is not None:
+                    put_or_abort(self.outbox, result, self.abort)
+        except PipelineAborted:
+            return
+        except Exception as e:
+            self.errors.append((self.name, e))
+            self.abort.set()
+            return
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last:
+            try:
+                put_or_abort(self.outbox, _STOP, self.abort)
+            except PipelineAborted:
+                pass
+
+
+def put_or_abort(q: queue.Queue, item, abort: threading.Event):
+    """Put, blocking while the queue is full (back-pressure), unless the pipeline aborts."""
+    while True:
+        if abort.is_set():
+            raise PipelineAborted()
+        try:
+            q.put(item, timeout=POLL_S)
+            return
+        except queue.Full:
+            continue
+
+
+def get_or_abort(q: queue.Queue, abort: threading.Event):
+    """Get, blocking while the queue is empty, unless the pipeline aborts."""
+    while True:
+        if abort.is_set():
+            raise PipelineAborted()
+        try:
+            return q.get(timeout=POLL_S)
+        except queue.Empty:
+            continue
+
+
+def run_streaming(conn, data_folder: str = "data", wrap_width: int = None,
+                  embedding_model: str = "all-MiniLM-L6-v2", extract_workers: int = 2,
+                  chunk_workers: int = 1, embed_workers: int = 1, store_writers: int = 1,
+                  queue_depth: int = DEFAULT_QUEUE_DEPTH, batch_size: int = None,
+                  registry=None) -> dict:
+    """
+    Extract, chunk, embed and store every file in data_folder with the stages running
+    concurrently.
+
+    :param conn: shared Neo4jConnection (left open)
+    :param data_folder: input folder (as data_extraction.py)
+    :param wrap_width: chunk_text wrap width (data_chunking.WRAP_WIDTH if None)
+    :param embedding_model: SentenceTransformer model name
+    :param extract_workers / chunk_workers / embed_workers: threads per stage
+    :param store_writers: store_in_neo4j parallel writers
+    :param queue_depth: max files waiting between two stages
+    :param batch_size: store_in_neo4j chunks per transaction (its default if None)
+    :param registry: ModelRegistry; the process-wide one if None
+    :return: report dict (wall_s, files, chunks, per-stage stats)
+    """
+    # Imported here: these pull in the parsers, nltk and sentence-transformers
+    from model_registry import get_registry
+    from data_extraction import list_data_files, extract_file
+    from data_chunking import chunk_file, WRAP_WIDTH
+    from embedding_text import embed_file
+    from store_in_neo4j import store_in_neo4j, DEFAULT_BATCH_SIZE
+
+    registry = registry or get_registry()
+    wrap_width = WRAP_WIDTH if wrap_width is None else wrap_width
+    if not os.path.isdir(data_folder):
+        raise FileNotFoundError(f"[streaming_pipeline] '{data_folder}' does not exist or is not a directory.")
+    file_names = list_data_files(data_folder)
+
+    # Load the embedding model before the workers start (one load, not a race)
+    model = registry.sentence_transformer(embedding_model)
+
+    abort = threading.Event()
+    errors = []
+    names_q = queue.Queue(maxsize=queue_depth)
+    parsed_q = queue.Queue(maxsize=queue_depth)
+    chunked_q = queue.Queue(maxsize=queue_depth)
+    embedded_q = queue.Queue(maxsize=queue_depth)
+
+    def embed(fobj):
+        embed_file(fobj, model)
+        return fobj
+
+    stages = [
+        StreamStage("extract", lambda name: extract_file(data_folder, name, registry=registry),
+                    extract_workers, names_q, parsed_q, abort, errors),
+        StreamStage("chunk", lambda entry: chunk_file(entry, wrap_width=wrap_width),
+                    chunk_workers, parsed_q, chunked_q, abort, errors),
+        StreamStage("embed", embed, embed_workers, chunked_q, embedded_q, abort, errors),
+    ]
+
+    def feed():
+        try:
+            for name in file_names:
+                put_or_abort(names_q, name, abort)
+            put_or_abort(names_q, _STOP, abort)
+        except PipelineAborted:
+            pass
+
+    store_wait = [0.0]
+    # Input queue of each stage, sampled for the report
+    inboxes = [("extract", names_q), ("chunk", parsed_q), ("embed", chunked_q), ("store", embedded_q)]
+    max_depths = {name: 0 for name, _ in inboxes}
+
+    def drain():
+        # The store stage's input: yields embedded files until the stop marker
+        while True:
+            for name, q in inboxes:
+                max_depths[name] = max(max_depths[name], q.qsize())
+            start = time.perf_counter()
+            item = get_or_abort(embedded_q, abort)
+            store_wait[0] += time.perf_counter() - start
+            if item is _STOP:
+                return
+            yield item
+
+    print(f"[streaming_pipeline] {len(file_names)} files; workers extract={extract_workers} "
+          f"chunk={chunk_workers} embed={embed_workers} store={store_writers}; queue depth {queue_depth}")
+    start = time.perf_counter()
+    feeder = threading.Thread(target=feed, name="stream-feed", daemon=True)
+    feeder.start()
+    for stage in stages:
+        stage.start()
+
+    # Storage runs in this thread, consuming the embed queue as a stream
+    doc_count = chunk_count = 0
+    try:
+        doc_count, chunk_count = store_in_neo4j(
+            files=drain(), conn=conn, writers=store_writers,
+            batch_size=batch_size or DEFAULT_BATCH_SIZE)
+    except PipelineAborted:
+        pass
+    except Exception as e:
+        errors.append(("store", e))
+        abort.set()
+    wall_s = time.perf_counter() - start
+
+    feeder.join()
+    for stage in stages:
+        stage.join()
+    if errors:
+        stage_name, error = errors[0]
+        print(f"[streaming_pipeline] Stage '{stage_name}' failed: {error}")
+        raise error
+
+    report = {
+        "wall_s": wall_s,
+        "files": len(file_names),
+        "documents": doc_count,
+        "chunks": chunk_count,
+        "queue_depth": queue_depth,
+        "stages": [],
+    }
+    for stage in stages:
+        report["stages"].append({
+            "stage": stage.name, "workers": stage.workers, "items": stage.items_in,
+            "busy_s": stage.busy_s, "max_queue": max_depths[stage.name],
+        })
+    report["stages"].append({
+        "stage": "store", "workers": store_writers, "items": doc_count,
+        "busy_s": max(wall_s - store_wait[0], 0.0), "max_queue": max_depths["store"],
+    })
+    return report
+
+
+def print_report(report: dict):
+    """Per-stage busy time and utilisation; the busiest stage bounds the wall time."""
+    wall_s = max(report["wall_s"], 1e-9)
+    print(f"\n[streaming_pipeline] {report['files']} files -> {report['documents']} documents, "
+          f"{report['chunks']} chunks in {wall_s:.2f}s")
+    print(f"  {'stage':<10} {'workers':>7} {'items':>7} {'busy s':>9} {'util':>6} {'max q':>6}")
+    busiest = None
+    for s in report["stages"]:
+        utilisation = s["busy_s"] / (wall_s * s["workers"])
+        print(f"  {s['stage']:<10} {s['workers']:>7} {s['items']:>7} {s['busy_s']:>9.2f} "
+              f"{utilisation:>6.0%} {s['max_queue']:>6}")
+        if busiest is None or s["busy_s"] / s["workers"] > busiest["busy_s"] / busiest["workers"]:
+            busiest = s
+    total_busy = sum(s["busy_s"] / s["workers"] for s in report["stages"])
+    print(f"  sum of stage times {total_busy:.2f}s vs wall {wall_s:.2f}s; "
+          f"bottleneck: {busiest['stage']} ({busiest['busy_s'] / busiest['workers']:.2f}s)")
+
+
+def main():
+    """
+    CLI: stream data/ into Neo4j (no relationships, no Q&A; see run_pipeline.py --mode streaming).
+    """
+    parser = argparse.ArgumentParser(description="Extract, chunk, embed and store with concurrent stages.")
+    parser.add_argument("--data", default="data", help="Input folder.")
+    parser.add_argument("--wrap-width", type=int, default=None, help="Text chunk wrap width.")
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2", help="SentenceTransformer model.")
+    parser.add_argument("--extract-workers", type=int, default=2, help="Extraction (parsing/OCR) threads.")
+    parser.add_argument("--chunk-workers", type=int, default=1, help="Chunking threads.")
+    parser.add_argument("--embed-workers", type=int, default=1, help="Embedding threads.")
+    parser.add_argument("--store-writers", type=int, default=1, help="Neo4j writer threads.")
+    parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="Max files waiting between two stages.")
+    args = parser.parse_args()
+
+    from neo4j_connection import Neo4jConnection
+
+    conn = Neo4jConnection.from_env()
+    print(f"[streaming_pipeline] Using Neo4j at {conn.uri} with user '{conn.user}'")
+    try:
+        report = run_streaming(conn, data_folder=args.data, wrap_width=args.wrap_width,
+                               embedding_model=args.embedding_model,
+                               extract_workers=args.extract_workers, chunk_workers=args.chunk_workers,
+                               embed_workers=args.embed_workers, store_writers=args.store_writers,
+                               queue_depth=args.queue_depth)
+        print_report(report)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # Profiled if PIPELINE_PROFILE selects this stage (see profiling.py)
+    with profile_stage("streaming"):
+        main()
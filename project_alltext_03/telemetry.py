@@ -0,0 +1,334 @@
+"""
+telemetry.py
+
+**Per-stage and per-file telemetry** for run_pipeline.py. Without it a run only
+printed stdout and return codes, so a slow night could not be pinned on OCR,
+Camelot, embedding or the Neo4j writes.
+
+Two parts:
+
+1) `Telemetry` (one per process, get_telemetry()): what the stages report about
+   themselves while they run:
+     - items processed per stage (add_items), e.g. files parsed, chunks embedded,
+     - one record per extracted file (record_file): parser, size, wall and CPU time,
+       status,
+     - named sub-step timers (timed / add_time), e.g. "parse_image.ocr" and
+       "parse_pdf.camelot".
+   When a stage runs as a subprocess, run_pipeline.py sets $PIPELINE_TELEMETRY_FILE
+   and the child dumps its collector there at exit, together with its own CPU
+   time and peak RSS.
+
+2) `RunReport` (in run_pipeline.py): per-stage wall time, CPU time, peak RSS, items
+   and items/s. At the end of the run it writes a JSON report (default
+   run_report.json) and prints a summary table, per-parser totals, sub-step timers
+   and the slowest files.
+
+Guiding Principles:
+1. **Stdlib only & cheap**: perf_counter / process_time / thread_time and getrusage;
+   a few dict updates per file.
+2. **Honest numbers**: Per-stage peak RSS comes from the kernel's high-water mark,
+   reset before each in-process stage where Linux allows it (/proc/self/clear_refs);
+   otherwise it is the process peak so far and is flagged as such. Per-file CPU is
+   the parsing thread's CPU time (work done in native thread pools, e.g. torch,
+   is not included).
+3. **Machine-readable first**: The JSON report holds everything the table shows.
+
+Usage:
+    from telemetry import get_telemetry, RunReport
+
+    get_telemetry().add_items("data_extraction", 1)
+    with get_telemetry().timed("parse_pdf.camelot"):
+        ...
+
+    report = RunReport(mode="inprocess")
+    with report.measure("data_chunking"):
+        chunk_data(...)
+    report.write("run_report.json")
+    report.print_summary()
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+from stage_checkpoint import write_json_atomic
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+TELEMETRY_FILE_ENV = "PIPELINE_TELEMETRY_FILE"
+DEFAULT_REPORT_PATH = os.getenv("PIPELINE_REPORT_PATH", "run_report.json")
+# Slowest files listed in the report
+SLOWEST_FILES = 10
+
+
+def _rusage_peak_mb(who) -> float:
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def peak_rss_mb() -> float:
+    """This process's peak resident set size (MB), or None if unknown."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _rusage_peak_mb(resource.RUSAGE_SELF) if resource else None
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak-RSS high-water mark to the current RSS (Linux); False if unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of `values` (pct in 0-100); 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class Telemetry:
+    """
+    What this process's stages report: items per stage, per-file parse records and
+    sub-step timers. Thread-safe (extraction parses in parallel pools).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items = {}
+        self.files = []
+        self.timers = {}
+
+    def add_items(self, stage: str, count: int = 1):
+        with self._lock:
+            self.items[stage] = self.items.get(stage, 0) + count
+
+    def record_file(self, stage: str, file_name: str, parser: str, size_bytes: int,
+                    wall_s: float, cpu_s: float, status: str = "ok"):
+        """One processed file (status "ok", "skipped" or "error")."""
+        with self._lock:
+            self.files.append({"stage": stage, "file": file_name, "parser": parser, "bytes": size_bytes,
+                               "wall_s": wall_s, "cpu_s": cpu_s, "status": status})
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            count, total = self.timers.get(name, (0, 0.0))
+            self.timers[name] = (count + 1, total + seconds)
+
+    @contextmanager
+    def timed(self, name: str):
+        """Time a sub-step (wall clock) under `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self.items, self.files, self.timers = {}, [], {}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"items": dict(self.items), "files": list(self.files),
+                    "timers": {name: list(value) for name, value in self.timers.items()}}
+
+    def merge(self, snapshot: dict):
+        """Add a snapshot taken in another process (a subprocess stage)."""
+        for stage, count in snapshot.get("items", {}).items():
+            self.add_items(stage, count)
+        with self._lock:
+            self.files.extend(snapshot.get("files", []))
+        for name, (count, total) in snapshot.get("timers", {}).items():
+            with self._lock:
+                old_count, old_total = self.timers.get(name, (0, 0.0))
+                self.timers[name] = (old_count + count, old_total + total)
+
+
+_telemetry = Telemetry()
+
+
+def get_telemetry() -> Telemetry:
+    """The process-wide collector."""
+    return _telemetry
+
+
+def _dump_for_parent():
+    """atexit hook in subprocess stages: hand the collector and own usage to run_pipeline."""
+    path = os.getenv(TELEMETRY_FILE_ENV)
+    if not path:
+        return
+    snapshot = _telemetry.snapshot()
+    snapshot["cpu_s"] = time.process_time()
+    snapshot["peak_rss_mb"] = peak_rss_mb()
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+    except OSError as e:
+        print(f"[telemetry] Could not write '{path}': {e}")
+
+
+if os.getenv(TELEMETRY_FILE_ENV):
+    atexit.register(_dump_for_parent)
+
+
+class RunReport:
+    """
+    Per-stage measurements of one pipeline run, plus the process-wide Telemetry
+    (per-file records and timers) at report time.
+
+    :param mode: pipeline mode, recorded in the report
+    """
+
+    def __init__(self, mode: str):
+        # One report per run: start the process-wide collector afresh
+        _telemetry.reset()
+        self.mode = mode
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.stages = []
+        # Mode-specific extras (e.g. the streaming stage report), copied into the JSON
+        self.extra = {}
+
+    def add_stage(self, name: str, wall_s: float, cpu_s: float = None, peak_rss_mb: float = None,
+                  items: int = None, status: str = "ok", peak_rss_exact: bool = True):
+        self.stages.append({
+            "stage": name,
+            "status": status,
+            "wall_s": wall_s,
+            "cpu_s": cpu_s,
+            "peak_rss_mb": peak_rss_mb,
+            "peak_rss_exact": peak_rss_exact,
+            "items": items,
+            "items_per_s": items / wall_s if items is not None and wall_s > 0 else None,
+        })
+
+    @contextmanager
+    def measure(self, name: str, items_key: str = None):
+        """
+        Measure an in-process stage: wall, process CPU, peak RSS and the items it
+        reported to get_telemetry() under items_key (default: name). Records the
+        stage as "error" if the block raises. Yields a dict; setting its "items"
+        overrides the reported count.
+        """
+        items_key = items_key or name
+        items_before = _telemetry.items.get(items_key, 0)
+        exact = reset_peak_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        status = "error"
+        overrides = {}
+        try:
+            yield overrides
+            status = "ok"
+        finally:
+            items = overrides.get("items", _telemetry.items.get(items_key, 0) - items_before)
+            self.add_stage(name, time.perf_counter() - wall_start, time.process_time() - cpu_start,
+                           peak_rss_mb(), items if items else None, status, peak_rss_exact=exact)
+
+    def child_env(self, path: str) -> dict:
+        """Environment for a subprocess stage that should dump its telemetry to `path`."""
+        if os.path.exists(path):
+            os.remove(path)
+        return dict(os.environ, **{TELEMETRY_FILE_ENV: path})
+
+    def add_subprocess_stage(self, name: str, wall_s: float, path: str, ok: bool,
+                             items_key: str = None):
+        """Record a stage run as a child process (see child_env) from the telemetry it dumped."""
+        snapshot = {}
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            os.remove(path)
+        _telemetry.merge(snapshot)
+        items = snapshot.get("items", {}).get(items_key or name)
+        self.add_stage(name, wall_s, snapshot.get("cpu_s"), snapshot.get("peak_rss_mb"), items,
+                       "ok" if ok else "error")
+
+    # ------------------------------------------------------------------- output
+    def to_dict(self) -> dict:
+        snapshot = _telemetry.snapshot()
+        files = snapshot["files"]
+        parsers = {}
+        for record in files:
+            totals = parsers.setdefault(record["parser"], {"files": 0, "bytes": 0, "wall_s": 0.0,
+                                                           "cpu_s": 0.0, "errors": 0})
+            totals["files"] += 1
+            totals["bytes"] += record["bytes"] or 0
+            totals["wall_s"] += record["wall_s"]
+            totals["cpu_s"] += record["cpu_s"] or 0.0
+            totals["errors"] += record["status"] == "error"
+        for totals in parsers.values():
+            totals["files_per_s"] = totals["files"] / totals["wall_s"] if totals["wall_s"] > 0 else None
+        return {
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "total_wall_s": sum(s["wall_s"] for s in self.stages),
+            "stages": self.stages,
+            "parsers": parsers,
+            "timers": {name: {"count": count, "total_s": total}
+                       for name, (count, total) in snapshot["timers"].items()},
+            "slowest_files": sorted(files, key=lambda r: r["wall_s"], reverse=True)[:SLOWEST_FILES],
+            "files": files,
+            **self.extra,
+        }
+
+    def write(self, path: str = DEFAULT_REPORT_PATH) -> dict:
+        """Write the JSON report atomically; returns the report dict."""
+        report = self.to_dict()
+        write_json_atomic(path, report, indent=2)
+        print(f"[telemetry] Wrote run report to '{path}'.")
+        return report
+
+    def print_summary(self, report: dict = None):
+        report = report or self.to_dict()
+
+        def num(value, fmt):
+            return format(value, fmt) if value is not None else "-"
+
+        print(f"\n[telemetry] Run summary ({report['mode']} mode, started {report['started_at']})")
+        print(f"  {'stage':<30} {'status':<6} {'wall s':>8} {'cpu s':>8} {'peak MB':>8} "
+              f"{'items':>7} {'items/s':>9}")
+        for s in report["stages"]:
+            peak = num(s["peak_rss_mb"], ".0f") + ("" if s["peak_rss_exact"] else "*")
+            print(f"  {s['stage']:<30} {s['status']:<6} {s['wall_s']:>8.2f} {num(s['cpu_s'], '.2f'):>8} "
+                  f"{peak:>8} {num(s['items'], 'd'):>7} {num(s['items_per_s'], '.1f'):>9}")
+        print(f"  {'total':<30} {'':<6} {report['total_wall_s']:>8.2f}")
+        if any(not s["peak_rss_exact"] for s in report["stages"]):
+            print("  * process peak so far (per-stage reset unavailable)")
+
+        if report["parsers"]:
+            print(f"\n  {'parser':<20} {'files':>6} {'MB':>8} {'wall s':>8} {'cpu s':>8} "
+                  f"{'files/s':>8} {'errors':>6}")
+            for parser, t in sorted(report["parsers"].items(), key=lambda kv: -kv[1]["wall_s"]):
+                print(f"  {parser:<20} {t['files']:>6} {t['bytes'] / (1024 * 1024):>8.1f} {t['wall_s']:>8.2f} "
+                      f"{t['cpu_s']:>8.2f} {num(t['files_per_s'], '.1f'):>8} {t['errors']:>6}")
+
+        if report["timers"]:
+            print(f"\n  {'sub-step':<30} {'count':>6} {'total s':>8}")
+            for name, t in sorted(report["timers"].items(), key=lambda kv: -kv[1]["total_s"]):
+                print(f"  {name:<30} {t['count']:>6} {t['total_s']:>8.2f}")
+
+        if report["slowest_files"]:
+            print("\n  Slowest files:")
+            for r in report["slowest_files"]:
+                print(f"  {r['wall_s']:>8.2f}s  {r['parser']:<18} {r['status']:<7} {r['file']}")
@@ -18,12 +18,13 @@ Guiding Principles (from the discussion):
    is recommended if some topics have hundreds or thousands of chunks.
 
 Usage:
+    from neo4j_connection import Neo4jConnection
     from topic_relationships import compute_topic_similarity
 
-    driver = GraphDatabase.driver(...)  # from neo4j
-    compute_topic_similarity(driver, full_clique=True)
+    conn = Neo4jConnection.from_env()
+    compute_topic_similarity(conn, full_clique=True)
     # or
-    compute_topic_similarity(driver, full_clique=False, top_k=5)
+    compute_topic_similarity(conn, full_clique=False, top_k=5)
 
 Implementation steps:
  - Each chunk node is expected to have a 'topic_id' property. We:
@@ -38,15 +39,27 @@ Implementation steps:
 """
 
 from collections import defaultdict
-from neo4j import Session
 
 
-def compute_topic_similarity(driver, full_clique=True, top_k=5):
+FETCH_TOPICS_QUERY = """
+MATCH (c:Chunk)
+WHERE EXISTS(c.topic_id)
+RETURN c.chunk_id AS chunk_id, c.topic_id AS topic_id
+"""
+
+MERGE_TOPIC_SIM_QUERY = """
+MATCH (c1:Chunk { chunk_id: $c1_id }),
+      (c2:Chunk { chunk_id: $c2_id })
+MERGE (c1)-[:TOPIC_SIM { topic_similarity: 1 }]->(c2)
+"""
+
+
+def compute_topic_similarity(conn, full_clique=True, top_k=5):
     """
     Creates :TOPIC_SIM edges among chunk nodes that share the same topic_id.
 
-    :param driver: A neo4j GraphDatabase driver
-    :type driver: neo4j.Driver
+    :param conn: The shared Neo4j connection
+    :type conn: neo4j_connection.Neo4jConnection
 
     :param full_clique: If True, for each topic_id we connect every chunk pair 
                         with an edge. Potentially large if many chunks share a topic.
@@ -69,22 +82,15 @@ def compute_topic_similarity(driver, full_clique=True, top_k=5):
          or you could store a more nuanced similarity if you have distributions.
 
     Example usage:
-        compute_topic_similarity(driver, full_clique=True)
+        compute_topic_similarity(conn, full_clique=True)
         # or partial approach with top_k=3
-        compute_topic_similarity(driver, full_clique=False, top_k=3)
+        compute_topic_similarity(conn, full_clique=False, top_k=3)
     """
     print("[topic_relationships] Building :TOPIC_SIM edges from chunk nodes with topic_id")
 
     # 1) Fetch chunk_id and topic_id for all chunks that have a topic_id
-    with driver.session() as session:
-        query = """
-        MATCH (c:Chunk)
-        WHERE EXISTS(c.topic_id)
-        RETURN c.chunk_id AS chunk_id, c.topic_id AS topic_id
-        """
-        result = session.run(query)
-
-        chunk_topic_list = [(r["chunk_id"], r["topic_id"]) for r in result]
+    rows = conn.run_read(FETCH_TOPICS_QUERY, label="relationships.fetch_topics")
+    chunk_topic_list = [(r["chunk_id"], r["topic_id"]) for r in rows]
 
     num_chunks = len(chunk_topic_list)
     print(f"[topic_relationships] Found {num_chunks} chunk(s) that have a topic_id.")
@@ -100,47 +106,35 @@ def compute_topic_similarity(driver, full_clique=True, top_k=5):
 
     relationship_count = 0
 
-    # 3) For each topic, link the relevant chunk_ids
-    with driver.session() as session:
-        for topic_id, cids in topic_map.items():
-            # If only one chunk in that topic, skip
-            if len(cids) < 2:
-                continue
-
-            if full_clique:
-                # connect all pairs in that topic
-                for i in range(len(cids)):
-                    for j in range(i+1, len(cids)):
-                        c1_id = cids[i]
-                        c2_id = cids[j]
-                        merge_query = """
-                        MATCH (c1:Chunk { chunk_id: $c1_id }),
-                              (c2:Chunk { chunk_id: $c2_id })
-                        MERGE (c1)-[:TOPIC_SIM { topic_similarity: 1 }]->(c2)
-                        """
-                        session.run(merge_query, {
-                            "c1_id": c1_id,
-                            "c2_id": c2_id
-                        })
-                        relationship_count += 1
-            else:
-                # partial approach: each chunk links to up to top_k neighbors
-                for i in range(len(cids)):
-                    c1_id = cids[i]
-                    # pick up to top_k in the list after i
-                    # you could do random but we do a stable approach
-                    upper_bound = min(len(cids), i+1+top_k)
-                    for j in range(i+1, upper_bound):
-                        c2_id = cids[j]
-                        merge_query = """
-                        MATCH (c1:Chunk { chunk_id: $c1_id }),
-                              (c2:Chunk { chunk_id: $c2_id })
-                        MERGE (c1)-[:TOPIC_SIM { topic_similarity: 1 }]->(c2)
-                        """
-                        session.run(merge_query, {
-                            "c1_id": c1_id,
-                            "c2_id": c2_id
-                        })
-                        relationship_count += 1
+    # 3) For each topic, link the relevant chunk_ids (one transaction per topic)
+    for topic_id, cids in topic_map.items():
+        # If only one chunk in that topic, skip
+        if len(cids) < 2:
+            continue
+
+        pairs = []
+        if full_clique:
+            # connect all pairs in that topic
+            for i in range(len(cids)):
+                for j in range(i+1, len(cids)):
+                    pairs.append((cids[i], cids[j]))
+        else:
+            # partial approach: each chunk links to up to top_k neighbors
+            for i in range(len(cids)):
+                # pick up to top_k in the list after i
+                # you could do random but we do a stable approach
+                upper_bound = min(len(cids), i+1+top_k)
+                for j in range(i+1, upper_bound):
+                    pairs.append((cids[i], cids[j]))
+
+        def work(tx):
+            for c1_id, c2_id in pairs:
+                tx.run(MERGE_TOPIC_SIM_QUERY, {
+                    "c1_id": c1_id,
+                    "c2_id": c2_id
+                })
+
+        conn.write_tx(work, label="relationships.merge_topic_sim")
+        relationship_count += len(pairs)
 
     print(f"[topic_relationships] Created {relationship_count} :TOPIC_SIM edges.")
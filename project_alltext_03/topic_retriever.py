@@ -3,18 +3,25 @@ topic_retriever.py
 
 This module helps retrieve relevant chunks from Neo4j based on their "topic_id"
 property. Typically, each chunk node is assigned a topic_id from a topic modeling
-step (like BERTopic). We define two main functions:
+step (like BERTopic). We define three main functions:
 
 1) get_topic_ids_from_chunks(chunks, top_n=3)
    - Examines the top embedding-based chunks (or any chunk list), extracts the 
      topic_id from the first 'top_n' chunks, and returns a set of those topic_ids.
    - This is a heuristic for deciding which topics the user’s query is likely about.
 
-2) retrieve_by_topic(driver, topic_ids, max_per_topic=5)
+2) retrieve_by_topic(conn, topic_ids, max_per_topic=5)
    - Given a set/list of topic_ids, queries Neo4j for chunks that match each topic_id,
      returning a limited number (max_per_topic) from each. This prevents huge floods 
      if a topic is large.
 
+3) retrieve_by_topic_batched(conn, topic_ids, max_per_topic=5)
+   - Same expansion in a single round trip: all topic ids are sent as one list
+     parameter (`UNWIND $tids`) and the per-topic limit is a parameter too, so the
+     query text never changes and the server's plan cache is reused. Results are
+     deduplicated by chunk_id and include each chunk's embedding, so callers
+     (hybrid_retriever) can score expansion chunks against the query.
+
 These functions are typically used in a "hybrid" retrieval scenario:
  - You do an embedding-based retrieval to get your top-K chunks.
  - From those chunks, you see which topic_ids appear.
@@ -30,11 +37,34 @@ Usage:
     from topic_retriever import get_topic_ids_from_chunks, retrieve_by_topic
 
     relevant_topics = get_topic_ids_from_chunks(top_embedding_chunks, top_n=3)
-    more_topic_chunks = retrieve_by_topic(driver, relevant_topics, max_per_topic=5)
+    more_topic_chunks = retrieve_by_topic(conn, relevant_topics, max_per_topic=5)
+    # or, in one round trip and with embeddings:
+    more_topic_chunks = retrieve_by_topic_batched(conn, relevant_topics, max_per_topic=5)
 """
 
 from typing import List, Dict, Set
-from neo4j import Driver, Session
+
+from neo4j_connection import Neo4jConnection
+
+
+# One round trip for all topics. The per-topic LIMIT lives in a subquery so it
+# applies to each topic separately, and it is a parameter so the query text (and
+# hence the cached plan) is identical for every call.
+RETRIEVE_BY_TOPICS_QUERY = """
+UNWIND $tids AS tid
+CALL {
+    WITH tid
+    MATCH (c:Chunk)
+    WHERE c.topic_id = tid
+    RETURN c
+    LIMIT $max_per_topic
+}
+WITH DISTINCT c
+RETURN c.chunk_id AS chunk_id,
+       c.content AS content,
+       c.topic_id AS topic_id,
+       c.embedding AS embedding
+"""
 
 
 def get_topic_ids_from_chunks(chunks: List[Dict], top_n: int = 3) -> Set:
@@ -76,14 +106,14 @@ def get_topic_ids_from_chunks(chunks: List[Dict], top_n: int = 3) -> Set:
     return topic_ids
 
 
-def retrieve_by_topic(driver: Driver, topic_ids, max_per_topic: int = 5) -> List[Dict]:
+def retrieve_by_topic(conn: Neo4jConnection, topic_ids, max_per_topic: int = 5) -> List[Dict]:
     """
     Given a set/list of topic_ids, retrieve up to 'max_per_topic' chunks for each 
     of those topics from Neo4j. This helps you "expand" your retrieval to include 
     thematically relevant chunks that might not have scored high in embedding similarity.
 
-    :param driver: A neo4j.Driver to connect to the DB
-    :type driver: neo4j.Driver
+    :param conn: The shared Neo4jConnection
+    :type conn: neo4j_connection.Neo4jConnection
 
     :param topic_ids: The set or list of topics we want to retrieve. 
                       e.g. {7, 12} if those were determined relevant.
@@ -108,16 +138,17 @@ def retrieve_by_topic(driver: Driver, topic_ids, max_per_topic: int = 5) -> List
     
     Example:
         relevant_topics = {7, 12}
-        expansions = retrieve_by_topic(driver, relevant_topics, max_per_topic=5)
+        expansions = retrieve_by_topic(conn, relevant_topics, max_per_topic=5)
         # expansions -> e.g. [ {chunk_id:..., content:..., topic_id:7}, {...}, ... ]
     """
     if not topic_ids:
         return []
 
-    results = []
     topic_ids_list = list(topic_ids)
 
-    with driver.session() as session:
+    def work(tx):
+        # Built per attempt: read_tx re-runs work() on transient errors
+        rows = []
         for tid in topic_ids_list:
             cypher = f"""
             MATCH (c:Chunk)
@@ -128,9 +159,47 @@ def retrieve_by_topic(driver: Driver, topic_ids, max_per_topic: int = 5) -> List
             LIMIT {max_per_topic}
             """
             # We param bind 'tid', but the limit is inline
-            recs = session.run(cypher, {"tid": tid})
-            for rec in recs:
-                chunk_info = dict(rec)
-                results.append(chunk_info)
+            rows.extend(tx.run(cypher, {"tid": tid}))
+        return rows
+
+    return conn.read_tx(work, label="retrieve.by_topic")
+
+
+def retrieve_by_topic_batched(conn: Neo4jConnection, topic_ids, max_per_topic: int = 5,
+                              timeout: float = None) -> List[Dict]:
+    """
+    Batched variant of retrieve_by_topic: one Cypher round trip for all topic ids,
+    with a parameterised per-topic limit, returning deduplicated chunks together
+    with their embeddings.
+
+    :param conn: The shared Neo4jConnection
+    :type conn: neo4j_connection.Neo4jConnection
+
+    :param topic_ids: The set or list of topics we want to retrieve.
+    :type topic_ids: set or list
+
+    :param max_per_topic: The maximum number of chunks to retrieve per topic.
+    :type max_per_topic: int
+
+    :param timeout: Optional transaction timeout in seconds; the server aborts the
+                    query once it passes.
+    :type timeout: float
+
+    :return: A list of chunk dicts, unique by chunk_id, each with
+             { "chunk_id":..., "content":..., "topic_id":..., "embedding": [...] }
+    :rtype: list of dict
+
+    Example:
+        expansions = retrieve_by_topic_batched(conn, {7, 12}, max_per_topic=5)
+    """
+    if not topic_ids:
+        return []
 
-    return results
+    # WITH DISTINCT c removes duplicates server-side, including those from a topic id
+    # passed twice
+    return conn.run_read(
+        RETRIEVE_BY_TOPICS_QUERY,
+        {"tids": list(topic_ids), "max_per_topic": int(max_per_topic)},
+        label="retrieve.by_topic_batched",
+        timeout=timeout
+    )
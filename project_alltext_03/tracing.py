@@ -0,0 +1,516 @@
+"""
+tracing.py
+
+**Structured tracing spans** for the query path (rag_query.py, query_server.py).
+The per-question prints ("scoring 3 ms, fetch 12 ms", "first token 900 ms") show
+single numbers; when a question takes 40 seconds we need to see how that time
+splits across query embedding, the Neo4j reads, Python scoring, prompt building,
+LLM queueing, prefill and generation, and to compare that split across many
+questions.
+
+A span is one timed step with a name, a parent and attributes (chunk counts,
+token counts, model names, ...). Spans nest through a context variable, so the
+code that opens a span does not need to know who called it:
+
+    question                      (root; one trace per question)
+      embed_query
+      retrieve
+        retrieve.index_load       (only when the index is loaded for this call)
+        retrieve.score            (GEMV + argpartition in Python/numpy)
+        retrieve.fetch            (Neo4j content read)
+      build_prompt
+      llm
+        llm.queue                 (waiting for an LLM scheduler slot)
+        llm.prefill               (request start to first token; includes model load)
+        llm.generate              (first token to the end of the stream)
+
+The llm.* children are measured inside the LLM scheduler and the Ollama client and
+are recorded after the fact (Tracer.record) from the numbers they return.
+
+Export:
+  - **JSONL** (RAG_TRACE_FILE or --trace FILE): one finished span per line.
+  - **OTLP/HTTP JSON** (RAG_TRACE_OTLP_ENDPOINT or --trace-otlp URL, e.g.
+    http://localhost:4318/v1/traces): batches posted from a background thread to a
+    locally running OpenTelemetry collector. No opentelemetry packages needed.
+With neither set, tracing is off and span() costs one attribute check.
+
+Summariser:
+    python tracing.py traces.jsonl [--by name|path] [--since-s SECONDS]
+prints, per span name (or per name path, e.g. question/llm/llm.prefill), the
+count, mean, p50 / p90 / p95 / p99 / max latency and the share of root time.
+
+Guiding Principles:
+1. **Stdlib only & cheap**: a few dict updates per span; exporters never block the
+   traced code for long (JSONL is one buffered line write, OTLP is queued).
+2. **Never breaks a query**: export errors are reported once and dropped.
+3. **Thread-aware**: each thread (query_server request, batch worker) has its own
+   current span, so concurrent questions get separate traces.
+
+Usage:
+    from tracing import get_tracer
+
+    tracer = get_tracer()
+    with tracer.span("question", k=5) as span:
+        with tracer.span("retrieve") as child:
+            ...
+            child.set(chunks=len(top_k))
+        span.set(model="deepseek-r1:32b")
+
+    python rag_query.py --trace traces.jsonl
+    python tracing.py traces.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import argparse
+import threading
+import contextvars
+import urllib.request
+from collections import defaultdict
+from contextlib import contextmanager
+
+from telemetry import percentile
+
+TRACE_FILE_ENV = "RAG_TRACE_FILE"
+TRACE_OTLP_ENV = "RAG_TRACE_OTLP_ENDPOINT"
+SERVICE_NAME = os.getenv("RAG_TRACE_SERVICE", "rag_query")
+
+# OTLP exporter batching
+OTLP_BATCH_SIZE = 64
+OTLP_FLUSH_S = 1.0
+OTLP_MAX_QUEUE = 10000
+OTLP_TIMEOUT_S = 2.0
+
+_current_span = contextvars.ContextVar("rag_trace_span", default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    """One timed step. Use Tracer.span() rather than creating these directly."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "status", "error")
+
+    def __init__(self, name: str, parent, attributes: dict, start_ns: int):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else _new_id(16)
+        self.span_id = _new_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attributes):
+        """Add or overwrite attributes (None values are skipped)."""
+        for key, value in attributes.items():
+            if value is not None:
+                self.attributes[key] = value
+
+    def set_error(self, error: str):
+        self.status = "error"
+        self.error = error
+
+    def to_dict(self) -> dict:
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "status": self.status,
+            "thread": threading.current_thread().name,
+        }
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+
+class _NoopSpan:
+    """Stands in for a Span while tracing is off."""
+
+    def set(self, **attributes):
+        pass
+
+    def set_error(self, error: str):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlExporter:
+    """Appends one JSON object per finished span to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(record: dict) -> dict:
+    span = {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "name": record["name"],
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(record["start_ns"]),
+        "endTimeUnixNano": str(record["end_ns"]),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in record["attributes"].items()],
+        # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+        "status": {"code": 2, "message": record.get("error", "")} if record["status"] == "error"
+                  else {"code": 1},
+    }
+    if record["parent_id"]:
+        span["parentSpanId"] = record["parent_id"]
+    return span
+
+
+class OtlpExporter:
+    """
+    Posts spans to an OTLP/HTTP collector endpoint as JSON (the OTLP JSON encoding of
+    ExportTraceServiceRequest). Spans are queued and sent in batches from a daemon
+    thread; when the collector is down they are dropped (and counted).
+
+    :param endpoint: full URL, e.g. http://localhost:4318/v1/traces
+    """
+
+    def __init__(self, endpoint: str, service_name: str = SERVICE_NAME):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.sent = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=OTLP_MAX_QUEUE)
+        self._warned = False
+        self._thread = threading.Thread(target=self._run, name="trace_otlp_exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record: dict):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + OTLP_FLUSH_S
+            stop = batch[0] is None
+            while not stop and len(batch) < OTLP_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+            batch = [r for r in batch if r is not None]
+            if batch:
+                self._post(batch)
+            if stop:
+                return
+
+    def _post(self, batch: list):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name",
+                                         "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"},
+                            "spans": [_otlp_span(r) for r in batch]}],
+        }]}
+        request = urllib.request.Request(self.endpoint, data=json.dumps(body).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=OTLP_TIMEOUT_S) as resp:
+                resp.read()
+            self.sent += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            if not self._warned:
+                self._warned = True
+                print(f"[tracing] OTLP export to {self.endpoint} failed ({e}); dropping spans.")
+
+    def close(self):
+        """Send what is queued (waits up to a few seconds)."""
+        try:
+            self._queue.put(None, timeout=OTLP_TIMEOUT_S)
+        except queue.Full:
+            return
+        self._thread.join(timeout=OTLP_FLUSH_S + 2 * OTLP_TIMEOUT_S)
+
+
+class Tracer:
+    """
+    Creates spans and hands finished ones to the exporters. Disabled (no exporters)
+    tracers return NOOP_SPAN.
+
+    :param exporters: objects with export(record: dict) and close()
+    """
+
+    def __init__(self, exporters: list = None):
+        self.exporters = list(exporters or [])
+        self.enabled = bool(self.exporters)
+        # Span times are perf_counter based, anchored to the wall clock once
+        self._wall0_ns = time.time_ns()
+        self._perf0_ns = time.perf_counter_ns()
+
+    def _now_ns(self) -> int:
+        return self._wall0_ns + (time.perf_counter_ns() - self._perf0_ns)
+
+    def to_epoch_ns(self, perf_s: float) -> int:
+        """Convert a time.perf_counter() reading to epoch nanoseconds on this tracer's clock."""
+        return self._wall0_ns + (int(perf_s * 1e9) - self._perf0_ns)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Time the block as a child of the current span (or as a new trace's root).
+        An exception leaving the block marks the span as an error and propagates.
+
+        :yield: the Span (NOOP_SPAN when tracing is off); call .set(...) to add attributes
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        span = Span(name, _current_span.get(),
+                    {k: v for k, v in attributes.items() if v is not None}, self._now_ns())
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = self._now_ns()
+            self._export(span)
+
+    def record(self, name: str, start_perf_s: float, end_perf_s: float, **attributes):
+        """
+        Record a finished child of the current span from perf_counter() readings taken
+        elsewhere (e.g. queue wait measured by the LLM scheduler).
+        """
+        if not self.enabled:
+            return
+        span = Span(name, _current_span.get(),
+                    {k: v for k, v in attributes.items() if v is not None},
+                    self.to_epoch_ns(start_perf_s))
+        span.end_ns = max(self.to_epoch_ns(end_perf_s), span.start_ns)
+        self._export(span)
+
+    def current_span(self):
+        """The innermost open span in this thread/context, or NOOP_SPAN."""
+        span = _current_span.get()
+        return span if span is not None else NOOP_SPAN
+
+    def _export(self, span: Span):
+        record = span.to_dict()
+        for exporter in self.exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                print(f"[tracing] Dropping span '{span.name}': {e}")
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters = []
+        self.enabled = False
+
+
+_tracer = None
+_tracer_lock = threading.RLock()
+
+
+def configure_tracing(trace_file: str = None, otlp_endpoint: str = None) -> Tracer:
+    """
+    (Re)create the process-wide tracer. Defaults come from RAG_TRACE_FILE and
+    RAG_TRACE_OTLP_ENDPOINT; with neither, tracing is off.
+
+    :param trace_file: JSONL path to append spans to
+    :param otlp_endpoint: OTLP/HTTP traces URL of a local collector
+    """
+    global _tracer
+    trace_file = trace_file or os.getenv(TRACE_FILE_ENV)
+    otlp_endpoint = otlp_endpoint or os.getenv(TRACE_OTLP_ENV)
+    exporters = []
+    if trace_file:
+        exporters.append(JsonlExporter(trace_file))
+    if otlp_endpoint:
+        exporters.append(OtlpExporter(otlp_endpoint))
+    with _tracer_lock:
+        if _tracer is not None:
+            _tracer.close()
+        _tracer = Tracer(exporters)
+    if trace_file or otlp_endpoint:
+        targets = [t for t in (trace_file, otlp_endpoint) if t]
+        print(f"[tracing] Tracing spans to {', '.join(targets)}")
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    """The process-wide Tracer (configured from the environment on first use)."""
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                configure_tracing()
+    return _tracer
+
+
+@atexit.register
+def _close_tracer():
+    if _tracer is not None:
+        _tracer.close()
+
+
+############################
+# Summariser
+############################
+def load_spans(path: str, since_s: float = None) -> list:
+    """
+    Read a JSONL trace file (malformed lines, e.g. a torn last line, are skipped).
+
+    :param since_s: keep only spans that started within the last since_s seconds
+    """
+    cutoff_ns = time.time_ns() - int(since_s * 1e9) if since_s else None
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if cutoff_ns is None or record.get("start_ns", 0) >= cutoff_ns:
+                spans.append(record)
+    return spans
+
+
+def summarize_spans(spans: list, by: str = "name") -> dict:
+    """
+    Per-span latency statistics.
+
+    :param spans: span records (load_spans)
+    :param by: "name" groups by span name; "path" by the chain of names from the root
+               (e.g. question/llm/llm.prefill)
+    :return: {"traces": int, "root_ms": float, "spans": {key: {"n", "errors", "mean_ms",
+              "p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms", "total_ms", "share"}}}
+    """
+    by_id = {s["span_id"]: s for s in spans}
+
+    def path_of(span):
+        names = [span["name"]]
+        seen = {span["span_id"]}
+        parent = by_id.get(span.get("parent_id"))
+        while parent is not None and parent["span_id"] not in seen:
+            names.append(parent["name"])
+            seen.add(parent["span_id"])
+            parent = by_id.get(parent.get("parent_id"))
+        return "/".join(reversed(names))
+
+    groups = defaultdict(list)
+    errors = defaultdict(int)
+    for span in spans:
+        key = path_of(span) if by == "path" else span["name"]
+        groups[key].append(span["duration_ms"])
+        if span.get("status") == "error":
+            errors[key] += 1
+
+    roots = [s for s in spans if not s.get("parent_id")]
+    root_ms = sum(s["duration_ms"] for s in roots)
+    summary = {}
+    for key, durations in groups.items():
+        total = sum(durations)
+        summary[key] = {
+            "n": len(durations),
+            "errors": errors[key],
+            "mean_ms": total / len(durations),
+            "p50_ms": percentile(durations, 50),
+            "p90_ms": percentile(durations, 90),
+            "p95_ms": percentile(durations, 95),
+            "p99_ms": percentile(durations, 99),
+            "max_ms": max(durations),
+            "total_ms": total,
+            "share": total / root_ms if root_ms > 0 else 0.0,
+        }
+    return {"traces": len({s["trace_id"] for s in roots}), "root_ms": root_ms, "spans": summary}
+
+
+def print_summary(summary: dict, prefix: str = "tracing"):
+    """Print summarize_spans() output, slowest total first."""
+    print(f"[{prefix}] {summary['traces']} traces, {summary['root_ms'] / 1000.0:.2f}s total root time")
+    if not summary["spans"]:
+        return
+    width = max(24, max(len(key) for key in summary["spans"]))
+    print(f"  {'span':<{width}} {'n':>6} {'err':>4} {'mean':>9} {'p50':>9} {'p90':>9} "
+          f"{'p95':>9} {'p99':>9} {'max':>9} {'% root':>7}")
+    rows = sorted(summary["spans"].items(), key=lambda kv: kv[1]["total_ms"], reverse=True)
+    for key, s in rows:
+        print(f"  {key:<{width}} {s['n']:>6} {s['errors']:>4} {s['mean_ms']:>9.1f} {s['p50_ms']:>9.1f} "
+              f"{s['p90_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} {s['max_ms']:>9.1f} "
+              f"{s['share'] * 100.0:>6.1f}%")
+    print("  (latencies in ms; % root = span time / time of all root spans, so nested spans overlap)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-span latency percentiles over a JSONL trace file.")
+    parser.add_argument("trace_file", help="JSONL file written with RAG_TRACE_FILE / --trace.")
+    parser.add_argument("--by", choices=("name", "path"), default="name",
+                        help="Group by span name, or by the chain of span names from the root.")
+    parser.add_argument("--since-s", type=float, default=None,
+                        help="Only spans that started in the last N seconds.")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.trace_file):
+        print(f"[tracing] No trace file at '{args.trace_file}'.")
+        sys.exit(1)
+    summary = summarize_spans(load_spans(args.trace_file, since_s=args.since_s), by=args.by)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+vector_index.py
+
+An in-memory, exact (brute-force) vector index over chunk embeddings stored in Neo4j.
+It replaces the per-chunk Python loop used by the retrievers:
+
+    for each chunk:
+        a = np.array(...); b = np.array(...)      # allocation per chunk
+        cos = dot(a, b) / (norm(a) * norm(b))     # norms recomputed per chunk
+    sort all N results                            # O(N log N) for k=5
+
+with a single contiguous float32 matrix whose rows are L2-normalised once at load
+time. Scoring a query is then one matrix-vector product (GEMV) and selecting the
+top-k is `np.argpartition` (O(N)) followed by sorting only the k winners.
+
+Guiding Principles:
+1. **Ids and vectors only**: We load chunk_id + embedding (+ the small topic_id),
+   never `content`. Content is fetched afterwards for the few winning ids (see
+   fetch_chunk_contents), so the scoring phase does not ship every chunk's text
+   over Bolt.
+2. **Exact results**: Same ranking as the old cosine loop (up to float32 rounding);
+   this is not an approximate index.
+3. **Reusable**: The same index serves single queries (`search`) and batches of
+   queries (`search_batch`, one matrix-matrix product).
+
+Usage:
+    from neo4j_connection import Neo4jConnection
+    from vector_index import VectorIndex, fetch_chunk_contents
+
+    conn = Neo4jConnection.from_env()
+    index = VectorIndex.from_neo4j(conn)
+    ids, sims = index.search(query_vec, k=5)
+    contents = fetch_chunk_contents(conn, ids)   # {chunk_id: content}
+"""
+
+import numpy as np
+
+from neo4j_connection import Neo4jConnection
+
+
+FETCH_IDS_AND_EMBEDDINGS_QUERY = """
+MATCH (c:Chunk)
+WHERE c.embedding IS NOT NULL AND size(c.embedding) > 0
+RETURN c.chunk_id AS chunk_id, c.embedding AS embedding, c.topic_id AS topic_id
+"""
+
+FETCH_CONTENTS_QUERY = """
+MATCH (c:Chunk)
+WHERE c.chunk_id IN $ids
+RETURN c.chunk_id AS chunk_id, c.content AS content
+"""
+
+
+def normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalise each row in place. Zero rows stay zero (cosine 0.0 with anything),
+    matching the old cos_sim behaviour for zero vectors.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k largest entries of a 1D score array, sorted by descending
+    score. Uses argpartition so only the k winners are sorted.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+class VectorIndex:
+    """
+    Contiguous, pre-normalised (N, dim) float32 matrix plus the matching chunk ids.
+    """
+
+    def __init__(self, chunk_ids: list, embeddings, topic_ids: list = None):
+        """
+        :param chunk_ids: list of N chunk ids
+        :param embeddings: (N, dim) array-like of raw (unnormalised) embeddings
+        :param topic_ids: optional list of N topic ids (None where a chunk has none)
+        """
+        self.chunk_ids = list(chunk_ids)
+        self.topic_ids = list(topic_ids) if topic_ids is not None else [None] * len(self.chunk_ids)
+        self._position = None
+        if len(self.chunk_ids) == 0:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+        else:
+            self.matrix = normalise_rows(np.array(embeddings, dtype=np.float32, order="C"))
+
+    @classmethod
+    def from_neo4j(cls, conn: Neo4jConnection):
+        """
+        Build the index from every Chunk with a non-empty embedding. Only ids and
+        embeddings are transferred.
+        """
+        rows = conn.run_read(FETCH_IDS_AND_EMBEDDINGS_QUERY, label="vector_index.load")
+        return cls([r["chunk_id"] for r in rows], [r["embedding"] for r in rows],
+                   [r.get("topic_id") for r in rows])
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def topic_of(self, chunk_id):
+        """topic_id stored for chunk_id (None if unknown or not assigned)."""
+        if self._position is None:
+            self._position = {cid: i for i, cid in enumerate(self.chunk_ids)}
+        i = self._position.get(chunk_id)
+        return self.topic_ids[i] if i is not None else None
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def scores(self, query_embedding) -> np.ndarray:
+        """Cosine similarity of the query against every row (one GEMV)."""
+        q = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        if len(self.chunk_ids) == 0 or norm == 0.0:
+            return np.zeros(len(self.chunk_ids), dtype=np.float32)
+        return self.matrix @ (q / norm)
+
+    def search(self, query_embedding, k: int = 5) -> tuple:
+        """
+        :param query_embedding: 1D query vector
+        :param k: number of results
+        :return: (chunk_ids, sims) for the top-k, sorted by descending similarity
+        """
+        sims = self.scores(query_embedding)
+        idx = top_k_indices(sims, k)
+        return [self.chunk_ids[i] for i in idx], [float(sims[i]) for i in idx]
+
+    def search_batch(self, query_embeddings, k: int = 5) -> list:
+        """
+        Score many queries at once with one matrix-matrix product (GEMM).
+
+        :param query_embeddings: (Q, dim) array of query vectors
+        :param k: number of results per query
+        :return: list of Q (chunk_ids, sims) tuples
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        if len(self.chunk_ids) == 0:
+            return [([], []) for _ in range(queries.shape[0])]
+        queries = normalise_rows(queries.copy())
+        all_sims = queries @ self.matrix.T  # (Q, N)
+        results = []
+        for sims in all_sims:
+            idx = top_k_indices(sims, k)
+            results.append(([self.chunk_ids[i] for i in idx], [float(sims[i]) for i in idx]))
+        return results
+
+
+def fetch_chunk_contents(conn: Neo4jConnection, chunk_ids: list, timeout: float = None) -> dict:
+    """
+    Fetch `content` for the given chunk ids in one parameterised round trip.
+
+    :param timeout: optional transaction timeout in seconds (Neo4jConnection.run_read)
+    :return: {chunk_id: content}
+    """
+    if not chunk_ids:
+        return {}
+    rows = conn.run_read(FETCH_CONTENTS_QUERY, {"ids": list(chunk_ids)}, label="vector_index.fetch_contents",
+                         timeout=timeout)
+    return {r["chunk_id"]: r["content"] for r in rows}
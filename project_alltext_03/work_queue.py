@@ -0,0 +1,373 @@
+"""
+work_queue.py
+
+A **shared work queue with leases** for spreading extraction (OCR) and embedding
+over several worker processes, on one host or on many hosts that see the same
+filesystem. Used by `data_extraction.py --queue` and `embedding_text.py --queue`.
+
+The queue is a single SQLite file. A coordinator creates a **job** (a name plus the
+parameters its shards depend on) and enqueues its **shards** (a few files, or a range
+of chunk positions). Workers claim a shard, process it, write the shard's output to
+`<queue>.shards/<job>/<shard>.json` and mark it done. Once every shard is done the
+coordinator merges the shard outputs, in shard order, into the stage's usual output
+file. The merged output is the same as a single-process run.
+
+Leases:
+- Claiming a shard leases it for `lease_s` seconds (default 60, $WORK_QUEUE_LEASE_S).
+  While the worker processes it, a heartbeat thread extends the lease every lease_s/3.
+- A worker that dies stops heartbeating. Its lease runs out and the next claim takes
+  the shard over. A worker that loses its lease this way cannot complete the shard.
+- A shard that fails (or whose leases keep expiring) is retried up to max_attempts
+  times (default 3), then marked failed. The coordinator then stops with an error.
+
+Guiding Principles:
+1. **Offline & stdlib only**: sqlite3 + the filesystem, no broker to run. Every
+   operation uses a short transaction on a fresh connection (BEGIN IMMEDIATE for
+   claims), so any number of processes and threads can share the file.
+2. **Restartable**: Re-running the coordinator with the same job parameters keeps the
+   shards already done; different parameters reset the job.
+3. **Deterministic merge**: Shard outputs are written atomically and merged by shard
+   id, so the result does not depend on which worker did what, or in what order.
+
+Caveats: SQLite locking on network filesystems (NFS, SMB) is only as reliable as the
+filesystem's own locks. Lease expiry compares wall clocks, so hosts should run NTP.
+
+Usage:
+    from work_queue import WorkQueue, run_worker, coordinate
+
+    queue = WorkQueue("work_queue.db")
+    queue.create_job("embed_chunks", params={...}, shards=[{"start": 0, "end": 500}, ...])
+    # on any number of hosts/processes:
+    run_worker(queue, "embed_chunks", process_shard=lambda params, payload: [...])
+    # coordinator (optionally starting local worker processes too):
+    if coordinate(queue, "embed_chunks", "embedding_text.py", ["--queue", "work_queue.db", "--worker"]):
+        for output in queue.shard_outputs("embed_chunks"):
+            ...
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import threading
+import subprocess
+
+from stage_checkpoint import write_json_atomic
+
+DEFAULT_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", "work_queue.db")
+DEFAULT_LEASE_S = float(os.getenv("WORK_QUEUE_LEASE_S", "60"))
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds between claim attempts while other workers hold the remaining shards
+DEFAULT_POLL_S = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job        TEXT PRIMARY KEY,
+    params     TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shards (
+    job           TEXT NOT NULL,
+    shard_id      INTEGER NOT NULL,
+    payload       TEXT NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'pending',   -- pending | leased | done | failed
+    worker        TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    error         TEXT,
+    PRIMARY KEY (job, shard_id)
+);
+CREATE INDEX IF NOT EXISTS shards_status ON shards (job, status);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Jobs and leased shards in a SQLite file. See the module docstring.
+
+    :param path: SQLite file, on a filesystem every worker can reach
+    :param lease_s: lease length; heartbeats renew it every lease_s/3
+    :param max_attempts: claims per shard before it is marked failed
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, lease_s: float = DEFAULT_LEASE_S,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.shard_dir = f"{path}.shards"
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # Autocommit mode: transactions are explicit (BEGIN IMMEDIATE ... COMMIT)
+        return _Connection(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    # ------------------------------------------------------------------ coordinator
+    def create_job(self, job: str, params: dict, shards: list) -> int:
+        """
+        Create the job with its shard payloads, or keep it if it already exists
+        with the same params (finished shards are not redone). Different params
+        replace the job.
+
+        :return: number of shards still to do
+        """
+        params_json = json.dumps(params, sort_keys=True)
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT params FROM jobs WHERE job = ?", (job,)).fetchone()
+            if row and row[0] == params_json:
+                # Failed shards get a fresh set of attempts on a coordinator re-run
+                db.execute("UPDATE shards SET status = 'pending', attempts = 0, error = NULL "
+                           "WHERE job = ? AND status = 'failed'", (job,))
+                db.execute("COMMIT")
+                print(f"[work_queue] Job '{job}' already queued with these parameters; "
+                      f"keeping finished shards.")
+            else:
+                if row:
+                    print(f"[work_queue] Job '{job}' had other parameters; replacing it.")
+                db.execute("DELETE FROM shards WHERE job = ?", (job,))
+                db.execute("INSERT OR REPLACE INTO jobs (job, params, created_at) VALUES (?, ?, ?)",
+                           (job, params_json, time.time()))
+                db.executemany("INSERT INTO shards (job, shard_id, payload) VALUES (?, ?, ?)",
+                               [(job, shard_id, json.dumps(payload)) for shard_id, payload in enumerate(shards)])
+                db.execute("COMMIT")
+                print(f"[work_queue] Queued job '{job}' with {len(shards)} shards in '{self.path}'.")
+        counts = self.progress(job)
+        return counts.get("pending", 0) + counts.get("leased", 0)
+
+    def job_params(self, job: str):
+        """The job's params dict, or None if there is no such job."""
+        with self._connect() as db:
+            row = db.execute("SELECT params FROM jobs WHERE job = ?", (job,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def progress(self, job: str) -> dict:
+        """Shard counts by status, e.g. {"pending": 3, "leased": 2, "done": 10}."""
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM shards WHERE job = ? GROUP BY status",
+                              (job,)).fetchall()
+        return dict(rows)
+
+    def failures(self, job: str) -> list:
+        """(shard_id, error) of the shards that ran out of attempts."""
+        with self._connect() as db:
+            return db.execute("SELECT shard_id, error FROM shards WHERE job = ? AND status = 'failed' "
+                              "ORDER BY shard_id", (job,)).fetchall()
+
+    def shard_output_path(self, job: str, shard_id: int) -> str:
+        return os.path.join(self.shard_dir, job, f"{shard_id:06d}.json")
+
+    def shard_outputs(self, job: str):
+        """Load the shard outputs in shard order (call once every shard is done)."""
+        with self._connect() as db:
+            rows = db.execute("SELECT shard_id, status FROM shards WHERE job = ? ORDER BY shard_id",
+                              (job,)).fetchall()
+        for shard_id, status in rows:
+            if status != "done":
+                raise RuntimeError(f"[work_queue] Shard {shard_id} of job '{job}' is {status}, not done.")
+            with open(self.shard_output_path(job, shard_id), "r", encoding="utf-8") as f:
+                yield json.load(f)
+
+    # ---------------------------------------------------------------------- workers
+    def claim(self, job: str, worker: str):
+        """
+        Lease the next pending shard, or one whose lease expired.
+
+        :return: (shard_id, payload) or None if nothing is claimable right now
+        """
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            # Expired leases that used up their attempts fail instead of looping forever
+            db.execute("UPDATE shards SET status = 'failed', "
+                       "error = COALESCE(error, 'lease expired ' || attempts || ' times') "
+                       "WHERE job = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                       (job, now, self.max_attempts))
+            row = db.execute("SELECT shard_id, payload, status, worker FROM shards "
+                             "WHERE job = ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                             "ORDER BY shard_id LIMIT 1", (job, now)).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            shard_id, payload, status, previous = row
+            db.execute("UPDATE shards SET status = 'leased', worker = ?, lease_expires = ?, "
+                       "attempts = attempts + 1 WHERE job = ? AND shard_id = ?",
+                       (worker, now + self.lease_s, job, shard_id))
+            db.execute("COMMIT")
+        if status == "leased":
+            print(f"[work_queue] {worker} took over shard {shard_id} from {previous} (lease expired).")
+        return shard_id, json.loads(payload)
+
+    def heartbeat(self, job: str, shard_id: int, worker: str) -> bool:
+        """Extend the lease; False if the worker no longer holds it."""
+        with self._connect() as db:
+            cur = db.execute("UPDATE shards SET lease_expires = ? "
+                             "WHERE job = ? AND shard_id = ? AND worker = ? AND status = 'leased'",
+                             (time.time() + self.lease_s, job, shard_id, worker))
+            return cur.rowcount == 1
+
+    def complete(self, job: str, shard_id: int, worker: str, output) -> bool:
+        """
+        Write the shard output and mark the shard done, if the worker still holds
+        the lease. False if it lost the lease (another worker redoes the shard).
+        """
+        path = self.shard_output_path(job, shard_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a worker-specific name, so a worker that lost its lease
+        # never clobbers the file of the one that holds it now
+        tmp_path = f"{path}.{worker.replace(':', '_').replace(os.sep, '_')}"
+        write_json_atomic(tmp_path, output)
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            cur = db.execute("UPDATE shards SET status = 'done', lease_expires = NULL, error = NULL "
+                             "WHERE job = ? AND shard_id = ? AND worker = ? AND status = 'leased'",
+                             (job, shard_id, worker))
+            if cur.rowcount == 1:
+                os.replace(tmp_path, path)
+            db.execute("COMMIT")
+        if cur.rowcount != 1:
+            os.remove(tmp_path)
+            return False
+        return True
+
+    def fail(self, job: str, shard_id: int, worker: str, error: str):
+        """Give the shard back for a retry, or mark it failed after max_attempts."""
+        with self._connect() as db:
+            db.execute("UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "worker = NULL, lease_expires = NULL, error = ? "
+                       "WHERE job = ? AND shard_id = ? AND worker = ? AND status = 'leased'",
+                       (self.max_attempts, error, job, shard_id, worker))
+
+
+class _Connection:
+    """sqlite3 connection as a context manager that closes (not commits) on exit."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.db.in_transaction:
+            self.db.execute("ROLLBACK")
+        self.db.close()
+        return False
+
+
+def run_worker(queue: WorkQueue, job: str, process_shard, worker_id: str = None,
+               poll_s: float = DEFAULT_POLL_S) -> int:
+    """
+    Claim and process shards of `job` until none are left (all done or failed).
+    While other workers hold the last shards it keeps polling, to take over any
+    whose lease expires.
+
+    :param process_shard: callable(job_params, payload) -> JSON-able shard output
+    :return: number of shards this worker completed
+    """
+    worker_id = worker_id or default_worker_id()
+    params = queue.job_params(job)
+    if params is None:
+        raise ValueError(f"[work_queue] No job '{job}' in '{queue.path}'.")
+
+    completed = 0
+    while True:
+        claimed = queue.claim(job, worker_id)
+        if claimed is None:
+            counts = queue.progress(job)
+            if not counts.get("pending") and not counts.get("leased"):
+                break
+            time.sleep(poll_s)
+            continue
+
+        shard_id, payload = claimed
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def beat():
+            while not stop.wait(queue.lease_s / 3):
+                if not queue.heartbeat(job, shard_id, worker_id):
+                    lost.set()
+                    return
+
+        heartbeat = threading.Thread(target=beat, name="work-queue-heartbeat", daemon=True)
+        heartbeat.start()
+        start = time.perf_counter()
+        try:
+            output = process_shard(params, payload)
+        except Exception as e:
+            stop.set()
+            heartbeat.join()
+            print(f"[work_queue] {worker_id}: shard {shard_id} failed: {e}")
+            queue.fail(job, shard_id, worker_id, f"{type(e).__name__}: {e}")
+            continue
+        stop.set()
+        heartbeat.join()
+
+        if lost.is_set() or not queue.complete(job, shard_id, worker_id, output):
+            print(f"[work_queue] {worker_id}: lost the lease on shard {shard_id}; discarding its output.")
+            continue
+        completed += 1
+        print(f"[work_queue] {worker_id}: shard {shard_id} done in {time.perf_counter() - start:.2f}s.")
+
+    print(f"[work_queue] {worker_id}: no shards left in job '{job}'; completed {completed}.")
+    return completed
+
+
+def wait_for_job(queue: WorkQueue, job: str, poll_s: float = DEFAULT_POLL_S, workers: list = None) -> bool:
+    """
+    Block until every shard of the job is done or failed, printing progress.
+
+    :param workers: optional local worker processes (Popen); if they
+                    have all exited while shards are still pending, stop waiting
+    :return: True if every shard is done
+    """
+    last = None
+    while True:
+        counts = queue.progress(job)
+        if counts != last:
+            print(f"[work_queue] Job '{job}': " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+            last = counts
+        if not counts.get("pending") and not counts.get("leased"):
+            break
+        if workers and all(p.poll() is not None for p in workers):
+            print(f"[work_queue] All local workers exited but job '{job}' is unfinished.")
+            return False
+        time.sleep(poll_s)
+
+    for shard_id, error in queue.failures(job):
+        print(f"[work_queue] Shard {shard_id} failed: {error}")
+    return not counts.get("failed")
+
+
+def coordinate(queue: WorkQueue, job: str, script_path: str, worker_args: list,
+               local_workers: int = 0, poll_s: float = DEFAULT_POLL_S) -> bool:
+    """
+    Coordinator side after create_job: optionally start `local_workers` worker
+    processes of the stage script on this host, then wait for the job.
+
+    :param worker_args: CLI args that make script_path run as a worker
+    :return: True if every shard is done (ready to merge)
+    """
+    workers = [subprocess.Popen([sys.executable, script_path] + list(worker_args))
+               for _ in range(local_workers)]
+    if not workers:
+        print(f"[work_queue] Waiting for workers. On each host, run: "
+              f"python {os.path.basename(script_path)} {' '.join(worker_args)}")
+    try:
+        return wait_for_job(queue, job, poll_s, workers=workers)
+    except BaseException:
+        for p in workers:
+            p.terminate()
+        raise
+    finally:
+        # Workers exit by themselves once no shards are left
+        for p in workers:
+            p.wait()